@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+"""
+best_tile_planner.py
+====================
+
+Description: This script predicts the best Landsat tile for each site before the zonal stats are calculated
+(command argument --best_tile_only). step2_4 selects the tile with the most non null zonal stats records per site after
+every overlapping tile has been processed; this planning stage makes the same choice up front so that only the chosen
+tile is processed for sites within a tile overlap.
+
+For each site that overlays more than one tile, each candidate tile is scored by:
+
+1. The estimated number of valid observations - the number of scenes in the tile scene list (step1_5) multiplied by the
+fraction of a sample of those scenes that contain valid (not no data) pixels within the site.
+
+2. The fraction of the 1ha site within the negatively buffered tile.
+
+3. The distance from the site centroid to the negatively buffered tile edge.
+
+The plan is exported to export_dir/tile_status/tile_status_lists/best_tile_plan.csv.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import from_bounds
+import landsat_tile_grid
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# number of scenes sampled per tile to estimate the fraction of valid observations.
+SAMPLE_SCENE_COUNT = 12
+
+# area of the 1ha site polygon (square metres).
+SITE_AREA = 10000.0
+
+
+def site_key_fn(site_geo_df):
+    """ Create the site key used by the zonal stats outputs and step2_4 (comp_site).
+
+    @param site_geo_df: geo-dataframe containing the 1ha sites (prop_code, prop_name and site_name features).
+    @return comp_site: pandas series object containing the comp_site value of each site.
+    """
+
+    return site_geo_df.prop_code.astype(str) + '_' + site_geo_df.prop_name.astype(str) + '_' + \
+        site_geo_df.site_name.astype(str)
+
+
+def scene_list_fn(tile_for_processing_dir, tile):
+    """ Read in the Landsat scene list created by step1_5 for a tile.
+
+    @param tile_for_processing_dir: string object containing the path to the export_dir/tile_status/for_processing dir.
+    @param tile: string object containing the six character tile name (i.e. 101077).
+    @return image_list: list object containing the path to each scene, or an empty list if there is no scene list.
+    """
+
+    scene_list_csv = os.path.join(tile_for_processing_dir, '{0}_{1}_landsat_tile_list.csv'.format(tile[:3], tile[3:]))
+
+    if not os.path.exists(scene_list_csv):
+        return []
+
+    with open(scene_list_csv, 'r') as scene_list:
+        image_list = [image.rstrip() for image in scene_list if image.strip()]
+
+    return image_list
+
+
+def sample_scene_list_fn(image_list, sample_size=SAMPLE_SCENE_COUNT):
+    """ Select scenes evenly spaced through the scene list (the scene list is sorted by the directory walk).
+
+    @param image_list: list object containing the path to each scene of the tile.
+    @param sample_size: integer object containing the maximum number of scenes sampled.
+    @return sample_list: list object containing the sampled scene paths.
+    """
+
+    if len(image_list) <= sample_size:
+        return list(image_list)
+
+    index_list = np.linspace(0, len(image_list) - 1, sample_size).round().astype(int)
+
+    return [image_list[i] for i in sorted(set(index_list))]
+
+
+def valid_observation_fraction_fn(sample_list, site_geo_df, no_data):
+    """ Calculate the fraction of the sampled scenes containing valid pixels within each site.
+
+    @param sample_list: list object containing the sampled scene paths.
+    @param site_geo_df: geo-dataframe containing the 1ha sites within the tile.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @return valid_fraction: numpy array object containing the valid fraction of each site (1.0 if no scene was read).
+    """
+
+    valid_count = np.zeros(len(site_geo_df.index))
+    read_count = 0
+
+    for image in sample_list:
+        try:
+            with rasterio.open(image) as src:
+                bounds_array = site_geo_df.to_crs(src.crs.to_wkt()).geometry.bounds.values
+
+                for n, bounds in enumerate(bounds_array):
+                    window = from_bounds(*bounds, transform=src.transform).round_offsets().round_lengths()
+                    array = src.read(1, window=window, boundless=True, fill_value=no_data)
+
+                    if np.any((array != no_data) & ~np.isnan(array)):
+                        valid_count[n] += 1
+
+            read_count += 1
+
+        except rasterio.errors.RasterioIOError:
+            print('Unable to sample the scene: ', image)
+
+    if read_count == 0:
+        # no evidence - rank the tile on the scene count, coverage and edge distance only.
+        return np.ones(len(site_geo_df.index))
+
+    return valid_count / read_count
+
+
+def tile_edge_distance_fn(site_geo_df, tile_geometry):
+    """ Calculate the distance from each site centroid to the edge of the negatively buffered tile.
+
+    @param site_geo_df: geo-dataframe containing the 1ha sites within the tile (tile crs).
+    @param tile_geometry: shapely polygon object containing the negatively buffered tile.
+    @return edge_distance: numpy array object containing the edge distance of each site (metres).
+    """
+
+    boundary = tile_geometry.boundary
+
+    return np.array([boundary.distance(centroid) for centroid in site_geo_df.geometry.centroid])
+
+
+def plan_best_tile_fn(site_tile_dict, derived_dict, tile_for_processing_dir, no_data, sample_size=SAMPLE_SCENE_COUNT):
+    """ Score each site and tile combination and select the best tile for each site.
+
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param derived_dict: dictionary object containing the crs name (key) and a tuple of the projected tile grid subset
+    and the buffered tiles (value).
+    @param tile_for_processing_dir: string object containing the path to the export_dir/tile_status/for_processing dir.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @param sample_size: integer object containing the maximum number of scenes sampled per tile.
+    @return plan_df: pandas dataframe object containing the score of each site and tile and the best_tile flag.
+    """
+
+    # buffered tile geometry of each tile (tile crs).
+    tile_geometry_dict = {}
+    for projected_df, buffer_tile_df in derived_dict.values():
+        tile_geometry_dict.update(dict(zip(buffer_tile_df.TILE, buffer_tile_df.geometry)))
+
+    # the sites that overlay more than one tile are the only sites that require sampling.
+    site_tile_count = pd.Series([site for site_geo_df in site_tile_dict.values()
+                                 for site in site_key_fn(site_geo_df).unique()]).value_counts()
+
+    list_plan_df = []
+
+    for tile, site_geo_df in site_tile_dict.items():
+        image_list = scene_list_fn(tile_for_processing_dir, tile)
+
+        plan_df = pd.DataFrame({'comp_site': site_key_fn(site_geo_df).values,
+                                'site_name': site_geo_df.site_name.values,
+                                'site_date': site_geo_df.site_date.values,
+                                'tile': tile,
+                                'scene_count': len(image_list)})
+
+        overlap = plan_df.comp_site.map(site_tile_count).values > 1
+        plan_df['coverage'] = np.minimum(site_geo_df.geometry.area.values / SITE_AREA, 1.0)
+        plan_df['valid_fraction'] = np.nan
+
+        if overlap.any():
+            print('Sampling ', min(len(image_list), sample_size), ' scenes from tile: ', tile)
+            overlap_geo_df = site_geo_df.loc[overlap]
+            plan_df.loc[overlap, 'valid_fraction'] = valid_observation_fraction_fn(
+                sample_scene_list_fn(image_list, sample_size), overlap_geo_df, no_data)
+
+        if tile in tile_geometry_dict:
+            plan_df['edge_distance'] = tile_edge_distance_fn(site_geo_df, tile_geometry_dict[tile])
+        else:
+            plan_df['edge_distance'] = np.nan
+
+        plan_df['est_observations'] = plan_df.scene_count * plan_df.valid_fraction.fillna(1.0)
+        list_plan_df.append(plan_df)
+
+    plan_df = pd.concat(list_plan_df, ignore_index=True)
+
+    # rank each site's tiles - a site (all visits) is assigned to a single tile as per step2_4.
+    site_score_df = plan_df.groupby(['comp_site', 'tile'], as_index=False)[
+        ['est_observations', 'coverage', 'edge_distance']].mean()
+    site_score_df.sort_values(['comp_site', 'est_observations', 'coverage', 'edge_distance'],
+                              ascending=[True, False, False, False], inplace=True)
+    best_df = site_score_df.drop_duplicates(subset=['comp_site'], keep='first')
+
+    best_key_set = set(zip(best_df.comp_site, best_df.tile))
+    plan_df['best_tile'] = [(site, tile) in best_key_set for site, tile in zip(plan_df.comp_site, plan_df.tile)]
+
+    return plan_df
+
+
+def apply_plan_fn(site_tile_dict, plan_df):
+    """ Remove the sites from every tile that is not their best tile (tiles without sites are removed).
+
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param plan_df: pandas dataframe object containing the score of each site and tile and the best_tile flag.
+    @return best_site_tile_dict: dictionary object containing the tile (key) and the 1ha sites for which the tile is the
+    best tile (value).
+    """
+
+    best_key_set = set(zip(plan_df.loc[plan_df.best_tile, 'comp_site'], plan_df.loc[plan_df.best_tile, 'tile']))
+    best_site_tile_dict = {}
+
+    for tile, site_geo_df in site_tile_dict.items():
+        keep = [(site, tile) in best_key_set for site in site_key_fn(site_geo_df)]
+        best_geo_df = site_geo_df.loc[keep].reset_index(drop=True)
+
+        if len(best_geo_df.index) > 0:
+            best_geo_df['uid'] = best_geo_df.index + 1
+            best_site_tile_dict[tile] = best_geo_df
+        else:
+            print('Tile skipped (not the best tile of any site): ', tile)
+
+    return best_site_tile_dict
+
+
+def main_routine(site_tile_dict, tile_grid, cache_dir, tile_status_dir, no_data, sample_size=SAMPLE_SCENE_COUNT):
+    """ Plan the best tile for each site and restrict the site_tile_dict to the best tile of each site.
+
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param tile_grid: string object containing the path to the Landsat tile grid shapefile (command argument).
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @param tile_status_dir: string object containing the path to the export_dir/tile_status directory.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @param sample_size: integer object containing the maximum number of scenes sampled per tile.
+    @return best_site_tile_dict: dictionary object containing the tile (key) and the 1ha sites for which the tile is the
+    best tile (value).
+    """
+
+    print('=' * 50)
+    print('Planning the best Landsat tile for each site.')
+
+    derived_dict = landsat_tile_grid.derived_tile_grid_fn(tile_grid, cache_dir)
+    tile_for_processing_dir = os.path.join(tile_status_dir, 'for_processing')
+
+    plan_df = plan_best_tile_fn(site_tile_dict, derived_dict, tile_for_processing_dir, no_data, sample_size)
+    plan_df.to_csv(os.path.join(tile_status_dir, 'tile_status_lists', 'best_tile_plan.csv'), index=False)
+
+    best_site_tile_dict = apply_plan_fn(site_tile_dict, plan_df)
+
+    before = sum(len(site_geo_df.index) for site_geo_df in site_tile_dict.values())
+    after = sum(len(site_geo_df.index) for site_geo_df in best_site_tile_dict.values())
+    print(' - site by tile records: ', before, ' > ', after)
+    print(' - tiles: ', len(site_tile_dict), ' > ', len(best_site_tile_dict))
+    print('=' * 50)
+
+    return best_site_tile_dict
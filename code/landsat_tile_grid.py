@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+"""
+landsat_tile_grid.py
+====================
+
+Description: This script contains the Landsat tile grid helpers shared by step1_3 and step1_4.
+
+1. Separates the Landsat tile grid into the three WGS84 UTM zones (52, 53 and 54) based on the WRSPR feature.
+
+2. Assigns each ODK site to the UTM zone(s) of the Landsat tiles that the site falls within, so that each site is only
+projected, buffered and intersected in the zone(s) it is required in. Sites that do not fall within a tile are assigned
+to a zone based on their longitude.
+
+3. Creates the derived tile grid (each zone subset re-projected and each tile negatively buffered by 4000m) and caches
+it within the local cache directory (command argument --cache_dir) keyed by the hash of the tile grid shapefile, so it
+is only re-built when the tile grid changes. Within a process (i.e. step1_1 --watch) the derived tile grid is also kept
+in memory, keyed by the same hash.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import copy
+import math
+import hashlib
+import pickle
+import geopandas as gpd
+import pandas as pd
+import odk_ingest
+import reprojection
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# standardised crs name and epsg code for each WGS84 UTM zone covered by the Northern Territory.
+ZONE_EPSG_DICT = {'WGS84z52': 32752, 'WGS84z53': 32753, 'WGS84z54': 32754}
+
+# negative buffer applied to each Landsat tile to mask the tile edges.
+TILE_BUFFER_DISTANCE = -4000
+
+# increment when the derived tile grid below changes to invalidate previously cached tile grids.
+DERIVED_TILE_GRID_VERSION = '1'
+
+# derived tile grids created or loaded during this process, keyed by the derived tile grid key.
+_derived_tile_grid_cache = {}
+
+
+def tile_grid_zone_selection_fn(tile_grid_gdf, owner_only=False):
+    """ Subset the Landsat tile grid into WGS84 zone 52, 53 and 54 based on the WRSPR feature (tiles are not projected).
+
+    Several tiles are selected in two zones (104_072, 104_073, 103_078 and 100_074); the outputs of the later zone
+    (52 > 53 > 54) overwrite the earlier zone outputs in step1_4, so the later zone is the owner of the tile.
+
+    @param tile_grid_gdf: geo-dataframe containing the Landsat tile locations and names.
+    @param owner_only: boolean object, True to only select each tile in the zone that owns it.
+    @return zone_tile_dict: dictionary object containing the crs name (key) and the tile grid subset (value).
+    """
+
+    tile_grid_54_selection = tile_grid_gdf.loc[tile_grid_gdf['WRSPR'] == 100_074]
+    tile_grid_53_selection = tile_grid_gdf.loc[(tile_grid_gdf['WRSPR'] <= 104_073) & (
+            (tile_grid_gdf['WRSPR'] != 103_078) | (tile_grid_gdf['WRSPR'] != 100_074))]
+    tile_grid_52_selection = tile_grid_gdf.loc[(tile_grid_gdf['WRSPR'] >= 104_072) | (
+            tile_grid_gdf['WRSPR'] == 103_078)]
+
+    if owner_only:
+        tile_grid_52_selection = tile_grid_52_selection.loc[
+            ~tile_grid_52_selection['WRSPR'].isin(tile_grid_53_selection['WRSPR']) &
+            ~tile_grid_52_selection['WRSPR'].isin(tile_grid_54_selection['WRSPR'])]
+        tile_grid_53_selection = tile_grid_53_selection.loc[
+            ~tile_grid_53_selection['WRSPR'].isin(tile_grid_54_selection['WRSPR'])]
+
+    zone_tile_dict = {'WGS84z52': tile_grid_52_selection,
+                      'WGS84z53': tile_grid_53_selection,
+                      'WGS84z54': tile_grid_54_selection}
+
+    return zone_tile_dict
+
+
+def longitude_crs_name_fn(lon):
+    """ Determine the WGS84 UTM zone crs name from a longitude value (southern hemisphere).
+
+    @param lon: float object containing the longitude (decimal degrees).
+    @return crs_name: string object containing the standardised crs name (i.e. 'WGS84z53').
+    """
+
+    zone = int(math.floor((float(lon) + 180.0) / 6.0)) + 1
+
+    # the Northern Territory is covered by zones 52 to 54 - clamp any outliers to the nearest zone.
+    zone = min(max(zone, 52), 54)
+
+    return 'WGS84z' + str(zone)
+
+
+def assign_site_zones_fn(site_geo_df, tile_grid):
+    """ Assign each site to the UTM zone(s) of the Landsat tiles that the site point falls within.
+
+    A site is only assigned to more than one zone when it falls within tiles belonging to different zones (i.e. tile
+    overlap along a zone boundary). Sites which do not fall within any tile are assigned a zone from their longitude.
+
+    @param site_geo_df: geo-dataframe containing the ODK site points.
+    @param tile_grid: string object containing the path to the Landsat tile grid shapefile or an open geo-dataframe.
+    @return zone_site_dict: dictionary object containing the crs name (key) and the site subset in the site_geo_df crs
+    (value) - the subset may be empty.
+    """
+
+    if isinstance(tile_grid, str):
+        tile_grid_gdf = gpd.read_file(tile_grid)
+    else:
+        tile_grid_gdf = tile_grid
+
+    sites = site_geo_df.reset_index(drop=True)
+    site_points = reprojection.to_crs_fn(gpd.GeoDataFrame(geometry=sites.geometry, crs=sites.crs), tile_grid_gdf.crs)
+
+    # each site is assigned to the zone that owns the tiles it falls within (matches the step1_4 tile selection).
+    zone_tile_dict = tile_grid_zone_selection_fn(tile_grid_gdf, owner_only=True)
+    assigned = pd.Series(False, index=sites.index)
+    zone_index_dict = {}
+
+    for crs_name, zone_tiles in zone_tile_dict.items():
+        joined = gpd.sjoin(site_points, zone_tiles[['geometry']], how='inner')
+        zone_index = joined.index.unique()
+        zone_index_dict[crs_name] = list(zone_index)
+        assigned.loc[zone_index] = True
+
+    # fall back to the longitude of the site for sites outside of the tile grid.
+    unassigned = sites.loc[~assigned]
+    if len(unassigned.index) > 0:
+        print('Sites outside of the Landsat tile grid (zone assigned from longitude): ', len(unassigned.index))
+        lon_series = reprojection.to_crs_fn(unassigned.geometry, epsg=4326).x
+        for index, lon in lon_series.items():
+            zone_index_dict[longitude_crs_name_fn(lon)].append(index)
+
+    zone_site_dict = {}
+    for crs_name in ZONE_EPSG_DICT:
+        zone_index = sorted(set(zone_index_dict.get(crs_name, [])))
+        zone_site_dict[crs_name] = sites.loc[zone_index]
+        print(' - ', crs_name, ' sites: ', len(zone_index))
+
+    return zone_site_dict
+
+
+def buffer_tile_grid_fn(projected_df):
+    """ Separate each Landsat tile and apply a negative buffer (4000m).
+
+    @param projected_df: geo-dataframe containing the filtered version of the Landsat tile grid (projected).
+    @return buffer_tile_df: geo-dataframe containing the six character tile name (TILE) and buffered tile geometry.
+    """
+
+    list_tile_df = []
+
+    for landsat_tile in projected_df.WRSPR.unique():
+        tile_df = projected_df.loc[projected_df.WRSPR == landsat_tile]
+        buffer_df = gpd.GeoDataFrame(geometry=tile_df.buffer(TILE_BUFFER_DISTANCE).values, crs=projected_df.crs)
+        # six character tile name (i.e. 101077 or 099077).
+        buffer_df['TILE'] = str(int(landsat_tile)).zfill(6)
+        list_tile_df.append(buffer_df)
+
+    if len(list_tile_df) >= 1:
+        buffer_tile_df = gpd.GeoDataFrame(pd.concat(list_tile_df, ignore_index=True), crs=projected_df.crs)
+    else:
+        buffer_tile_df = gpd.GeoDataFrame({'TILE': [], 'geometry': []}, geometry='geometry', crs=projected_df.crs)
+
+    return buffer_tile_df
+
+
+def build_derived_tile_grid_fn(tile_grid):
+    """ Read in the Landsat tile grid, subset it into the zones that own each tile, re-project and buffer each zone.
+
+    @param tile_grid: string object containing the path to the Landsat tile grid shapefile.
+    @return derived_dict: dictionary object containing the crs name (key) and a tuple of the projected tile grid subset
+    and the buffered tiles (value).
+    """
+
+    print('Building the derived Landsat tile grid: ', tile_grid)
+    tile_grid_gdf = gpd.read_file(tile_grid)
+    zone_tile_dict = tile_grid_zone_selection_fn(tile_grid_gdf, owner_only=True)
+
+    derived_dict = {}
+    for crs_name, epsg in ZONE_EPSG_DICT.items():
+        projected_df = zone_tile_dict[crs_name].to_crs(epsg=epsg)
+        derived_dict[crs_name] = (projected_df, buffer_tile_grid_fn(projected_df))
+
+    return derived_dict
+
+
+def shapefile_hash_fn(shapefile):
+    """ Calculate a combined sha1 hash of a shapefile and its sidecar files (.shx, .dbf, .prj and .cpg).
+
+    @param shapefile: string object containing the path to the shapefile.
+    @return hex_digest: string object containing the combined sha1 hash.
+    """
+
+    sha1 = hashlib.sha1()
+    root, _ = os.path.splitext(shapefile)
+
+    for extension in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
+        file_path = root + extension
+        if os.path.exists(file_path):
+            sha1.update((extension + odk_ingest.file_hash_fn(file_path)).encode('utf-8'))
+
+    return sha1.hexdigest()
+
+
+def derived_tile_grid_fn(tile_grid, cache_dir=None):
+    """ Return the derived Landsat tile grid from the cache if the tile grid shapefile is unchanged, otherwise build
+    and cache the derived tile grid.
+
+    @param tile_grid: string object containing the path to the Landsat tile grid shapefile.
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @return derived_dict: dictionary object containing the crs name (key) and a tuple of the projected tile grid subset
+    and the buffered tiles (value).
+    """
+
+    key_string = '|'.join([shapefile_hash_fn(tile_grid), DERIVED_TILE_GRID_VERSION, str(TILE_BUFFER_DISTANCE)])
+    key = hashlib.sha1(key_string.encode('utf-8')).hexdigest()
+
+    if key in _derived_tile_grid_cache:
+        # a copy - the stages must not alter the derived tile grid kept in memory.
+        print('Derived Landsat tile grid loaded from memory: ', tile_grid)
+        return copy.deepcopy(_derived_tile_grid_cache[key])
+
+    if cache_dir is None:
+        derived_dict = build_derived_tile_grid_fn(tile_grid)
+        _derived_tile_grid_cache[key] = copy.deepcopy(derived_dict)
+        return derived_dict
+
+    tile_grid_cache_dir = os.path.join(cache_dir, 'tile_grid')
+    if not os.path.exists(tile_grid_cache_dir):
+        os.makedirs(tile_grid_cache_dir)
+
+    cache_file = os.path.join(tile_grid_cache_dir, key + '.pkl')
+
+    if os.path.exists(cache_file):
+        print('Derived Landsat tile grid loaded from the cache: ', cache_file)
+        with open(cache_file, 'rb') as file:
+            derived_dict = pickle.load(file)
+    else:
+        derived_dict = build_derived_tile_grid_fn(tile_grid)
+        with open(cache_file + '.tmp', 'wb') as file:
+            pickle.dump(derived_dict, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + '.tmp', cache_file)
+
+    _derived_tile_grid_cache[key] = copy.deepcopy(derived_dict)
+
+    return derived_dict
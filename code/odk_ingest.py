@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+"""
+odk_ingest.py
+=============
+
+Description: This script reads the ODK star transect csv files with an explicit schema, only reading in the columns
+used by the pipeline (usecols), reading the files in parallel and caching each parsed file in a local cache directory
+keyed by the file hash.
+
+The cache is written as Parquet when pyarrow (or fastparquet) is installed, otherwise it falls back to a pickle file.
+A cached file is re-used for as long as the csv content (and the schema) is unchanged.
+
+The full ODK records (every column) are only read for the odk output csv and shapefile deliverables of step1_3
+(read_odk_record_rows_fn), cached as a pickle file alongside the schema cache. Only the files containing records retained
+by the pipeline are read in full (i.e. the new or changed files of an incremental run).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# columns read in from the star transect csv files and their data types - all other columns are ignored.
+ODK_SCHEMA_DICT = {'final_prop': str,
+                   'site_orig': str,
+                   'date': str,
+                   'loc_c': str,
+                   'wgs_c_lon': str,
+                   'wgs_c_lat': str,
+                   'gda_c_lon': str,
+                   'gda_c_lat': str}
+
+# coordinate columns, converted to floats after reading (non numeric values such as 'BLANK' become NaN).
+ODK_COORDINATE_LIST = ['wgs_c_lon', 'wgs_c_lat', 'gda_c_lon', 'gda_c_lat']
+
+# increment when the schema or the cleaning below changes to invalidate previously cached files.
+ODK_SCHEMA_VERSION = '1'
+
+
+def parquet_available_fn():
+    """ Determine if a Parquet engine (pyarrow or fastparquet) is installed.
+
+    @return available: boolean object, True if Parquet files can be written and read.
+    """
+
+    try:
+        import pyarrow
+        available = True
+    except ImportError:
+        try:
+            import fastparquet
+            available = True
+        except ImportError:
+            available = False
+
+    return available
+
+
+def file_hash_fn(file_path, block_size=1048576):
+    """ Calculate the sha1 hash of a file's content.
+
+    @param file_path: string object containing the path to the file.
+    @param block_size: integer object containing the number of bytes read per block.
+    @return hex_digest: string object containing the sha1 hash of the file.
+    """
+
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        block = file.read(block_size)
+        while block:
+            sha1.update(block)
+            block = file.read(block_size)
+
+    return sha1.hexdigest()
+
+
+def parse_odk_csv_fn(file_path, schema_dict):
+    """ Read in an ODK csv using the explicit schema, only reading the schema columns present in the csv.
+
+    @param file_path: string object containing the path to the ODK csv.
+    @param schema_dict: dictionary object containing the column names (key) and data types (value) to read in.
+    @return df: pandas dataframe object containing the schema columns.
+    """
+
+    import pandas as pd
+
+    # usecols as a callable ignores schema columns that are absent and any leading (unnamed) index column.
+    df = pd.read_csv(file_path, usecols=lambda column: column in schema_dict, dtype=schema_dict)
+
+    for column in ODK_COORDINATE_LIST:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+
+    # retain the schema column order.
+    df = df[[column for column in schema_dict if column in df.columns]]
+
+    return df
+
+
+def read_odk_csv_fn(file_path, cache_dir=None, schema_dict=None):
+    """ Read in an ODK csv from the cache if the file content is unchanged, otherwise parse and cache the file.
+
+    @param file_path: string object containing the path to the ODK csv.
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @param schema_dict: dictionary object containing the columns to read in (default: ODK_SCHEMA_DICT).
+    @return df: pandas dataframe object containing the schema columns.
+    """
+
+    import pandas as pd
+
+    if schema_dict is None:
+        schema_dict = ODK_SCHEMA_DICT
+
+    if cache_dir is None:
+        return parse_odk_csv_fn(file_path, schema_dict)
+
+    odk_cache_dir = os.path.join(cache_dir, 'odk')
+    if not os.path.exists(odk_cache_dir):
+        os.makedirs(odk_cache_dir)
+
+    # the cache key includes the schema so that a schema change never returns stale columns.
+    schema_key = ODK_SCHEMA_VERSION + '|' + '|'.join(sorted(schema_dict))
+    key = hashlib.sha1((file_hash_fn(file_path) + schema_key).encode('utf-8')).hexdigest()
+
+    if parquet_available_fn():
+        cache_file = os.path.join(odk_cache_dir, key + '.parquet')
+        if os.path.exists(cache_file):
+            df = pd.read_parquet(cache_file)
+        else:
+            df = parse_odk_csv_fn(file_path, schema_dict)
+            df.to_parquet(cache_file + '.tmp', index=False)
+            os.replace(cache_file + '.tmp', cache_file)
+    else:
+        cache_file = os.path.join(odk_cache_dir, key + '.pkl')
+        if os.path.exists(cache_file):
+            df = pd.read_pickle(cache_file)
+        else:
+            df = parse_odk_csv_fn(file_path, schema_dict)
+            df.to_pickle(cache_file + '.tmp')
+            os.replace(cache_file + '.tmp', cache_file)
+
+    return df
+
+
+def parse_odk_record_fn(file_path):
+    """ Read in the full ODK record (every column) of an ODK csv, dropping a leading (unnamed) index column.
+
+    @param file_path: string object containing the path to the ODK csv.
+    @return df: pandas dataframe object containing every column of the csv.
+    """
+
+    import pandas as pd
+
+    df = pd.read_csv(file_path)
+    if len(df.columns) > 0 and str(df.columns[0]).startswith('Unnamed'):
+        df = df.iloc[:, 1:]
+
+    return df
+
+
+def read_odk_record_fn(file_path, cache_dir=None):
+    """ Read in the full ODK record (every column) of an ODK csv from the cache if the file content is unchanged,
+    otherwise parse and cache the file (pickle - the inferred column types are kept as read).
+
+    @param file_path: string object containing the path to the ODK csv.
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @return df: pandas dataframe object containing every column of the csv.
+    """
+
+    import pandas as pd
+
+    if cache_dir is None:
+        return parse_odk_record_fn(file_path)
+
+    odk_cache_dir = os.path.join(cache_dir, 'odk')
+    if not os.path.exists(odk_cache_dir):
+        os.makedirs(odk_cache_dir)
+
+    key = hashlib.sha1((file_hash_fn(file_path) + ODK_SCHEMA_VERSION + '|record').encode('utf-8')).hexdigest()
+    cache_file = os.path.join(odk_cache_dir, key + '_record.pkl')
+
+    if os.path.exists(cache_file):
+        df = pd.read_pickle(cache_file)
+    else:
+        df = parse_odk_record_fn(file_path)
+        df.to_pickle(cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file)
+
+    return df
+
+
+def read_odk_record_rows_fn(list_input, row_index, cache_dir=None, max_workers=8):
+    """ Read in the full ODK records (every column) of the retained rows of a list of ODK csv files. The rows are
+    identified by their position within the concatenated schema dataframes (read_odk_csv_list_fn) and only the files
+    containing a retained row are read in full.
+
+    @param list_input: list object containing the paths to the ODK csv files.
+    @param row_index: list like object containing the row positions (ascending) of the retained records.
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @param max_workers: integer object containing the maximum number of files read at the same time.
+    @return output_df: pandas dataframe object containing every column of the retained records.
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    workers = max(1, min(max_workers, len(list_input)))
+
+    # the row count of each file is taken from the schema dataframes (re-used from the cache).
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        row_count_list = list(executor.map(lambda file_path: len(read_odk_csv_fn(file_path, cache_dir)), list_input))
+
+    offset_array = np.cumsum([0] + row_count_list)
+    row_array = np.asarray(row_index, dtype=np.int64)
+    file_array = np.searchsorted(offset_array, row_array, side='right') - 1
+
+    read_list = [(file_path, row_array[file_array == n] - offset_array[n]) for n, file_path in enumerate(list_input)
+                 if (file_array == n).any()]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(read_list)))) as executor:
+        list_df = list(executor.map(lambda item: read_odk_record_fn(item[0], cache_dir).iloc[item[1]], read_list))
+
+    if not list_df:
+        return read_odk_record_fn(list_input[0], cache_dir).iloc[[]]
+
+    output_df = pd.concat(list_df, sort=False)
+
+    return output_df
+
+
+def read_odk_csv_list_fn(list_input, cache_dir=None, schema_dict=None, max_workers=8):
+    """ Read in a list of ODK csv files in parallel and concatenate them into a single dataframe.
+
+    @param list_input: list object containing the paths to the ODK csv files.
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @param schema_dict: dictionary object containing the columns to read in (default: ODK_SCHEMA_DICT).
+    @param max_workers: integer object containing the maximum number of files read at the same time.
+    @return output_df: pandas dataframe object containing the concatenated csv files.
+    """
+
+    import pandas as pd
+
+    workers = max(1, min(max_workers, len(list_input)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list_df = list(executor.map(lambda file_path: read_odk_csv_fn(file_path, cache_dir, schema_dict), list_input))
+
+    output_df = pd.concat(list_df)
+
+    return output_df
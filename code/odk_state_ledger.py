@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+
+"""
+odk_state_ledger.py
+===================
+
+Description: This script maintains a persistent state ledger (odk_state_ledger.json) within the export directory
+(command argument --export_dir). The ledger records which ODK csv files (content hash) and which (site, date) records
+(record fingerprint) have been processed, the run directory they were processed in and the Landsat tiles each record
+overlays.
+
+When the pipeline is run with --incremental:
+
+1. Only ODK csv files that are new or have changed since the last run are read in (step1_3).
+
+2. Only records that are new or have changed are buffered, assigned to tiles, processed and plotted.
+
+3. The ODK outputs (odk_int_output and odk_ras_output csv and shapefiles) of the previous run are merged into the new
+run directory once step1_3 is complete, and the zonal stats, rainfall, plot and sort_site_df outputs of the previous
+run before the plots are created (so step2_4 and step2_5 file every site and property, i.e. prop_output), so the new
+run directory always contains the complete set of outputs. Only the sites of the new or changed records are plotted.
+
+4. A run with no new or changed records records the changed ODK files in the ledger (they are not read in again) and
+keeps the previous run as the last run.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import json
+import glob
+import shutil
+import odk_ingest
+import warnings
+
+warnings.filterwarnings("ignore")
+
+LEDGER_FILE_NAME = 'odk_state_ledger.json'
+
+# export directory sub-folders (and their Parquet dataset kind) merged from the previous run during an incremental run.
+MERGE_CSV_FOLDER_LIST = [('zonal_stats', 'fc'), ('rainfall', 'rainfall')]
+MERGE_PLOT_FOLDER_LIST = ['plots', os.path.join('plots', 'interactive'), 'final_plots', 'final_interactive']
+
+# step1_3 ODK outputs (run directory) merged from the previous run during an incremental run.
+MERGE_ODK_FILE_LIST = ['odk_int_output.csv', 'odk_ras_output.csv', 'odk_int_output.shp', 'odk_int_output_wgs84.shp',
+                       'odk_ras_output_wgs84.shp']
+
+# step2_3 outputs (run directory) copied from the previous run during an incremental run.
+MERGE_ROOT_PATTERN_LIST = ['sort_site_df_*.csv']
+
+
+def load_ledger_fn(export_dir, incremental=False):
+    """ Read in the state ledger from the export directory, or create an empty ledger if one does not exist.
+
+    @param export_dir: string object containing the path to the export directory (command argument --export_dir).
+    @param incremental: boolean object, True if only new or changed ODK records are to be processed.
+    @return ledger: dictionary object containing the processed files, records and the last run directory.
+    """
+
+    ledger_path = os.path.join(export_dir, LEDGER_FILE_NAME)
+
+    if os.path.exists(ledger_path):
+        with open(ledger_path, 'r') as ledger_file:
+            ledger = json.load(ledger_file)
+    else:
+        ledger = {'version': 1, 'files': {}, 'records': {}, 'last_run': None}
+
+    # working (un-saved) state for the current run.
+    ledger['incremental'] = bool(incremental)
+    ledger['pending_files'] = {}
+    ledger['pending_records'] = {}
+
+    if incremental:
+        print('Incremental run - previously processed records: ', len(ledger['records']))
+
+    return ledger
+
+
+def save_ledger_fn(ledger, export_dir):
+    """ Write the state ledger (excluding the working state of the current run) to the export directory.
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param export_dir: string object containing the path to the export directory (command argument --export_dir).
+    """
+
+    ledger_path = os.path.join(export_dir, LEDGER_FILE_NAME)
+    output = {key: value for key, value in ledger.items() if key not in ['incremental', 'pending_files',
+                                                                         'pending_records']}
+
+    with open(ledger_path + '.tmp', 'w') as ledger_file:
+        json.dump(output, ledger_file, indent=1, sort_keys=True)
+    os.replace(ledger_path + '.tmp', ledger_path)
+
+    print('State ledger updated: ', ledger_path)
+
+
+def record_key_fn(site_name, date):
+    """ Create the ledger key for a (site, date) record - the date is cleaned to match the step1_3 site_date attribute.
+
+    @param site_name: string object containing the site name.
+    @param date: string object containing the ODK date time (i.e. 14/07/2020 9:35:00 AM).
+    @return key: string object containing the record key (i.e. NTH01A|14.07.2020).
+    """
+
+    site_date = str(date).split(' ')[0].replace('/', '.')
+
+    return '{0}|{1}'.format(str(site_name), site_date)
+
+
+def changed_files_fn(ledger, list_input):
+    """ Stage the hash of each ODK csv and return the files that are new or changed (incremental) or all files.
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param list_input: list object containing the paths to the ODK csv files.
+    @return list_changed: list object containing the paths to the ODK csv files to be read in.
+    """
+
+    list_changed = []
+
+    for file_path in list_input:
+        file_key = os.path.abspath(file_path)
+        file_hash = odk_ingest.file_hash_fn(file_path)
+        ledger['pending_files'][file_key] = file_hash
+
+        previous = ledger['files'].get(file_key)
+        if not ledger['incremental'] or previous is None or previous['hash'] != file_hash:
+            list_changed.append(file_path)
+
+    if ledger['incremental']:
+        print(' - New or changed ODK files: ', len(list_changed), ' of ', len(list_input))
+
+    return list_changed
+
+
+def stage_records_fn(ledger, odk_df):
+    """ Stage the (site, date) records of the ODK dataframe and return the new or changed records (incremental) or
+    all records.
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param odk_df: pandas dataframe object containing the ODK records (columns renamed to site_name and prop_name).
+    @return odk_df: pandas dataframe object containing the ODK records to be processed.
+    """
+
+    import pandas as pd
+
+    if len(odk_df.index) == 0:
+        return odk_df
+
+    # fingerprint each record from its content so that edited records are re-processed.
+    fingerprint_series = pd.util.hash_pandas_object(odk_df.astype(str), index=False).astype(str)
+    key_list = [record_key_fn(site, date) for site, date in zip(odk_df.site_name, odk_df.date)]
+
+    keep_list = []
+    for key, fingerprint in zip(key_list, fingerprint_series):
+        previous = ledger['records'].get(key)
+        new_record = previous is None or previous['fingerprint'] != fingerprint
+
+        if not ledger['incremental'] or new_record:
+            ledger['pending_records'][key] = fingerprint
+            keep_list.append(True)
+        else:
+            keep_list.append(False)
+
+    if ledger['incremental']:
+        print(' - New or changed ODK records: ', sum(keep_list), ' of ', len(keep_list))
+        odk_df = odk_df.loc[keep_list]
+
+    return odk_df
+
+
+def commit_ledger_fn(ledger, export_dir, export_dir_path, list_comp_geo_df):
+    """ Record the staged files and records as processed by the current run and save the ledger.
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param export_dir: string object containing the path to the export directory (command argument --export_dir).
+    @param export_dir_path: string object containing the path to the current run directory.
+    @param list_comp_geo_df: list object containing the step1_4 geo-dataframes (site and tile information) or None.
+    """
+
+    tile_dict = {}
+    for comp_geo_df in list_comp_geo_df:
+        if comp_geo_df is not None:
+            for site, site_date, tile in zip(comp_geo_df.site_name, comp_geo_df.site_date, comp_geo_df.tile):
+                tile_dict.setdefault('{0}|{1}'.format(site, site_date), set()).add(str(tile))
+
+    for file_key, file_hash in ledger['pending_files'].items():
+        ledger['files'][file_key] = {'hash': file_hash, 'run': export_dir_path}
+
+    for key, fingerprint in ledger['pending_records'].items():
+        ledger['records'][key] = {'fingerprint': fingerprint, 'run': export_dir_path,
+                                  'tiles': sorted(tile_dict.get(key, []))}
+
+    ledger['last_run'] = export_dir_path
+    ledger['pending_files'] = {}
+    ledger['pending_records'] = {}
+
+    save_ledger_fn(ledger, export_dir)
+
+
+def commit_files_fn(ledger, export_dir):
+    """ Record the staged files as processed and save the ledger, keeping the last run (a run with no new or changed
+    records - its run directory is removed).
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param export_dir: string object containing the path to the export directory (command argument --export_dir).
+    """
+
+    for file_key, file_hash in ledger['pending_files'].items():
+        ledger['files'][file_key] = {'hash': file_hash, 'run': ledger.get('last_run')}
+
+    ledger['pending_files'] = {}
+    ledger['pending_records'] = {}
+
+    save_ledger_fn(ledger, export_dir)
+
+
+def previous_run_fn(ledger, export_dir_path):
+    """ Return the path to the last run recorded in the ledger, or None if there are no previous outputs to merge. """
+
+    previous_run = ledger.get('last_run')
+
+    if previous_run is None or not os.path.isdir(previous_run) or previous_run == export_dir_path:
+        return None
+
+    return previous_run
+
+
+def plot_site_dict_fn(site_tile_dict):
+    """ Return the sites (comp_site) of each tile processed by the run - an incremental run only plots these sites.
+
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @return plot_site_dict: dictionary object containing the tile (key) and the set of comp_site values (value).
+    """
+
+    return {tile: set(site_df.prop_code.astype(str) + '_' + site_df.prop_name.astype(str) + '_' +
+                      site_df.site_name.astype(str)) for tile, site_df in site_tile_dict.items()}
+
+
+def record_key_list_fn(df):
+    """ Return the ledger key (record_key_fn) of each record of a step1_3 ODK output. """
+
+    return [record_key_fn(site, date) for site, date in zip(df.site_name, df.date)]
+
+
+def merge_odk_file_fn(previous_path, new_path):
+    """ Merge a step1_3 ODK output (csv or shapefile) of the previous run into the new run directory. Records
+    (site_name and date) output by the new run replace the previous records.
+
+    @param previous_path: string object containing the path to the previous run output.
+    @param new_path: string object containing the path to the new run output.
+    """
+
+    import pandas as pd
+
+    if not os.path.exists(new_path):
+        # no records of the output in the new run - copy the output (and shapefile sidecar files).
+        for file_path in glob.glob(os.path.splitext(previous_path)[0] + '.*'):
+            shutil.copy(file_path, os.path.dirname(new_path))
+        return
+
+    if new_path.endswith('.csv'):
+        new_df = pd.read_csv(new_path, index_col=0)
+        previous_df = pd.read_csv(previous_path, index_col=0)
+    else:
+        import geopandas as gpd
+        new_df = gpd.read_file(new_path)
+        previous_df = gpd.read_file(previous_path)
+
+    previous_df = previous_df.loc[~pd.Series(record_key_list_fn(previous_df), index=previous_df.index).isin(
+        set(record_key_list_fn(new_df)))]
+    merged_df = pd.concat([new_df, previous_df], ignore_index=True, sort=False)
+
+    if new_path.endswith('.csv'):
+        merged_df.to_csv(new_path)
+    else:
+        gpd.GeoDataFrame(merged_df, crs=new_df.crs, geometry='geometry').to_file(new_path, driver='ESRI Shapefile')
+
+
+def merge_odk_outputs_fn(ledger, export_dir_path):
+    """ Merge the step1_3 ODK outputs of the last run recorded in the ledger into the current run directory.
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param export_dir_path: string object containing the path to the current run directory.
+    """
+
+    previous_run = previous_run_fn(ledger, export_dir_path)
+
+    if previous_run is not None:
+        print('Merging the ODK outputs of the previous run: ', previous_run)
+
+        for file_name in MERGE_ODK_FILE_LIST:
+            previous_path = os.path.join(previous_run, file_name)
+            if os.path.exists(previous_path):
+                merge_odk_file_fn(previous_path, os.path.join(export_dir_path, file_name))
+
+
+def tile_from_file_name_fn(file_name):
+    """ Extract the Landsat tile from a zonal stats or rainfall zonal stats csv file name.
+
+    @param file_name: string object containing the csv file name (i.e. NTH_Nutwood_Downs_101077_zonal_stats.csv).
+    @return tile: string object containing the Landsat tile (i.e. 101077).
+    """
+
+    tile_name = file_name.split('_')
+
+    if tile_name[-3] == 'rainfall':
+        tile = tile_name[-4]
+    else:
+        tile = tile_name[-3]
+
+    return tile
+
+
+def visit_key_fn(df):
+    """ Return the (comp_site, site_date) key of each zonal stats record - one key per site visit.
+
+    @param df: dataframe object containing the zonal stats or rainfall zonal stats records.
+    @return visit_key: pandas MultiIndex object containing the visit key of each record.
+    """
+
+    import pandas as pd
+
+    return pd.MultiIndex.from_frame(df[['comp_site', 'site_date']].astype(str))
+
+
+def merge_csv_dir_fn(previous_dir, new_dir):
+    """ Merge the zonal stats csv files of the previous run into the new run directory (per Landsat tile). Records of
+    site visits (comp_site and site_date) processed in the new run replace the previous records of those visits, the
+    earlier visits of a revisited site are kept.
+
+    @param previous_dir: string object containing the path to the previous run sub-directory.
+    @param new_dir: string object containing the path to the new run sub-directory.
+    @return output_list: list object containing the paths to the merged (or copied) csv files of the new run.
+    """
+
+    import pandas as pd
+
+    new_tile_dict = {}
+    output_list = []
+
+    for file_path in glob.glob(os.path.join(new_dir, '*.csv')):
+        new_tile_dict[tile_from_file_name_fn(os.path.basename(file_path))] = file_path
+
+    for file_path in glob.glob(os.path.join(previous_dir, '*.csv')):
+        tile = tile_from_file_name_fn(os.path.basename(file_path))
+
+        if tile in new_tile_dict:
+            new_df = pd.read_csv(new_tile_dict[tile])
+            previous_df = pd.read_csv(file_path)
+            previous_df = previous_df.loc[~visit_key_fn(previous_df).isin(visit_key_fn(new_df))]
+            merged_df = pd.concat([new_df, previous_df], ignore_index=True, sort=False)
+            merged_df.to_csv(new_tile_dict[tile], index=False)
+            output_list.append(new_tile_dict[tile])
+        else:
+            shutil.copy(file_path, new_dir)
+            output_list.append(os.path.join(new_dir, os.path.basename(file_path)))
+
+    return output_list
+
+
+def merge_plot_dir_fn(previous_dir, new_dir):
+    """ Copy the previous run plots into the new run directory, excluding the plots already in the new run directory
+    (the plots of the sites processed in the new run are re-created and replace the copies).
+
+    @param previous_dir: string object containing the path to the previous run plot sub-directory.
+    @param new_dir: string object containing the path to the new run plot sub-directory.
+    """
+
+    for file_path in glob.glob(os.path.join(previous_dir, '*.*')):
+        file_name = os.path.basename(file_path)
+
+        if not os.path.exists(os.path.join(new_dir, file_name)):
+            shutil.copy(file_path, new_dir)
+
+
+def merge_previous_outputs_fn(ledger, export_dir_path):
+    """ Merge the zonal stats, rainfall, plot and sort_site_df outputs of the last run recorded in the ledger into the
+    current run directory (before the plots are created - the plots of the new run replace the previous plots). The
+    Parquet dataset (--parquet) of the merged tiles is re-written from the merged csv files.
+
+    @param ledger: dictionary object containing the processed files, records and the last run directory.
+    @param export_dir_path: string object containing the path to the current run directory.
+    """
+
+    import zonal_stats_parquet
+
+    previous_run = previous_run_fn(ledger, export_dir_path)
+
+    if previous_run is None:
+        print('There are no previous outputs to merge.')
+
+    else:
+        print('Merging the outputs of the previous run: ', previous_run)
+
+        for folder, kind in MERGE_CSV_FOLDER_LIST:
+            previous_dir = os.path.join(previous_run, folder)
+            new_dir = os.path.join(export_dir_path, folder)
+            if os.path.isdir(previous_dir) and os.path.isdir(new_dir):
+                for output_csv in merge_csv_dir_fn(previous_dir, new_dir):
+                    if zonal_stats_parquet.enabled_fn():
+                        import pandas as pd
+                        zonal_stats_parquet.write_partitions_fn(
+                            pd.read_csv(output_csv), export_dir_path, kind,
+                            tile_from_file_name_fn(os.path.basename(output_csv)))
+
+        for folder in MERGE_PLOT_FOLDER_LIST:
+            previous_dir = os.path.join(previous_run, folder)
+            new_dir = os.path.join(export_dir_path, folder)
+            if os.path.isdir(previous_dir):
+                if not os.path.isdir(new_dir):
+                    os.makedirs(new_dir)
+                merge_plot_dir_fn(previous_dir, new_dir)
+
+        for pattern in MERGE_ROOT_PATTERN_LIST:
+            for file_path in glob.glob(os.path.join(previous_run, pattern)):
+                if not os.path.exists(os.path.join(export_dir_path, os.path.basename(file_path))):
+                    shutil.copy(file_path, export_dir_path)
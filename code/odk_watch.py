@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""
+odk_watch.py
+============
+
+Description: This script runs the fractional cover zonal stats pipeline in watch mode (step1_1 command argument
+--watch). The pipeline process stays running and:
+
+1. Polls the ODK directory (command argument --directory_odk) every --poll_interval seconds for star transect csv files
+that are new or have changed (size or modification time). Polling is used rather than file system notifications as
+the ODK directory is usually on a network drive.
+
+2. Waits until the new or changed files have not changed for --debounce seconds (uploads in progress are not read),
+then runs the pipeline as an incremental run (--incremental) - only the new or changed sites are processed and the
+outputs of the previous run are merged into the new run directory.
+
+3. Keeps the loaded modules and the in memory caches warm between batches (pastoral estate index, derived Landsat tile
+grid and Landsat scene catalogue), so a batch only pays for the new sites.
+
+A failed batch is retried with an increasing delay (the state ledger is only updated by a successful batch). Stop the
+watch with Ctrl+C.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import copy
+import time
+import traceback
+from datetime import datetime
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# file name ending of the ODK star transect csv files (step1_3).
+ODK_SEARCH_CRITERIA = 'star_transect.csv'
+
+# minimum number of seconds between the start of two batches (run directories are named by the minute).
+MIN_BATCH_INTERVAL = 60
+
+# maximum delay (seconds) before a failed batch is retried.
+MAX_RETRY_DELAY = 3600
+
+
+def odk_snapshot_fn(directory_odk):
+    """ Record the size and modification time of every ODK star transect csv within the ODK directory.
+
+    @param directory_odk: string object containing the path to the ODK directory.
+    @return snapshot: dictionary object containing the file path (key) and a (size, modification time) tuple (value).
+    """
+
+    snapshot = {}
+
+    for root, dirs, files in os.walk(directory_odk):
+        for file in files:
+            if file.endswith(ODK_SEARCH_CRITERIA):
+                file_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    # the file was moved or deleted during the walk.
+                    continue
+                snapshot[file_path] = (stat.st_size, stat.st_mtime)
+
+    return snapshot
+
+
+def changed_files_fn(processed, snapshot):
+    """ Return the files that are new or have changed since the last batch.
+
+    @param processed: dictionary object containing the snapshot of the files processed by the last batch.
+    @param snapshot: dictionary object containing the current snapshot of the ODK directory.
+    @return changed_list: sorted list object containing the paths of the new or changed files.
+    """
+
+    return sorted(file_path for file_path, signature in snapshot.items() if processed.get(file_path) != signature)
+
+
+def update_settle_fn(settle_dict, snapshot, changed_list, now):
+    """ Record when each new or changed file last changed (the debounce timer restarts every time a file changes).
+
+    @param settle_dict: dictionary object containing the file path (key) and a (signature, time first seen) tuple.
+    @param snapshot: dictionary object containing the current snapshot of the ODK directory.
+    @param changed_list: list object containing the paths of the new or changed files.
+    @param now: float object containing the current time (seconds).
+    @return settle_dict: dictionary object containing the pending files only.
+    """
+
+    updated_dict = {}
+
+    for file_path in changed_list:
+        signature, seen = settle_dict.get(file_path, (None, now))
+        if signature != snapshot[file_path]:
+            seen = now
+        updated_dict[file_path] = (snapshot[file_path], seen)
+
+    return updated_dict
+
+
+def settled_fn(settle_dict, now, debounce):
+    """ Determine if every pending file has not changed for the debounce period. """
+
+    return bool(settle_dict) and all(now - seen >= debounce for signature, seen in settle_dict.values())
+
+
+def batch_args_fn(cmd_args):
+    """ Return the command arguments of a batch (an incremental run, not a watch). """
+
+    batch_args = copy.copy(cmd_args)
+    batch_args.incremental = True
+    batch_args.watch = False
+
+    return batch_args
+
+
+def run_batch_fn(cmd_args, run_fn, changed_list):
+    """ Run the pipeline over the new or changed ODK files.
+
+    @param cmd_args: argparse namespace object containing the step1_1 command arguments.
+    @param run_fn: function object that runs the pipeline (step1_1 main_routine) from the command arguments.
+    @param changed_list: list object containing the paths of the new or changed files.
+    @return success: boolean object, True if the batch completed.
+    """
+
+    print('=' * 50)
+    print('Watch - new or changed ODK files: {0} ({1})'.format(len(changed_list), datetime.now()))
+    for file_path in changed_list:
+        print(' - ', file_path)
+    print('=' * 50)
+
+    try:
+        run_fn(batch_args_fn(cmd_args))
+
+    except (Exception, SystemExit):
+        # a failed batch must not stop the watch (the stages call sys.exit on some input errors).
+        traceback.print_exc()
+        print('Watch - the batch failed and will be retried.')
+        return False
+
+    return True
+
+
+def watch_fn(cmd_args, run_fn):
+    """ Poll the ODK directory and run the pipeline over new or changed ODK files once they have settled.
+
+    @param cmd_args: argparse namespace object containing the step1_1 command arguments (directory_odk, poll_interval
+    and debounce).
+    @param run_fn: function object that runs the pipeline (step1_1 main_routine) from the command arguments.
+    """
+
+    directory_odk = cmd_args.directory_odk
+    poll_interval = max(1, cmd_args.poll_interval)
+    debounce = max(0, cmd_args.debounce)
+
+    processed = {}
+    settle_dict = {}
+    last_batch = 0.0
+    retry_at = 0.0
+    failures = 0
+
+    print('Watching: ', directory_odk, ' - poll interval (s): ', poll_interval, ' debounce (s): ', debounce)
+
+    try:
+        while True:
+            now = time.time()
+            snapshot = odk_snapshot_fn(directory_odk)
+            changed_list = changed_files_fn(processed, snapshot)
+            settle_dict = update_settle_fn(settle_dict, snapshot, changed_list, now)
+
+            if settled_fn(settle_dict, now, debounce) and now >= retry_at and \
+                    now - last_batch >= MIN_BATCH_INTERVAL:
+                last_batch = now
+                if run_batch_fn(cmd_args, run_fn, changed_list):
+                    # the files are recorded as they were when the batch started (later changes are picked up next).
+                    processed.update({file_path: snapshot[file_path] for file_path in changed_list})
+                    # files that were removed are forgotten (they are processed again if they return).
+                    processed = {file_path: signature for file_path, signature in processed.items()
+                                 if file_path in snapshot}
+                    settle_dict = {}
+                    failures = 0
+                    print('Watch - waiting for new ODK files: ', directory_odk)
+                else:
+                    failures += 1
+                    retry_at = time.time() + min(MAX_RETRY_DELAY, poll_interval * 2 ** failures)
+
+            time.sleep(poll_interval)
+
+    except KeyboardInterrupt:
+        print('Watch stopped.')
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+pastoral_estate_index.py
+========================
+
+Description: This script reads the NT Pastoral Estate shapefile once per run and creates a property lookup index that
+is shared by every stage of the pipeline (step1_3, step2_1 and step2_3).
+
+The index is memoized on the absolute shapefile path (and the shapefile size and modification time), so repeated calls
+within the same process return the index that was created by the first call instead of re-reading the shapefile, and a
+long running process (step1_1 --watch) re-reads the shapefile when it is replaced.
+
+The index contains:
+ - name_tag_dict: normalised property name -> property tag.
+ - tag_name_dict: normalised property tag -> property name.
+ - name_dist_dict: normalised property name -> pastoral district.
+ - prop_tag_dict: property name (as per the shapefile) -> property tag.
+ - prop_dist_dict: property name (as per the shapefile) -> pastoral district.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+from collections import namedtuple
+import warnings
+
+warnings.filterwarnings("ignore")
+
+EstateIndex = namedtuple('EstateIndex', ['name_tag_dict', 'tag_name_dict', 'name_dist_dict', 'prop_tag_dict',
+                                         'prop_dist_dict'])
+
+# estate indexes created during this run, keyed by the absolute path, size and modification time of the shapefile.
+_estate_index_cache = {}
+
+
+def string_clean_upper_fn(dirty_string):
+    """ Remove whitespaces and clean strings.
+
+    @param dirty_string: string object that may have whitespaces, - or _.
+    @return clean_string: processed string object.
+    """
+
+    str1 = str(dirty_string).replace('_', ' ')
+    str2 = str1.replace('-', ' ')
+    str3 = str2.upper()
+    clean_string = str3.strip()
+    return clean_string
+
+
+def build_estate_index_fn(pastoral_estate):
+    """ Read in the pastoral estate shapefile and create the property lookup dictionaries.
+
+    @param pastoral_estate: string object containing the path to the NT Pastoral Estate shapefile.
+    @return estate_index: EstateIndex named tuple containing the property lookup dictionaries.
+    """
+
+    import geopandas as gpd
+
+    print('Reading in the pastoral estate: ', pastoral_estate)
+    estate = gpd.read_file(pastoral_estate)
+
+    prop_tag_dict = dict(zip(estate.PROPERTY, estate.PROP_TAG))
+    prop_dist_dict = dict(zip(estate.PROPERTY, estate.DISTRICT))
+
+    name_tag_dict = {}
+    tag_name_dict = {}
+    name_dist_dict = {}
+
+    for prop, prop_tag, district in zip(estate.PROPERTY, estate.PROP_TAG, estate.DISTRICT):
+        clean_prop = string_clean_upper_fn(prop)
+        clean_tag = string_clean_upper_fn(prop_tag)
+
+        # retain the first occurrence - matches the previous .iloc[0] behaviour.
+        name_tag_dict.setdefault(clean_prop, prop_tag)
+        tag_name_dict.setdefault(clean_tag, prop)
+        name_dist_dict.setdefault(clean_prop, district)
+
+    estate_index = EstateIndex(name_tag_dict, tag_name_dict, name_dist_dict, prop_tag_dict, prop_dist_dict)
+
+    return estate_index
+
+
+def estate_index_fn(pastoral_estate):
+    """ Return the property lookup index for the pastoral estate shapefile, reading the shapefile on the first call only.
+
+    @param pastoral_estate: string object containing the path to the NT Pastoral Estate shapefile.
+    @return estate_index: EstateIndex named tuple containing the property lookup dictionaries.
+    """
+
+    stat = os.stat(pastoral_estate)
+    key = (os.path.abspath(pastoral_estate), stat.st_size, stat.st_mtime)
+
+    if key not in _estate_index_cache:
+        _estate_index_cache[key] = build_estate_index_fn(pastoral_estate)
+
+    return _estate_index_cache[key]
+
+
+def prop_tag_lookup_fn(estate_index, prop):
+    """ Return the property tag for a property name, or an empty string if the property is not in the estate.
+
+    @param estate_index: EstateIndex named tuple containing the property lookup dictionaries.
+    @param prop: string object containing the property name.
+    @return prop_tag: string object containing the property tag.
+    """
+
+    return estate_index.name_tag_dict.get(string_clean_upper_fn(prop), '')
+
+
+def prop_name_lookup_fn(estate_index, prop_tag):
+    """ Return the property name for a property tag, or the cleaned tag if the tag is not in the estate.
+
+    @param estate_index: EstateIndex named tuple containing the property lookup dictionaries.
+    @param prop_tag: string object containing the property tag.
+    @return prop_name: string object containing the property name.
+    """
+
+    clean_tag = string_clean_upper_fn(prop_tag)
+
+    return estate_index.tag_name_dict.get(clean_tag, clean_tag)
+
+
+def prop_district_lookup_fn(estate_index, prop):
+    """ Return the pastoral district for a property name, or an empty string if the property is not in the estate.
+
+    @param estate_index: EstateIndex named tuple containing the property lookup dictionaries.
+    @param prop: string object containing the property name.
+    @return district: string object containing the pastoral district.
+    """
+
+    return estate_index.name_dist_dict.get(string_clean_upper_fn(prop), '')
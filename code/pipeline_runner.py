@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+"""
+pipeline_runner.py
+==================
+
+Description: This script runs the stages of the fractional cover zonal stats pipeline (step1_1) as a stage graph and
+records each completed stage in a run manifest (run_manifest.json) within the run (export) directory.
+
+For each stage the manifest records:
+ - input_hash: a hash of the stage inputs (command arguments, input file signatures and the keys of the upstream
+   stages the stage depends on).
+ - outputs: the output files of the stage (relative to the run directory) and their content (sha1) hashes.
+ - key: a hash of the stage input hash and output hashes, used as an input by the downstream stages.
+ - the stage state (return values) is pickled to the run directory (.checkpoints sub-directory).
+
+When the pipeline is run with --resume <run_dir>, every stage whose inputs are unchanged and whose outputs are complete
+(present and unchanged) is skipped and its state is loaded from the checkpoint, so a failed run restarts from the stage
+that failed.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import json
+import glob
+import pickle
+import hashlib
+from datetime import datetime
+import odk_ingest
+import run_report
+import warnings
+
+warnings.filterwarnings("ignore")
+
+RUN_MANIFEST_NAME = 'run_manifest.json'
+CHECKPOINT_DIR_NAME = '.checkpoints'
+
+
+def load_manifest_fn(export_dir_path, resume=False):
+    """ Read in the run manifest from the run directory (resume), or create an empty run manifest.
+
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param resume: boolean object, True if the run directory is being resumed.
+    @return manifest: dictionary object containing the completed stages of the run.
+    """
+
+    manifest_path = os.path.join(export_dir_path, RUN_MANIFEST_NAME)
+
+    if resume and os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        print('Resuming run: ', export_dir_path, ' - recorded stages: ', len(manifest['stages']))
+    else:
+        if resume:
+            print('There is no run manifest to resume - all stages will be run: ', manifest_path)
+        manifest = {'version': 1, 'run_dir': export_dir_path, 'stages': {}}
+
+    manifest['resume'] = bool(resume)
+
+    return manifest
+
+
+def save_manifest_fn(manifest, export_dir_path):
+    """ Write the run manifest to the run directory.
+
+    @param manifest: dictionary object containing the completed stages of the run.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    """
+
+    manifest_path = os.path.join(export_dir_path, RUN_MANIFEST_NAME)
+    output = {key: value for key, value in manifest.items() if key != 'resume'}
+
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(output, manifest_file, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def hash_object_fn(value):
+    """ Calculate the sha1 hash of a json serialisable object (non serialisable values are converted to strings).
+
+    @param value: object to be hashed (i.e. dictionary of stage inputs).
+    @return hex_digest: string object containing the sha1 hash.
+    """
+
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def file_signature_fn(path):
+    """ Create a fast signature (size and modification time) of a file, or of every file within a directory.
+
+    @param path: string object containing the path to a file or directory.
+    @return signature: string object containing the sha1 hash of the signature, or None if the path does not exist.
+    """
+
+    if path is None or not os.path.exists(str(path)):
+        return None
+
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return hash_object_fn([os.path.basename(path), stat.st_size, stat.st_mtime])
+
+    signature_list = []
+    for root, dirs, files in os.walk(path):
+        for file in sorted(files):
+            stat = os.stat(os.path.join(root, file))
+            signature_list.append([os.path.relpath(os.path.join(root, file), path), stat.st_size, stat.st_mtime])
+
+    return hash_object_fn(sorted(signature_list))
+
+
+def relative_path_fn(path, export_dir_path):
+    """ Return the path of an output file relative to the run directory (with '/' separators), so the manifest remains
+    valid when the run directory is moved or reached through a different path (i.e. drive letter or UNC path).
+    Paths recorded by earlier versions (absolute) are converted.
+
+    @param path: string object containing the absolute or relative path to the output file.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @return relative_path: string object containing the path relative to the run directory.
+    """
+
+    if os.path.isabs(path):
+        path = os.path.relpath(path, export_dir_path)
+
+    return path.replace('\\', '/')
+
+
+def output_hash_fn(output_list, export_dir_path):
+    """ Calculate the content (sha1) hash of each output file.
+
+    @param output_list: list object containing the paths to the stage output files.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @return output_hash_dict: dictionary object containing the output path relative to the run directory (key) and
+    sha1 hash (value).
+    """
+
+    return {relative_path_fn(path, export_dir_path): odk_ingest.file_hash_fn(path)
+            for path in output_list if os.path.isfile(path)}
+
+
+def glob_output_fn(directory, search_criteria):
+    """ Return the files within a directory matching the search criteria (i.e. the outputs of a stage).
+
+    @param directory: string object containing the path to the directory.
+    @param search_criteria: string object containing the glob search criteria (i.e. '*.csv').
+    @return output_list: sorted list object containing the matching file paths.
+    """
+
+    return sorted(glob.glob(os.path.join(directory, search_criteria)))
+
+
+def checkpoint_path_fn(export_dir_path, stage):
+    """ Return the path to the pickled stage state.
+
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param stage: string object containing the stage name.
+    @return checkpoint_path: string object containing the path to the stage checkpoint.
+    """
+
+    return os.path.join(export_dir_path, CHECKPOINT_DIR_NAME, stage + '.pkl')
+
+
+def stage_key_fn(manifest, stage):
+    """ Return the key of a completed stage (used as an input by the downstream stages).
+
+    @param manifest: dictionary object containing the completed stages of the run.
+    @param stage: string object containing the stage name.
+    @return key: string object containing the stage key, or None if the stage has not been completed.
+    """
+
+    record = manifest['stages'].get(stage)
+
+    return record['key'] if record else None
+
+
+def stage_complete_fn(manifest, export_dir_path, stage, input_hash):
+    """ Determine if a stage can be skipped - the inputs are unchanged and the outputs are present and unchanged.
+
+    @param manifest: dictionary object containing the completed stages of the run.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param stage: string object containing the stage name.
+    @param input_hash: string object containing the hash of the current stage inputs.
+    @return complete: boolean object, True if the stage can be skipped.
+    """
+
+    record = manifest['stages'].get(stage)
+
+    if record is None or record['status'] != 'complete' or record['input_hash'] != input_hash:
+        return False
+
+    if not os.path.exists(checkpoint_path_fn(export_dir_path, stage)):
+        return False
+
+    # absolute paths (earlier manifests) are relative to the run directory they were recorded in.
+    record_dir = manifest.get('run_dir', export_dir_path)
+
+    for relative_path, file_hash in record['outputs'].items():
+        path = os.path.join(export_dir_path, relative_path_fn(relative_path, record_dir))
+        if not os.path.isfile(path) or odk_ingest.file_hash_fn(path) != file_hash:
+            return False
+
+    return True
+
+
+def stage_resume_fn(manifest, export_dir_path, stage, input_hash):
+    """ Load the stage state from the checkpoint if the run is being resumed and the stage is complete.
+
+    @param manifest: dictionary object containing the completed stages of the run.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param stage: string object containing the stage name.
+    @param input_hash: string object containing the hash of the current stage inputs.
+    @return skip: boolean object, True if the stage is complete and can be skipped.
+    @return state: the stage state loaded from the checkpoint, or None.
+    """
+
+    if manifest['resume'] and stage_complete_fn(manifest, export_dir_path, stage, input_hash):
+        print('Stage complete (resume) - skipped: ', stage)
+        with open(checkpoint_path_fn(export_dir_path, stage), 'rb') as checkpoint_file:
+            return True, pickle.load(checkpoint_file)
+
+    return False, None
+
+
+def record_stage_fn(manifest, export_dir_path, stage, input_hash, state, output_list, start=None):
+    """ Checkpoint the stage state and record the completed stage in the run manifest.
+
+    @param manifest: dictionary object containing the completed stages of the run.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param stage: string object containing the stage name.
+    @param input_hash: string object containing the hash of the stage inputs.
+    @param state: the stage state (return value of the stage).
+    @param output_list: list object containing the paths to the stage output files.
+    @param start: datetime object containing the stage start time.
+    """
+
+    checkpoint_path = checkpoint_path_fn(export_dir_path, stage)
+    output_hash_dict = output_hash_fn(output_list, export_dir_path)
+
+    if not os.path.exists(os.path.dirname(checkpoint_path)):
+        os.makedirs(os.path.dirname(checkpoint_path))
+    with open(checkpoint_path + '.tmp', 'wb') as checkpoint_file:
+        pickle.dump(state, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+    manifest['stages'][stage] = {'status': 'complete',
+                                 'input_hash': input_hash,
+                                 'outputs': output_hash_dict,
+                                 'key': hash_object_fn([input_hash, output_hash_dict,
+                                                        odk_ingest.file_hash_fn(checkpoint_path)]),
+                                 'started': str(start),
+                                 'finished': str(datetime.now())}
+    save_manifest_fn(manifest, export_dir_path)
+
+
+def run_stage_fn(manifest, export_dir_path, stage, input_dict, stage_fn, output_fn=None, report=None):
+    """ Run a stage of the pipeline, or load the stage state from the checkpoint if the stage is complete (resume).
+
+    @param manifest: dictionary object containing the completed stages of the run.
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param stage: string object containing the stage name.
+    @param input_dict: dictionary object containing the stage inputs (arguments, file signatures and upstream keys).
+    @param stage_fn: function object (no arguments) that runs the stage and returns the stage state.
+    @param output_fn: function object that returns a list of the stage output files from the stage state, or None.
+    @param report: dictionary object containing the run report (run_report), or None.
+    @return state: the stage state (return value of stage_fn).
+    """
+
+    input_hash = hash_object_fn(input_dict)
+
+    skip, state = stage_resume_fn(manifest, export_dir_path, stage, input_hash)
+    if skip:
+        run_report.record_stage_fn(report, stage, {}, 'skipped')
+        return state
+
+    start = datetime.now()
+    state, metrics = run_report.measure_fn(stage_fn)
+
+    output_list = output_fn(state) if output_fn is not None else []
+    record_stage_fn(manifest, export_dir_path, stage, input_hash, state, output_list, start)
+
+    run_report.record_stage_fn(report, stage, run_report.add_counts_fn(metrics, output_list=output_list))
+    run_report.save_report_fn(report, export_dir_path)
+
+    return state
@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+
+"""
+raster_staging.py
+=================
+
+Description: This script stages the Landsat scenes and rainfall images read by the pipeline from the network drive to
+a local staging directory (step1_1 command argument --staging_dir), so each raster is copied across the network once
+and every later read (the three bands of a scene, the rainfall images of every tile and later runs) is served from the
+local disk.
+
+1. staged_raster_fn (staged_path_fn) returns the local copy of a raster, copying it (and its sidecar files, i.e. the .ige of a large
+.img) on first use. A local copy is only used while the size and modification time of the network raster are unchanged.
+
+2. The staging directory is limited to --staging_size MB - before a copy is made its space is reserved, deleting the
+least recently used copies that are not being read (readers pin the copy with staged_raster_fn). When the copies being
+read leave no room, the raster is read from the network drive rather than exceeding the limit. The space is reserved
+and the copies are pinned while holding a lock file, as the tile and scene queue worker processes share the directory.
+
+3. prefetch_fn copies a list of rasters in a background thread (i.e. the scenes of the next tile while the current
+tile is being processed). Only the rasters (in list order) that fit within the size limit, less the rasters reserved
+for the running tiles, are copied - so the prefetch does not evict the scenes still being read.
+
+The settings are held in environment variables so they are inherited by the tile worker and scene queue worker
+processes; workers started by hand on another machine may set RMB_STAGING_DIR (and RMB_STAGING_SIZE) to use a local
+staging directory.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import json
+import time
+import shutil
+import hashlib
+import itertools
+import threading
+import contextlib
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# environment variables holding the staging settings (inherited by the worker processes).
+STAGING_DIR_ENV = 'RMB_STAGING_DIR'
+STAGING_SIZE_ENV = 'RMB_STAGING_SIZE'
+
+# default size limit (MB) of the staging directory.
+DEFAULT_STAGING_SIZE = 20000
+
+# name of the file recording the network raster of a staged copy (its modification time records the last use).
+ENTRY_FILE_NAME = 'entry.json'
+
+# sidecar file extensions copied with a raster (appended to the raster path or replacing its extension).
+SIDECAR_LIST = ['.aux.xml', '.ovr', '.ige', '.rrd', '.aux']
+
+# lock file of the staging directory (held while space is reserved, copies are evicted and copies are pinned).
+LOCK_FILE_NAME = 'staging.lock'
+
+# a lock held for longer than this number of seconds was left by a stopped process.
+LOCK_TIMEOUT = 60
+
+# name prefix of the pin files of a staged copy (one per read in progress - a pinned copy is not evicted).
+PIN_PREFIX = 'pin.'
+
+# name of the file recording the space reserved by a copy in progress.
+RESERVE_FILE_NAME = 'reserve.json'
+
+# a pin or copy in progress older than this number of seconds was left by a stopped process.
+STALE_TIMEOUT = 6 * 3600
+
+# only one thread of a process copies a raster at a time (prefetch and stage requests of the same raster).
+_copy_lock = threading.Lock()
+
+# pin file counter (unique pin names within a thread).
+_pin_counter = itertools.count()
+
+
+def configure_fn(staging_dir, staging_size=DEFAULT_STAGING_SIZE):
+    """ Store the staging settings in the environment (step1_1 command arguments).
+
+    @param staging_dir: string object containing the path to the local staging directory, or None to disable staging.
+    @param staging_size: integer object containing the size limit (MB) of the staging directory.
+    """
+
+    if staging_dir is None or str(staging_dir) == 'None':
+        return
+
+    if not os.path.exists(staging_dir):
+        os.makedirs(staging_dir)
+
+    os.environ[STAGING_DIR_ENV] = os.path.abspath(staging_dir)
+    os.environ[STAGING_SIZE_ENV] = str(int(staging_size))
+    print('Staging rasters to: ', os.environ[STAGING_DIR_ENV], ' - size limit (MB): ', staging_size)
+
+
+def staging_dir_fn():
+    """ Return the staging directory, or None if staging is disabled. """
+
+    return os.environ.get(STAGING_DIR_ENV) or None
+
+
+def sidecar_list_fn(path):
+    """ Return the sidecar files of a raster that exist (i.e. 101077.img -> 101077.ige, 101077.img.aux.xml).
+
+    @param path: string object containing the path to the raster.
+    @return sidecar_list: list object containing the paths to the sidecar files.
+    """
+
+    root = os.path.splitext(path)[0]
+    candidate_list = [path + extension for extension in SIDECAR_LIST] + [root + extension for extension in SIDECAR_LIST]
+
+    return [candidate for candidate in sorted(set(candidate_list)) if os.path.isfile(candidate)]
+
+
+def source_signature_fn(path):
+    """ Return the size and modification time of a network raster (used to detect a replaced raster). """
+
+    stat = os.stat(path)
+
+    return [stat.st_size, stat.st_mtime]
+
+
+def source_size_fn(path):
+    """ Return the size (bytes) of a network raster and its sidecar files, or 0 if the raster can not be read. """
+
+    try:
+        return sum(os.path.getsize(file_path) for file_path in [path] + sidecar_list_fn(path))
+    except (IOError, OSError):
+        return 0
+
+
+def entry_dir_fn(staging_dir, path):
+    """ Return the staging sub-directory of a raster (named by the hash of the absolute network path). """
+
+    return os.path.join(staging_dir, hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest())
+
+
+def read_entry_fn(entry_dir):
+    """ Read the entry of a staged copy, or None if there is no complete copy. """
+
+    try:
+        with open(os.path.join(entry_dir, ENTRY_FILE_NAME), 'r') as entry_file:
+            return json.load(entry_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def staging_lock_fn(staging_dir):
+    """ Hold the staging directory lock (a lock file shared by the threads and processes using the directory) while the
+    space is reserved, copies are evicted and staged copies are pinned.
+
+    @param staging_dir: string object containing the path to the local staging directory.
+    """
+
+    lock_path = os.path.join(staging_dir, LOCK_FILE_NAME)
+
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                # the lock of a stopped process is removed.
+                if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            time.sleep(0.05)
+
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+def pin_name_fn():
+    """ Return a unique pin file name for the current thread. """
+
+    return '{0}{1}.{2}.{3}'.format(PIN_PREFIX, os.getpid(), threading.current_thread().ident, next(_pin_counter))
+
+
+def pinned_fn(entry_dir, now):
+    """ Determine if a staged copy is being read (a pin file that is not stale). """
+
+    for name in os.listdir(entry_dir):
+        if name.startswith(PIN_PREFIX) and now - os.path.getmtime(os.path.join(entry_dir, name)) < STALE_TIMEOUT:
+            return True
+
+    return False
+
+
+def evict_fn(staging_dir, size_limit, required=0):
+    """ Delete the least recently used staged copies that are not pinned (being read) until the staging directory,
+    including the space reserved by the copies in progress, has room for the required bytes within the size limit.
+    Called while holding the staging directory lock.
+
+    @param staging_dir: string object containing the path to the local staging directory.
+    @param size_limit: integer object containing the size limit (MB) of the staging directory.
+    @param required: integer object containing the bytes to be added.
+    @return room: boolean object, True if the required bytes fit within the size limit.
+    """
+
+    now = time.time()
+    entry_list = []
+    total = 0
+
+    for name in os.listdir(staging_dir):
+        entry_dir = os.path.join(staging_dir, name)
+        if not os.path.isdir(entry_dir):
+            continue
+
+        if name.endswith('.tmp'):
+            # a copy in progress - its reserved size counts (the copy of a stopped process is removed).
+            try:
+                with open(os.path.join(entry_dir, RESERVE_FILE_NAME), 'r') as reserve_file:
+                    reserved = json.load(reserve_file)['size']
+                if now - os.path.getmtime(entry_dir) < STALE_TIMEOUT:
+                    total += reserved
+                    continue
+            except (IOError, OSError, ValueError):
+                pass
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            continue
+
+        entry = read_entry_fn(entry_dir)
+        if entry is not None:
+            total += entry['size']
+            if not pinned_fn(entry_dir, now):
+                entry_list.append((os.path.getmtime(os.path.join(entry_dir, ENTRY_FILE_NAME)), entry['size'],
+                                   entry_dir))
+
+    limit = size_limit * 1048576.0
+
+    for last_used, size, entry_dir in sorted(entry_list):
+        if total + required <= limit:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+
+    return total + required <= limit
+
+
+def copy_to_staging_fn(staging_dir, path, signature, pin_name=None):
+    """ Copy a raster and its sidecar files to the staging directory, once the space is reserved within the size limit.
+
+    @param staging_dir: string object containing the path to the local staging directory.
+    @param path: string object containing the path to the network raster.
+    @param signature: list object containing the size and modification time of the network raster.
+    @param pin_name: string object containing the pin file name of the copy (it is being read), or None.
+    @return local_path: string object containing the path to the staged copy, or None if the raster does not fit
+    within the size limit (the copies of the staging directory are being read).
+    """
+
+    entry_dir = entry_dir_fn(staging_dir, path)
+    # the copy is made in a temporary directory and moved into place, so a partial copy is never read.
+    temp_dir = '{0}.{1}.{2}.tmp'.format(entry_dir, os.getpid(), threading.current_thread().ident)
+    size = source_size_fn(path)
+
+    with staging_lock_fn(staging_dir):
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+        if os.path.exists(entry_dir) and pinned_fn(entry_dir, time.time()):
+            # the previous copy of a replaced raster is being read.
+            return None
+        if not evict_fn(staging_dir, int(os.environ.get(STAGING_SIZE_ENV, DEFAULT_STAGING_SIZE)), size):
+            return None
+
+        # reserve the space of the copy.
+        os.makedirs(temp_dir)
+        with open(os.path.join(temp_dir, RESERVE_FILE_NAME), 'w') as reserve_file:
+            json.dump({'size': size}, reserve_file)
+
+    try:
+        for file_path in [path] + sidecar_list_fn(path):
+            shutil.copyfile(file_path, os.path.join(temp_dir, os.path.basename(file_path)))
+
+        with open(os.path.join(temp_dir, ENTRY_FILE_NAME), 'w') as entry_file:
+            json.dump({'source': os.path.abspath(path), 'signature': signature, 'size': size}, entry_file)
+        os.remove(os.path.join(temp_dir, RESERVE_FILE_NAME))
+
+        if pin_name is not None:
+            # pinned before it is moved into place, so it can not be evicted before it is read.
+            open(os.path.join(temp_dir, pin_name), 'w').close()
+
+        with staging_lock_fn(staging_dir):
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(temp_dir, entry_dir)
+
+    except OSError:
+        # the copy failed (i.e. the local disk is full) - the network raster is read.
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    return os.path.join(entry_dir, os.path.basename(path))
+
+
+def stage_fn(path, pin=False):
+    """ Return the local copy of a network raster, staging the raster on first use.
+
+    @param path: string object containing the path to the network raster.
+    @param pin: boolean object, True to pin the copy (it is not evicted until it is unpinned - unpin_fn).
+    @return local_path: string object containing the path to the raster to be read (the network path when staging is
+    disabled or the raster can not be staged within the size limit).
+    @return pin_path: string object containing the path to the pin file, or None.
+    """
+
+    staging_dir = staging_dir_fn()
+    if staging_dir is None:
+        return path, None
+
+    pin_name = pin_name_fn() if pin else None
+
+    def staged_entry_fn(entry_dir, signature):
+        # the current copy of the raster (pinned), or None if there is no current copy.
+        with staging_lock_fn(staging_dir):
+            entry = read_entry_fn(entry_dir)
+            if entry is None or entry['signature'] != signature:
+                return None
+
+            # record the use of the copy (least recently used eviction).
+            os.utime(os.path.join(entry_dir, ENTRY_FILE_NAME), None)
+            if pin_name is None:
+                return os.path.join(entry_dir, os.path.basename(path)), None
+            open(os.path.join(entry_dir, pin_name), 'w').close()
+            return os.path.join(entry_dir, os.path.basename(path)), os.path.join(entry_dir, pin_name)
+
+    try:
+        signature = source_signature_fn(path)
+        entry_dir = entry_dir_fn(staging_dir, path)
+
+        staged = staged_entry_fn(entry_dir, signature)
+        if staged is not None:
+            return staged
+
+        with _copy_lock:
+            # another thread of the process may have staged the raster.
+            staged = staged_entry_fn(entry_dir, signature)
+            if staged is not None:
+                return staged
+            local_path = copy_to_staging_fn(staging_dir, path, signature, pin_name)
+
+        if local_path is None:
+            print('Raster staging is full (--staging_size) - reading from the network: ', path)
+            return path, None
+
+        return local_path, None if pin_name is None else os.path.join(os.path.dirname(local_path), pin_name)
+
+    except (IOError, OSError) as error:
+        # i.e. the local disk is full - read from the network drive.
+        print('Raster staging failed - reading from the network: ', path, repr(error))
+        return path, None
+
+
+def unpin_fn(pin_path):
+    """ Remove the pin of a staged copy (stage_fn) once it has been read. """
+
+    if pin_path is not None:
+        try:
+            os.remove(pin_path)
+        except OSError:
+            pass
+
+
+@contextlib.contextmanager
+def staged_raster_fn(path):
+    """ Pin the local copy of a network raster while it is read, i.e.
+    with raster_staging.staged_raster_fn(image_s) as local_path: rasterio.open(local_path)
+
+    @param path: string object containing the path to the network raster.
+    """
+
+    local_path, pin_path = stage_fn(path, pin=True)
+    try:
+        yield local_path
+    finally:
+        unpin_fn(pin_path)
+
+
+def staged_path_fn(path):
+    """ Return the path to the local copy of a network raster, staging the raster on first use (the copy is not pinned -
+    used by prefetch_fn; readers use staged_raster_fn). The network path is returned when staging is disabled or the
+    raster can not be staged.
+
+    @param path: string object containing the path to the network raster.
+    @return local_path: string object containing the path to the raster to be read.
+    """
+
+    return stage_fn(path)[0]
+
+
+def prefetch_fn(path_list, reserved_list=None):
+    """ Stage a list of rasters in a background thread. The rasters are copied in list order until the staging
+    directory size limit, less the size of the reserved rasters, is reached.
+
+    @param path_list: list object containing the paths to the network rasters.
+    @param reserved_list: list object containing the paths to the rasters being read (i.e. the scenes of the running
+    tiles), which are kept within the staging directory.
+    @return thread: threading.Thread object copying the rasters, or None if staging is disabled.
+    """
+
+    if staging_dir_fn() is None or not path_list:
+        return None
+
+    def prefetch_thread_fn():
+        # the sizes are read within the thread, so the network drive does not delay the caller.
+        limit = int(os.environ.get(STAGING_SIZE_ENV, DEFAULT_STAGING_SIZE)) * 1048576.0
+        limit -= sum(source_size_fn(path) for path in set(reserved_list or []))
+
+        total = 0
+        for path in path_list:
+            size = source_size_fn(path)
+            if total + size > limit:
+                print('Raster prefetch stopped at the staging size limit: ', path)
+                break
+            total += size
+            staged_path_fn(path)
+
+    thread = threading.Thread(target=prefetch_thread_fn, name='raster_prefetch')
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+
+def list_file_fn(list_path):
+    """ Read the raster paths of a list file (i.e. a tile scene list or the rainfall image list). """
+
+    with open(list_path, 'r') as list_file:
+        return [line.rstrip() for line in list_file if line.strip()]
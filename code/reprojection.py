@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""
+reprojection.py
+===============
+
+Description: This script re-projects the 1ha sites for the pipeline stages (step1_3 UTM zones, step1_5 and step2_5
+GDA94 and step1_7 WGS84) in place of the geopandas to_crs method, which creates a new pyproj transformer and transforms
+the coordinates one geometry at a time on every call.
+
+1. transformer_fn creates one pyproj transformer per source and target crs and thread and keeps it for the life of the
+thread (pyproj transformers can not be shared between threads - the step1_7 rainfall tasks run in a thread pool).
+
+2. transform_geometry_list_fn gathers the coordinates of every geometry (points, lines and polygon rings) into one
+array, transforms the array with a single transformer call and rebuilds the geometries.
+
+3. to_crs_fn memoizes the re-projected geometries by a hash of the input geometries (well known binary) and the target
+crs, so the same site set re-projected again within a process (i.e. each tile of a run) is only transformed once.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# number of re-projected geometry lists held in memory (least recently used are discarded first).
+MEMO_SIZE = 32
+
+# pyproj transformers of each thread (transformer_local.transformer_dict) keyed by the source and target crs.
+transformer_local = threading.local()
+
+# re-projected geometry lists keyed by the geometry hash, source crs and target crs (shared - guarded by memo_lock).
+memo_dict = OrderedDict()
+memo_lock = threading.Lock()
+
+
+def crs_fn(crs):
+    """ Return a pyproj CRS object for a crs (pyproj CRS, epsg integer, 'EPSG:xxxx' string or {'init': ...} dict). """
+    from pyproj import CRS
+
+    return CRS.from_user_input(crs)
+
+
+def transformer_fn(source_crs, target_crs):
+    """ Return the (cached per thread) pyproj transformer between two crs (always x, y - longitude, latitude - order).
+
+    @param source_crs: pyproj CRS object containing the crs of the coordinates.
+    @param target_crs: pyproj CRS object containing the crs to transform the coordinates to.
+    @return transformer: pyproj Transformer object.
+    """
+    from pyproj import Transformer
+
+    transformer_dict = getattr(transformer_local, 'transformer_dict', None)
+    if transformer_dict is None:
+        transformer_dict = transformer_local.transformer_dict = {}
+
+    key = (source_crs.to_wkt(), target_crs.to_wkt())
+    transformer = transformer_dict.get(key)
+    if transformer is None:
+        transformer = transformer_dict[key] = Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+    return transformer
+
+
+def transform_array_fn(x_array, y_array, source_crs, target_crs):
+    """ Transform arrays of coordinates with a single transformer call.
+
+    @param x_array: numpy array object containing the x (longitude / easting) coordinates.
+    @param y_array: numpy array object containing the y (latitude / northing) coordinates.
+    @param source_crs: crs object of the coordinates (any crs_fn input).
+    @param target_crs: crs object to transform the coordinates to (any crs_fn input).
+    @return x_array: numpy array object containing the transformed x coordinates.
+    @return y_array: numpy array object containing the transformed y coordinates.
+    """
+
+    transformer = transformer_fn(crs_fn(source_crs), crs_fn(target_crs))
+    x_array, y_array = transformer.transform(np.asarray(x_array, dtype=float), np.asarray(y_array, dtype=float))
+
+    return np.asarray(x_array), np.asarray(y_array)
+
+
+def sequence_list_fn(geometry):
+    """ Return the coordinate sequences of a geometry (points, lines and polygon rings) in a fixed order. """
+
+    if geometry is None or geometry.is_empty:
+        return []
+
+    geom_type = geometry.geom_type
+    if geom_type in ('Point', 'LineString', 'LinearRing'):
+        return [np.asarray(geometry.coords)]
+
+    if geom_type == 'Polygon':
+        return [np.asarray(geometry.exterior.coords)] + [np.asarray(ring.coords) for ring in geometry.interiors]
+
+    # multi-part geometries and geometry collections.
+    return [sequence for part in geometry.geoms for sequence in sequence_list_fn(part)]
+
+
+def rebuild_fn(geometry, sequence_iter):
+    """ Rebuild a geometry from the transformed coordinate sequences (in the sequence_list_fn order). """
+    from shapely.geometry import Point, LineString, LinearRing, Polygon
+
+    if geometry is None or geometry.is_empty:
+        return geometry
+
+    geom_type = geometry.geom_type
+    if geom_type == 'Point':
+        return Point(next(sequence_iter)[0])
+
+    if geom_type == 'LineString':
+        return LineString(next(sequence_iter))
+
+    if geom_type == 'LinearRing':
+        return LinearRing(next(sequence_iter))
+
+    if geom_type == 'Polygon':
+        exterior = next(sequence_iter)
+        interior_list = [next(sequence_iter) for ring in geometry.interiors]
+        return Polygon(exterior, interior_list)
+
+    # multi-part geometries and geometry collections.
+    return type(geometry)([rebuild_fn(part, sequence_iter) for part in geometry.geoms])
+
+
+def transform_geometry_list_fn(geometry_list, source_crs, target_crs):
+    """ Re-project a list of geometries by transforming all of their coordinates as one array.
+
+    @param geometry_list: list object containing the shapely geometries (None or empty geometries are kept as is).
+    @param source_crs: crs object of the geometries (any crs_fn input).
+    @param target_crs: crs object to re-project the geometries to (any crs_fn input).
+    @return geometry_list: list object containing the re-projected shapely geometries.
+    """
+
+    sequence_list = [sequence for geometry in geometry_list for sequence in sequence_list_fn(geometry)]
+    if len(sequence_list) == 0:
+        return list(geometry_list)
+
+    xy_array = np.concatenate([sequence[:, :2] for sequence in sequence_list])
+    x_array, y_array = transform_array_fn(xy_array[:, 0], xy_array[:, 1], source_crs, target_crs)
+    transformed_array = np.column_stack([x_array, y_array])
+
+    # split the transformed coordinates back into their sequences (z values are kept as is).
+    split_list = np.split(transformed_array, np.cumsum([len(sequence) for sequence in sequence_list])[:-1])
+    transformed_list = []
+    for sequence, transformed in zip(sequence_list, split_list):
+        if sequence.shape[1] > 2:
+            transformed = np.column_stack([transformed, sequence[:, 2:]])
+        transformed_list.append(transformed)
+
+    sequence_iter = iter(transformed_list)
+
+    return [rebuild_fn(geometry, sequence_iter) for geometry in geometry_list]
+
+
+def geometry_hash_fn(geometry_list):
+    """ Create a hash key for a list of geometries from their well known binary.
+
+    @param geometry_list: list object containing the shapely geometries.
+    @return key: string object containing the sha1 hash of the geometries.
+    """
+
+    sha1 = hashlib.sha1()
+    for geometry in geometry_list:
+        sha1.update(b'' if geometry is None else geometry.wkb)
+        sha1.update(b'|')
+
+    return sha1.hexdigest()
+
+
+def to_crs_fn(geo_data, crs=None, epsg=None):
+    """ Re-project a geo-dataframe or geo-series (replaces the geopandas to_crs method, same arguments).
+
+    @param geo_data: geo-dataframe or geo-series object with a crs.
+    @param crs: crs object to re-project to (any crs_fn input), or None if epsg is provided.
+    @param epsg: integer object containing the epsg code to re-project to, or None if crs is provided.
+    @return geo_data: geo-dataframe or geo-series (copy) re-projected to the target crs.
+    """
+    import geopandas as gpd
+
+    if geo_data.crs is None:
+        raise ValueError('Cannot transform naive geometries. Please set a crs on the object first.')
+
+    if crs is None and epsg is None:
+        raise ValueError('Must pass either crs or epsg.')
+
+    source_crs = crs_fn(geo_data.crs)
+    target_crs = crs_fn(crs if epsg is None else epsg)
+    geometry_list = list(geo_data.geometry)
+
+    if source_crs != target_crs:
+        key = (geometry_hash_fn(geometry_list), source_crs.to_wkt(), target_crs.to_wkt())
+
+        with memo_lock:
+            projected_list = memo_dict.get(key)
+            if projected_list is not None:
+                memo_dict.move_to_end(key)
+
+        if projected_list is None:
+            # transformed outside of the lock (a second thread may transform the same sites - the result is identical).
+            projected_list = transform_geometry_list_fn(geometry_list, source_crs, target_crs)
+            with memo_lock:
+                memo_dict[key] = projected_list
+                while len(memo_dict) > MEMO_SIZE:
+                    memo_dict.popitem(last=False)
+
+        geometry_list = projected_list
+
+    geo_series = gpd.GeoSeries(geometry_list, index=geo_data.index, crs=target_crs)
+    if isinstance(geo_data, gpd.GeoSeries):
+        return geo_series
+
+    projected_df = geo_data.copy()
+    projected_df[geo_data.geometry.name] = geo_series
+    projected_df.crs = target_crs
+
+    return projected_df
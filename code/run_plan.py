@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+"""
+run_plan.py
+===========
+
+Description: This script produces the work plan of a pipeline run (step1_1 command argument --plan) before any raster
+is read, so that the size and the approximate duration of a run are known before it is started.
+
+1. step1_1 runs step1_2 to step1_5 (rainfall image list, ODK collation, tile identity and Landsat scene lists) from the
+file catalogues only and hands the tiles for processing to tile_plan_fn; no fractional cover scene or rainfall image
+is opened.
+
+2. The recorded throughput of previous runs (run_report.json within the export directory - seconds per fractional
+cover scene, seconds per rainfall image and the time taken by the plot stages) is used to estimate the duration of each
+tile and of the run (tiles are assigned to the --tile_workers longest first; the rainfall zonal stats of a tile run
+alongside its fractional cover zonal stats).
+
+3. The plan (a row per tile and the run totals) is printed and written to run_plan.json within the export directory.
+Without a previous run report the work breakdown is still produced, but the duration is not estimated.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import glob
+import json
+from datetime import datetime
+import run_report
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# name of the plan file written to the export directory.
+RUN_PLAN_NAME = 'run_plan.json'
+
+# number of the most recent run reports used to estimate the throughput.
+REPORT_LIMIT = 10
+
+# recorded plot stages of a tile (step2_1) - the tile name is appended.
+TILE_PLOT_STAGE_LIST = ['step2_2_bare_ground_plots_', 'step2_3_interactive_plots_']
+
+# recorded plot stages run once per run (step2_1).
+RUN_PLOT_STAGE_LIST = ['step2_4_sort_plots', 'step2_5_file_plots_to_working_drive']
+
+
+def median_fn(value_list):
+    """ Return the median of a list of values, or None if the list is empty. """
+
+    value_list = sorted(value_list)
+    if not value_list:
+        return None
+
+    middle = len(value_list) // 2
+    if len(value_list) % 2:
+        return value_list[middle]
+
+    return (value_list[middle - 1] + value_list[middle]) / 2.0
+
+
+def report_list_fn(export_dir, report_limit=REPORT_LIMIT):
+    """ Read in the most recent run reports of the export directory (run directories and shard directories).
+
+    @param export_dir: string object containing the path to the export directory (command argument).
+    @param report_limit: integer object containing the maximum number of run reports read in.
+    @return report_list: list object containing the run report dictionaries (most recent first).
+    """
+
+    path_list = glob.glob(os.path.join(export_dir, '*', run_report.RUN_REPORT_NAME))
+    path_list.sort(key=os.path.getmtime, reverse=True)
+
+    report_list = []
+    for path in path_list[:report_limit]:
+        try:
+            with open(path, 'r') as report_file:
+                report_list.append(json.load(report_file))
+        except (IOError, OSError, ValueError):
+            print('Unable to read the run report: ', path)
+
+    return report_list
+
+
+def throughput_fn(report_list):
+    """ Derive the throughput of the tile tasks and the plot stages from the recorded run reports.
+
+    @param report_list: list object containing the run report dictionaries.
+    @return throughput: dictionary object containing the median seconds per fractional cover scene (fc_scene), per
+    rainfall image (rainfall_image), the plot stages of a tile (tile_plots) and the plot stages run once (run_plots);
+    None where nothing was recorded.
+    """
+
+    fc_list = []
+    rainfall_list = []
+    tile_plot_list = []
+    run_plot_list = []
+
+    for report in report_list:
+        for tile, tile_dict in report.get('tiles', {}).items():
+            for task, value_list in [('fc', fc_list), ('rainfall', rainfall_list)]:
+                metrics = tile_dict.get(task)
+                if isinstance(metrics, dict) and metrics.get('scenes') and metrics.get('wall_time'):
+                    value_list.append(metrics['wall_time'] / metrics['scenes'])
+
+        stage_dict = dict((record['stage'], record) for record in report.get('stages', [])
+                          if record.get('status') == 'complete' and record.get('wall_time') is not None)
+
+        for tile in report.get('tiles', {}):
+            plot_time = [stage_dict[stage + tile]['wall_time'] for stage in TILE_PLOT_STAGE_LIST
+                         if stage + tile in stage_dict]
+            if len(plot_time) == len(TILE_PLOT_STAGE_LIST):
+                tile_plot_list.append(sum(plot_time))
+
+        run_plot_time = [stage_dict[stage]['wall_time'] for stage in RUN_PLOT_STAGE_LIST if stage in stage_dict]
+        if len(run_plot_time) == len(RUN_PLOT_STAGE_LIST):
+            run_plot_list.append(sum(run_plot_time))
+
+    return {'fc_scene': median_fn(fc_list),
+            'rainfall_image': median_fn(rainfall_list),
+            'tile_plots': median_fn(tile_plot_list),
+            'run_plots': median_fn(run_plot_list),
+            'reports': len(report_list),
+            'tile_samples': len(fc_list)}
+
+
+def tile_plan_fn(list_zonal_tile, site_tile_dict, rainfall_images, throughput):
+    """ Create the work breakdown of each tile for processing.
+
+    @param list_zonal_tile: list object containing the paths to the tile scene list csv files (for_processing).
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param rainfall_images: integer object containing the number of rainfall images (months).
+    @param throughput: dictionary object containing the recorded throughput (throughput_fn).
+    @return tile_list: list object containing a dictionary per tile (sites, scenes, rainfall images and the estimated
+    seconds of the fractional cover, rainfall and plot stages).
+    """
+
+    tile_list = []
+
+    for tile in list_zonal_tile:
+        complete_tile = os.path.basename(tile)[:7].replace('_', '')
+        scenes = run_report.line_count_fn(tile) or 0
+        site_df = site_tile_dict[complete_tile]
+
+        # a record per site visit (1ha site and date).
+        row = {'tile': complete_tile,
+               'sites': site_df['site_name'].nunique() if 'site_name' in site_df.columns else len(site_df.index),
+               'visits': len(site_df.index),
+               'scenes': scenes,
+               'rainfall_images': rainfall_images,
+               'fc_seconds': None,
+               'rainfall_seconds': None,
+               'plot_seconds': throughput['tile_plots']}
+
+        if throughput['fc_scene'] is not None:
+            row['fc_seconds'] = round(scenes * throughput['fc_scene'], 1)
+        if throughput['rainfall_image'] is not None:
+            row['rainfall_seconds'] = round(rainfall_images * throughput['rainfall_image'], 1)
+
+        tile_list.append(row)
+
+    return tile_list
+
+
+def schedule_seconds_fn(seconds_list, tile_workers):
+    """ Estimate the time taken to process tasks on a number of workers (longest task first to the first free worker).
+
+    @param seconds_list: list object containing the estimated seconds of each task.
+    @param tile_workers: integer object containing the number of workers.
+    @return seconds: float object containing the estimated time until every task is complete.
+    """
+
+    worker_list = [0.0] * max(1, int(tile_workers))
+
+    for seconds in sorted(seconds_list, reverse=True):
+        worker_list[worker_list.index(min(worker_list))] += seconds
+
+    return max(worker_list)
+
+
+def summary_fn(tile_list, throughput, stage_seconds, tile_workers):
+    """ Total the work breakdown and estimate the duration of the run.
+
+    @param tile_list: list object containing the work breakdown of each tile (tile_plan_fn).
+    @param throughput: dictionary object containing the recorded throughput (throughput_fn).
+    @param stage_seconds: float object containing the measured seconds of step1_2 to step1_5 (run by the plan).
+    @param tile_workers: integer object containing the number of tiles processed at once.
+    @return summary: dictionary object containing the run totals and the estimated seconds (None if not estimated).
+    """
+
+    summary = {'tiles': len(tile_list),
+               'sites': sum(row['sites'] for row in tile_list),
+               'visits': sum(row['visits'] for row in tile_list),
+               'scenes': sum(row['scenes'] for row in tile_list),
+               'rainfall_images': tile_list[0]['rainfall_images'] if tile_list else 0,
+               'tile_workers': tile_workers,
+               'catalogue_seconds': round(stage_seconds, 1),
+               'zonal_stats_seconds': None,
+               'plot_seconds': None,
+               'estimated_seconds': None}
+
+    if throughput['fc_scene'] is None:
+        return summary
+
+    # the rainfall zonal stats of a tile run alongside its fractional cover zonal stats.
+    tile_seconds = [max(row['fc_seconds'], row['rainfall_seconds'] or 0.0) for row in tile_list]
+    summary['zonal_stats_seconds'] = round(schedule_seconds_fn(tile_seconds, tile_workers), 1)
+
+    # the plots are created one tile at a time (step2_1).
+    summary['plot_seconds'] = round((throughput['tile_plots'] or 0.0) * len(tile_list) +
+                                    (throughput['run_plots'] or 0.0), 1)
+    summary['estimated_seconds'] = round(stage_seconds + summary['zonal_stats_seconds'] + summary['plot_seconds'], 1)
+
+    return summary
+
+
+def duration_fn(seconds):
+    """ Format a number of seconds as hours, minutes and seconds (i.e. 1h 02m 03s), or '-' if not estimated. """
+
+    if seconds is None:
+        return '-'
+
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return '{0}h {1:02d}m {2:02d}s'.format(hours, minutes, seconds)
+
+
+def print_plan_fn(tile_list, summary, throughput):
+    """ Print the work breakdown per tile and the run totals. """
+
+    print('=' * 100)
+    print('Run plan (no raster has been read)')
+    print('-' * 100)
+    print('{0:<10}{1:>8}{2:>8}{3:>10}{4:>12}{5:>16}{6:>16}{7:>16}'.format(
+        'tile', 'sites', 'visits', 'scenes', 'rainfall', 'fc', 'rainfall', 'plots'))
+
+    for row in tile_list:
+        print('{0:<10}{1:>8}{2:>8}{3:>10}{4:>12}{5:>16}{6:>16}{7:>16}'.format(
+            row['tile'], row['sites'], row['visits'], row['scenes'],
+            row['rainfall_images'], duration_fn(row['fc_seconds']), duration_fn(row['rainfall_seconds']),
+            duration_fn(row['plot_seconds'])))
+
+    print('-' * 100)
+    print('Tiles: {0}, sites (per tile): {1}, site visits (per tile): {2}, scenes: {3}, rainfall images (months): '
+          '{4}'.format(summary['tiles'], summary['sites'], summary['visits'], summary['scenes'],
+                       summary['rainfall_images']))
+    print('step1_2 to step1_5 (measured): ', duration_fn(summary['catalogue_seconds']))
+
+    if summary['estimated_seconds'] is None:
+        print('There is no recorded throughput (run_report.json) in the export directory - the duration is not '
+              'estimated.')
+    else:
+        print('Zonal stats ({0} tile workers): {1}'.format(summary['tile_workers'],
+                                                           duration_fn(summary['zonal_stats_seconds'])))
+        print('Plots: ', duration_fn(summary['plot_seconds']))
+        print('Estimated run time: {0} (from {1} tile records of {2} previous runs)'.format(
+            duration_fn(summary['estimated_seconds']), throughput['tile_samples'], throughput['reports']))
+
+    print('=' * 100)
+
+
+def main_routine(export_dir, list_zonal_tile, site_tile_dict, export_rainfall, stage_seconds, tile_workers=1):
+    """ Produce, print and export the work plan of a run (step1_1 --plan).
+
+    @param export_dir: string object containing the path to the export directory (command argument).
+    @param list_zonal_tile: list object containing the paths to the tile scene list csv files (for_processing).
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param export_rainfall: string object containing the path to the rainfall image list csv.
+    @param stage_seconds: float object containing the measured seconds of step1_2 to step1_5.
+    @param tile_workers: integer object containing the number of tiles processed at once.
+    @return plan: dictionary object containing the tile work breakdown, the run totals and the throughput.
+    """
+
+    throughput = throughput_fn(report_list_fn(export_dir))
+    tile_list = tile_plan_fn(list_zonal_tile, site_tile_dict, run_report.line_count_fn(export_rainfall) or 0,
+                             throughput)
+    summary = summary_fn(tile_list, throughput, stage_seconds, tile_workers)
+
+    print_plan_fn(tile_list, summary, throughput)
+
+    plan = {'created': str(datetime.now()), 'summary': summary, 'throughput': throughput, 'tiles': tile_list}
+
+    if not os.path.exists(export_dir):
+        os.makedirs(export_dir)
+    plan_path = os.path.join(export_dir, RUN_PLAN_NAME)
+    with open(plan_path, 'w') as plan_file:
+        json.dump(plan, plan_file, indent=2)
+    print('Run plan: ', plan_path)
+
+    return plan
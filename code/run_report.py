@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+
+"""
+run_report.py
+=============
+
+Description: This script records the performance of each stage of the fractional cover zonal stats pipeline (step1_1),
+of each tile (step1_6 and step1_7) and of each plot stage (step2_2 to step2_5) and writes the results to run_report.json
+within the export directory, so that slow runs can be compared.
+
+For each stage the report records:
+ - wall_time and cpu_time (seconds, cpu_time is the cpu time of the thread that ran the stage or tile task, so tile
+   tasks run within threads - step1_7 rainfall zonal stats and --tile_workers 1 - are measured separately).
+ - peak_rss_mb: the peak resident memory of the process (MB) at the end of the stage.
+ - process_cpu_time, process_bytes_read and process_bytes_written: the totals of the process (pid) at the end of the
+   stage (the bytes include the network drive). These are process wide - the tasks sharing a process (threads) are
+   not separated - and are compared between the records of the same pid.
+ - scenes and scenes_per_s: the number of Landsat scenes (or rainfall images) read (tile stages).
+ - rows_written and output_bytes: the number of csv rows and the bytes of the stage output files.
+
+The peak memory is read from the resource module (ru_maxrss - Linux and macOS) or the peak working set (psutil or the
+Windows process api - ctypes), and the bytes read and written from psutil, /proc/self/io (Linux) or the Windows process
+api, otherwise they are recorded as None. psutil is part of the environment file (assets/yml/rmb_zonal.yml) but remains
+optional.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import sys
+import json
+import time
+import socket
+from datetime import datetime
+import warnings
+
+warnings.filterwarnings("ignore")
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+RUN_REPORT_NAME = 'run_report.json'
+
+
+def new_report_fn(export_dir_path, argument_dict=None):
+    """ Create an empty run report.
+
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param argument_dict: dictionary object containing the command arguments of the run.
+    @return report: dictionary object containing the run report.
+    """
+
+    return {'version': 1,
+            'run_dir': export_dir_path,
+            'host': socket.gethostname(),
+            'python': sys.version.split()[0],
+            'arguments': argument_dict or {},
+            'started': str(datetime.now()),
+            'start_time': time.time(),
+            'finished': None,
+            'stages': [],
+            'tiles': {}}
+
+
+def windows_counter_fn(counter):
+    """ Read a counter of the current process from the Windows process api (ctypes - used when psutil is missing).
+
+    @param counter: string object containing the counter (peak_wset, wset, read_bytes or write_bytes).
+    @return value: integer object containing the counter value (bytes), or None if it is not available.
+    """
+
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        kernel32 = ctypes.WinDLL('kernel32')
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        handle = kernel32.GetCurrentProcess()
+
+        if counter in ['peak_wset', 'wset']:
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t),
+                            ('PeakPagefileUsage', ctypes.c_size_t)]
+
+            memory_counters = ProcessMemoryCounters()
+            memory_counters.cb = ctypes.sizeof(memory_counters)
+            psapi = ctypes.WinDLL('psapi')
+            psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters),
+                                                   wintypes.DWORD]
+            if psapi.GetProcessMemoryInfo(handle, ctypes.byref(memory_counters), memory_counters.cb):
+                if counter == 'wset':
+                    return memory_counters.WorkingSetSize
+                return memory_counters.PeakWorkingSetSize
+
+        else:
+            class IoCounters(ctypes.Structure):
+                _fields_ = [(name, ctypes.c_ulonglong) for name in
+                            ['ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount',
+                             'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount']]
+
+            io_counters = IoCounters()
+            kernel32.GetProcessIoCounters.argtypes = [wintypes.HANDLE, ctypes.POINTER(IoCounters)]
+            if kernel32.GetProcessIoCounters(handle, ctypes.byref(io_counters)):
+                return io_counters.ReadTransferCount if counter == 'read_bytes' else io_counters.WriteTransferCount
+
+    except (ImportError, AttributeError, OSError):
+        pass
+
+    return None
+
+
+def peak_rss_fn():
+    """ Return the peak resident memory (MB) of the process.
+
+    @return peak_rss: float object containing the peak resident memory (MB), or None if it is not available.
+    """
+
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kilobytes on Linux.
+        return max_rss / 1048576.0 if sys.platform == 'darwin' else max_rss / 1024.0
+
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        # peak_wset (Windows) is the peak working set.
+        if hasattr(memory_info, 'peak_wset'):
+            return memory_info.peak_wset / 1048576.0
+
+    if sys.platform == 'win32':
+        peak_wset = windows_counter_fn('peak_wset')
+        if peak_wset is not None:
+            return peak_wset / 1048576.0
+
+    if psutil is not None:
+        # the operating system does not report a peak - the current resident memory is the best available value.
+        return psutil.Process().memory_info().rss / 1048576.0
+
+    return None
+
+
+def current_rss_fn():
+    """ Return the current resident memory (MB) of the process.
+
+    @return rss: float object containing the current resident memory (MB), or None if it is not available.
+    """
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1048576.0
+
+    if sys.platform == 'win32':
+        wset = windows_counter_fn('wset')
+        return wset / 1048576.0 if wset is not None else None
+
+    try:
+        # the second field of statm is the resident memory (pages).
+        with open('/proc/self/statm', 'r') as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def io_counters_fn():
+    """ Return the bytes read and written by the process (including network drives).
+
+    @return read_bytes: integer object containing the bytes read, or None if it is not available.
+    @return write_bytes: integer object containing the bytes written, or None if it is not available.
+    """
+
+    if psutil is not None:
+        try:
+            io_counters = psutil.Process().io_counters()
+            return io_counters.read_bytes, io_counters.write_bytes
+        except (AttributeError, NotImplementedError):
+            pass
+
+    if sys.platform == 'win32':
+        return windows_counter_fn('read_bytes'), windows_counter_fn('write_bytes')
+
+    try:
+        io_dict = {}
+        with open('/proc/self/io', 'r') as io_file:
+            for line in io_file:
+                key, value = line.split(':')
+                io_dict[key.strip()] = int(value)
+        # rchar and wchar include reads and writes served by the page cache and the network drive.
+        return io_dict['rchar'], io_dict['wchar']
+    except (IOError, OSError, KeyError, ValueError):
+        return None, None
+
+
+def snapshot_fn():
+    """ Take a snapshot of the wall time, the cpu time of the current thread and the process counters.
+
+    @return snapshot: dictionary object containing the counters.
+    """
+
+    times = os.times()
+    read_bytes, write_bytes = io_counters_fn()
+
+    return {'wall': time.time(),
+            'thread_cpu': time.thread_time(),
+            # the children times are only reported for terminated child processes (not Windows).
+            'process_cpu': times[0] + times[1] + times[2] + times[3],
+            'read_bytes': read_bytes,
+            'write_bytes': write_bytes}
+
+
+def output_metrics_fn(output_list):
+    """ Count the csv rows and the bytes of the stage output files.
+
+    @param output_list: list object containing the paths to the stage output files.
+    @return rows_written: integer object containing the number of csv rows (excluding headers).
+    @return output_bytes: integer object containing the size of the output files (bytes).
+    """
+
+    rows_written = 0
+    output_bytes = 0
+
+    for path in output_list:
+        if not os.path.isfile(path):
+            continue
+        output_bytes += os.path.getsize(path)
+        if path.endswith('.csv'):
+            with open(path, 'rb') as csv_file:
+                rows_written += max(sum(1 for line in csv_file) - 1, 0)
+
+    return rows_written, output_bytes
+
+
+def measure_fn(stage_fn, *args, **kwargs):
+    """ Run a function and measure its wall time, cpu time, peak memory and bytes read and written.
+
+    @param stage_fn: function object to be measured.
+    @param args: the positional arguments of stage_fn.
+    @param kwargs: the keyword arguments of stage_fn.
+    @return result: the return value of stage_fn.
+    @return metrics: dictionary object containing the stage metrics.
+    """
+
+    start = snapshot_fn()
+    result = stage_fn(*args, **kwargs)
+    end = snapshot_fn()
+
+    # the cpu time is measured for the thread running the stage; the process counters (shared by the tile tasks run
+    # within threads of the same process) are recorded as totals of the process.
+    metrics = {'wall_time': round(end['wall'] - start['wall'], 3),
+               'cpu_time': round(end['thread_cpu'] - start['thread_cpu'], 3),
+               'peak_rss_mb': peak_rss_fn(),
+               'process_cpu_time': round(end['process_cpu'], 3),
+               'process_bytes_read': end['read_bytes'],
+               'process_bytes_written': end['write_bytes'],
+               'pid': os.getpid()}
+
+    return result, metrics
+
+
+def add_counts_fn(metrics, scenes=None, output_list=None):
+    """ Add the scene count (and throughput) and the output rows and bytes to the stage metrics.
+
+    @param metrics: dictionary object containing the stage metrics (measure_fn).
+    @param scenes: integer object containing the number of scenes read by the stage.
+    @param output_list: list object containing the paths to the stage output files.
+    @return metrics: dictionary object containing the updated stage metrics.
+    """
+
+    if scenes is not None:
+        metrics['scenes'] = scenes
+        metrics['scenes_per_s'] = round(scenes / metrics['wall_time'], 3) if metrics['wall_time'] > 0 else None
+
+    if output_list is not None:
+        metrics['rows_written'], metrics['output_bytes'] = output_metrics_fn(output_list)
+
+    return metrics
+
+
+def line_count_fn(path):
+    """ Return the number of non-empty lines of a list file (i.e. a tile scene list).
+
+    @param path: string object containing the path to the list file.
+    @return count: integer object containing the number of non-empty lines, or None if the file can not be read.
+    """
+
+    try:
+        with open(path, 'r') as list_file:
+            return sum(1 for line in list_file if line.strip())
+    except (IOError, OSError):
+        return None
+
+
+def record_stage_fn(report, stage, metrics, status='complete'):
+    """ Record the metrics of a stage in the run report.
+
+    @param report: dictionary object containing the run report, or None (instrumentation disabled).
+    @param stage: string object containing the stage name.
+    @param metrics: dictionary object containing the stage metrics.
+    @param status: string object containing the stage status (i.e. complete or skipped).
+    """
+
+    if report is None:
+        return
+
+    record = {'stage': stage, 'status': status}
+    record.update(metrics or {})
+    report['stages'].append(record)
+
+
+def record_tile_fn(report, complete_tile, task, metrics):
+    """ Record the metrics of a tile task (fc or rainfall) in the run report.
+
+    @param report: dictionary object containing the run report, or None (instrumentation disabled).
+    @param complete_tile: string object containing the six character tile name.
+    @param task: string object containing the tile task name (fc or rainfall), or status.
+    @param metrics: dictionary object containing the tile task metrics, or the tile status (i.e. skipped).
+    """
+
+    if report is None:
+        return
+
+    report['tiles'].setdefault(complete_tile, {})[task] = metrics
+
+
+def save_report_fn(report, export_dir_path, finished=False):
+    """ Write the run report to the export directory (run_report.json).
+
+    @param report: dictionary object containing the run report, or None (instrumentation disabled).
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param finished: boolean object, True if the run is complete.
+    """
+
+    if report is None:
+        return
+
+    if finished:
+        report['finished'] = str(datetime.now())
+        report['peak_rss_mb'] = peak_rss_fn()
+        report['wall_time'] = round(time.time() - report['start_time'], 3)
+
+    report_path = os.path.join(export_dir_path, RUN_REPORT_NAME)
+    with open(report_path + '.tmp', 'w') as report_file:
+        json.dump(report, report_file, indent=1, sort_keys=True, default=str)
+    os.replace(report_path + '.tmp', report_path)
@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+
+"""
+scene_queue.py
+==============
+
+Description: This script holds the fractional cover zonal stats work of a run (step1_1 command argument --scene_queue)
+in a local work queue (SQLite) within the export directory (export_dir/scene_queue/scene_queue.sqlite), one task per
+(tile, scene).
+
+1. step1_1 adds the scenes of each tile to the queue and writes the 1ha sites of each tile to the queue directory.
+
+2. Workers lease a task (the lease expires after --lease_timeout seconds), calculate the three band zonal stats of the
+scene and write them to the queue directory (scene_queue/results/<tile>). A failed task is returned to the queue and
+retried until it has been attempted --max_attempts times; a task whose lease expired (i.e. a scene read that stalled or
+a worker that stopped) is leased again by another worker.
+
+3. The tile task of the pipeline works through the scenes of its own tile, waits for the scenes leased by other workers
+and combines the scene results into the tile zonal stats csv (step1_6 output). Scenes that failed every attempt are
+left out of the tile outputs and reported, rather than stopping the tile.
+
+Any number of worker processes can drain the queue - step1_1 starts --queue_workers local workers and workers on other
+machines sharing the export drive can be started with:
+
+python scene_queue.py --queue <export_dir>/scene_queue/scene_queue.sqlite
+
+A resumed run (--resume) re-uses the queue - scenes that are complete are not processed again.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import sys
+import glob
+import time
+import pickle
+import socket
+import sqlite3
+import argparse
+import subprocess
+import warnings
+
+warnings.filterwarnings("ignore")
+
+QUEUE_DIR_NAME = 'scene_queue'
+QUEUE_FILE_NAME = 'scene_queue.sqlite'
+
+# default lease timeout (seconds) and number of attempts of a scene task.
+DEFAULT_LEASE_TIMEOUT = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+# seconds between polls of the queue while waiting for scenes leased by other workers.
+POLL_INTERVAL = 2
+
+# seconds a SQLite connection waits for another worker to release the queue.
+DATABASE_TIMEOUT = 60
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description='Lease and process the fractional cover zonal stats scene tasks of a run (step1_1 '
+                    '--scene_queue).')
+
+    p.add_argument('-q', '--queue', help='Path to the scene queue (export_dir/scene_queue/scene_queue.sqlite).',
+                   required=True)
+
+    p.add_argument('-t', '--tile', default=None, help='Only process the scenes of a tile (i.e. 101077).')
+
+    p.add_argument('-s', '--status', action='store_true', help='Print the number of tasks by tile and status.')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def connect_fn(queue_path):
+    """ Open the scene queue (autocommit - transactions are started explicitly).
+
+    @param queue_path: string object containing the path to the scene queue.
+    @return connection: sqlite3 connection object.
+    """
+
+    return sqlite3.connect(queue_path, timeout=DATABASE_TIMEOUT, isolation_level=None)
+
+
+def queue_dir_fn(export_dir_path):
+    """ Return the path to the queue directory of a run (export_dir/scene_queue). """
+
+    return os.path.join(export_dir_path, QUEUE_DIR_NAME)
+
+
+def create_queue_fn(export_dir_path, no_data, lease_timeout=DEFAULT_LEASE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """ Create the scene queue of a run (or open the queue of a resumed run) and store the queue settings.
+
+    @param export_dir_path: string object containing the path to the run (export) directory.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @param lease_timeout: integer object containing the number of seconds before a lease expires.
+    @param max_attempts: integer object containing the number of attempts of a task before it fails.
+    @return queue_path: string object containing the path to the scene queue.
+    """
+
+    queue_dir = queue_dir_fn(export_dir_path)
+    if not os.path.exists(queue_dir):
+        os.makedirs(queue_dir)
+
+    queue_path = os.path.join(queue_dir, QUEUE_FILE_NAME)
+    connection = connect_fn(queue_path)
+
+    try:
+        connection.execute('CREATE TABLE IF NOT EXISTS setting (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS tile (tile TEXT PRIMARY KEY, input_hash TEXT, '
+                           'scene_list TEXT)')
+        connection.execute("CREATE TABLE IF NOT EXISTS task (tile TEXT, scene TEXT, status TEXT DEFAULT 'queued', "
+                           'attempts INTEGER DEFAULT 0, worker TEXT, lease_expires REAL, error TEXT, finished REAL, '
+                           'PRIMARY KEY (tile, scene))')
+        connection.execute('CREATE INDEX IF NOT EXISTS task_status ON task (status, tile)')
+        connection.executemany('INSERT OR REPLACE INTO setting VALUES (?, ?)',
+                               [('no_data', str(no_data)), ('lease_timeout', str(lease_timeout)),
+                                ('max_attempts', str(max_attempts))])
+    finally:
+        connection.close()
+
+    return queue_path
+
+
+def setting_fn(connection):
+    """ Read the queue settings (no_data, lease_timeout and max_attempts). """
+
+    setting_dict = dict(connection.execute('SELECT key, value FROM setting').fetchall())
+
+    return int(setting_dict['no_data']), float(setting_dict['lease_timeout']), int(setting_dict['max_attempts'])
+
+
+def site_path_fn(queue_path, complete_tile):
+    """ Return the path to the pickled 1ha sites of a tile within the queue directory. """
+
+    return os.path.join(os.path.dirname(queue_path), 'sites', complete_tile + '.pkl')
+
+
+def result_dir_fn(queue_path, complete_tile):
+    """ Return the path to the scene results directory of a tile within the queue directory. """
+
+    return os.path.join(os.path.dirname(queue_path), 'results', complete_tile)
+
+
+def result_path_fn(queue_path, complete_tile, image_s):
+    """ Return the path to the zonal stats result of a scene (named after the scene file, any extension). """
+
+    scene_name = os.path.splitext(os.path.basename(image_s))[0]
+
+    return os.path.join(result_dir_fn(queue_path, complete_tile), 'image_' + scene_name + '.csv')
+
+
+def enqueue_tile_fn(queue_path, tile, complete_tile, tile_site_dict, input_hash=None):
+    """ Add the scenes of a tile to the queue. Scenes already complete with the same tile inputs (resumed run) are kept,
+    failed scenes are queued again and the queue of a tile whose inputs changed is replaced.
+
+    @param queue_path: string object containing the path to the scene queue.
+    @param tile: string object containing the path to the tile scene list csv (tile_status/for_processing).
+    @param complete_tile: string object containing the six character tile name.
+    @param tile_site_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param input_hash: string object containing the run manifest input hash of the tile.
+    @return scene_count: integer object containing the number of scenes of the tile that are not complete.
+    """
+
+    with open(tile, 'r') as imagery_list:
+        scene_list = [image.rstrip() for image in imagery_list if image.strip()]
+
+    site_path = site_path_fn(queue_path, complete_tile)
+    for directory in [os.path.dirname(site_path), result_dir_fn(queue_path, complete_tile)]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    with open(site_path + '.tmp', 'wb') as site_file:
+        pickle.dump(tile_site_dict[complete_tile], site_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(site_path + '.tmp', site_path)
+
+    connection = connect_fn(queue_path)
+
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        record = connection.execute('SELECT input_hash FROM tile WHERE tile = ?', (complete_tile,)).fetchone()
+
+        if record is not None and record[0] != input_hash:
+            # the sites or scenes of the tile changed - the scene results can not be re-used.
+            connection.execute('DELETE FROM task WHERE tile = ?', (complete_tile,))
+            for result_path in glob.glob(os.path.join(result_dir_fn(queue_path, complete_tile), '*.csv')):
+                os.remove(result_path)
+
+        connection.execute('INSERT OR REPLACE INTO tile VALUES (?, ?, ?)', (complete_tile, input_hash, tile))
+        connection.executemany('INSERT OR IGNORE INTO task (tile, scene) VALUES (?, ?)',
+                               [(complete_tile, image_s) for image_s in scene_list])
+        connection.execute("UPDATE task SET status = 'queued', attempts = 0, worker = NULL, lease_expires = NULL "
+                           "WHERE tile = ? AND status = 'failed'", (complete_tile,))
+        scene_count = connection.execute("SELECT COUNT(*) FROM task WHERE tile = ? AND status != 'complete'",
+                                         (complete_tile,)).fetchone()[0]
+        connection.execute('COMMIT')
+
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+
+    finally:
+        connection.close()
+
+    print('Scene queue - tile: {0}, scenes queued: {1} of {2}'.format(complete_tile, scene_count, len(scene_list)))
+
+    return scene_count
+
+
+def worker_name_fn():
+    """ Return the name of the current worker (host:process id). """
+
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+def lease_task_fn(connection, worker, complete_tile=None):
+    """ Lease the next queued task (or a task whose lease expired). Tasks whose lease expired on the last attempt are
+    marked as failed.
+
+    @param connection: sqlite3 connection object.
+    @param worker: string object containing the worker name.
+    @param complete_tile: string object containing the six character tile name, or None to lease a task of any tile.
+    @return task: tuple object containing the tile and scene of the leased task, or None if there is no task to lease.
+    """
+
+    no_data, lease_timeout, max_attempts = setting_fn(connection)
+    now = time.time()
+    tile_filter = ' AND tile = ?' if complete_tile is not None else ''
+    tile_args = (complete_tile,) if complete_tile is not None else ()
+
+    connection.execute('BEGIN IMMEDIATE')
+
+    try:
+        connection.execute("UPDATE task SET status = 'failed', error = 'lease expired' WHERE status = 'leased' AND "
+                           'lease_expires < ? AND attempts >= ?', (now, max_attempts))
+        task = connection.execute("SELECT tile, scene FROM task WHERE (status = 'queued' OR (status = 'leased' AND "
+                                  'lease_expires < ?))' + tile_filter + ' ORDER BY rowid LIMIT 1',
+                                  (now,) + tile_args).fetchone()
+        if task is not None:
+            connection.execute("UPDATE task SET status = 'leased', attempts = attempts + 1, worker = ?, "
+                               'lease_expires = ? WHERE tile = ? AND scene = ?',
+                               (worker, now + lease_timeout, task[0], task[1]))
+        connection.execute('COMMIT')
+
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+
+    return task
+
+
+def finish_task_fn(connection, worker, complete_tile, image_s, error=None):
+    """ Record a leased task as complete, or return it to the queue (failed once every attempt has been made). Only
+    the worker holding the lease can finish the task - a worker whose lease expired and was leased again by another
+    worker leaves the task to that worker.
+
+    @param connection: sqlite3 connection object.
+    @param worker: string object containing the worker name (the worker that leased the task).
+    @param complete_tile: string object containing the six character tile name.
+    @param image_s: string object containing the path to the scene.
+    @param error: string object containing the error of a failed task, or None if the task is complete.
+    """
+
+    if error is None:
+        connection.execute("UPDATE task SET status = 'complete', error = NULL, finished = ? WHERE tile = ? AND "
+                           "scene = ? AND worker = ? AND status = 'leased'",
+                           (time.time(), complete_tile, image_s, worker))
+    else:
+        max_attempts = setting_fn(connection)[2]
+        connection.execute("UPDATE task SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                           "error = ?, lease_expires = NULL WHERE tile = ? AND scene = ? AND worker = ? AND "
+                           "status = 'leased'", (max_attempts, error, complete_tile, image_s, worker))
+
+
+def process_task_fn(queue_path, complete_tile, image_s, no_data, site_cache):
+    """ Calculate the three band zonal stats of a scene and write them to the tile results directory.
+
+    @param queue_path: string object containing the path to the scene queue.
+    @param complete_tile: string object containing the six character tile name.
+    @param image_s: string object containing the path to the scene.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @param site_cache: dictionary object containing the 1ha sites and footprints of each tile read by the worker.
+    """
+
+    import step1_6_fc_zonal_stats
+    import site_footprint
+
+    if complete_tile not in site_cache:
+        with open(site_path_fn(queue_path, complete_tile), 'rb') as site_file:
+            shape = pickle.load(site_file)
+        # unique site footprints (revisits with identical coordinates share a footprint).
+        site_cache[complete_tile] = (shape, site_footprint.unique_footprint_fn(shape,
+                                                                               site_footprint.PROJECTED_PRECISION))
+    shape, footprint = site_cache[complete_tile]
+
+    scene_df = step1_6_fc_zonal_stats.scene_zonal_stats_fn(image_s, no_data, shape, 'uid', footprint)
+
+    # written atomically - a worker whose lease expired may still be writing the same result.
+    result_path = result_path_fn(queue_path, complete_tile, image_s)
+    temp_path = '{0}.{1}.tmp'.format(result_path, os.getpid())
+    scene_df.to_csv(temp_path, index=False)
+    os.replace(temp_path, result_path)
+
+
+def run_worker_fn(queue_path, complete_tile=None, worker=None, site_cache=None):
+    """ Lease and process tasks until there are no tasks left to lease.
+
+    @param queue_path: string object containing the path to the scene queue.
+    @param complete_tile: string object containing the six character tile name, or None to process every tile.
+    @param worker: string object containing the worker name, or None (host:process id).
+    @param site_cache: dictionary object containing the 1ha sites of each tile read by the worker, or None.
+    @return processed: integer object containing the number of tasks processed.
+    """
+
+    worker = worker or worker_name_fn()
+    site_cache = site_cache if site_cache is not None else {}
+    connection = connect_fn(queue_path)
+    processed = 0
+
+    try:
+        no_data = setting_fn(connection)[0]
+
+        while True:
+            task = lease_task_fn(connection, worker, complete_tile)
+            if task is None:
+                break
+
+            task_tile, image_s = task
+            try:
+                process_task_fn(queue_path, task_tile, image_s, no_data, site_cache)
+                finish_task_fn(connection, worker, task_tile, image_s)
+            except Exception as error:
+                print('Scene task failed: ', task_tile, image_s, repr(error))
+                finish_task_fn(connection, worker, task_tile, image_s, repr(error))
+            processed += 1
+
+    finally:
+        connection.close()
+
+    return processed
+
+
+def tile_status_fn(connection, complete_tile):
+    """ Return the number of tasks of a tile by status.
+
+    @param connection: sqlite3 connection object.
+    @param complete_tile: string object containing the six character tile name.
+    @return status_dict: dictionary object containing the status (key) and number of tasks (value).
+    """
+
+    return dict(connection.execute('SELECT status, COUNT(*) FROM task WHERE tile = ? GROUP BY status',
+                                   (complete_tile,)).fetchall())
+
+
+def queue_fc_zonal_stats_task_fn(queue_path, tile, zonal_stats_output):
+    """ Process the scenes of a tile from the queue (alongside any other workers), wait for the scenes leased by other
+    workers and combine the scene results into the tile zonal stats csv (tile_scheduler fractional cover task).
+
+    @param queue_path: string object containing the path to the scene queue.
+    @param tile: string object containing the path to the tile scene list csv.
+    @param zonal_stats_output: string object containing the path to the export_dir/zonal_stats directory.
+    @return complete_tile: string object containing the six character tile name.
+    @return metrics: dictionary object containing the task performance metrics (run_report).
+    """
+
+    import run_report
+
+    complete_tile = os.path.basename(tile)[:7].replace('_', '')
+    output, metrics = run_report.measure_fn(queue_tile_fn, queue_path, complete_tile, zonal_stats_output)
+    metrics = run_report.add_counts_fn(metrics, scenes=output[0])
+    metrics['failed_scenes'] = output[1]
+
+    return complete_tile, metrics
+
+
+def queue_tile_fn(queue_path, complete_tile, zonal_stats_output):
+    """ Drain the tasks of a tile and combine the scene results (queue_fc_zonal_stats_task_fn).
+
+    @return scene_count: integer object containing the number of scenes in the tile zonal stats.
+    @return failed_list: list object containing the scenes that failed every attempt.
+    """
+
+    import pandas as pd
+    import step1_6_fc_zonal_stats
+
+    print('=' * 50)
+    print('Working on tile (scene queue): ', complete_tile)
+    site_cache = {}
+    connection = connect_fn(queue_path)
+
+    try:
+        while True:
+            run_worker_fn(queue_path, complete_tile, site_cache=site_cache)
+            status_dict = tile_status_fn(connection, complete_tile)
+            if not status_dict.get('queued') and not status_dict.get('leased'):
+                break
+            # scenes leased by other workers - wait for them to finish (or for their lease to expire).
+            time.sleep(POLL_INTERVAL)
+
+        task_list = connection.execute('SELECT scene, status, error FROM task WHERE tile = ? ORDER BY scene',
+                                       (complete_tile,)).fetchall()
+
+    finally:
+        connection.close()
+
+    failed_list = [scene for scene, status, error in task_list if status == 'failed']
+    for scene, status, error in task_list:
+        if status == 'failed':
+            print('Scene excluded (failed every attempt): ', scene, error)
+
+    result_list = [result_path_fn(queue_path, complete_tile, scene) for scene, status, error in task_list
+                   if status == 'complete']
+    if not result_list:
+        raise RuntimeError('Every scene of tile {0} failed.'.format(complete_tile))
+
+    # the scene results are combined in scene name order.
+    output_zonal_stats = pd.concat((pd.read_csv(result_path) for result_path in sorted(result_list)),
+                                   ignore_index=True, sort=False)
+
+    # the output is named after the property of the last site (as step1_6).
+    with open(site_path_fn(queue_path, complete_tile), 'rb') as site_file:
+        last_site = pickle.load(site_file).iloc[-1]
+
+    output_zonal_stats, output_csv = step1_6_fc_zonal_stats.export_zonal_stats_fn(
+        output_zonal_stats, zonal_stats_output, complete_tile, str(last_site['prop_code']),
+        str(last_site['prop_name']))
+
+    return len(result_list), failed_list
+
+
+def start_workers_fn(queue_path, worker_count):
+    """ Start local worker processes to drain the queue alongside the pipeline.
+
+    @param queue_path: string object containing the path to the scene queue.
+    @param worker_count: integer object containing the number of worker processes.
+    @return process_list: list object containing the worker processes (subprocess.Popen).
+    """
+
+    script = os.path.abspath(__file__)
+    process_list = [subprocess.Popen([sys.executable, script, '--queue', queue_path], cwd=os.path.dirname(script))
+                    for n in range(max(0, int(worker_count)))]
+
+    if process_list:
+        print('Scene queue workers started: ', len(process_list))
+
+    return process_list
+
+
+def stop_workers_fn(process_list):
+    """ Stop the local worker processes (the workers exit once there are no tasks left to lease). """
+
+    for process in process_list:
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+
+
+def print_status_fn(queue_path):
+    """ Print the number of tasks of each tile by status. """
+
+    connection = connect_fn(queue_path)
+
+    try:
+        for complete_tile, status, count in connection.execute(
+                'SELECT tile, status, COUNT(*) FROM task GROUP BY tile, status ORDER BY tile, status'):
+            print(' - {0}: {1} {2}'.format(complete_tile, status, count))
+    finally:
+        connection.close()
+
+
+def main_routine():
+    """ Lease and process scene tasks from the queue until there are no tasks left to lease. """
+
+    cmd_args = get_cmd_args_fn()
+
+    if not os.path.exists(cmd_args.queue):
+        print('The scene queue does not exist: ', cmd_args.queue)
+        sys.exit(1)
+
+    if cmd_args.status:
+        print_status_fn(cmd_args.queue)
+        return
+
+    worker = worker_name_fn()
+    processed = run_worker_fn(cmd_args.queue, cmd_args.tile, worker)
+    print('Scene queue worker {0} finished - scenes processed: {1}'.format(worker, processed))
+
+
+if __name__ == '__main__':
+    main_routine()
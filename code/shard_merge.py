@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+
+"""
+shard_merge.py
+==============
+
+Description: This script splits a fractional cover zonal stats run across several processing machines that share the
+export drive (step1_1 command argument --shard i/N) and merges the shard outputs into the normal export layout.
+
+Shard run (step1_1 --shard i/N):
+
+1. Every shard runs step1_2 to step1_5 (and the best tile plan); these stages only read catalogues and are identical
+for every shard.
+
+2. The Landsat tiles for processing are assigned to the shards deterministically - tiles are sorted by their number of
+scenes (then name) and each tile is assigned to the shard with the fewest scenes assigned so far - and each shard
+only calculates the fractional cover and rainfall zonal stats (step1_6 and step1_7) of its own tiles.
+
+3. The shard outputs are written to export_dir/shard_i_of_N; the plots are not created and the state ledger is not
+updated by a shard.
+
+Merge (python shard_merge.py --export_dir <export_dir>), run once every shard is complete:
+
+1. Checks every shard completed, ran from the same inputs (identical step1_2 to step1_5 outputs) and that every tile
+was processed by exactly one shard.
+
+2. Creates the run directory (export_dir/user_YYYYMMDD_HHMM), copies the step1_2 to step1_5 outputs from the first
+shard and the zonal stats and rainfall outputs of every tile from its shard.
+
+3. Runs the plot pipeline (step2_1 to step2_5) over the merged outputs (the plots need the rainfall of every tile and
+the best tile of each site is selected across all tiles), merges the previous run outputs (--incremental) and updates the
+state ledger - the merged run directory is identical to that of a single machine run.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import sys
+import glob
+import json
+import shutil
+import pickle
+import argparse
+import warnings
+
+warnings.filterwarnings("ignore")
+
+SHARD_DIR_TEMPLATE = 'shard_{0}_of_{1}'
+
+# stages run by every shard - their outputs must be identical for the shards to be merged.
+COMMON_STAGE_LIST = ['step1_2_rainfall_list', 'step1_3_collate_odk', 'step1_5_landsat_list', 'best_tile_plan']
+
+# shard run directory contents that are not copied to the merged run directory (tile outputs are copied per tile and
+# the plots are created by the merge).
+EXCLUDE_LIST = ['run_manifest.json', 'run_report.json', '.checkpoints', 'profile', 'scene_queue', 'zonal_stats',
+                'rainfall', 'plots', 'final_plots', 'final_interactive', 'parquet']
+
+TILE_STAGE_PREFIX = 'step1_6_7_zonal_stats_'
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description='Merge the shard run directories (step1_1 --shard i/N) into a single run directory and create the '
+                    'plots.')
+
+    p.add_argument('-x', '--export_dir', help='The export directory used by every shard (command argument '
+                                              '--export_dir of step1_1).', required=True)
+
+    p.add_argument('-n', '--shard_count', type=int, default=None,
+                   help='The number of shards (N) - default: determined from the shard run directories.')
+
+    p.add_argument('-rm', '--remove_shards', action='store_true',
+                   help='Delete the shard run directories once they have been merged.')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def parse_shard_fn(shard):
+    """ Parse the shard command argument (i.e. 2/4).
+
+    @param shard: string object containing the shard number and the number of shards (i/N, 1 <= i <= N).
+    @return shard_index: integer object containing the shard number (1 to N).
+    @return shard_count: integer object containing the number of shards.
+    """
+
+    try:
+        shard_index, shard_count = [int(value) for value in str(shard).split('/')]
+    except ValueError:
+        raise ValueError('--shard must be entered as i/N (i.e. 1/4): {0}'.format(shard))
+
+    if shard_count < 1 or not 1 <= shard_index <= shard_count:
+        raise ValueError('--shard i/N requires 1 <= i <= N: {0}'.format(shard))
+
+    return shard_index, shard_count
+
+
+def shard_dir_fn(export_dir, shard_index, shard_count):
+    """ Return the path to the run directory of a shard (export_dir/shard_i_of_N).
+
+    @param export_dir: string object containing the path to the export directory shared by the shards.
+    @param shard_index: integer object containing the shard number (1 to N).
+    @param shard_count: integer object containing the number of shards.
+    @return shard_dir: string object containing the path to the shard run directory.
+    """
+
+    return os.path.join(export_dir, SHARD_DIR_TEMPLATE.format(shard_index, shard_count))
+
+
+def tile_name_fn(tile):
+    """ Return the six character tile name of a step1_5 scene list (i.e. 101_077_landsat_tile_list.csv -> 101077). """
+
+    return os.path.basename(tile)[:7].replace('_', '')
+
+
+def shard_plan_fn(list_zonal_tile, shard_count):
+    """ Assign the tiles to the shards - the tiles are sorted by their number of scenes (most first, then name) and each
+    tile is assigned to the shard with the fewest scenes assigned so far (the lowest shard number on a tie).
+
+    @param list_zonal_tile: list object containing the paths to the scene list (step1_5) of each tile for processing.
+    @param shard_count: integer object containing the number of shards.
+    @return shard_dict: dictionary object containing the six character tile name (key) and shard number (value).
+    """
+
+    import run_report
+
+    weight_list = sorted([(-(run_report.line_count_fn(tile) or 0), tile_name_fn(tile)) for tile in list_zonal_tile])
+    load_list = [0] * shard_count
+    shard_dict = {}
+
+    for weight, complete_tile in weight_list:
+        shard = load_list.index(min(load_list))
+        load_list[shard] -= weight
+        shard_dict[complete_tile] = shard + 1
+
+    return shard_dict
+
+
+def shard_tile_list_fn(list_zonal_tile, shard_index, shard_count):
+    """ Return the tiles assigned to a shard and print the shard plan.
+
+    @param list_zonal_tile: list object containing the paths to the scene list (step1_5) of each tile for processing.
+    @param shard_index: integer object containing the shard number (1 to N).
+    @param shard_count: integer object containing the number of shards.
+    @return shard_tile_list: list object containing the scene list paths of the tiles assigned to the shard.
+    """
+
+    shard_dict = shard_plan_fn(list_zonal_tile, shard_count)
+    shard_tile_list = [tile for tile in list_zonal_tile if shard_dict[tile_name_fn(tile)] == shard_index]
+
+    print('-' * 50)
+    print('Shard {0} of {1} - tiles: {2} of {3}'.format(shard_index, shard_count, len(shard_tile_list),
+                                                       len(list_zonal_tile)))
+    for tile in shard_tile_list:
+        print(' - ', tile_name_fn(tile))
+
+    return shard_tile_list
+
+
+def shard_dir_list_fn(export_dir, shard_count=None):
+    """ Locate the shard run directories within the export directory.
+
+    @param export_dir: string object containing the path to the export directory shared by the shards.
+    @param shard_count: integer object containing the number of shards, or None to determine it from the directories.
+    @return shard_dir_list: list object containing the path to the run directory of each shard (shard 1 first).
+    """
+
+    if shard_count is None:
+        count_set = set(os.path.basename(path).split('_')[-1] for path in
+                        glob.glob(os.path.join(export_dir, SHARD_DIR_TEMPLATE.format('*', '*'))))
+        if len(count_set) != 1:
+            raise RuntimeError('Enter --shard_count, the export directory does not contain the shards of a single '
+                               'run: {0}'.format(export_dir))
+        shard_count = int(count_set.pop())
+
+    shard_dir_list = [shard_dir_fn(export_dir, shard_index, shard_count) for shard_index in range(1, shard_count + 1)]
+    missing_list = [path for path in shard_dir_list if not os.path.isdir(path)]
+
+    if missing_list:
+        raise RuntimeError('The following shards have not been run: {0}'.format(', '.join(missing_list)))
+
+    return shard_dir_list
+
+
+def read_json_fn(path):
+    """ Read in a json file (i.e. the run manifest or run report of a shard). """
+
+    with open(path, 'r') as json_file:
+        return json.load(json_file)
+
+
+def relative_outputs_fn(manifest, shard_dir, stage):
+    """ Return the output hashes of a stage relative to the shard run directory (comparable between shards).
+
+    @param manifest: dictionary object containing the run manifest of the shard.
+    @param shard_dir: string object containing the path to the shard run directory.
+    @param stage: string object containing the stage name.
+    @return output_dict: dictionary object containing the relative output path (key) and sha1 hash (value), or None if
+    the stage was not run.
+    """
+
+    import pipeline_runner
+
+    record = manifest['stages'].get(stage)
+    if record is None:
+        return None
+
+    # absolute paths (earlier manifests) are relative to the run directory they were recorded in.
+    record_dir = manifest.get('run_dir', shard_dir)
+
+    return {pipeline_runner.relative_path_fn(path, record_dir): file_hash
+            for path, file_hash in record['outputs'].items()}
+
+
+def load_checkpoint_fn(shard_dir, stage):
+    """ Load the stage state from the checkpoint of a shard run directory. """
+
+    import pipeline_runner
+
+    with open(pipeline_runner.checkpoint_path_fn(shard_dir, stage), 'rb') as checkpoint_file:
+        return pickle.load(checkpoint_file)
+
+
+def check_shards_fn(shard_dir_list):
+    """ Check every shard is complete, was run from the same inputs and that every tile was processed by its shard.
+
+    @param shard_dir_list: list object containing the path to the run directory of each shard (shard 1 first).
+    @return manifest_list: list object containing the run manifest of each shard.
+    @return shard_dict: dictionary object containing the six character tile name (key) and shard number (value).
+    """
+
+    import pipeline_runner
+    import run_report
+
+    manifest_list = []
+    for shard_dir in shard_dir_list:
+        report = read_json_fn(os.path.join(shard_dir, run_report.RUN_REPORT_NAME))
+        if report.get('finished') is None:
+            raise RuntimeError('The shard has not finished: {0} - rerun it with --resume {0}'.format(shard_dir))
+        manifest_list.append(read_json_fn(os.path.join(shard_dir, pipeline_runner.RUN_MANIFEST_NAME)))
+
+    for stage in COMMON_STAGE_LIST:
+        first_outputs = relative_outputs_fn(manifest_list[0], shard_dir_list[0], stage)
+        for manifest, shard_dir in zip(manifest_list[1:], shard_dir_list[1:]):
+            if relative_outputs_fn(manifest, shard_dir, stage) != first_outputs:
+                raise RuntimeError('The {0} outputs of {1} and {2} differ - the shards were run from different '
+                                   'inputs.'.format(stage, shard_dir_list[0], shard_dir))
+
+    # the tiles for processing and the shard of each tile (recalculated from the first shard).
+    site_tile_dict = site_tile_dict_fn(shard_dir_list[0])
+    tile_for_processing_dir = os.path.join(shard_dir_list[0], 'tile_status', 'for_processing')
+    list_zonal_tile = [tile for tile in glob.glob(os.path.join(tile_for_processing_dir, '*.csv'))
+                       if tile_name_fn(tile) in site_tile_dict]
+    shard_dict = shard_plan_fn(list_zonal_tile, len(shard_dir_list))
+
+    missing_list = []
+    for complete_tile, shard_index in sorted(shard_dict.items()):
+        record = manifest_list[shard_index - 1]['stages'].get(TILE_STAGE_PREFIX + complete_tile)
+        if record is None or record['status'] != 'complete':
+            missing_list.append('{0} (shard {1})'.format(complete_tile, shard_index))
+
+    if missing_list:
+        raise RuntimeError('The zonal stats of the following tiles are missing: {0}'.format(', '.join(missing_list)))
+
+    return manifest_list, shard_dict
+
+
+def site_tile_dict_fn(shard_dir):
+    """ Load the sites within each tile (best tile plan when --best_tile_only was used) from a shard checkpoint.
+
+    @param shard_dir: string object containing the path to the shard run directory.
+    @return site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    """
+
+    import pipeline_runner
+
+    if os.path.exists(pipeline_runner.checkpoint_path_fn(shard_dir, 'best_tile_plan')):
+        return load_checkpoint_fn(shard_dir, 'best_tile_plan')
+
+    return load_checkpoint_fn(shard_dir, 'step1_4_tile_identity')[4]
+
+
+def copy_common_outputs_fn(shard_dir, export_dir_path):
+    """ Copy the step1_2 to step1_5 outputs of a shard (identical for every shard) to the merged run directory.
+
+    @param shard_dir: string object containing the path to the shard run directory.
+    @param export_dir_path: string object containing the path to the merged run directory.
+    """
+
+    for root, dirs, files in os.walk(shard_dir):
+        if root == shard_dir:
+            dirs[:] = [folder for folder in dirs if folder not in EXCLUDE_LIST]
+            files = [file for file in files if file not in EXCLUDE_LIST]
+
+        output_dir = os.path.join(export_dir_path, os.path.relpath(root, shard_dir))
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        for file in files:
+            shutil.copy2(os.path.join(root, file), output_dir)
+
+
+def copy_tile_outputs_fn(shard_dir, export_dir_path, complete_tile):
+    """ Copy the zonal stats and rainfall zonal stats of a tile from its shard to the merged run directory.
+
+    @param shard_dir: string object containing the path to the shard run directory.
+    @param export_dir_path: string object containing the path to the merged run directory.
+    @param complete_tile: string object containing the six character tile name.
+    @return output_list: list object containing the paths to the copied files.
+    """
+
+    output_list = []
+
+    for folder, search_criteria in [('zonal_stats', '*_{0}_zonal_stats.csv'),
+                                    ('rainfall', '*_{0}_rainfall_zonal_stats.csv')]:
+        for file_path in sorted(glob.glob(os.path.join(shard_dir, folder, search_criteria.format(complete_tile)))):
+            shutil.copy2(file_path, os.path.join(export_dir_path, folder))
+            output_list.append(os.path.join(export_dir_path, folder, os.path.basename(file_path)))
+
+    # the Parquet partitions of the tile (step1_1 --parquet).
+    for tile_dir in sorted(glob.glob(os.path.join(shard_dir, 'parquet', '*', '*', 'tile=' + complete_tile))):
+        output_dir = os.path.join(export_dir_path, os.path.relpath(tile_dir, shard_dir))
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        shutil.copytree(tile_dir, output_dir)
+        output_list.extend(sorted(glob.glob(os.path.join(output_dir, '*', '*.parquet'))))
+
+    return output_list
+
+
+def main_routine():
+    """ Merge the shard run directories into a single run directory and run the plot pipeline (step2_1) over the merged
+    outputs. """
+
+    cmd_args = get_cmd_args_fn()
+    export_dir = cmd_args.export_dir
+
+    import step1_1_initiate_fractional_cover_zonal_stats_pipeline as step1_1
+    import odk_state_ledger
+    import pipeline_runner
+    import run_report
+    import stage_profiler
+
+    shard_dir_list = shard_dir_list_fn(export_dir, cmd_args.shard_count)
+    manifest_list, shard_dict = check_shards_fn(shard_dir_list)
+
+    # the command arguments of the shard run (identical for every shard except --shard).
+    arguments = read_json_fn(os.path.join(shard_dir_list[0], run_report.RUN_REPORT_NAME))['arguments']
+
+    print('=' * 50)
+    print('Merging {0} shards - tiles: {1}'.format(len(shard_dir_list), len(shard_dict)))
+
+    final_user = os.path.basename(os.path.expanduser("~"))[3:]
+    export_dir_path = step1_1.export_file_path_fn(export_dir, final_user)
+    copy_common_outputs_fn(shard_dir_list[0], export_dir_path)
+    tile_status_dir, plot_dir, zonal_stats_output_dir, rainfall_output_dir = step1_1.export_dir_folders_fn(
+        export_dir_path)
+
+    manifest = pipeline_runner.load_manifest_fn(export_dir_path)
+    stage_profiler.configure_fn(arguments.get('profile'), arguments.get('profile_memory'),
+                                os.path.join(export_dir_path, 'profile'))
+    report = run_report.new_report_fn(export_dir_path, dict(arguments, shard=None,
+                                                            merged_shards=shard_dir_list))
+
+    # ---------------------------------------------- Tile outputs -----------------------------------------------
+
+    list_tile_key = []
+    for complete_tile, shard_index in sorted(shard_dict.items()):
+        output_list, metrics = run_report.measure_fn(copy_tile_outputs_fn, shard_dir_list[shard_index - 1],
+                                                     export_dir_path, complete_tile)
+        run_report.record_tile_fn(report, complete_tile, 'merge', run_report.add_counts_fn(
+            metrics, output_list=output_list))
+
+        # the key of the tile stage is recorded as completed by the shard.
+        stage = TILE_STAGE_PREFIX + complete_tile
+        record = manifest_list[shard_index - 1]['stages'][stage]
+        pipeline_runner.record_stage_fn(manifest, export_dir_path, stage, record['input_hash'], complete_tile,
+                                        output_list)
+        list_tile_key.append(pipeline_runner.stage_key_fn(manifest, stage))
+        print(' - ', complete_tile, ' shard: ', shard_index, ' files: ', len(output_list))
+
+    run_report.save_report_fn(report, export_dir_path)
+
+    # --------------------------------------------------- Plots -----------------------------------------------------
+
+    site_tile_dict = site_tile_dict_fn(shard_dir_list[0])
+    previous_visits = arguments['visits']
+    pastoral_estate = arguments['pastoral_estate']
+
+    import zonal_stats_parquet
+    zonal_stats_parquet.configure_fn(arguments.get('parquet'))
+
+    # the ODK files and records staged by step1_3 and the site tiles of step1_4 (identical for every shard).
+    pending_files, pending_records = load_checkpoint_fn(shard_dir_list[0], 'step1_3_collate_odk')[1:]
+    comp_geo_df52, comp_geo_df53, comp_geo_df54 = load_checkpoint_fn(shard_dir_list[0], 'step1_4_tile_identity')[:3]
+
+    ledger = odk_state_ledger.load_ledger_fn(export_dir, arguments['incremental'])
+    ledger['pending_files'], ledger['pending_records'] = pending_files, pending_records
+
+    if arguments['incremental']:
+        # merge the outputs of the previous run before the plots (the ODK outputs were merged by each shard).
+        odk_state_ledger.merge_previous_outputs_fn(ledger, export_dir_path)
+        plot_site_dict = odk_state_ledger.plot_site_dict_fn(site_tile_dict)
+    else:
+        plot_site_dict = None
+
+    if arguments.get('zonal_stats_store'):
+        # the merged run is loaded into the consolidated store once (zonal_stats_store - step1_1 --zonal_stats_store).
+        import zonal_stats_store
+        zonal_stats_store_path = zonal_stats_store.store_path_fn(export_dir)
+        zonal_stats_store.load_run_fn(zonal_stats_store_path, export_dir_path)
+    else:
+        zonal_stats_store_path = None
+
+    import step2_1_initiate_zonal_stats_plot_pipeline
+    pipeline_runner.run_stage_fn(
+        manifest, export_dir_path, 'step2_1_plots',
+        {'tiles': list_tile_key, 'end_date': arguments['end_date'], 'rolling_mean': arguments['rolling_mean'],
+         'zonal_stats_store': bool(arguments.get('zonal_stats_store')),
+         'previous_visits': pipeline_runner.file_signature_fn(previous_visits),
+         'pastoral_estate': pipeline_runner.file_signature_fn(pastoral_estate),
+         'pastoral_districts_dir': arguments['pastoral_districts_dir']},
+        lambda: stage_profiler.profile_call_fn(step2_1_initiate_zonal_stats_plot_pipeline.main_routine,
+                                               zonal_stats_output_dir, export_dir_path, rainfall_output_dir,
+                                               arguments['end_date'], arguments['rainfall_dir'], previous_visits,
+                                               pastoral_estate, arguments['rolling_mean'],
+                                               arguments['pastoral_districts_dir'], site_tile_dict, report,
+                                               zonal_stats_store_path, plot_site_dict),
+        lambda state: (pipeline_runner.glob_output_fn(plot_dir, '*.*') +
+                       pipeline_runner.glob_output_fn(export_dir_path, os.path.join('final_*', '*.*'))),
+        report)
+
+    # ----------------------------------------------- State ledger ----------------------------------------------
+
+    odk_state_ledger.commit_ledger_fn(ledger, export_dir, export_dir_path, [comp_geo_df52, comp_geo_df53,
+                                                                            comp_geo_df54])
+
+    run_report.save_report_fn(report, export_dir_path, finished=True)
+    print('Run report: ', os.path.join(export_dir_path, run_report.RUN_REPORT_NAME))
+
+    if cmd_args.remove_shards:
+        for shard_dir in shard_dir_list:
+            shutil.rmtree(shard_dir)
+        print('The shard run directories have been deleted.')
+
+    print('The shards have been merged: ', export_dir_path)
+    print('goodbye.')
+
+
+if __name__ == '__main__':
+    try:
+        main_routine()
+    except RuntimeError as error:
+        print(error)
+        sys.exit(1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+site_footprint.py
+=================
+
+Description: This script de-duplicates the 1ha site footprints before the zonal stats are calculated (step1_6 and
+step1_7). ODK collections often contain the same site visited in different years with identical coordinates, each visit
+creating its own 1ha polygon. The footprints are keyed by a hash of the geometry (coordinates rounded to a set
+precision), the zonal stats are calculated once per unique footprint and fanned back out to every visit record, so the
+output records (and schemas) are unchanged.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import hashlib
+from shapely import wkt
+from rasterstats import zonal_stats
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# number of decimal places the footprint coordinates are rounded to (projected metres - 1cm).
+PROJECTED_PRECISION = 2
+
+# number of decimal places the footprint coordinates are rounded to (geographic degrees - approximately 1cm).
+GEOGRAPHIC_PRECISION = 7
+
+
+def footprint_key_fn(geometry, precision=PROJECTED_PRECISION):
+    """ Create a hash key for a site footprint from its rounded coordinates.
+
+    @param geometry: shapely geometry object containing the site footprint.
+    @param precision: integer object containing the number of decimal places the coordinates are rounded to.
+    @return key: string object containing the sha1 hash of the rounded footprint.
+    """
+
+    return hashlib.sha1(wkt.dumps(geometry, rounding_precision=precision).encode('utf-8')).hexdigest()
+
+
+def unique_footprint_fn(site_geo_df, precision=PROJECTED_PRECISION):
+    """ Identify the unique site footprints and the unique footprint of each record.
+
+    @param site_geo_df: geo-dataframe containing the 1ha site records.
+    @param precision: integer object containing the number of decimal places the coordinates are rounded to.
+    @return unique_geo_df: geo-dataframe containing the first record (geometry only) of each unique footprint.
+    @return inverse_list: list object containing the position of each record's footprint within unique_geo_df.
+    """
+
+    position_dict = {}
+    unique_position_list = []
+    inverse_list = []
+
+    for n, geometry in enumerate(site_geo_df.geometry):
+        key = footprint_key_fn(geometry, precision)
+
+        if key not in position_dict:
+            position_dict[key] = len(unique_position_list)
+            unique_position_list.append(n)
+
+        inverse_list.append(position_dict[key])
+
+    unique_geo_df = site_geo_df.iloc[unique_position_list][['geometry']]
+
+    if len(unique_position_list) < len(inverse_list):
+        print(' - unique site footprints: ', len(unique_position_list), ' of ', len(inverse_list), ' records')
+
+    return unique_geo_df, inverse_list
+
+
+def footprint_zonal_stats_fn(unique_geo_df, inverse_list, array, affine, nodata, stats, all_touched):
+    """ Calculate the zonal stats once per unique footprint and fan the results out to every record.
+
+    @param unique_geo_df: geo-dataframe containing the unique site footprints.
+    @param inverse_list: list object containing the position of each record's footprint within unique_geo_df.
+    @param array: numpy array object containing the raster band.
+    @param affine: affine object containing the raster transform.
+    @param nodata: integer object containing the raster no data value.
+    @param stats: list object containing the zonal statistics to calculate.
+    @param all_touched: boolean object, True to include all pixels touched by the footprint.
+    @return zs: list object containing a zonal stats dictionary for each record (in record order).
+    """
+
+    unique_zs = zonal_stats(unique_geo_df, array, affine=affine, nodata=nodata, stats=stats, all_touched=all_touched)
+
+    zs = [dict(unique_zs[position]) for position in inverse_list]
+
+    return zs
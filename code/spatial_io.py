@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+spatial_io.py
+=============
+
+Description: This script writes and reads the spatial intermediates of the pipeline (step1_1 command argument
+--spatial_format) as ESRI shapefiles (default), as layers of a single GeoPackage or as GeoParquet files, so that the
+intermediates are not split into a set of sidecar files per layer and keep their full attribute names.
+
+1. write_layer_fn (called by step1_3, step1_4, step1_5 and step1_7) writes a geo-dataframe as a named layer of a
+directory: <name>.shp (shp), a layer of <directory>/intermediate_layers.gpkg (gpkg) or <name>.parquet (parquet).
+
+2. read_layer_fn and layer_list_fn read a named layer or every layer of a directory (step1_6, step1_7 and step2_5).
+
+3. The final deliverables (the export directory odk and 1ha shapefiles and the property 1ha shapefiles filed by
+step2_5) are always written as shapefiles.
+
+Note: GeoParquet requires pyarrow, the GeoPackage format is used when it is not installed.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+
+# Import modules
+from __future__ import print_function, division
+import os
+import glob
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# environment variable holding the spatial intermediate format (inherited by the worker processes).
+SPATIAL_FORMAT_ENV = 'RMB_SPATIAL_FORMAT'
+
+# spatial intermediate formats (step1_1 command argument --spatial_format).
+FORMAT_LIST = ['shp', 'gpkg', 'parquet']
+
+# name of the GeoPackage holding the layers of a directory.
+GPKG_NAME = 'intermediate_layers.gpkg'
+
+
+def configure_fn(spatial_format):
+    """ Store the spatial intermediate format in the environment (step1_1 command argument --spatial_format).
+
+    @param spatial_format: string object containing the format of the spatial intermediates (shp, gpkg or parquet).
+    """
+
+    if spatial_format == 'parquet':
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            print('pyarrow is not installed - the spatial intermediates will be written to a GeoPackage.')
+            spatial_format = 'gpkg'
+
+    if spatial_format in (None, 'shp'):
+        os.environ.pop(SPATIAL_FORMAT_ENV, None)
+    else:
+        os.environ[SPATIAL_FORMAT_ENV] = spatial_format
+
+
+def format_fn():
+    """ Return the spatial intermediate format (shp, gpkg or parquet). """
+
+    return os.environ.get(SPATIAL_FORMAT_ENV, 'shp')
+
+
+def layer_path_fn(directory, name, spatial_format=None):
+    """ Return the path to the file holding a named layer of a directory.
+
+    @param directory: string object containing the path to the directory.
+    @param name: string object containing the layer name (the file name without an extension).
+    @param spatial_format: string object containing the format, or None to use the configured format.
+    @return layer_path: string object containing the path to the shapefile, GeoPackage or GeoParquet file.
+    """
+
+    spatial_format = spatial_format or format_fn()
+
+    if spatial_format == 'gpkg':
+        return os.path.join(directory, GPKG_NAME)
+
+    return os.path.join(directory, name + '.' + spatial_format)
+
+
+def write_layer_fn(geo_df, directory, name):
+    """ Write a geo-dataframe (or geo-series) as a named layer of a directory in the configured format.
+
+    @param geo_df: geo-dataframe or geo-series object to be written.
+    @param directory: string object containing the path to the directory.
+    @param name: string object containing the layer name (the file name without an extension).
+    @return layer_path: string object containing the path to the file the layer was written to.
+    """
+    import geopandas as gpd
+
+    if isinstance(geo_df, gpd.GeoSeries):
+        geo_df = gpd.GeoDataFrame({'geometry': geo_df}, geometry='geometry', crs=geo_df.crs)
+
+    spatial_format = format_fn()
+    layer_path = layer_path_fn(directory, name, spatial_format)
+
+    if spatial_format == 'gpkg':
+        # each layer is added to (or replaces a layer of) the GeoPackage of the directory.
+        geo_df.to_file(layer_path, layer=name, driver='GPKG')
+    elif spatial_format == 'parquet':
+        geo_df.to_parquet(layer_path)
+    else:
+        geo_df.to_file(layer_path, driver='ESRI Shapefile')
+
+    return layer_path
+
+
+def read_layer_fn(directory, name):
+    """ Read a named layer of a directory in the configured format.
+
+    @param directory: string object containing the path to the directory.
+    @param name: string object containing the layer name (the file name without an extension).
+    @return geo_df: geo-dataframe containing the layer.
+    """
+    import geopandas as gpd
+
+    spatial_format = format_fn()
+    layer_path = layer_path_fn(directory, name, spatial_format)
+
+    if spatial_format == 'gpkg':
+        return gpd.read_file(layer_path, layer=name)
+    elif spatial_format == 'parquet':
+        return gpd.read_parquet(layer_path)
+
+    return gpd.read_file(layer_path)
+
+
+def layer_list_fn(directory):
+    """ Read every layer of a directory in the configured format.
+
+    @param directory: string object containing the path to the directory.
+    @return list_geo_df: list object containing a geo-dataframe for each layer (sorted by layer name).
+    """
+    import geopandas as gpd
+
+    spatial_format = format_fn()
+
+    if spatial_format == 'gpkg':
+        gpkg_path = os.path.join(directory, GPKG_NAME)
+        if not os.path.exists(gpkg_path):
+            return []
+
+        import fiona
+        return [gpd.read_file(gpkg_path, layer=layer) for layer in sorted(fiona.listlayers(gpkg_path))]
+
+    elif spatial_format == 'parquet':
+        return [gpd.read_parquet(file_path) for file_path in sorted(glob.glob(os.path.join(directory, '*.parquet')))]
+
+    return [gpd.read_file(file_path) for file_path in sorted(glob.glob(os.path.join(directory, '*.shp')))]
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""
+stage_profiler.py
+=================
+
+Description: This script provides opt-in profiling hooks for the stages of the fractional cover zonal stats pipeline.
+The main_routine of each selected stage is run within cProfile (and optionally tracemalloc) and the results are written
+to the profile sub-directory of the export directory:
+ - <stage>.prof: the cProfile statistics (i.e. snakeviz <stage>.prof or python -m pstats <stage>.prof).
+ - <stage>_top.txt: the top functions by cumulative and internal time.
+ - <stage>_memory.txt: the top memory allocations by line (tracemalloc, --profile_memory only).
+
+The stages are selected with the step1_1 command argument --profile (i.e. --profile step1_6,step2_2) or the RMB_PROFILE
+environment variable, matched against the start of the stage module name (i.e. step1_6 matches
+step1_6_fc_zonal_stats; stage1_6 is accepted for step1_6; all selects every stage). The settings are held in environment
+variables so that they reach the tile worker processes. When no stage is selected the stage main_routine is called
+directly.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import io
+import threading
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# environment variables holding the profile settings (inherited by the tile worker processes).
+PROFILE_ENV = 'RMB_PROFILE'
+PROFILE_MEMORY_ENV = 'RMB_PROFILE_MEMORY'
+PROFILE_DIR_ENV = 'RMB_PROFILE_DIR'
+
+# number of functions (and memory allocation lines) in the summaries.
+TOP_N = 30
+
+# a stage run within a profiled stage is not profiled again (per thread).
+_active = threading.local()
+
+
+def configure_fn(profile, profile_memory, profile_dir):
+    """ Store the profile settings in the environment (step1_1 command arguments).
+
+    @param profile: string object containing the comma separated stages to be profiled, or None.
+    @param profile_memory: boolean object, True to record tracemalloc snapshots of the profiled stages.
+    @param profile_dir: string object containing the path to the profile output directory.
+    """
+
+    if profile:
+        os.environ[PROFILE_ENV] = profile
+    if profile_memory:
+        os.environ[PROFILE_MEMORY_ENV] = '1'
+    if os.environ.get(PROFILE_ENV):
+        os.environ[PROFILE_DIR_ENV] = profile_dir
+        print('Profiling stages: ', os.environ[PROFILE_ENV], ' - output: ', profile_dir)
+
+
+def selected_fn(stage_name):
+    """ Determine if a stage has been selected for profiling.
+
+    @param stage_name: string object containing the stage (module) name.
+    @return selected: boolean object, True if the stage is to be profiled.
+    """
+
+    profile = os.environ.get(PROFILE_ENV)
+    if not profile:
+        return False
+
+    for stage in profile.split(','):
+        stage = stage.strip().replace('stage', 'step', 1)
+        if stage and (stage == 'all' or stage_name.startswith(stage)):
+            return True
+
+    return False
+
+
+def write_summary_fn(profiler, output_path):
+    """ Write the cProfile statistics (.prof) and the top functions by cumulative and internal time (_top.txt).
+
+    @param profiler: cProfile.Profile object containing the stage statistics.
+    @param output_path: string object containing the output path without the extension.
+    """
+
+    import pstats
+
+    profiler.dump_stats(output_path + '.prof')
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.strip_dirs()
+    for sort in ['cumulative', 'tottime']:
+        stream.write('=' * 50 + '\nTop {0} functions by {1}\n'.format(TOP_N, sort) + '=' * 50 + '\n')
+        stats.sort_stats(sort).print_stats(TOP_N)
+
+    with open(output_path + '_top.txt', 'w') as summary_file:
+        summary_file.write(stream.getvalue())
+
+
+def write_memory_fn(snapshot, output_path):
+    """ Write the top memory allocations by line of a tracemalloc snapshot (_memory.txt).
+
+    @param snapshot: tracemalloc.Snapshot object taken at the end of the stage.
+    @param output_path: string object containing the output path without the extension.
+    """
+
+    statistic_list = snapshot.statistics('lineno')
+
+    with open(output_path + '_memory.txt', 'w') as memory_file:
+        memory_file.write('Top {0} memory allocations by line (total {1:.1f} MB)\n'.format(
+            TOP_N, sum(statistic.size for statistic in statistic_list) / 1048576.0))
+        for statistic in statistic_list[:TOP_N]:
+            memory_file.write('{0}\n'.format(statistic))
+
+
+def profile_call_fn(stage_fn, *args, **kwargs):
+    """ Call a stage main_routine, within cProfile (and tracemalloc) if the stage has been selected for profiling.
+
+    @param stage_fn: function object containing the stage main_routine.
+    @param args: the positional arguments of stage_fn.
+    @param kwargs: the keyword arguments of stage_fn; profile_tag (i.e. the tile) is appended to the output names.
+    @return result: the return value of stage_fn.
+    """
+
+    profile_tag = kwargs.pop('profile_tag', None)
+    stage_name = stage_fn.__module__
+
+    if not selected_fn(stage_name) or getattr(_active, 'stage', None):
+        return stage_fn(*args, **kwargs)
+
+    import cProfile
+    import tracemalloc
+
+    profile_dir = os.environ.get(PROFILE_DIR_ENV) or os.path.join(os.getcwd(), 'profile')
+    if not os.path.exists(profile_dir):
+        os.makedirs(profile_dir)
+    output_path = os.path.join(profile_dir, stage_name + ('_' + str(profile_tag) if profile_tag else ''))
+
+    trace_memory = bool(os.environ.get(PROFILE_MEMORY_ENV)) and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+
+    profiler = cProfile.Profile()
+    _active.stage = stage_name
+    try:
+        return profiler.runcall(stage_fn, *args, **kwargs)
+
+    finally:
+        _active.stage = None
+        write_summary_fn(profiler, output_path)
+        if trace_memory:
+            write_memory_fn(tracemalloc.take_snapshot(), output_path)
+            tracemalloc.stop()
+        print('Profile: ', output_path + '.prof')
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+"""
+startup_benchmark.py
+====================
+
+Description: This script measures the start up time of the pipeline entry points (i.e. step1_1 --help), so that a heavy
+library import (geopandas, rasterio, matplotlib or bokeh) creeping back into the start up path shows up as a
+regression.
+
+1. Each entry point is run --repeats times in a new Python process; the time taken by the process and by the entry
+point itself (module imports and argument parsing) are recorded, with the heavy libraries loaded by the entry point.
+
+2. Entry points that should start without the heavy libraries (i.e. --help) fail the benchmark if one is loaded.
+
+3. The results are written to startup_report.json within --output_dir and printed as a table. When an earlier report
+is provided (--baseline), an entry point whose median time grew by more than --tolerance (fraction) fails the
+benchmark; the script exits with 1 on a failure so it can be run by a scheduled job, i.e.
+python startup_benchmark.py -o /tmp/rmb_startup --baseline /tmp/rmb_startup/startup_report.json
+
+4. --import_time also writes the python -X importtime breakdown of each entry point (<entry>_importtime.txt).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# directory containing the pipeline scripts.
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# heavy libraries that should only be imported by the stages that use them.
+HEAVY_MODULE_LIST = ['numpy', 'pandas', 'geopandas', 'shapely', 'fiona', 'rasterio', 'rasterstats', 'matplotlib',
+                     'bokeh']
+
+# entry points: name, script (.py - run as __main__) or module (imported), command arguments and whether the entry
+# point must start without the heavy libraries.
+ENTRY_LIST = [
+    ('python', 'this', [], True),
+    ('step1_1_help', 'step1_1_initiate_fractional_cover_zonal_stats_pipeline.py', ['--help'], True),
+    ('step2_1_import', 'step2_1_initiate_zonal_stats_plot_pipeline', [], True),
+    ('step2_1_independent_help', 'step2_1_initiate_zonal_stats_plot_pipeline_independent.py', ['--help'], True),
+    ('shard_merge_help', 'shard_merge.py', ['--help'], True),
+    ('scene_queue_help', 'scene_queue.py', ['--help'], True),
+    ('odk_watch_import', 'odk_watch', [], True),
+    ('step1_6_import', 'step1_6_fc_zonal_stats', [], False),
+    ('step2_2_import', 'step2_2_bare_ground_plots', [], False),
+    ('step2_3_import', 'step2_3_interactive_plots', [], False),
+]
+
+# code run within the benchmark process - the result is written as the last line of stdout.
+CHILD_CODE = r"""
+import sys, json, time, runpy
+start = time.time()
+target = sys.argv[1]
+sys.argv = [target] + sys.argv[2:]
+sys.path.insert(0, {code_dir!r})
+try:
+    if target.endswith('.py'):
+        runpy.run_path(target, run_name='__main__')
+    elif target != 'this':
+        __import__(target)
+except SystemExit:
+    pass
+seconds = time.time() - start
+print('')
+print(json.dumps({{'seconds': seconds, 'modules': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(description='Measure the start up time of the pipeline entry points.')
+
+    p.add_argument('-o', '--output_dir', default=os.getcwd(),
+                   help='Directory for startup_report.json (default: the current directory).')
+
+    p.add_argument('-n', '--repeats', type=int, default=5, help='Number of runs of each entry point (default 5).')
+
+    p.add_argument('-b', '--baseline', default=None, help='Path to an earlier startup_report.json to compare with.')
+
+    p.add_argument('-tl', '--tolerance', type=float, default=0.5,
+                   help='Allowed growth (fraction) of the median time over the baseline (default 0.5).')
+
+    p.add_argument('-it', '--import_time', action='store_true',
+                   help='Write the python -X importtime breakdown of each entry point.')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def median_fn(value_list):
+    """ Return the median of a list of values. """
+
+    value_list = sorted(value_list)
+    middle = len(value_list) // 2
+
+    if len(value_list) % 2:
+        return value_list[middle]
+
+    return (value_list[middle - 1] + value_list[middle]) / 2.0
+
+
+def run_entry_fn(target, argument_list, option_list=None):
+    """ Run an entry point in a new Python process.
+
+    @param target: string object containing the script (.py) or module name of the entry point.
+    @param argument_list: list object containing the command arguments of the entry point.
+    @param option_list: list object containing additional Python interpreter options (i.e. -X importtime).
+    @return process_seconds: float object containing the time taken by the process.
+    @return result: dictionary object containing the time taken by the entry point and the heavy libraries loaded.
+    @return stderr: string object containing the process stderr.
+    """
+
+    code = CHILD_CODE.format(code_dir=CODE_DIR, heavy=HEAVY_MODULE_LIST)
+    command = [sys.executable] + (option_list or []) + ['-c', code, target] + argument_list
+
+    start = time.time()
+    process = subprocess.Popen(command, cwd=CODE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, stderr = process.communicate()
+    process_seconds = time.time() - start
+
+    try:
+        result = json.loads(stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        raise RuntimeError('The entry point failed: {0} {1}\n{2}'.format(target, ' '.join(argument_list), stderr))
+
+    return process_seconds, result, stderr
+
+
+def benchmark_entry_fn(name, target, argument_list, light, repeats, output_dir, import_time):
+    """ Run an entry point repeatedly and summarise the start up times.
+
+    @param name: string object containing the entry point name.
+    @param target: string object containing the script (.py) or module name of the entry point.
+    @param argument_list: list object containing the command arguments of the entry point.
+    @param light: boolean object, True if the entry point must start without the heavy libraries.
+    @param repeats: integer object containing the number of runs.
+    @param output_dir: string object containing the path to the output directory.
+    @param import_time: boolean object, True to write the python -X importtime breakdown.
+    @return entry: dictionary object containing the entry point results.
+    """
+
+    process_list = []
+    entry_list = []
+    module_list = []
+
+    for n in range(max(1, repeats)):
+        process_seconds, result, stderr = run_entry_fn(target, argument_list)
+        process_list.append(process_seconds)
+        entry_list.append(result['seconds'])
+        module_list = result['modules']
+
+    if import_time:
+        process_seconds, result, stderr = run_entry_fn(target, argument_list, ['-X', 'importtime'])
+        with open(os.path.join(output_dir, name + '_importtime.txt'), 'w') as import_file:
+            import_file.write(stderr)
+
+    entry = {'name': name,
+             'command': ' '.join([target] + argument_list),
+             'process_median': median_fn(process_list),
+             'process_min': min(process_list),
+             'entry_median': median_fn(entry_list),
+             'heavy_modules': module_list,
+             'light': light,
+             'failures': []}
+
+    if light and module_list:
+        entry['failures'].append('heavy libraries loaded at start up: ' + ', '.join(module_list))
+
+    return entry
+
+
+def compare_baseline_fn(entry_list, baseline, tolerance):
+    """ Record a failure for each entry point whose median process time grew by more than the tolerance.
+
+    @param entry_list: list object containing the entry point results.
+    @param baseline: string object containing the path to an earlier startup_report.json.
+    @param tolerance: float object containing the allowed growth (fraction) of the median time.
+    """
+
+    with open(baseline, 'r') as baseline_file:
+        baseline_dict = dict((entry['name'], entry) for entry in json.load(baseline_file)['entries'])
+
+    for entry in entry_list:
+        previous = baseline_dict.get(entry['name'])
+        if previous is None or not entry['process_median']:
+            continue
+
+        entry['baseline_median'] = previous['process_median']
+        if entry['process_median'] > previous['process_median'] * (1.0 + tolerance):
+            entry['failures'].append('median start up {0:.2f}s exceeds the baseline {1:.2f}s by more than '
+                                     '{2:.0%}'.format(entry['process_median'], previous['process_median'], tolerance))
+
+
+def print_report_fn(entry_list):
+    """ Print the start up times as a table. """
+
+    print('=' * 100)
+    print('{0:<28}{1:>12}{2:>12}{3:>12}{4:>12}  {5}'.format('entry point', 'median (s)', 'min (s)', 'entry (s)',
+                                                           'baseline', 'heavy libraries'))
+    print('-' * 100)
+
+    for entry in entry_list:
+        baseline = entry.get('baseline_median')
+        print('{0:<28}{1:>12.3f}{2:>12.3f}{3:>12.3f}{4:>12}  {5}'.format(
+            entry['name'], entry['process_median'], entry['process_min'], entry['entry_median'],
+            '' if baseline is None else '{0:.3f}'.format(baseline), ', '.join(entry['heavy_modules']) or '-'))
+
+    print('=' * 100)
+
+    for entry in entry_list:
+        for failure in entry['failures']:
+            print('FAILED - {0}: {1}'.format(entry['name'], failure))
+
+
+def main_routine():
+    """ Measure the start up time of each entry point, compare with the baseline and write startup_report.json. """
+
+    cmd_args = get_cmd_args_fn()
+    output_dir = os.path.abspath(cmd_args.output_dir)
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    entry_list = []
+    for name, target, argument_list, light in ENTRY_LIST:
+        print('Measuring: ', name)
+        try:
+            entry_list.append(benchmark_entry_fn(name, target, argument_list, light, cmd_args.repeats, output_dir,
+                                                 cmd_args.import_time))
+        except RuntimeError as error:
+            print(error)
+            entry_list.append({'name': name, 'command': ' '.join([target] + argument_list), 'process_median': 0.0,
+                               'process_min': 0.0, 'entry_median': 0.0, 'heavy_modules': [], 'light': light,
+                               'failures': ['the entry point failed to start']})
+
+    if cmd_args.baseline is not None:
+        compare_baseline_fn(entry_list, cmd_args.baseline, cmd_args.tolerance)
+
+    print_report_fn(entry_list)
+
+    report = {'created': str(datetime.now()),
+              'python': sys.version.split(' ')[0],
+              'platform': platform.platform(),
+              'repeats': cmd_args.repeats,
+              'entries': entry_list}
+
+    # the report is written after the baseline is read (the baseline may be the previous report).
+    with open(os.path.join(output_dir, 'startup_report.json'), 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    if any(entry['failures'] for entry in entry_list):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_routine()
@@ -102,6 +102,119 @@ Landsat images. -- default set to 'dilm3_zstdmask.img'
 string object from the concatenation of the end part of the filename search criteria for the QLD Rainfall images.
 -- default set to '.img'
 
+--incremental
+flag - only process ODK files and (site, date) records that are new or have changed since the last run (recorded in
+the odk_state_ledger.json file within the export directory) and merge the new outputs with the previous outputs.
+
+--cache_dir: str
+string object containing the path to a local directory used to cache parsed ODK csv files and derived assets between
+runs (i.e. the projected and buffered Landsat tile grid) -- default set to the rmb_zonal_stats_cache folder in your
+home directory. Enter 'None' to disable the cache.
+
+--debug_dump
+flag - the 1ha sites are handed between step1_3, step1_4, step1_6 and step1_7 in memory; when set, the intermediate
+shapefiles (per site buffers, tile grid, identity and site by tile shapefiles) are also written to the temporary
+directory.
+
+--best_tile_only
+flag - predict the best Landsat tile for each site overlaying more than one tile (estimated valid observations, site
+coverage and distance to the tile edge) and only process the best tile of each site (best_tile_plan.csv is exported
+to the tile_status_lists directory).
+
+--resume: str
+string object containing the path to the run directory (i.e. export_dir/user_YYYYMMDD_HHMM) of a failed or
+interrupted run. The run directory is re-used and every stage recorded in its run_manifest.json with unchanged inputs
+and complete outputs is skipped -- default set to None (a new run directory is created).
+
+--tile_workers: int
+integer object containing the number of Landsat tiles processed at once (step1_6 fractional cover zonal stats run in
+separate processes) -- default set to 1.
+
+--io_workers: int
+integer object containing the number of step1_7 rainfall zonal stats (I/O heavy) run at once alongside the fractional
+cover zonal stats; with one tile worker and one io worker the tiles are processed one at a time -- default set to 1.
+
+--memory_budget: int
+integer object containing the memory budget (MB) of the tiles being processed at once; a tile is only started when its
+estimated memory fits within the budget -- default set to 0 (no budget).
+
+--max_memory: int
+integer object containing the peak memory budget (MB) of the fractional cover zonal stats (step1_6) of the tiles
+processed at once; each of the --tile_workers is given an equal share of the budget and the scenes and sites of its tile
+are processed in chunks within the share, spilled to the temporary directory and merged into the tile csv -- default
+set to 0 (the tile is processed at once).
+
+--profile: str
+string object containing the comma separated stages (step module names, i.e. step1_6,step2_2 or all) to be run within
+cProfile. The .prof files and top function summaries are written to the profile sub-directory of the export directory
+(the RMB_PROFILE environment variable may be used instead) -- default set to None (no profiling).
+
+--profile_memory
+flag - record tracemalloc snapshots (top memory allocations by line) of the profiled stages.
+
+--shard: str
+string object containing the shard number and number of shards (i.e. 2/4) used to split a run across processing
+machines sharing the export drive. The Landsat tiles are assigned to the shards deterministically and the shard only
+calculates the zonal stats of its own tiles (export_dir/shard_i_of_N); once every shard is complete, shard_merge.py
+merges the shards into a single run directory and creates the plots -- default set to None (a single machine run).
+
+--scene_queue
+flag - hold the fractional cover zonal stats work in a SQLite work queue (export_dir/scene_queue), one task per
+(tile, scene). Tasks are leased with a timeout and failed tasks are retried; scenes that fail every attempt are left out
+of the tile outputs rather than stopping the run. Additional workers (on this or other machines sharing the export
+drive) can drain the queue with scene_queue.py.
+
+--queue_workers: int
+integer object containing the number of additional local scene queue worker processes -- default set to 0.
+
+--lease_timeout: int
+integer object containing the number of seconds before the lease of a scene task expires and the scene is leased by
+another worker -- default set to 600.
+
+--max_attempts: int
+integer object containing the number of attempts of a scene task before the scene is excluded -- default set to 3.
+
+--watch
+flag - keep running and watch the ODK directory (--directory_odk) for new or changed star transect csv files; once the
+files have settled (--debounce) the new sites are run through the pipeline as an incremental run. The loaded assets and
+caches stay in memory between batches. Stop with Ctrl+C.
+
+--poll_interval: int
+integer object containing the number of seconds between polls of the ODK directory (--watch) -- default set to 60.
+
+--debounce: int
+integer object containing the number of seconds a new or changed ODK file must be unchanged before it is processed
+(--watch) -- default set to 120.
+
+--staging_dir: str
+string object containing the path to a local directory used to stage (copy) the Landsat scenes and rainfall images
+from the network drive before they are read; the scenes of the next tile are staged in the background -- default set
+to None (the rasters are read from the network drive).
+
+--staging_size: int
+integer object containing the size limit (MB) of the staging directory; the least recently used rasters that are not
+being read are deleted to make room (a raster that does not fit is read from the network) -- default set to 20000.
+
+--plan
+flag - run step1_2 to step1_5 from the file catalogues only (no raster is read), print the work breakdown per tile
+(sites, site visits, scenes and rainfall months) and estimate the run time from the throughput recorded by previous
+runs (run_report.json); the plan is written to run_plan.json within the export directory and nothing else is kept.
+
+--zonal_stats_store
+flag - load the fractional cover and rainfall zonal stats of the run into the consolidated store
+(zonal_stats_store.sqlite within the export directory, one row per site, tile, scene and date - the latest run
+replaces a site's time series) and read the zonal stats of the plot and filing stages (step2_1 - step2_5) from it.
+
+--parquet
+flag - also write the fractional cover and rainfall zonal stats as a Parquet dataset partitioned by property code,
+tile and year (export_dir/parquet, requires pyarrow); step2_5 files each property from its partitions.
+
+--spatial_format: str
+format of the spatial intermediates (shp, gpkg or parquet) - the temporary and debug layers of step1_3 - step1_7 and
+the landsat_tile_site_identity layer are written as shapefiles, as layers of one GeoPackage per directory
+(intermediate_layers.gpkg) or as GeoParquet files (requires pyarrow); the final deliverables remain shapefiles.
+-- default set to shp
+
 ======================================================================================================
 
 """
@@ -112,9 +225,21 @@ import os
 from datetime import datetime
 import argparse
 import shutil
+import tempfile
+import time
 import sys
 import warnings
 import glob
+import odk_ingest
+import odk_state_ledger
+import pipeline_runner
+import run_report
+import raster_staging
+import zonal_stats_parquet
+import spatial_io
+import zonal_stats_chunks
+import stage_profiler
+import shard_merge
 
 warnings.filterwarnings("ignore")
 
@@ -182,8 +307,110 @@ def get_cmd_args_fn():
     p.add_argument('-pd', '--pastoral_districts_dir', help='File path to the Pastoral_Districts directory.',
                    default=r"U:\Pastoral_Districts")
 
+    p.add_argument('-c', '--cache_dir',
+                   help='Local directory used to cache parsed ODK csv files and derived assets between runs. '
+                        'Enter "None" to disable the cache.',
+                   default=os.path.join(os.path.expanduser("~"), 'rmb_zonal_stats_cache'))
+
+    p.add_argument('-in', '--incremental', action='store_true',
+                   help='Only process ODK files and (site, date) records that are new or changed since the last run '
+                        '(state ledger in the export directory) and merge them into the previous outputs.')
+
+    p.add_argument('-dd', '--debug_dump', action='store_true',
+                   help='Write the intermediate shapefiles of step1_3, step1_4 and step1_7 to the temporary directory.')
+
+    p.add_argument('-bt', '--best_tile_only', action='store_true',
+                   help='Predict the best Landsat tile for each site and only process the best tile of each site.')
+
+    p.add_argument('-rs', '--resume', default=None,
+                   help='Path to the run directory (export directory) of a failed run to resume - stages with unchanged '
+                        'inputs and complete outputs (run_manifest.json) are skipped.')
+
+    p.add_argument('-tw', '--tile_workers', type=int, default=1,
+                   help='The number of Landsat tiles processed at once (fractional cover zonal stats processes).')
+
+    p.add_argument('-iw', '--io_workers', type=int, default=1,
+                   help='The number of rainfall zonal stats run at once alongside the fractional cover zonal stats '
+                        '(default 1 - with one tile worker the tiles are processed one at a time).')
+
+    p.add_argument('-mb', '--memory_budget', type=int, default=0,
+                   help='The memory budget (MB) of the tiles processed at once (0 - no budget).')
+
+    p.add_argument('-mm', '--max_memory', type=int, default=0,
+                   help='The peak memory budget (MB) of the step1_6 zonal stats of the tiles processed at once, shared '
+                        'equally by the tile workers - the scenes and sites are processed in chunks (0 - the tile is '
+                        'processed at once).')
+
+    p.add_argument('-pf', '--profile', default=None,
+                   help='Comma separated stages to run within cProfile (i.e. step1_6,step2_2 or all) - the .prof files '
+                        'and top function summaries are written to export_dir/profile.')
+
+    p.add_argument('-pm', '--profile_memory', action='store_true',
+                   help='Record tracemalloc memory snapshots of the profiled stages.')
+
+    p.add_argument('-sh', '--shard', default=None,
+                   help='Process one shard of the Landsat tiles (i.e. 2/4) - the shards are merged with '
+                        'shard_merge.py.')
+
+    p.add_argument('-sq', '--scene_queue', action='store_true',
+                   help='Hold the fractional cover zonal stats work in a SQLite work queue (one task per tile and '
+                        'scene) drained by leasing workers.')
+
+    p.add_argument('-qw', '--queue_workers', type=int, default=0,
+                   help='Number of additional local scene queue worker processes (default 0).')
+
+    p.add_argument('-lt', '--lease_timeout', type=int, default=600,
+                   help='Seconds before the lease of a scene task expires (default 600).')
+
+    p.add_argument('-ma', '--max_attempts', type=int, default=3,
+                   help='Number of attempts of a scene task before the scene is excluded (default 3).')
+
+    p.add_argument('-w', '--watch', action='store_true',
+                   help='Watch the ODK directory and run new or changed ODK files through the pipeline as they land.')
+
+    p.add_argument('-pi', '--poll_interval', type=int, default=60,
+                   help='Seconds between polls of the ODK directory (--watch, default 60).')
+
+    p.add_argument('-db', '--debounce', type=int, default=120,
+                   help='Seconds a new or changed ODK file must be unchanged before it is processed (--watch, '
+                        'default 120).')
+
+    p.add_argument('-sd', '--staging_dir', default=None,
+                   help='Local directory used to stage the Landsat scenes and rainfall images read from the network '
+                        'drive (default None - no staging).')
+
+    p.add_argument('-ss', '--staging_size', type=int, default=20000,
+                   help='Size limit (MB) of the staging directory (--staging_dir, default 20000).')
+
+    p.add_argument('-pl', '--plan', action='store_true',
+                   help='Print the work breakdown per tile and the estimated run time without reading any raster.')
+
+    p.add_argument('-zs', '--zonal_stats_store', action='store_true',
+                   help='Load the zonal stats into the consolidated store (export_dir/zonal_stats_store.sqlite) and '
+                        'read the plot and filing stage zonal stats from it.')
+
+    p.add_argument('-pq', '--parquet', action='store_true',
+                   help='Also write the zonal stats as a Parquet dataset partitioned by property code, tile and year '
+                        '(requires pyarrow).')
+
+    p.add_argument('-sf', '--spatial_format', choices=spatial_io.FORMAT_LIST, default='shp',
+                   help='Format of the spatial intermediates: shp, gpkg (one GeoPackage per directory) or parquet '
+                        '(GeoParquet, requires pyarrow) - the final deliverables remain shapefiles.')
+
     cmd_args = p.parse_args()
 
+    if cmd_args.shard is not None:
+        try:
+            shard_merge.parse_shard_fn(cmd_args.shard)
+        except ValueError as error:
+            p.error(str(error))
+
+    if cmd_args.watch and (cmd_args.resume is not None or cmd_args.shard is not None):
+        p.error('--watch can not be used with --resume or --shard')
+
+    if cmd_args.plan and (cmd_args.resume is not None or cmd_args.watch):
+        p.error('--plan can not be used with --resume or --watch')
+
     if cmd_args.directory_odk is None:
         p.print_help()
 
@@ -192,24 +419,27 @@ def get_cmd_args_fn():
     return cmd_args
 
 
-def temporary_dir_fn():
+def temporary_dir_fn(suffix=''):
     """ Create a temporary directory 'user_YYYMMDD_HHMM'.
 
+    @param suffix: string object appended to the directory name (i.e. the shard of a shard run).
     @return temp_dir_path: string object containing the newly created directory path.
     @return final_user: string object containing the user id or the operator.
     """
 
     # extract user name
     home_dir = os.path.expanduser("~")
-    _, user = home_dir.rsplit('\\', 1)
+    user = os.path.basename(home_dir)
     final_user = user[3:]
 
     # create file name based on date and time.
     date_time_replace = str(datetime.now()).replace('-', '')
     date_time_list = date_time_replace.split(' ')
     date_time_list_split = date_time_list[1].split(':')
-    temp_dir_path = '\\' + str(final_user) + '_' + str(date_time_list[0]) + '_' + str(
-        date_time_list_split[0]) + str(date_time_list_split[1])
+    # the root of the working drive (Windows) or the system temporary directory.
+    temp_root = os.path.abspath(os.sep) if os.name == 'nt' else tempfile.gettempdir()
+    temp_dir_path = os.path.join(temp_root, str(final_user) + '_' + str(date_time_list[0]) + '_' + str(
+        date_time_list_split[0]) + str(date_time_list_split[1]) + suffix)
 
     # check if the folder already exists - if False = create directory, if True = return error message zzzz.
     try:
@@ -235,19 +465,19 @@ def temp_dir_folders_fn(temp_dir_path):
 
     """
 
-    prime_temp_grid_dir = temp_dir_path + '\\temp_tile_grid'
+    prime_temp_grid_dir = os.path.join(temp_dir_path, 'temp_tile_grid')
     os.mkdir(prime_temp_grid_dir)
 
-    zonal_stats_ready_dir = prime_temp_grid_dir + '\\zonal_stats_ready'
+    zonal_stats_ready_dir = os.path.join(prime_temp_grid_dir, 'zonal_stats_ready')
     os.makedirs(zonal_stats_ready_dir)
 
-    proj_tile_grid_sep_dir = prime_temp_grid_dir + '\\separation'
+    proj_tile_grid_sep_dir = os.path.join(prime_temp_grid_dir, 'separation')
     os.makedirs(proj_tile_grid_sep_dir)
 
-    prime_temp_buffer_dir = temp_dir_path + '\\temp_1ha_buffer'
+    prime_temp_buffer_dir = os.path.join(temp_dir_path, 'temp_1ha_buffer')
     os.mkdir(prime_temp_buffer_dir)
 
-    gcs_wgs84_dir = (temp_dir_path + '\\gcs_wgs84')
+    gcs_wgs84_dir = os.path.join(temp_dir_path, 'gcs_wgs84')
     os.mkdir(gcs_wgs84_dir)
 
     return prime_temp_grid_dir, prime_temp_buffer_dir
@@ -265,9 +495,9 @@ def export_file_path_fn(export_dir, final_user):
     date_time_replace = str(datetime.now()).replace('-', '')
     date_time_list = date_time_replace.split(' ')
     date_time_list_split = date_time_list[1].split(':')
-    export_dir_path = export_dir + '\\' + final_user + '_' + str(date_time_list[0]) + '_' + str(
+    export_dir_path = os.path.join(export_dir, final_user + '_' + str(date_time_list[0]) + '_' + str(
         date_time_list_split[0]) + str(
-        date_time_list_split[1])
+        date_time_list_split[1]))
 
     # check if the folder already exists - if False = create directory, if True = return error message.
     try:
@@ -283,6 +513,16 @@ def export_file_path_fn(export_dir, final_user):
     return export_dir_path
 
 
+def make_dir_fn(directory):
+    """ Create a directory if it does not already exist (i.e. a resumed run directory).
+
+    @param directory: string object containing the path to the directory.
+    """
+
+    if not os.path.exists(directory):
+        os.mkdir(directory)
+
+
 def export_dir_folders_fn(export_dir_path):
     """ Create sub-folders within the export directory.
 
@@ -295,46 +535,55 @@ def export_dir_folders_fn(export_dir_path):
     @return rainfall_output_dir:
     """
 
-    rainfall_output_dir = (export_dir_path + '\\rainfall')
-    os.mkdir(rainfall_output_dir)
+    rainfall_output_dir = os.path.join(export_dir_path, 'rainfall')
+    make_dir_fn(rainfall_output_dir)
 
-    tile_status_dir = (export_dir_path + '\\tile_status')
-    os.mkdir(tile_status_dir)
+    tile_status_dir = os.path.join(export_dir_path, 'tile_status')
+    make_dir_fn(tile_status_dir)
 
-    tile_for_processing_dir = (tile_status_dir + '\\for_processing')
-    os.mkdir(tile_for_processing_dir)
+    tile_for_processing_dir = os.path.join(tile_status_dir, 'for_processing')
+    make_dir_fn(tile_for_processing_dir)
 
-    insuf_files_dir = (tile_status_dir + '\\insufficient_files')
-    os.mkdir(insuf_files_dir)
+    insuf_files_dir = os.path.join(tile_status_dir, 'insufficient_files')
+    make_dir_fn(insuf_files_dir)
 
-    stat_list_dir = tile_status_dir + '\\tile_status_lists'
-    os.mkdir(stat_list_dir)
+    stat_list_dir = os.path.join(tile_status_dir, 'tile_status_lists')
+    make_dir_fn(stat_list_dir)
 
-    plot_dir = export_dir_path + '\\plots'
-    os.mkdir(plot_dir)
+    plot_dir = os.path.join(export_dir_path, 'plots')
+    make_dir_fn(plot_dir)
 
-    interactive_outputs = plot_dir + '\\interactive'
-    os.mkdir(interactive_outputs)
+    interactive_outputs = os.path.join(plot_dir, 'interactive')
+    make_dir_fn(interactive_outputs)
 
-    final_plot_outputs = export_dir_path + '\\final_plots'
-    os.mkdir(final_plot_outputs)
+    final_plot_outputs = os.path.join(export_dir_path, 'final_plots')
+    make_dir_fn(final_plot_outputs)
 
-    final_interactive_outputs = export_dir_path + '\\final_interactive'
-    os.mkdir(final_interactive_outputs)
+    final_interactive_outputs = os.path.join(export_dir_path, 'final_interactive')
+    make_dir_fn(final_interactive_outputs)
 
-    zonal_stats_output_dir = (export_dir_path + '\\zonal_stats')
-    os.mkdir(zonal_stats_output_dir)
+    zonal_stats_output_dir = os.path.join(export_dir_path, 'zonal_stats')
+    make_dir_fn(zonal_stats_output_dir)
 
     return tile_status_dir, plot_dir, zonal_stats_output_dir, rainfall_output_dir
 
 
-def main_routine():
+def main_routine(cmd_args=None):
     """" Description: This script determines which Landsat tile had the most non null zonal statistics records per site
-    and files those plots (bare ground, all bands and interactive) into final output folders. """
+    and files those plots (bare ground, all bands and interactive) into final output folders. The command arguments
+    are read in when they are not provided (each --watch batch is run with its own command arguments). """
 
     # print('fcZonalStatsPipeline.py INITIATED.')
     # read in the command arguments
-    cmd_args = get_cmd_args_fn()
+    if cmd_args is None:
+        cmd_args = get_cmd_args_fn()
+
+        if cmd_args.watch:
+            # run each batch of new ODK files within this process (odk_watch).
+            import odk_watch
+            odk_watch.watch_fn(cmd_args, main_routine)
+            return
+
     directory_odk = cmd_args.directory_odk
     tile_grid = cmd_args.tile_grid
     export_dir = cmd_args.export_dir
@@ -351,65 +600,275 @@ def main_routine():
     rolling_mean = cmd_args.rolling_mean
     end_date = cmd_args.end_date
     pastoral_districts_dir = cmd_args.pastoral_districts_dir
+    cache_dir = None if str(cmd_args.cache_dir) == 'None' else cmd_args.cache_dir
+    incremental = cmd_args.incremental
+    debug_dump = cmd_args.debug_dump
+    best_tile_only = cmd_args.best_tile_only
+    resume = cmd_args.resume
+    tile_workers = cmd_args.tile_workers
+    io_workers = cmd_args.io_workers
+    memory_budget = cmd_args.memory_budget
+    max_memory = cmd_args.max_memory
+    profile = cmd_args.profile
+    profile_memory = cmd_args.profile_memory
+    shard = cmd_args.shard
+    scene_queue_flag = cmd_args.scene_queue
+    staging_dir = cmd_args.staging_dir
+    staging_size = cmd_args.staging_size
+    plan = cmd_args.plan
+    zonal_stats_store_flag = cmd_args.zonal_stats_store
+    parquet = cmd_args.parquet
+    spatial_format = cmd_args.spatial_format
 
     print("This pipeline is set to work on the new FC files (dp0)")
 
-    # call the temporaryDir function.
-    temp_dir_path, final_user = temporary_dir_fn()
+    if shard is not None:
+        shard_index, shard_count = shard_merge.parse_shard_fn(shard)
+        shard_name = '_' + shard_merge.SHARD_DIR_TEMPLATE.format(shard_index, shard_count)
+    else:
+        shard_name = ''
+
+    # call the temporaryDir function (shards run on the same machine do not share a temporary directory).
+    temp_dir_path, final_user = temporary_dir_fn(shard_name)
     # call the tempDirFolders function.
     prime_temp_grid_dir, prime_temp_buffer_dir = temp_dir_folders_fn(temp_dir_path)
-    # call the exportFilepath function.
-    export_dir_path = export_file_path_fn(export_dir, final_user)
+
+    if plan:
+        # the plan stages write to the temporary directory - only run_plan.json is kept (--plan).
+        export_dir_path = os.path.join(temp_dir_path, 'plan')
+        os.makedirs(export_dir_path)
+    elif resume is not None:
+        # re-use the run directory of the failed (or interrupted) run - it is not deleted.
+        if not os.path.isdir(resume):
+            print('The run directory to resume does not exist: ', resume)
+            sys.exit(1)
+        export_dir_path = resume
+    elif shard is not None:
+        # every machine writes its shard to the shared export directory (export_dir/shard_i_of_N).
+        export_dir_path = shard_merge.shard_dir_fn(export_dir, shard_index, shard_count)
+        if os.path.exists(export_dir_path):
+            shutil.rmtree(export_dir_path)
+        os.makedirs(export_dir_path)
+    else:
+        # call the exportFilepath function.
+        export_dir_path = export_file_path_fn(export_dir, final_user)
     # call the exportDirFolders function.
     tile_status_dir, plot_dir, zonal_stats_output_dir, rainfall_output_dir = export_dir_folders_fn(export_dir_path)
 
     prop_of_interest = "None"
 
+    # read in the run manifest (stages completed by the run being resumed).
+    manifest = pipeline_runner.load_manifest_fn(export_dir_path, resume is not None)
+
+    # store the profile settings (--profile) - the selected stages are written to the export_dir/profile directory.
+    stage_profiler.configure_fn(profile, profile_memory, os.path.join(export_dir_path, 'profile'))
+
+    # store the raster staging settings (--staging_dir) - inherited by the tile and scene queue worker processes.
+    if not plan:
+        raster_staging.configure_fn(staging_dir, staging_size)
+
+    # store the Parquet setting (--parquet) - inherited by the tile and scene queue worker processes.
+    zonal_stats_parquet.configure_fn(parquet and not plan)
+
+    # store the spatial intermediate format (--spatial_format) - inherited by the tile and scene queue worker processes.
+    spatial_io.configure_fn(spatial_format)
+
+    # store the step1_6 memory budget (--max_memory) shared by the tile workers - inherited by the tile worker processes.
+    zonal_stats_chunks.configure_fn(max_memory, tile_workers)
+
+    # create the run report (performance of each stage and tile - run_report.json).
+    report = run_report.new_report_fn(export_dir_path, vars(cmd_args))
+
+    # read in the state ledger of previously processed ODK files and records.
+    ledger = odk_state_ledger.load_ledger_fn(export_dir, incremental)
+
     # call the step1_2_list_of_rainfall_images.py script.
     import step1_2_list_of_rainfall_images
-    export_rainfall, rain_start_date, rain_finish_date = step1_2_list_of_rainfall_images.main_routine(
-        export_dir_path, rainfall_dir, end_file_name)
+    export_rainfall, rain_start_date, rain_finish_date = pipeline_runner.run_stage_fn(
+        manifest, export_dir_path, 'step1_2_rainfall_list',
+        {'rainfall_dir': pipeline_runner.file_signature_fn(rainfall_dir), 'end_file_name': end_file_name},
+        lambda: stage_profiler.profile_call_fn(step1_2_list_of_rainfall_images.main_routine, export_dir_path,
+                                               rainfall_dir, end_file_name),
+        lambda state: [state[0]], report)
+
+    def collate_odk_stage_fn():
+        import step1_3_collate_odk_apply_1ha_buffer
+        geo_df_list = stage_profiler.profile_call_fn(
+            step1_3_collate_odk_apply_1ha_buffer.main_routine, directory_odk, export_dir_path, prime_temp_buffer_dir,
+            pastoral_estate, tile_grid, cache_dir, ledger, debug_dump)
+        # the staged ledger files and records are part of the stage state (committed at the end of the run).
+        return geo_df_list, ledger['pending_files'], ledger['pending_records']
+
+    (geo_df_52, crs_name_52, geo_df_53, crs_name_53, geo_df_54, crs_name_54), pending_files, pending_records = \
+        pipeline_runner.run_stage_fn(
+            manifest, export_dir_path, 'step1_3_collate_odk',
+            {'directory_odk': pipeline_runner.file_signature_fn(directory_odk),
+             'pastoral_estate': pipeline_runner.file_signature_fn(pastoral_estate),
+             'tile_grid': pipeline_runner.file_signature_fn(tile_grid), 'incremental': incremental,
+             'ledger_last_run': ledger.get('last_run')},
+            collate_odk_stage_fn,
+            lambda state: pipeline_runner.glob_output_fn(export_dir_path, 'comp_geo_df_1ha_*'), report)
+    ledger['pending_files'], ledger['pending_records'] = pending_files, pending_records
+
+    if geo_df_52 is None and geo_df_53 is None and geo_df_54 is None:
+        # incremental run with no new or changed ODK records - the changed files are recorded so they are not read in
+        # again (the previous run remains the last run).
+        odk_state_ledger.commit_files_fn(ledger, export_dir)
+        shutil.rmtree(temp_dir_path)
+        if resume is None and not plan:
+            shutil.rmtree(export_dir_path)
+        print('There are no new or changed ODK records since the last run - goodbye.')
+        return
 
-    import step1_3_collate_odk_apply_1ha_buffer
-    geo_df_52, crs_name_52, geo_df_53, crs_name_53, geo_df_54, crs_name_54 = step1_3_collate_odk_apply_1ha_buffer.main_routine(
-        directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral_estate)
+    if incremental:
+        # merge the ODK outputs (csv and shapefiles) of the previous run into this run directory.
+        odk_state_ledger.merge_odk_outputs_fn(ledger, export_dir_path)
 
     import step1_4_landsat_tile_grid_identify
-    comp_geo_df52, comp_geo_df53, comp_geo_df54, zonal_stats_ready_dir = step1_4_landsat_tile_grid_identify.main_routine(
-        tile_grid, geo_df_52, geo_df_53, geo_df_54, prime_temp_grid_dir)
+    comp_geo_df52, comp_geo_df53, comp_geo_df54, zonal_stats_ready_dir, site_tile_dict = pipeline_runner.run_stage_fn(
+        manifest, export_dir_path, 'step1_4_tile_identity',
+        {'step1_3_collate_odk': pipeline_runner.stage_key_fn(manifest, 'step1_3_collate_odk'),
+         'tile_grid': pipeline_runner.file_signature_fn(tile_grid)},
+        lambda: stage_profiler.profile_call_fn(step1_4_landsat_tile_grid_identify.main_routine, tile_grid, geo_df_52,
+                                               geo_df_53, geo_df_54, prime_temp_grid_dir, debug_dump, cache_dir),
+        report=report)
 
     # call the step1_5_fc_landsat_list.py script.
     import step1_5_fc_landsat_list
-    list_sufficient = step1_5_fc_landsat_list.main_routine(
-        export_dir_path, comp_geo_df52, comp_geo_df53, comp_geo_df54, fc_count, landsat_dir, image_search_criteria1,
-        image_search_criteria2, image_search_criteria4)
-
+    list_sufficient = pipeline_runner.run_stage_fn(
+        manifest, export_dir_path, 'step1_5_landsat_list',
+        {'step1_4_tile_identity': pipeline_runner.stage_key_fn(manifest, 'step1_4_tile_identity'),
+         'fc_count': fc_count, 'landsat_dir': landsat_dir, 'search_criteria': [image_search_criteria1,
+                                                                              image_search_criteria2,
+                                                                              image_search_criteria4]},
+        lambda: stage_profiler.profile_call_fn(
+            step1_5_fc_landsat_list.main_routine, export_dir_path, comp_geo_df52, comp_geo_df53, comp_geo_df54,
+            fc_count, landsat_dir, image_search_criteria1, image_search_criteria2, image_search_criteria4),
+        lambda state: pipeline_runner.glob_output_fn(tile_status_dir, os.path.join('*', '*.csv')), report)
+
+    if best_tile_only and plan:
+        print('The best tile plan (--best_tile_only) samples the Landsat scenes - every tile is included in the plan.')
+    elif best_tile_only:
+        # restrict each site to its predicted best tile (step2_4 would otherwise discard the other tiles).
+        import best_tile_planner
+        site_tile_dict = pipeline_runner.run_stage_fn(
+            manifest, export_dir_path, 'best_tile_plan',
+            {'step1_5_landsat_list': pipeline_runner.stage_key_fn(manifest, 'step1_5_landsat_list'),
+             'no_data': no_data},
+            lambda: stage_profiler.profile_call_fn(best_tile_planner.main_routine, site_tile_dict, tile_grid, cache_dir,
+                                                   tile_status_dir, no_data),
+            lambda state: pipeline_runner.glob_output_fn(tile_status_dir, os.path.join('tile_status_lists',
+                                                                                       'best_tile_plan.csv')),
+            report)
 
     # define the tile for processing directory.
-    tile_for_processing_dir = (tile_status_dir + '\\for_processing')
+    tile_for_processing_dir = os.path.join(tile_status_dir, 'for_processing')
     print('-' * 50)
 
-    zonal_stats_output = (export_dir_path + '\\zonal_stats')
+    zonal_stats_output = os.path.join(export_dir_path, 'zonal_stats')
     print('zonal_stats_output: ', zonal_stats_output)
     list_zonal_tile = []
 
-    for file in glob.glob(tile_for_processing_dir + '\\*.csv'):
+    for file in glob.glob(os.path.join(tile_for_processing_dir, '*.csv')):
         print(file)
+        # tiles that are not the best tile of any site are skipped (--best_tile_only).
+        if os.path.basename(file)[:7].replace('_', '') not in site_tile_dict:
+            continue
         # append tile paths to list.
         list_zonal_tile.append(file)
 
+    if shard is not None:
+        # only the tiles assigned to this shard are processed (--shard).
+        list_zonal_tile = shard_merge.shard_tile_list_fn(list_zonal_tile, shard_index, shard_count)
+
+    if plan:
+        # print the work breakdown and the estimated run time - no raster is read (run_plan).
+        import run_plan
+        run_plan.main_routine(export_dir, list_zonal_tile, site_tile_dict, export_rainfall,
+                              time.time() - report['start_time'], tile_workers)
+        shutil.rmtree(temp_dir_path)
+        return
+
+    # ----------------------------------------------- Tile schedule ------------------------------------------------
+
+    import tile_scheduler
+    list_tile_stage = []
+    list_tile_task = []
+
     for tile in list_zonal_tile:
-        # call the step1_6_fc_zonal_stats.py script.
-        import step1_6_fc_zonal_stats
-        output_zonal_stats, complete_tile, tile, temp_dir_bands = step1_6_fc_zonal_stats.main_routine(
-            temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stats_output)
-
-        print('=' * 50)
-        print('tile: ', tile)
-        print('complete_tile: ', complete_tile)
-        import step1_7_monthly_rainfall_zonal_stats
-        step1_7_monthly_rainfall_zonal_stats.main_routine(
-            export_dir_path, zonal_stats_ready_dir, complete_tile, export_rainfall, temp_dir_path)
+        complete_tile = os.path.basename(tile)[:7].replace('_', '')
+
+        # the stage inputs are the tile scene list, the sites within the tile and the rainfall image list.
+        stage = 'step1_6_7_zonal_stats_' + complete_tile
+        input_hash = pipeline_runner.hash_object_fn(
+            {'scene_list': odk_ingest.file_hash_fn(tile),
+             'sites': site_tile_dict[complete_tile].drop(columns='geometry').to_dict('records'),
+             'geometry': [geometry.wkt for geometry in site_tile_dict[complete_tile].geometry],
+             'step1_2_rainfall_list': pipeline_runner.stage_key_fn(manifest, 'step1_2_rainfall_list'),
+             'no_data': no_data})
+        list_tile_stage.append(stage)
+
+        skip, state = pipeline_runner.stage_resume_fn(manifest, export_dir_path, stage, input_hash)
+        if skip:
+            run_report.record_tile_fn(report, complete_tile, 'status', 'skipped')
+        else:
+            list_tile_task.append(tile_scheduler.tile_task_fn(
+                tile, complete_tile, temp_dir_path, zonal_stats_ready_dir, no_data, zonal_stats_output,
+                export_dir_path, export_rainfall, site_tile_dict, debug_dump, stage, input_hash))
+
+    def tile_complete_fn(task):
+        # record each tile in the run manifest as soon as both of its zonal stats tasks are complete.
+        complete_tile = task['complete_tile']
+        fc_output_list = pipeline_runner.glob_output_fn(zonal_stats_output, '*_' + complete_tile + '_zonal_stats.csv')
+        rainfall_output_list = pipeline_runner.glob_output_fn(rainfall_output_dir,
+                                                              '*_' + complete_tile + '_rainfall_zonal_stats.csv')
+        pipeline_runner.record_stage_fn(manifest, export_dir_path, task['stage'], task['input_hash'], complete_tile,
+                                        fc_output_list + rainfall_output_list)
+
+        # record the performance of the tile tasks in the run report.
+        run_report.record_tile_fn(report, complete_tile, 'fc', run_report.add_counts_fn(
+            task['metrics']['fc'], output_list=fc_output_list))
+        run_report.record_tile_fn(report, complete_tile, 'rainfall', run_report.add_counts_fn(
+            task['metrics']['rainfall'], output_list=rainfall_output_list))
+        run_report.save_report_fn(report, export_dir_path)
+
+    worker_list = []
+    if scene_queue_flag and list_tile_task:
+        # one queue task per (tile, scene) - the tile tasks combine the scene results (--scene_queue).
+        import scene_queue
+        queue_path = scene_queue.create_queue_fn(export_dir_path, no_data, cmd_args.lease_timeout,
+                                                 cmd_args.max_attempts)
+        for task in list_tile_task:
+            scene_queue.enqueue_tile_fn(queue_path, task['tile'], task['complete_tile'], site_tile_dict,
+                                        task['input_hash'])
+            task['fc_fn'] = scene_queue.queue_fc_zonal_stats_task_fn
+            task['fc_args'] = (queue_path, task['tile'], zonal_stats_output)
+        print('Scene queue: ', queue_path)
+        worker_list = scene_queue.start_workers_fn(queue_path, cmd_args.queue_workers)
+
+    try:
+        failed_list, metrics = run_report.measure_fn(tile_scheduler.run_tile_schedule_fn, list_tile_task,
+                                                     tile_workers, io_workers, memory_budget, tile_complete_fn)
+    finally:
+        if worker_list:
+            scene_queue.stop_workers_fn(worker_list)
+    run_report.record_stage_fn(report, 'step1_6_7_zonal_stats', run_report.add_counts_fn(
+        metrics, scenes=sum(run_report.line_count_fn(task['tile']) or 0 for task in list_tile_task)))
+    run_report.save_report_fn(report, export_dir_path)
+
+    if failed_list:
+        raise RuntimeError('The zonal stats failed for tiles: {0} - rerun with --resume {1}'.format(
+            ', '.join(failed_list), export_dir_path))
+
+    list_tile_key = [pipeline_runner.stage_key_fn(manifest, stage) for stage in list_tile_stage]
+
+    if shard is not None:
+        # the plots and the state ledger are created once every shard is complete (shard_merge.py).
+        run_report.save_report_fn(report, export_dir_path, finished=True)
+        shutil.rmtree(temp_dir_path)
+        print('Shard {0} of {1} is complete: {2}'.format(shard_index, shard_count, export_dir_path))
+        print('Once every shard is complete, run: python shard_merge.py --export_dir {0}'.format(export_dir))
+        return
 
     # --------------------------------------------------- Plots -----------------------------------------------------
 
@@ -417,17 +876,52 @@ def main_routine():
     cmd = "E:\\DENR\\code\\rangeland_monitoring\\fractional_cover_zonal_stats_pipeline\\code\\step2_1_initiate_zonal_stats_plot_pipeline_independent.py --directory_zonal %s --export_dir %s --rainfall_dir %s --end_date %s --rainfall_raster_dir %s --visits %s --pastoral_estate %s --rolling_mean %s --pastoral_districts_dir %s" % (zonal_stats_output_dir, export_dir_path, rainfall_output_dir, end_date, rainfall_dir, previous_visits, pastoral_estate, rolling_mean, pastoral_districts_dir)
     os.system(cmd)"""
 
+    if incremental:
+        # merge the outputs of the previous run so that the plots, store and filed property outputs (step2_4 and
+        # step2_5) include every site - only the sites of this run are plotted.
+        odk_state_ledger.merge_previous_outputs_fn(ledger, export_dir_path)
+        plot_site_dict = odk_state_ledger.plot_site_dict_fn(site_tile_dict)
+    else:
+        plot_site_dict = None
+
+    if zonal_stats_store_flag:
+        # load the zonal stats of this run into the consolidated store (zonal_stats_store).
+        import zonal_stats_store
+        zonal_stats_store_path = zonal_stats_store.store_path_fn(export_dir)
+        zonal_stats_store.load_run_fn(zonal_stats_store_path, export_dir_path)
+    else:
+        zonal_stats_store_path = None
+
     import step2_1_initiate_zonal_stats_plot_pipeline
-    step2_1_initiate_zonal_stats_plot_pipeline.main_routine(zonal_stats_output_dir, export_dir_path,
-                                                                        rainfall_output_dir,
-                                                                        end_date, rainfall_dir, previous_visits, pastoral_estate,
-                                                                        rolling_mean, pastoral_districts_dir, zonal_stats_ready_dir)
+    pipeline_runner.run_stage_fn(
+        manifest, export_dir_path, 'step2_1_plots',
+        {'tiles': list_tile_key, 'end_date': end_date, 'rolling_mean': rolling_mean,
+         'zonal_stats_store': zonal_stats_store_flag,
+         'previous_visits': pipeline_runner.file_signature_fn(previous_visits),
+         'pastoral_estate': pipeline_runner.file_signature_fn(pastoral_estate),
+         'pastoral_districts_dir': pastoral_districts_dir},
+        lambda: stage_profiler.profile_call_fn(step2_1_initiate_zonal_stats_plot_pipeline.main_routine,
+                                               zonal_stats_output_dir, export_dir_path, rainfall_output_dir, end_date,
+                                               rainfall_dir, previous_visits, pastoral_estate, rolling_mean,
+                                               pastoral_districts_dir, site_tile_dict, report,
+                                               zonal_stats_store_path, plot_site_dict),
+        lambda state: (pipeline_runner.glob_output_fn(plot_dir, '*.*') +
+                       pipeline_runner.glob_output_fn(export_dir_path, os.path.join('final_*', '*.*'))),
+        report)
 
     """import step2_1_initiate_zonal_stats_plot_pipeline
     step2_1_initiate_zonal_stats_plot_pipeline.main_routine(export_dir_path, previous_visits, pastoral_estate, rolling_mean, rainfall_dir,
                                                             end_date, plot_dir, zonal_stats_output_dir,
                                                             rainfall_output_dir, pastoral_districts_dir)"""
 
+    # record the processed ODK files and records in the state ledger.
+    odk_state_ledger.commit_ledger_fn(ledger, export_dir, export_dir_path, [comp_geo_df52, comp_geo_df53,
+                                                                            comp_geo_df54])
+
+    # write the completed run report.
+    run_report.save_report_fn(report, export_dir_path, finished=True)
+    print('Run report: ', os.path.join(export_dir_path, run_report.RUN_REPORT_NAME))
+
     # delete the TempDir Path and its contents.
 
     shutil.rmtree(temp_dir_path)
@@ -436,6 +930,5 @@ def main_routine():
     print('fractional cover zonal stats pipeline is complete.')
     print('goodbye.')
 
-
 if __name__ == '__main__':
     main_routine()
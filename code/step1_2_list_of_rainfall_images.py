@@ -84,16 +84,14 @@ def rainfall_start_finish_dates_fn(list_image):
 
     path_s = list_image[0]
 
-    image_ = path_s.rsplit('\\')
-    image_name = image_[-1]
+    image_name = os.path.basename(path_s)
     year_s = image_name[:4]
     month_s = image_name[4:6]
     rain_start_date = (str(year_s) + '-' + str(month_s) + '-01')
     print('rain_start_date: ', rain_start_date)
 
     path_f = list_image[-1]
-    image_ = path_f.rsplit('\\')
-    image_name = image_[-1]
+    image_name = os.path.basename(path_f)
     year_f = image_name[:4]
     month_f = image_name[4:6]
     rain_finish_date = (str(year_f) + '-' + str(month_f) + '-30')
@@ -112,7 +110,7 @@ def output_csv_fn(list_image, export_dir_path):
     """
     # assumes that file_list is a flat list, it adds a new path in a new row, producing multiple observations.
     # todo remove the word new
-    export_rainfall = (export_dir_path + '\\rainfall_image_list_new.csv')
+    export_rainfall = os.path.join(export_dir_path, 'rainfall_image_list_new.csv')
     with open(export_rainfall, "w") as output:
         writer = csv.writer(output, lineterminator='\n')
         for file in list_image:
@@ -21,6 +21,9 @@ All integrated and RAS outputs and exports a csv and a projected shapefiles (WGS
 This script also applies a 1ha square buffer to each site and outputs a csv, projected shapefiles and a complete
 (cleaned) shapefile for executing step1_4_landsat_tile_grid_identify.py.
 
+Each site is only projected and buffered within the UTM zone(s) of the Landsat tiles it falls within
+(landsat_tile_grid.assign_site_zones_fn), sites outside of the tile grid are assigned a zone from their longitude.
+
 Note: Ras assessment have been turned off.
 
 Author: Rob McGregor
@@ -63,8 +66,13 @@ from shapely.geometry import Point
 import geopandas as gpd
 from geopandas import GeoDataFrame
 import pandas as pd
-import glob
 import sys
+import pastoral_estate_index
+import landsat_tile_grid
+import odk_ingest
+import odk_state_ledger
+import spatial_io
+import reprojection
 
 import warnings
 
@@ -106,47 +114,66 @@ def os_walk_odk_fn(directory_odk):
     return list_ras, list_integrated
 
 
-def concatenate_df_list(list_input):
+def concatenate_df_list(list_input, cache_dir=None):
     """ Concatenate ODK csv outputs into a Pandas DataFrame.
 
     @param list_input: list object containing all located integrated star transect OR RAS output file paths.
+    @param cache_dir: string object containing the path to the local cache directory (None disables the cache).
     @return output_df: Pandas dataframe containing the concatenated csv files from the input list.
     """
 
-    list_df = []
-    # list_length = len(list_input)
-
-    for i in list_input:
-
-        df = pd.read_csv(i)
-        if len(df.columns) == 234:
-            df1 = df
-        else:
-            df1 = df.iloc[:, 1:]
-
-        list_df.append(df1)
-    # Concatenate list of DataFrames into a single DataFrame.
-    output_df = pd.concat(list_df)
+    # Read the csv files in parallel - only the schema columns are read (odk_ingest.ODK_SCHEMA_DICT).
+    output_df = odk_ingest.read_odk_csv_list_fn(list_input, cache_dir)
 
     return output_df
 
 
-def single_csv_fn(list_input):
+def single_csv_fn(list_input, cache_dir=None):
     """ Create a Pandas DataFrame from a list with only one list element (csv path).
 
     @param list_input: list object containing all located integrated star transect OR RAS output file paths.
+    @param cache_dir: string object containing the path to the local cache directory (None disables the cache).
     @return df: Pandas dataframe containing the concatenated csv files from the input list
     """
     for i in list_input:
-        df = pd.read_csv(i)
-        if len(df.columns) == 234:
-            df1 = df
-        else:
-            df1 = df.iloc[:, 1:]
+        df1 = odk_ingest.read_odk_csv_fn(i, cache_dir)
 
     return df1
 
 
+def full_record_df_fn(list_input, record_df, cache_dir=None):
+    """ Read the full ODK records (every column) of the records retained in the pipeline dataframe, used for the odk
+    output csv and shapefile deliverables (the pipeline only reads the odk_ingest.ODK_SCHEMA_DICT columns).
+
+    @param list_input: list object containing all located integrated star transect OR RAS output file paths.
+    @param record_df: Pandas dataframe containing the retained records, indexed by their row position within the
+    concatenated csv files.
+    @param cache_dir: string object containing the path to the local cache directory (None disables the cache).
+    @return full_df: Pandas dataframe containing every column of the retained records.
+    """
+
+    # only the files containing a retained record are read in full.
+    full_df = odk_ingest.read_odk_record_rows_fn(list_input, record_df.index, cache_dir)
+    full_df.rename(columns={'final_prop': 'prop_name', 'site_orig': 'site_name'}, inplace=True)
+
+    return full_df
+
+
+def export_full_record_fn(full_df, geometry, drop_list, crs, shapefile_path):
+    """ Export the full ODK records as a point shapefile (deliverable).
+
+    @param full_df: Pandas dataframe containing every column of the retained records (full_record_df_fn).
+    @param geometry: list object containing the point geometry of each record.
+    @param drop_list: list object containing the coordinate columns to be removed.
+    @param crs: string object containing the crs of the point geometry.
+    @param shapefile_path: string object containing the path to the output shapefile.
+    """
+
+    export_df = full_df.drop(drop_list, axis=1)
+    export_df.date = export_df.date.astype(str)
+    GeoDataFrame(export_df, crs=crs, geometry=geometry).to_file(shapefile_path, driver='ESRI Shapefile')
+
+
 def projection_file_name_fn(epsg, clean_odk_geo_df):
     """ Project a geo-dataframe with the input epsg param and return several crs specific string and integer outputs.
 
@@ -188,28 +215,28 @@ def projection_file_name_fn(epsg, clean_odk_geo_df):
         new_dict = {'init': 'EPSG:' + str(epsg_int)}
         crs_output = new_dict
 
-    # Project DF to epsg value
-    projected_df = clean_odk_geo_df.to_crs(epsg)
+    # Project DF to epsg value (cached transformer, batch transform - reprojection).
+    projected_df = reprojection.to_crs_fn(clean_odk_geo_df, epsg)
 
     return crs_name, crs_output, projected_df
 
 
-def square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name):
-    """ Separate each point, apply a 1ha square buffer and export shapefiles.
+def square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name, debug_dump=False):
+    """ Separate each point and apply a 1ha square buffer (shapefiles are only exported when debug_dump is True).
 
     @param projected_df: Pandas dataframe in the relevant projection (WGSz52 or WGSz53).
     @param prime_temp_buffer_dir: directory to the temporary sub-directory (temp_1ha_buffer).
     @param crs_name: string object containing the crs name for file naming.
-    @return buffer_temp_dir: string object containing the path to the final output subdirectory titled after the crs name.
+    @param debug_dump: boolean object, True to export the intermediate 1ha site shapefiles.
+    @return buffer_geo_df: geo-dataframe containing the 1ha site polygons and the property (file naming convention),
+    site and date of each site.
     """
 
-    buffer_temp_dir = prime_temp_buffer_dir + '\\sites_1ha\\' + crs_name
-    if not os.path.exists(buffer_temp_dir):
+    buffer_temp_dir = os.path.join(prime_temp_buffer_dir, 'sites_1ha', crs_name)
+    if debug_dump and not os.path.exists(buffer_temp_dir):
         os.makedirs(buffer_temp_dir)
-    else:
-        pass
 
-    print(projected_df)
+    list_buffer = []
     for i in projected_df.site_name.unique():
         projected_df2 = projected_df.loc[projected_df.site_name == i]
         property_name = projected_df2.prop_name.unique()
@@ -228,140 +255,180 @@ def square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name):
         date4 = date3.replace('/', '.')
         projected_df3 = projected_df2.buffer(50, cap_style=3)
 
-        projected_df3.to_file(
-            buffer_temp_dir + '\\' + prop2 + '_' + str(i) + '_' + str(date4) + '_1ha' + crs_name + '.shp')
+        if debug_dump:
+            spatial_io.write_layer_fn(projected_df3, buffer_temp_dir,
+                                      prop2 + '_' + str(i) + '_' + str(date4) + '_1ha' + crs_name)
 
-    return buffer_temp_dir
+        site_buffer_df = gpd.GeoDataFrame({'geometry': projected_df3}, geometry='geometry', crs=projected_df.crs)
+        site_buffer_df['prop_file'] = prop2
+        site_buffer_df['site_name'] = str(i)
+        site_buffer_df['site_date'] = str(date4)
+        list_buffer.append(site_buffer_df)
 
+    buffer_geo_df = gpd.GeoDataFrame(pd.concat(list_buffer, ignore_index=True), crs=projected_df.crs)
 
-def add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name, pastoral_estate):
-    """ Retrieve file path for each 1ha shapefiles and add SITE_NAME and PROP_CODE attributes.
+    return buffer_geo_df
 
+
+def add_site_attribute_fn(buffer_geo_df, prime_temp_buffer_dir, crs_name, pastoral_estate, debug_dump=False):
+    """ Add the SITE_NAME, PROP_NAME, PROP_CODE and SITE_DATE attributes to the 1ha sites (shapefiles are only exported
+    when debug_dump is True).
+
+    @param buffer_geo_df: geo-dataframe containing the 1ha site polygons created by the square_buffer_fn function.
     @param prime_temp_buffer_dir: string object containing the path to a sub-directory within the temporary directory.
-    @param buffer_temp_dir: string object containing the path to the sub-directory containing the 1ha site shapefiles.
     @param crs_name: string object containing the crs name for file naming.
     @param pastoral_estate: string object containing the path to the NT Pastoral Estate shapefile (command argument).
-    @return prime_temp_buffer_dir: string object containing the path to a sub-directory within the temporary directory.
+    @param debug_dump: boolean object, True to export the intermediate attributed 1ha site shapefiles.
+    @return attribute_geo_df: geo-dataframe containing the attributed 1ha site polygons.
     """
 
-    # Create a string path to a sub-directory
-    attribute_temp_dir = prime_temp_buffer_dir + '\\1ha_attribute\\' + crs_name
+    # retrieve the property lookup index (the pastoral estate is only read in once per run).
+    estate_index = pastoral_estate_index.estate_index_fn(pastoral_estate)
 
-    # Check if the sub-directory already exists and create if if does not.
-    if not os.path.exists(attribute_temp_dir):
-        os.makedirs(attribute_temp_dir)
-
-    # search for shapefiles that meet the search criteria
-    for root, dirs, files in os.walk(buffer_temp_dir):
-        for file in files:
-            ends_with = '_1ha' + str(crs_name) + '.shp'
-            if file.endswith(ends_with):
-                # split file name
-                list_file_variables = file.split('_')
-                property_dirty = list_file_variables[0]
-                property_clean = property_dirty.title().replace('.', '_')
+    attribute_geo_df = buffer_geo_df.copy()
+    # property name from the file naming convention (i.e. Labelle.Downs > Labelle_Downs).
+    attribute_geo_df['prop_name'] = [str(prop).title().replace('.', '_') for prop in attribute_geo_df.prop_file]
 
-                # open pastoral estate and create a series only including the property name and property tag
-                geo_df = gpd.read_file(pastoral_estate)
-                geo_series = geo_df[['PROPERTY', 'PROP_TAG']]
+    # call the prop_code_extraction_fn function to extract the property tag from the Pastoral Estate
+    # index using the property name.
+    attribute_geo_df['prop_code'] = [str(prop_code_extraction_fn(prop, estate_index)) for prop in
+                                     attribute_geo_df.prop_name]
 
-                # call the prop_code_extraction_fn function to extract the property tag from the Pastoral Estate
-                # shapefile using the property name.
-                prop_code = prop_code_extraction_fn(property_clean, geo_series)
-                # create two variables from the shapefile name
-                site = list_file_variables[1]
-                date = list_file_variables[2]
+    attribute_geo_df = attribute_geo_df[['site_name', 'prop_name', 'prop_code', 'site_date', 'geometry']]
 
-                # join the root and file name to create a complete path to the current shapefile to open and a
-                # geo-dataframe.
-                shp = os.path.join(root, file)
-                geo_df = gpd.read_file(os.path.abspath(shp))
+    if debug_dump:
+        # Create a string path to a sub-directory
+        attribute_temp_dir = os.path.join(prime_temp_buffer_dir, '1ha_attribute', crs_name)
 
-                # add required attributes to the geo-dataframe from previously defined variables.
-                geo_df['site_name'] = str(site)
-                geo_df['prop_name'] = property_clean
-                geo_df['prop_code'] = str(prop_code)
-                geo_df['site_date'] = str(date)
+        # Check if the sub-directory already exists and create if if does not.
+        if not os.path.exists(attribute_temp_dir):
+            os.makedirs(attribute_temp_dir)
 
-                # export finalised geo-dataframe as a shapefile.
-                geo_df.to_file(
-                    attribute_temp_dir + '\\' + property_clean + '_' + str(site) + '_1ha_attrib_' + crs_name + '.shp')
+        for site in attribute_geo_df.site_name.unique():
+            geo_df = attribute_geo_df.loc[attribute_geo_df.site_name == site]
+            property_clean = geo_df.prop_name.iloc[0]
+            # export finalised geo-dataframe (--spatial_format).
+            spatial_io.write_layer_fn(geo_df, attribute_temp_dir,
+                                      property_clean + '_' + str(site) + '_1ha_attrib_' + crs_name)
 
-    return prime_temp_buffer_dir
+    return attribute_geo_df
 
 
-def concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name):
-    """  Concatenate attributed shapefiles and export completed shapefile.
+def concatenate_df_fn(list_geo_df, export_dir_path, crs_name):
+    """  Concatenate the attributed 1ha sites of a zone and export completed shapefile.
 
-    @param prime_temp_buffer_dir: string object containing the path to a sub-directory within the temporary directory.
+    @param list_geo_df: list object containing the attributed 1ha site geo-dataframes of the zone.
     @param export_dir_path: string object containing the path to the export directory.
     @param crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
-    @return comp_geo_df: geo-dataframe created by the concatenation of all shapefiles located in the specified directory.
+    @return comp_geo_df: geo-dataframe created by the concatenation of all attributed 1ha sites within the zone.
     @return crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
     """
 
-    list_df2 = []
-    search_term = '*.shp'
-
-    for file in glob.glob(prime_temp_buffer_dir + '\\1ha_attribute\\' + crs_name + '\\' + search_term):
-        geo_df = gpd.read_file(file)
-        list_df2.append(geo_df)
-
-    if len(list_df2) >= 1:
+    if len(list_geo_df) >= 1:
 
-        comp_geo_df = gpd.GeoDataFrame(pd.concat(list_df2, ignore_index=True), crs=list_df2[0].crs)
-        comp_geo_df.to_file(export_dir_path + '\\comp_geo_df_1ha_' + crs_name + '.shp')
+        comp_geo_df = gpd.GeoDataFrame(pd.concat(list_geo_df, ignore_index=True), crs=list_geo_df[0].crs)
+        comp_geo_df.to_file(os.path.join(export_dir_path, 'comp_geo_df_1ha_' + crs_name + '.shp'))
 
     else:
 
-        print('There are no shapefiles to concatenate: ', crs_name)
-        sys.exit(1)
+        # sites are only buffered within their assigned zone(s), so a zone may not contain any sites.
         print('There are no shapefiles to concatenate: ', crs_name)
         comp_geo_df = None
 
     return comp_geo_df, crs_name
 
 
-def prop_code_extraction_fn(prop, pastoral_estate):
-    """ Extract the property tag from the Pastoral Estate shapefile using the property name.
+def prop_code_extraction_fn(prop, estate_index):
+    """ Extract the property tag from the Pastoral Estate index using the property name.
 
     @param prop: string object containing the current property name.
-    @param pastoral_estate: geo-dataframe object created from the Pastoral Estate shapefile
+    @param estate_index: EstateIndex named tuple created from the Pastoral Estate shapefile (pastoral_estate_index).
     @return prop_code: string object extracted from the Pastoral Estate based on the property name.
     """
-    property_list = pastoral_estate.PROPERTY.tolist()
-
-    prop_upper = prop.upper().replace('_', ' ')
-    if prop_upper in property_list:
 
-        prop_code = pastoral_estate.loc[pastoral_estate['PROPERTY'] == prop_upper, 'PROP_TAG'].iloc[0]
-    else:
-        prop_code = ''
+    prop_code = pastoral_estate_index.prop_tag_lookup_fn(estate_index, prop)
 
     return prop_code
 
 
-def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral_estate):
+def zone_buffer_fn(clean_odk_geo_df, tile_grid, prime_temp_buffer_dir, pastoral_estate, zone_geo_df_dict,
+                   debug_dump=False):
+    """ Assign each site to the UTM zone(s) of the Landsat tiles it falls within, then project, buffer and attribute the
+    sites of each zone in that zone only.
+
+    @param clean_odk_geo_df: geo-dataframe object containing the ODK site points.
+    @param tile_grid: string object containing the path to the Landsat tile grid shapefile (command argument).
+    @param prime_temp_buffer_dir: string object containing the path to a sub-directory within the temporary directory.
+    @param pastoral_estate: string object containing the path to the NT Pastoral Estate shapefile (command argument).
+    @param zone_geo_df_dict: dictionary object containing the crs name (key) and a list of attributed 1ha site
+    geo-dataframes (value).
+    @param debug_dump: boolean object, True to export the intermediate shapefiles.
+    @return zone_geo_df_dict: dictionary object with the attributed 1ha sites of each zone appended.
+    """
+
+    if len(clean_odk_geo_df.index) == 0:
+        print('There are no sites to buffer.')
+        return zone_geo_df_dict
+
+    zone_site_dict = landsat_tile_grid.assign_site_zones_fn(clean_odk_geo_df, tile_grid)
+
+    for crs_name, zone_sites_df in zone_site_dict.items():
+
+        if len(zone_sites_df.index) >= 1:
+            epsg = landsat_tile_grid.ZONE_EPSG_DICT[crs_name]
+
+            # Project the zone subset of clean_odk_geo_df to the zone crs.
+            crs_name, crs_output, projected_df = projection_file_name_fn(epsg, zone_sites_df)
+
+            # Apply a 1ha square buffer to each point.
+            buffer_geo_df = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name, debug_dump)
+
+            # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
+            attribute_geo_df = add_site_attribute_fn(buffer_geo_df, prime_temp_buffer_dir, crs_name, pastoral_estate,
+                                                     debug_dump)
+            zone_geo_df_dict[crs_name].append(attribute_geo_df)
+        else:
+            print('There are no sites within: ', crs_name)
+
+    return zone_geo_df_dict
+
+
+def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral_estate, tile_grid, cache_dir=None,
+                 ledger=None, debug_dump=False):
     # ------------------------------------------- ODK csv collation --------------------------------------------------
 
     # Call the os_walk_odk_fn function to append all csv files with the required search criteria into one of two lists
     # list_integrated or list_ras depending on the type of site.
     list_ras, list_integrated = os_walk_odk_fn(directory_odk)
 
+    # attributed 1ha sites of each zone - passed in memory to step1_4 (shapefiles are only exported when debug_dump).
+    zone_geo_df_dict = {crs_name: [] for crs_name in landsat_tile_grid.ZONE_EPSG_DICT}
+
+    if ledger is not None:
+        # record the file hashes in the state ledger - incremental runs only read new or changed files.
+        list_integrated = odk_state_ledger.changed_files_fn(ledger, list_integrated)
+
     list_input = list_integrated
 
     if len(list_input) >= 2:
 
         # Call the concatenate_df_list_fn function - input = list_input - output = integrated_df.
 
-        int_df = concatenate_df_list(list_input)
+        # the records are indexed by their row position (aligns the full ODK records of the deliverables).
+        int_df = concatenate_df_list(list_input, cache_dir).reset_index(drop=True)
 
         # rename two column headers so that both the integrated_df and ras_df columns are the same: PROP_NAME and
         # SITE_NAME
         int_df.rename(columns={'final_prop': 'prop_name', 'site_orig': 'site_name'}, inplace=True)
 
+        if ledger is not None:
+            # record the (site, date) records in the state ledger - incremental runs only process new records.
+            int_df = odk_state_ledger.stage_records_fn(ledger, int_df)
+
         integrated_df = int_df
-        int_df.to_csv(export_dir_path + '//odk_int_output.csv')
+        # export the full ODK records (every column) of the processed records.
+        full_df = full_record_df_fn(list_input, integrated_df, cache_dir)
+        full_df.to_csv(os.path.join(export_dir_path, 'odk_int_output.csv'))
 
         # ------------------------------------------- Convert to geo-DataFrame -----------------------------------------
 
@@ -371,56 +438,20 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
         integrated_df2.date = integrated_df2.date.astype(str)
         clean_odk_geo_df = GeoDataFrame(integrated_df2, crs='EPSG:4283', geometry=geometry)
 
-        # Export shapefile.
-        clean_odk_geo_df.to_file(export_dir_path + '//odk_int_output.shp', driver='ESRI Shapefile')
-
-        # ----------------------------------------------- EPSG: 32752 --------------------------------------------------
-        # set epsg to WGSz52.
-        epsg = 32752
-
-        # Project clean_odk_geo_df to WGSz52.
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # ------------------------------------------------ EPSG: 32753 -------------------------------------------------
-
-        # set epsg to WGSz52
-        epsg = 32753
-
-        # Project clean_odk_geo_df to WGSz53
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
+        # Export shapefile (full ODK records).
+        export_full_record_fn(full_df, geometry, ['gda_c_lon', 'gda_c_lat'], 'EPSG:4283',
+                              os.path.join(export_dir_path, 'odk_int_output.shp'))
 
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
+        # ------------------------------------- EPSG: 32752, 32753 and 32754 -------------------------------------------
 
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # ------------------------------------------------ EPSG: 32754 -------------------------------------------------
-
-        # set epsg to WGSz52
-        epsg = 32754
-
-        # Project clean_odk_geo_df to WGSz53
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
+        # Project, buffer and attribute each site within its assigned zone(s) only.
+        zone_geo_df_dict = zone_buffer_fn(clean_odk_geo_df, tile_grid, prime_temp_buffer_dir, pastoral_estate,
+                                          zone_geo_df_dict, debug_dump)
 
     elif len(list_input) == 1:
 
-        int_df = single_csv_fn(list_input)
+        # the records are indexed by their row position (aligns the full ODK records of the deliverables).
+        int_df = single_csv_fn(list_input, cache_dir).reset_index(drop=True)
 
         print(list(int_df.columns))
         # rename two column headers so that both the integrated_df and ras_df columns are the
@@ -428,8 +459,14 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
 
         int_df.rename(columns={'final_prop': 'prop_name', 'site_orig': 'site_name'}, inplace=True)
 
+        if ledger is not None:
+            # record the (site, date) records in the state ledger - incremental runs only process new records.
+            int_df = odk_state_ledger.stage_records_fn(ledger, int_df)
+
         integrated_df = int_df
-        integrated_df.to_csv(export_dir_path + '//odk_int_output.csv')
+        # export the full ODK records (every column) of the processed records.
+        full_df = full_record_df_fn(list_input, integrated_df, cache_dir)
+        full_df.to_csv(os.path.join(export_dir_path, 'odk_int_output.csv'))
         # -------------------------------------- Convert to geo-DataFrame ----------------------------------------------
 
         # Create a geometry column to convert the DF into a geo_df.
@@ -440,54 +477,15 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
         integrated_df2.date = integrated_df2.date.astype(str)
         clean_odk_geo_df = GeoDataFrame(integrated_df2, crs='EPSG:4326', geometry=geometry)
 
-        # Export shapefile.    
-        clean_odk_geo_df.to_file(export_dir_path + '//odk_int_output_wgs84.shp', driver='ESRI Shapefile')
-
-        # ---------------------------------------------- EPSG: 32752 ---------------------------------------------------
-        # set epsg to WGSz52.
-        epsg = 32752
-
-        # Project clean_odk_geo_df to WGSz52.
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # ------------------------------------------------ EPSG: 32753 -------------------------------------------------
-
-        # set epsg to WGSz52
-        epsg = 32753
-
-        # Project clean_odk_geo_df to WGSz53
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
+        # Export shapefile (full ODK records).
+        export_full_record_fn(full_df, geometry, ['wgs_c_lon', 'wgs_c_lat'], 'EPSG:4326',
+                              os.path.join(export_dir_path, 'odk_int_output_wgs84.shp'))
 
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-
-        # ------------------------------------------------ EPSG: 32754 -------------------------------------------------
-
-        # set epsg to WGSz52
-        epsg = 32754
-
-        # Project clean_odk_geo_df to WGSz54
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
+        # ------------------------------------- EPSG: 32752, 32753 and 32754 -------------------------------------------
 
+        # Project, buffer and attribute each site within its assigned zone(s) only.
+        zone_geo_df_dict = zone_buffer_fn(clean_odk_geo_df, tile_grid, prime_temp_buffer_dir, pastoral_estate,
+                                          zone_geo_df_dict, debug_dump)
 
     else:
 
@@ -502,7 +500,7 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
 
         # run concatenate_df_list_fn function - input = list_input - output = integrated_df.
 
-        ras_df = concatenate_df_list(list_input)
+        ras_df = concatenate_df_list(list_input, cache_dir).reset_index(drop=True)
         # rename two column headers so that both the integrated_df and ras_df columns are the
         # same: PROP_NAME and SITE_NAME
 
@@ -512,8 +510,9 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
         ras_df_ = ras_df
         ras_df2 = ras_df_[ras_df_.loc_c != 'BLANK']
 
-        # Export csv
-        ras_df2.to_csv(export_dir_path + '//odk_ras_output.csv')
+        # Export csv (full ODK records).
+        full_df = full_record_df_fn(list_input, ras_df2, cache_dir)
+        full_df.to_csv(os.path.join(export_dir_path, 'odk_ras_output.csv'))
 
         # --------------------------------------- Convert to geo-DataFrame ---------------------------------------------
 
@@ -523,76 +522,31 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
         ras_df3.date = ras_df3.date.astype(str)
         clean_odk_geo_df = GeoDataFrame(ras_df3, crs='EPSG:4326', geometry=geometry)
 
-        # Export shapefile
-        clean_odk_geo_df.to_file(export_dir_path + '//odk_ras_output_wgs84.shp', driver='ESRI Shapefile')
-
-        # ---------------------------------------------- EPSG: 32752 ---------------------------------------------------
-        # set epsg to WGSz52.
-        epsg = 32752
-
-        # Project clean_odk_geo_df to WGSz52.
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # Concatenate, clean and export geo_df_52
-        geo_df_52, crs_name_52 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
-
-        # ---------------------------------------------- EPSG: 32753 ---------------------------------------------------
-
-        # set epsg to WGSz52
-        epsg = 32753
-
-        # Project clean_odk_geo_df to WGSz53
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
+        # Export shapefile (full ODK records).
+        export_full_record_fn(full_df, geometry, ['wgs_c_lon', 'wgs_c_lat'], 'EPSG:4326',
+                              os.path.join(export_dir_path, 'odk_ras_output_wgs84.shp'))
 
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # Concatenate, clean and export geo_df_53
-        geo_df_53, crs_name_53 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
-
-        # ---------------------------------------------- EPSG: 32754 ---------------------------------------------------
-
-        # set epsg to WGSz54
-        epsg = 32754
-
-        # Project clean_odk_geo_df to WGSz54
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # Concatenate, clean and export geo_df_54
-        geo_df_54, crs_name_54 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
+        # ------------------------------------- EPSG: 32752, 32753 and 32754 -------------------------------------------
 
+        # Project, buffer and attribute each site within its assigned zone(s) only.
+        zone_geo_df_dict = zone_buffer_fn(clean_odk_geo_df, tile_grid, prime_temp_buffer_dir, pastoral_estate,
+                                          zone_geo_df_dict, debug_dump)
 
     elif len(list_input) == 1:
         print("list input == 1 triggered")
 
-        ras_df = single_csv_fn(list_input)
+        ras_df = single_csv_fn(list_input, cache_dir).reset_index(drop=True)
         # rename two column headers so that both the integrated_df and ras_df columns are the
         # same: PROP_NAME and SITE_NAME
         ras_df.rename(columns={'final_prop': 'prop_name', 'site_orig': 'site_name'}, inplace=True)
         # Drop rows which contain the string 'BLANK' instead of a Lon Lat value.
 
         ras_df_ = ras_df
-        ras_df2 = ras_df[ras_df.wgs_c_lon != 'BLANK']
-        # Export csv
-        ras_df2.to_csv(export_dir_path + '//odk_ras_output.csv')
+        # 'BLANK' coordinates are read in as NaN (odk_ingest).
+        ras_df2 = ras_df[ras_df.wgs_c_lon.notnull()]
+        # Export csv (full ODK records).
+        full_df = full_record_df_fn(list_input, ras_df2, cache_dir)
+        full_df.to_csv(os.path.join(export_dir_path, 'odk_ras_output.csv'))
 
         # --------------------------------------- Convert to geo-DataFrame ---------------------------------------------
 
@@ -602,63 +556,15 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
         ras_df3.date = ras_df3.date.astype(str)
         clean_odk_geo_df = GeoDataFrame(ras_df3, crs='EPSG:4326', geometry=geometry)
 
-        # Export shapefile
-        clean_odk_geo_df.to_file(export_dir_path + '//odk_ras_output_wgs84.shp', driver='ESRI Shapefile')
-
-        # --------------------------------------------- EPSG: 32752 ----------------------------------------------------
-        # set epsg to WGSz52.
-        epsg = 32752
-
-        # Project clean_odk_geo_df to WGSz52.
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # Concatenate, clean and export geo_df_52
-        geo_df_52, crs_name_52 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
-
-        # ----------------------------------------------- EPSG: 32753 --------------------------------------------------
+        # Export shapefile (full ODK records).
+        export_full_record_fn(full_df, geometry, ['wgs_c_lon', 'wgs_c_lat'], 'EPSG:4326',
+                              os.path.join(export_dir_path, 'odk_ras_output_wgs84.shp'))
 
-        # set epsg to WGSz52
-        epsg = 32753
-
-        # Project clean_odk_geo_df to WGSz53
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # Concatenate, clean and export geo_df_53
-        geo_df_53, crs_name_53 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
-
-
-        # ----------------------------------------------- EPSG: 32754 --------------------------------------------------
-
-        # set epsg to WGSz52
-        epsg = 32754
-
-        # Project clean_odk_geo_df to WGSz53
-        crs_name, crs_output, projected_df = projection_file_name_fn(epsg, clean_odk_geo_df)
-
-        # Apply a 1ha square buffer to each point.
-        buffer_temp_dir = square_buffer_fn(projected_df, prime_temp_buffer_dir, crs_name)
-
-        # Add attributes (SITE_NAME and PROP_CODE) to geo-DataFrame.
-        prime_temp_buffer_dir = add_site_attribute_fn(prime_temp_buffer_dir, buffer_temp_dir, crs_name,
-                                                      pastoral_estate)
-
-        # Concatenate, clean and export geo_df_53
-        geo_df_54, crs_name_54 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
+        # ------------------------------------- EPSG: 32752, 32753 and 32754 -------------------------------------------
 
+        # Project, buffer and attribute each site within its assigned zone(s) only.
+        zone_geo_df_dict = zone_buffer_fn(clean_odk_geo_df, tile_grid, prime_temp_buffer_dir, pastoral_estate,
+                                          zone_geo_df_dict, debug_dump)
 
     else:
         print("list_len else triggered")
@@ -667,17 +573,25 @@ def main_routine(directory_odk, export_dir_path, prime_temp_buffer_dir, pastoral
         # todo uncomment if time trace for ras is useful
         # print('There are no ras sites to be processed.')
 
-    # Concatenate, clean and export geo_df_52
+    # Concatenate, clean and export geo_df_52 (None if no sites were assigned to the zone)
     crs_name = 'WGS84z52'
-    geo_df_52, crs_name_52 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
+    geo_df_52, crs_name_52 = concatenate_df_fn(zone_geo_df_dict[crs_name], export_dir_path, crs_name)
 
     # Concatenate, clean and export geo_df_53
     crs_name = 'WGS84z53'
-    geo_df_53, crs_name_53 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
+    geo_df_53, crs_name_53 = concatenate_df_fn(zone_geo_df_dict[crs_name], export_dir_path, crs_name)
 
     # Concatenate, clean and export geo_df_54
     crs_name = 'WGS84z54'
-    geo_df_54, crs_name_54 = concatenate_df_fn(prime_temp_buffer_dir, export_dir_path, crs_name)
+    geo_df_54, crs_name_54 = concatenate_df_fn(zone_geo_df_dict[crs_name], export_dir_path, crs_name)
+
+    if geo_df_52 is None and geo_df_53 is None and geo_df_54 is None:
+        if ledger is not None and ledger['incremental']:
+            # nothing new since the last run - step1_1 ends the run.
+            print('There are no new or changed ODK records to process.')
+        else:
+            print('There are no 1ha sites to process in any zone.')
+            sys.exit(1)
 
     return geo_df_52, crs_name_52, geo_df_53, crs_name_53, geo_df_54, crs_name_54
 
@@ -10,13 +10,13 @@ which Landsat tile.
 
 Step 1: Divides the Landsat tile grid into two based on its WGS zonal position.
 
-Step 2: Applies a negative 4000m buffer to each Landsat tile to reduce noise, and concatenates them into two shapefiles
-(projectedDF2 and projectedDF3)
+Step 2: Applies a negative 4000m buffer to each Landsat tile to reduce noise. The projected and buffered tile grid is
+cached (command argument --cache_dir) keyed by the tile grid hash and only re-built when the tile grid changes.
 
-Step 3: Using GeoPandas, preforms a spatial overlay (identify) is preformed between the Landsat Tile Grid and the
-completed ODK sites shapefile to determine which Landsat tile should be used to derive zonal statistics from, on a site
-by site basis. Following this, the identity shapefiles are concatenated and two outputs are created
-(comp_geo_df_52 and comp_geo_df_53).
+Step 3: Using the GeoPandas spatial index of the buffered Landsat tiles, all of the completed ODK sites are queried in a
+single bulk query to determine which Landsat tile should be used to derive zonal statistics from, on a site by site
+basis. Each site is clipped to the buffered tile (identity) and the site by tile outputs are created
+(comp_geo_df_52, comp_geo_df_53 and comp_geo_df_54).
 
 
 Author: Rob McGregor
@@ -56,170 +56,174 @@ SOFTWARE.
 # Import modules
 from __future__ import print_function, division
 import os
+import re
 import geopandas as gpd
 import pandas as pd
-import glob
 import warnings
 import sys
+import landsat_tile_grid
+import spatial_io
 
 warnings.filterwarnings("ignore")
 
 
-def project_tile_grid_fn(tile_grid, prime_temp_grid_dir):
-    """ Subset and re-project the Landsat tile grid into WGS zone 52 and 53.
+def project_tile_grid_fn(tile_grid, prime_temp_grid_dir, debug_dump=False, cache_dir=None):
+    """ Subset, re-project and negatively buffer the Landsat tile grid into WGS zone 52, 53 and 54 (loaded from the
+    derived tile grid cache when the tile grid is unchanged).
 
-    @param tile_grid: geo-dataframe containing the Landsat tile locations and names.
+    @param tile_grid: string object containing the path to the Landsat tile grid shapefile.
     @param prime_temp_grid_dir: string object containing the path to the temporary directory.
-    @return tile_grid_wgs52: geo-dataframe object filtered based on utm zone from the Landsat tile grid.
-    @return tile_grid_wgs53: geo-dataframe object filtered based on utm zone from the Landsat tile grid.
+    @param debug_dump: boolean object, True to export the intermediate shapefiles to the temporary directory.
+    @param cache_dir: string object containing the path to the local cache directory, or None to disable caching.
+    @return derived_dict: dictionary object containing the crs name (key) and a tuple of the projected tile grid subset
+    and the buffered tiles (value).
     """
-    proj_tile_grid_sep_dir = prime_temp_grid_dir + '\\separation'
+    proj_tile_grid_sep_dir = os.path.join(prime_temp_grid_dir, 'separation')
 
-    # read in Landsat tile grid vector dataset
-    tile_grid = gpd.read_file(tile_grid)
-    # subset dataset into WGSz52 and WGSz53
-    tile_grid_54_selection = tile_grid.loc[tile_grid['WRSPR'] == 100_074]
-    tile_grid_53_selection = tile_grid.loc[(tile_grid['WRSPR'] <= 104_073) & ((tile_grid['WRSPR'] != 103_078) |(tile_grid['WRSPR'] != 100_074))]
-    tile_grid_52_selection = tile_grid.loc[(tile_grid['WRSPR'] >= 104_072) | (tile_grid['WRSPR'] == 103_078)]
+    # subset dataset into WGSz52, WGSz53 and WGSz54 (shared with the step1_3 site zone assignment) - tiles selected in
+    # two zones are only processed in the zone that owns them.
+    derived_dict = landsat_tile_grid.derived_tile_grid_fn(tile_grid, cache_dir)
 
-    # project subsets into crs
-    tile_grid_wgs52 = tile_grid_52_selection.to_crs(epsg=32752)
-    tile_grid_wgs53 = tile_grid_53_selection.to_crs(epsg=32753)
-    tile_grid_wgs54 = tile_grid_54_selection.to_crs(epsg=32754)
+    if debug_dump:
+        # export the projected tile grids (--spatial_format).
+        for crs_name, (projected_df, buffer_tile_df) in derived_dict.items():
+            spatial_io.write_layer_fn(projected_df, proj_tile_grid_sep_dir, 'tile_grid_wgs' + crs_name[-2:])
 
-    # export shapefiles
-    tile_grid_wgs52.to_file(driver='ESRI Shapefile', filename=proj_tile_grid_sep_dir + '\\tile_grid_wgs52.shp')
-    tile_grid_wgs53.to_file(driver='ESRI Shapefile', filename=proj_tile_grid_sep_dir + '\\tile_grid_wgs53.shp')
-    tile_grid_wgs54.to_file(driver='ESRI Shapefile', filename=proj_tile_grid_sep_dir + '\\tile_grid_wgs54.shp')
+    return derived_dict
 
-    return tile_grid_wgs52, tile_grid_wgs53, tile_grid_wgs54
 
+def negative_buffer_fn(buffer_tile_df, prime_temp_grid_dir, crs_name, debug_dump=False):
+    """ Separate each negatively buffered (4000m) Landsat tile of the derived tile grid.
 
-def negative_buffer_fn(projected_df, prime_temp_grid_dir, crs_name):
-    """ Separate each Landsat tile, apply a negative buffer (4000m) and export the shapefiles.
-
-    @param projected_df: geo-dataframe containing the filtered version of the Landsat tile grid.
+    @param buffer_tile_df: geo-dataframe containing the buffered Landsat tiles of the zone (TILE feature).
     @param prime_temp_grid_dir: string object containing the path to the temporary directory.
     @param crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
-    @return tile_grid_temp_dir: string object containing the path to sub-directory tile_grid/crs_name.
+    @param debug_dump: boolean object, True to export each buffered tile shapefile to the temporary directory.
+    @return list_tile_df: list object containing a geo-dataframe (tile and geometry) for each buffered Landsat tile.
     @return crs_name: string object containing the standardised crs information to be used as part of the file name.
     """
-    tile_grid_temp_dir = prime_temp_grid_dir + '\\tile_grid\\' + crs_name
-    os.makedirs(tile_grid_temp_dir)
+    tile_grid_temp_dir = os.path.join(prime_temp_grid_dir, 'tile_grid', crs_name)
+    if debug_dump:
+        os.makedirs(tile_grid_temp_dir)
 
-    # Loop through the unique values within the projected_df feature: WRSPR
-    for landsatTile in projected_df.WRSPR.unique():
-        # subset the projected_df geoDataFrame based on the unique Landsat tile variable.
-        projected_df2 = projected_df.loc[projected_df.WRSPR == landsatTile]
+    list_tile_df = []
 
-        # apply a negative 4000m buffer from each Landsat tile to mask the tile images at a later point.
-        projected_df3 = projected_df2.buffer(-4000)
+    # Loop through the unique values within the buffer_tile_df feature: TILE
+    for landsat_tile in buffer_tile_df.TILE.unique():
+        tile_df = buffer_tile_df.loc[buffer_tile_df.TILE == landsat_tile]
+        list_tile_df.append(tile_df)
 
-        # export shapefile.
-        projected_df3.to_file(driver='ESRI Shapefile',
-                              filename=tile_grid_temp_dir + '\\' + str(landsatTile) + '_NegBuffer_' + crs_name + '.shp')
+        if debug_dump:
+            # export the buffered tile (--spatial_format).
+            spatial_io.write_layer_fn(tile_df, tile_grid_temp_dir, landsat_tile + '_NegBuffer_' + crs_name)
 
-    return tile_grid_temp_dir, crs_name
+    return list_tile_df, crs_name
 
 
-def concatenate_df_fn(prime_temp_grid_dir, tile_grid_temp_dir, crs_name):
+def concatenate_df_fn(prime_temp_grid_dir, list_tile_df, crs_name, debug_dump=False):
     """ Create one geoDataFrame (comp_tile_geo_df) containing all negatively buffered Landsat tiles identified as
     overlaying an odk 1ha site within their respective WGS84 zones.
 
     @param prime_temp_grid_dir: string object containing the path to the temporary directory.
-    @param tile_grid_temp_dir: string object containing the path to sub-directory tile_grid/crs_name.
+    @param list_tile_df: list object containing a geo-dataframe for each buffered Landsat tile.
     @param crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
-    @return comp_tile_geo_df: geo-dataframe produced from all located shapefiles.
-    @return concat_tile_grid_temp_dir: string object containing the path to the export temporary sub-directory
+    @param debug_dump: boolean object, True to export the concatenated shapefile to the temporary directory.
+    @return comp_tile_geo_df: geo-dataframe containing all of the buffered Landsat tiles.
     @return crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
     """
-    # Create two folders for outputs
-    concat_tile_grid_temp_dir = prime_temp_grid_dir + '\\concat_tile_grid\\' + crs_name
-    os.makedirs(concat_tile_grid_temp_dir)
-
-    # create an empty list     
-    list_df = []
-
-    for landsat_tile_shp in glob.glob(tile_grid_temp_dir + '\\*.shp'):
-        geo_df = gpd.read_file(landsat_tile_shp)
-        list_df.append(geo_df)
 
-    if len(list_df) >= 2:
+    if len(list_tile_df) >= 1:
+        comp_tile_geo_df = gpd.GeoDataFrame(pd.concat(list_tile_df, ignore_index=True), crs=list_tile_df[0].crs)
 
-        comp_tile_geo_df = gpd.GeoDataFrame(pd.concat(list_df, ignore_index=True), crs=list_df[0].crs)
-        comp_tile_geo_df.to_file(concat_tile_grid_temp_dir + '\\comp_geo_df_buffer_' + crs_name + '.shp')
+        if debug_dump:
+            concat_tile_grid_temp_dir = os.path.join(prime_temp_grid_dir, 'concat_tile_grid', crs_name)
+            os.makedirs(concat_tile_grid_temp_dir)
+            spatial_io.write_layer_fn(comp_tile_geo_df, concat_tile_grid_temp_dir, 'comp_geo_df_buffer_' + crs_name)
 
-    elif len(list_df) == 1:
-
-        comp_tile_geo_df = gpd.read_file(landsat_tile_shp, ignore_index=True)
-        comp_tile_geo_df.to_file(concat_tile_grid_temp_dir + '\\comp_geo_df_buffer_' + crs_name + '.shp')
     else:
         print('There are no files: concatenate_df_fn')
         sys.exit(1)
         comp_tile_geo_df = None
 
-    return comp_tile_geo_df, concat_tile_grid_temp_dir, crs_name
+    return comp_tile_geo_df, crs_name
 
 
-def identity_df_fn(tile_grid_temp_dir, prime_temp_grid_dir, odk_geo_1ha_df, crs_name):
-    """ Identify which site spatially overlays which Landsat tile and output a shapefile with the tile name in the
-    filename.
+def bulk_query_fn(sindex, geometry):
+    """ Query a spatial index with every geometry at once - sindex.query accepts an array of geometries from geopandas
+    0.12 (query_bulk was removed in geopandas 1.0), earlier versions (i.e. 0.8.1) only provide query_bulk.
 
-    @param tile_grid_temp_dir: string object containing the path to sub-directory tile_grid/crs_name.
-    @param prime_temp_grid_dir: string object containing the path to the temporary directory.
-    @param odk_geo_1ha_df:
-    @param crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
-    @return identify_tile_grid_temp_dir: string object containing the path to sub-directory identify_tile_grid\crs_name.
+    @param sindex: spatial index object (GeoDataFrame.sindex).
+    @param geometry: geo-series object containing the query geometries.
+    @return index_array: array object containing the (query geometry, indexed geometry) index pairs.
     """
-    identify_tile_grid_temp_dir = prime_temp_grid_dir + '\\identify_tile_grid\\' + crs_name
-    os.makedirs(identify_tile_grid_temp_dir)
 
-    # create an empty list
-    list_df = []
+    version = tuple(int(part) for part in re.findall(r'\d+', gpd.__version__)[:2])
 
-    for file in glob.glob(tile_grid_temp_dir + '\\*.shp'):
-        # Extract Landsat tile name
-        tile = str(file[-29:-23])
-        # code_str = str(code)
-        clean_tile = tile.replace('\\', '0')
-        # Append the open geo_df to a list.
-        geo_df = gpd.read_file(file)
-        list_df.append(geo_df)
-        intersect_df = gpd.overlay(geo_df, odk_geo_1ha_df, how='identity')
-        intersect_df.to_file(identify_tile_grid_temp_dir + '\\' + clean_tile + '_identity_' + crs_name + '.shp')
+    if version >= (0, 12):
+        return sindex.query(geometry, predicate='intersects')
 
-    return identify_tile_grid_temp_dir
+    return sindex.query_bulk(geometry, predicate='intersects')
 
 
-def concatenate_tile_df_fn(zonal_stats_ready_dir, identify_tile_grid_temp_dir, prime_temp_grid_dir, crs_name):
-    """ Create a geoDataFrame for all of the shapefiles created in the identity_df_fn function through concatenation.
+def identity_df_fn(comp_tile_geo_df, prime_temp_grid_dir, odk_geo_1ha_df, crs_name, debug_dump=False):
+    """ Identify which site spatially overlays which Landsat tile with a single bulk query of the buffered tile spatial
+    index, and clip each site to the buffered tile it overlays (equivalent to the previous per tile identity overlay).
 
-    @param zonal_stats_ready_dir: string object containing the path to a temporary sub-directory
-    prime_temp_grid_dir\zonal_stats_ready\crs_name.
-    @param identify_tile_grid_temp_dir: string object containing the path to sub-directory identify_tile_grid\crs_name.
+    @param comp_tile_geo_df: geo-dataframe containing all of the buffered Landsat tiles (TILE feature).
     @param prime_temp_grid_dir: string object containing the path to the temporary directory.
+    @param odk_geo_1ha_df: geo-dataframe containing the 1ha sites assigned to the zone.
     @param crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
-    @return comp_geo_df: geo-dataframe
+    @param debug_dump: boolean object, True to export the site by tile shapefile to the temporary directory.
+    @return list_identity_df: list object containing the site by tile geo-dataframe (one row per site and tile hit).
     """
 
-    concat_identity_tile_grid_dir = prime_temp_grid_dir + '\\concat_identity_tile_grid\\' + crs_name
-    os.makedirs(concat_identity_tile_grid_dir)
+    sites = odk_geo_1ha_df.reset_index(drop=True)
+    tiles = comp_tile_geo_df.reset_index(drop=True)
 
-    list_identify_zone = []
+    # query every site polygon against the buffered tile polygons at once - returns the (site, tile) index pairs.
+    site_index, tile_index = bulk_query_fn(tiles.sindex, sites.geometry)
 
-    for file in glob.glob(identify_tile_grid_temp_dir + "\\*" + crs_name + ".shp"):
-        #print("file: ", file)
-        # append the open geo_df to a list.
-        geo_df = gpd.read_file(file)
-        clean_tile = file[-28:-22]
-        geo_df['TILE'] = clean_tile
-        list_identify_zone.append(geo_df)
+    site_tile_df = sites.iloc[site_index].reset_index(drop=True)
+    site_tile_df['TILE'] = tiles.TILE.iloc[tile_index].values
+    tile_geometry = tiles.geometry.iloc[tile_index].reset_index(drop=True)
 
-    if len(list_identify_zone) >= 1:
-        geo_df1 = gpd.GeoDataFrame(pd.concat(list_identify_zone, ignore_index=True), crs=list_identify_zone[0].crs)
-        comp_geo_df = geo_df1.dropna(axis=0, subset=['FID_2'])
-        comp_geo_df.rename(columns={"TILE": "tile"}, errors="raise", inplace=True)
+    # clip each site to the buffered tile and retain polygon overlays only (sites only touching a tile are removed).
+    site_tile_df['geometry'] = site_tile_df.geometry.intersection(tile_geometry)
+    site_tile_df = site_tile_df.loc[~site_tile_df.geometry.is_empty &
+                                    site_tile_df.geom_type.isin(['Polygon', 'MultiPolygon'])]
+    site_tile_df = gpd.GeoDataFrame(site_tile_df.sort_values('TILE', kind='mergesort'), geometry='geometry',
+                                    crs=odk_geo_1ha_df.crs)
 
+    print(crs_name, ' site by tile hits: ', len(site_tile_df.index))
+
+    if debug_dump:
+        identify_tile_grid_temp_dir = os.path.join(prime_temp_grid_dir, 'identify_tile_grid', crs_name)
+        os.makedirs(identify_tile_grid_temp_dir)
+        if len(site_tile_df.index) > 0:
+            spatial_io.write_layer_fn(site_tile_df, identify_tile_grid_temp_dir, 'site_by_tile_' + crs_name)
+
+    list_identity_df = [site_tile_df]
+
+    return list_identity_df
+
+
+def concatenate_tile_df_fn(zonal_stats_ready_dir, list_identity_df, site_tile_dict, debug_dump=False):
+    """ Create a geoDataFrame for all of the site by tile geo-dataframes created in the identity_df_fn function through
+    concatenation, and add the sites of each Landsat tile to the site_tile_dict.
+
+    @param zonal_stats_ready_dir: string object containing the path to a temporary sub-directory
+    prime_temp_grid_dir\zonal_stats_ready.
+    @param list_identity_df: list object containing the site by tile geo-dataframe(s).
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param debug_dump: boolean object, True to export the site by tile shapefiles to the zonal_stats_ready_dir.
+    @return comp_geo_df: geo-dataframe
+    """
+
+    if len(list_identity_df) >= 1:
+        geo_df1 = gpd.GeoDataFrame(pd.concat(list_identity_df, ignore_index=True), crs=list_identity_df[0].crs)
+        # remove any record without a site.
+        comp_geo_df = geo_df1.dropna(axis=0, subset=['site_name'])
+        comp_geo_df.rename(columns={"TILE": "tile"}, errors="raise", inplace=True)
 
         for i in comp_geo_df.tile.unique():
 
@@ -227,7 +231,10 @@ def concatenate_tile_df_fn(zonal_stats_ready_dir, identify_tile_grid_temp_dir, p
             site_tile_df2 = site_tile_df[['site_name', 'prop_name', 'prop_code', 'site_date', 'tile', 'geometry']]
             site_tile_df2.reset_index(drop=True, inplace=True)
             site_tile_df2['uid'] = site_tile_df2.index + 1
-            site_tile_df2.to_file(zonal_stats_ready_dir + '\\' + str(i) + '_ODK_by_tile.shp')
+            site_tile_dict[str(i)] = site_tile_df2
+
+            if debug_dump:
+                spatial_io.write_layer_fn(site_tile_df2, zonal_stats_ready_dir, str(i) + '_ODK_by_tile')
 
     else:
         sys.exit(1)
@@ -236,69 +243,66 @@ def concatenate_tile_df_fn(zonal_stats_ready_dir, identify_tile_grid_temp_dir, p
     return comp_geo_df
 
 
-def main_routine(tile_grid, geo_df52, geo_df53, geo_df54, prime_temp_grid_dir):
+def zone_identity_fn(buffer_tile_df, odk_geo1ha_df, crs_name, prime_temp_grid_dir, zonal_stats_ready_dir, site_tile_dict,
+                     debug_dump=False):
+    """ Buffer the zone tile grid and identify which Landsat tiles the zone 1ha sites overlay.
 
+    @param buffer_tile_df: geo-dataframe containing the buffered Landsat tiles of the zone (derived tile grid).
+    @param odk_geo1ha_df: geo-dataframe containing the 1ha sites assigned to the zone, or None if there are none.
+    @param crs_name: string object containing the standardised crs information to be used as part of the file/sub-dir.
+    @param prime_temp_grid_dir: string object containing the path to the temporary directory.
+    @param zonal_stats_ready_dir: string object containing the path to a temporary sub-directory
+    prime_temp_grid_dir\zonal_stats_ready.
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param debug_dump: boolean object, True to export the intermediate shapefiles to the temporary directory.
+    @return comp_geo_df: geo-dataframe containing the zone 1ha sites with Landsat tile information, or None.
+    """
 
-    # define the zonal_stats_ready_dir path
-    zonal_stats_ready_dir = prime_temp_grid_dir + '\\zonal_stats_ready'
+    if odk_geo1ha_df is None:
+        # step1_3 only buffers sites within their assigned zone(s).
+        print('There are no 1ha sites assigned to: ', crs_name)
+        comp_geo_df = None
+
+    else:
+        # call the negative_buffer_fn function.
+        list_tile_df, crs_name = negative_buffer_fn(buffer_tile_df, prime_temp_grid_dir, crs_name, debug_dump)
+        # call the concatenate_df_fn function.
+        comp_tile_geo_df, crs_name = concatenate_df_fn(prime_temp_grid_dir, list_tile_df, crs_name, debug_dump)
+        # call the identity_df_fn function.
+        list_identity_df = identity_df_fn(comp_tile_geo_df, prime_temp_grid_dir, odk_geo1ha_df, crs_name, debug_dump)
+        # call the concatenate_tile_df_fn function.
+        comp_geo_df = concatenate_tile_df_fn(zonal_stats_ready_dir, list_identity_df, site_tile_dict, debug_dump)
+
+    return comp_geo_df
+
+
+def main_routine(tile_grid, geo_df52, geo_df53, geo_df54, prime_temp_grid_dir, debug_dump=False, cache_dir=None):
+
+    # define the zonal_stats_ready_dir path (only written to when debug_dump is True)
+    zonal_stats_ready_dir = os.path.join(prime_temp_grid_dir, 'zonal_stats_ready')
+
+    # tile (key) and the 1ha sites within the tile (value) - handed to the zonal stats steps in memory.
+    site_tile_dict = {}
 
     # call the project_tile_grid_fn function.
-    tile_grid_wgs52, tile_grid_wgs53, tile_grid_wgs54 = project_tile_grid_fn(tile_grid, prime_temp_grid_dir)
+    derived_dict = project_tile_grid_fn(tile_grid, prime_temp_grid_dir, debug_dump, cache_dir)
 
     # ------------------------------------------ tile_grid_wgs52 -------------------------------------------------------
 
-    # set the projected_df to tile_grid_wgs52
-    projected_df = tile_grid_wgs52
-    # set the crs_name variable to 'WGS84z52'
-    crs_name = 'WGS84z52'
-    # call the negative_buffer_fn function.
-    tile_grid_temp_dir, crs_name = negative_buffer_fn(projected_df, prime_temp_grid_dir, crs_name)
-    # set the odk_geo1ha_df variable to geo_df52
-    odk_geo1ha_df = geo_df52
-    # call the concatenate_df_fn function.
-    comp_tile_geo_df, concat_tile_grid_temp_dir, crs_name = concatenate_df_fn(prime_temp_grid_dir, tile_grid_temp_dir,
-                                                                              crs_name)
-    # call the identity_df_fn function.
-    identify_tile_grid_temp_dir = identity_df_fn(tile_grid_temp_dir, prime_temp_grid_dir, odk_geo1ha_df, crs_name)
-    # call the concatenate_tile_df_fn function.
-    comp_geo_df52 = concatenate_tile_df_fn(zonal_stats_ready_dir, identify_tile_grid_temp_dir, prime_temp_grid_dir,
-                                           crs_name)
+    comp_geo_df52 = zone_identity_fn(derived_dict['WGS84z52'][1], geo_df52, 'WGS84z52', prime_temp_grid_dir,
+                                     zonal_stats_ready_dir, site_tile_dict, debug_dump)
 
     # -------------------------------------------- tile_grid_wgs53 -----------------------------------------------------
 
-    projected_df = tile_grid_wgs53
-    crs_name = 'WGS84z53'
-    # call the negative_buffer_fn function.
-    tile_grid_temp_dir, crs_name = negative_buffer_fn(projected_df, prime_temp_grid_dir, crs_name)
-    # set the odk_geo1ha_df variable to geo_df53
-    odk_geo1ha_df = geo_df53
-    # call the concatenate_df_fn function.
-    comp_tile_geo_df, concat_tile_grid_temp_dir, crs_name = concatenate_df_fn(prime_temp_grid_dir, tile_grid_temp_dir,
-                                                                              crs_name)
-    # call the identifyDF function.
-    identify_tile_grid_temp_dir = identity_df_fn(tile_grid_temp_dir, prime_temp_grid_dir, odk_geo1ha_df, crs_name)
-    # call the concatenate_tile_df_fn function.
-    comp_geo_df53 = concatenate_tile_df_fn(zonal_stats_ready_dir, identify_tile_grid_temp_dir, prime_temp_grid_dir,
-                                           crs_name)
+    comp_geo_df53 = zone_identity_fn(derived_dict['WGS84z53'][1], geo_df53, 'WGS84z53', prime_temp_grid_dir,
+                                     zonal_stats_ready_dir, site_tile_dict, debug_dump)
 
     # -------------------------------------------- tile_grid_wgs54 -----------------------------------------------------
 
-    projected_df = tile_grid_wgs54
-    crs_name = 'WGS84z54'
-    # call the negative_buffer_fn function.
-    tile_grid_temp_dir, crs_name = negative_buffer_fn(projected_df, prime_temp_grid_dir, crs_name)
-    # set the odk_geo1ha_df variable to geo_df53
-    odk_geo1ha_df = geo_df54
-    # call the concatenate_df_fn function.
-    comp_tile_geo_df, concat_tile_grid_temp_dir, crs_name = concatenate_df_fn(prime_temp_grid_dir, tile_grid_temp_dir,
-                                                                              crs_name)
-    # call the identifyDF function.
-    identify_tile_grid_temp_dir = identity_df_fn(tile_grid_temp_dir, prime_temp_grid_dir, odk_geo1ha_df, crs_name)
-    # call the concatenate_tile_df_fn function.
-    comp_geo_df54 = concatenate_tile_df_fn(zonal_stats_ready_dir, identify_tile_grid_temp_dir, prime_temp_grid_dir,
-                                           crs_name)
-
-    return comp_geo_df52, comp_geo_df53, comp_geo_df54, zonal_stats_ready_dir
+    comp_geo_df54 = zone_identity_fn(derived_dict['WGS84z54'][1], geo_df54, 'WGS84z54', prime_temp_grid_dir,
+                                     zonal_stats_ready_dir, site_tile_dict, debug_dump)
+
+    return comp_geo_df52, comp_geo_df53, comp_geo_df54, zonal_stats_ready_dir, site_tile_dict
 
 
 if __name__ == "__main__":
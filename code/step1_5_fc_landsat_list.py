@@ -49,10 +49,20 @@ from __future__ import print_function, division
 import os
 import csv
 import sys
+import time
+import pandas as pd
+import geopandas as gpd
+import spatial_io
+import reprojection
 import warnings
 
 warnings.filterwarnings("ignore")
 
+# Landsat tile directory listings made during this process (step1_1 --watch), keyed by the tile directory and search
+# criteria - a listing is re-used while the modification time of every directory walked is unchanged (adding or
+# removing a file changes the modification time of its directory).
+_scene_catalogue_cache = {}
+
 
 def append_geo_df_fn(comp_geo_df_52, comp_geo_df_53, comp_geo_df_54, export_dir_path):
     """ Concatenate previously separated projected 1ha sites to a single geo-DataFrame and re-project to
@@ -62,26 +72,27 @@ def append_geo_df_fn(comp_geo_df_52, comp_geo_df_53, comp_geo_df_54, export_dir_
     to WGSz52.
     @param comp_geo_df_53: geo-dataframe containing 1ha sites with property, site and Landsat tile information projected
     to WGSz53.
+    @param comp_geo_df_54: geo-dataframe containing 1ha sites with property, site and Landsat tile information projected
+    to WGSz54.
+    Note: any of the zone geo-dataframes may be None if no sites were assigned to the zone.
     @param export_dir_path: string object containing the path to the export directory.
     @return geo_df: geo-dataframe containing all inputs projected in GDA94 geographics.
     """
 
     # Add a feature: crs, to each projected geoDataFrame and fill with a projection string variable.
-    comp_geo_df_52['crs'] = 'WGSz52'
-    comp_geo_df_53['crs'] = 'WGSz53'
-    comp_geo_df_54['crs'] = 'WGSz54'
-
-    # Project all geoDataFrames to geographic GDA94.
-    geo_df_gda94_52 = comp_geo_df_52.to_crs(epsg=4283)
-    geo_df_gda94_53 = comp_geo_df_53.to_crs(epsg=4283)
-    geo_df_gda94_54 = comp_geo_df_54.to_crs(epsg=4283)
+    # Project all geoDataFrames to geographic GDA94 - zones without sites (None) are skipped.
+    list_geo_df = []
+    for comp_geo_df, crs in [(comp_geo_df_52, 'WGSz52'), (comp_geo_df_53, 'WGSz53'), (comp_geo_df_54, 'WGSz54')]:
+        if comp_geo_df is not None:
+            comp_geo_df['crs'] = crs
+            list_geo_df.append(reprojection.to_crs_fn(comp_geo_df, epsg=4283))
 
-    # Append/concatenate both geoDataFrames into one.
-    geo_df = geo_df_gda94_52.append([geo_df_gda94_53, geo_df_gda94_54])
+    # Append/concatenate the geoDataFrames into one.
+    geo_df = gpd.GeoDataFrame(pd.concat(list_geo_df), crs=list_geo_df[0].crs)
 
-    # Export geoDataFrame to the export directory (command argument).
-    geo_df.to_file(driver='ESRI Shapefile', filename=export_dir_path + '\\' + 'landsat_tile_site_identity_gda94.shp')
-    print("output geo_df to: ", export_dir_path + '\\' + 'landsat_tile_site_identity_gda94.shp')
+    # Export geoDataFrame to the export directory (command argument) in the spatial intermediate format.
+    layer_path = spatial_io.write_layer_fn(geo_df, export_dir_path, 'landsat_tile_site_identity_gda94')
+    print("output geo_df to: ", layer_path)
 
 
     return geo_df
@@ -110,21 +121,74 @@ def unique_values_fn(geo_df):
     return list_tile_unique
 
 
+def directory_signature_fn(directory_list):
+    """ Return the modification time of each directory (None if the directory no longer exists).
+
+    @param directory_list: list object containing the directory paths.
+    @return signature: tuple object containing the modification time of each directory.
+    """
+
+    signature = []
+    for directory in directory_list:
+        try:
+            signature.append(os.stat(directory).st_mtime)
+        except OSError:
+            signature.append(None)
+
+    return tuple(signature)
+
+
 def list_file_directory_fn(landsat_tile_dir, image_search_criteria1, image_search_criteria2, image_search_criteria4):
+    """ Return the Landsat images of a tile directory matching the search criteria, re-using the listing made earlier
+    in this process while the directories are unchanged (_scene_catalogue_cache).
+
+    @param landsat_tile_dir: string object containing the path to the Landsat tile directory.
+    @param image_search_criteria1: string object containing the end part of the required file name (--search_criteria1)
+    @param image_search_criteria2: string object containing the end part of the required file name (--search_criteria2)
+    @param image_search_criteria4: string object containing the end part of the required file name (--search_criteria4)
+    @return list_landsat_tile_path: list object containing the path to all matching either search criteria.
+    """
+
+    key = (os.path.abspath(landsat_tile_dir), image_search_criteria1, image_search_criteria2, image_search_criteria4)
+
+    if key in _scene_catalogue_cache:
+        directory_list, signature, list_landsat_tile_path = _scene_catalogue_cache[key]
+        if directory_signature_fn(directory_list) == signature:
+            print(' - Landsat scene listing re-used (directories unchanged): ', landsat_tile_dir)
+            return list(list_landsat_tile_path)
+
+    walk_start = time.time()
+    list_landsat_tile_path, directory_list = walk_file_directory_fn(landsat_tile_dir, image_search_criteria1,
+                                                                    image_search_criteria2, image_search_criteria4)
+    # a missing tile directory is recorded so that the listing is made again once the directory exists.
+    directory_list = directory_list or [landsat_tile_dir]
+    signature = directory_signature_fn(directory_list)
+
+    # directories that changed during the walk may not be fully listed - the listing is not re-used.
+    if all(mtime is None or mtime < walk_start for mtime in signature):
+        _scene_catalogue_cache[key] = (directory_list, signature, list(list_landsat_tile_path))
+
+    return list_landsat_tile_path
+
+
+def walk_file_directory_fn(landsat_tile_dir, image_search_criteria1, image_search_criteria2, image_search_criteria4):
     """ Create an empty list to store the Landsat image file path for images that meet the search criteria
     (image_search_criteria1 and image_search_criteria2).
     @param landsat_tile_dir:
     @param image_search_criteria1: string object containing the end part of the required file name (--search_criteria1)
     @param image_search_criteria2: string object containing the end part of the required file name (--search_criteria2)
     @return list_landsat_tile_path: list object containing the path to all matching either search criteria.
+    @return directory_list: list object containing the path to every directory walked.
     """
     # Create an empty list to store file paths.
     list_landsat_tile_path = []
+    directory_list = []
     #print('image_search_criteria1: ', image_search_criteria1)
     #print('image_search_criteria2: ', image_search_criteria2)
     # Navigate and loop through the folders within the Landsat Tile Directory stored in the 'landsat_tile_dir'
     # object variable.
     for root, dirs, files in os.walk(landsat_tile_dir):
+        directory_list.append(root)
         for file in files:
             #print('file: ', file)
             # Search for files ending with the string value stored in the object variable: imageSearchCriteria.
@@ -135,7 +199,7 @@ def list_file_directory_fn(landsat_tile_dir, image_search_criteria1, image_searc
                 # Append the image_path variable to the empty list 'list_landsat_tile_path'.
                 list_landsat_tile_path.append(image_path)
                 #print("list_landsat: ", list_landsat_tile_path)
-    return list_landsat_tile_path
+    return list_landsat_tile_path, directory_list
 
 
 def create_csv_list_of_paths_fn(list_tile_unique, landsat_dir, image_search_criteria1, image_search_criteria2,
@@ -159,7 +223,7 @@ def create_csv_list_of_paths_fn(list_tile_unique, landsat_dir, image_search_crit
 
     for landsat_tile in list_tile_unique:
         # Loop through the unique Landsat Tile list ' listTile Unique'.
-        landsat_tile_dir = landsat_dir + '\\' + landsat_tile
+        landsat_tile_dir = os.path.join(landsat_dir, landsat_tile)
         print('=' * 50)
         print('Confirm that there are sufficient fractional cover tiles for processing')
         print('landsat_tile_dir: ', landsat_tile_dir)
@@ -181,7 +245,7 @@ def create_csv_list_of_paths_fn(list_tile_unique, landsat_dir, image_search_crit
             list_sufficient.append(landsat_tile)
 
             # Assumes that file_list is 1D, it writes each path to a new line in the first 'column' of a .csv
-            csv_output = tile_status_dir + '\\for_processing\\' + str(landsat_tile) + '_landsat_tile_list.csv'
+            csv_output = os.path.join(tile_status_dir, 'for_processing', str(landsat_tile) + '_landsat_tile_list.csv')
 
             # Creates a csv list of the Landsat fractional cover image paths if the minimum fc_count threshold was met.
             with open(csv_output, "w") as output:
@@ -194,7 +258,7 @@ def create_csv_list_of_paths_fn(list_tile_unique, landsat_dir, image_search_crit
             sys.exit()
 
     # assumes that file_list is a flat list, it adds a
-    csv_output2 = tile_status_dir + '\\tile_status_lists\\' + 'Complete_list_of_tiles_ready_for_zonal_stats.csv'
+    csv_output2 = os.path.join(tile_status_dir, 'tile_status_lists', 'Complete_list_of_tiles_ready_for_zonal_stats.csv')
     # Creates a csv list of all of the Landsat tile names that contain 1ha sites that have met the minimum
     # fc_count threshold.
     with open(csv_output2, "w") as output:
@@ -202,7 +266,7 @@ def create_csv_list_of_paths_fn(list_tile_unique, landsat_dir, image_search_crit
         for file in list_sufficient:
             writer.writerow([file])
 
-    csv_output3 = tile_status_dir + '\\tile_status_lists\\' + 'Complete_list_of_tiles_not_processed.csv'
+    csv_output3 = os.path.join(tile_status_dir, 'tile_status_lists', 'Complete_list_of_tiles_not_processed.csv')
     # Creates a csv list of all of the Landsat tile names that contain 1ha sites that have NOT met the minimum
     # fc_count threshold.
     with open(csv_output3, "w") as output:
@@ -217,7 +281,7 @@ def main_routine(export_dir_path, comp_geo_df52, comp_geo_df53, comp_geo_df54, f
                  image_search_criteria2, image_search_criteria4):
 
     # define the tile_status_dir path
-    tile_status_dir = (export_dir_path + '\\tile_status')
+    tile_status_dir = os.path.join(export_dir_path, 'tile_status')
     print("tile_status_dir:", tile_status_dir)
 
     # Call the append_geo_df_fn function to concatenate previously separated projected 1ha sites to a single
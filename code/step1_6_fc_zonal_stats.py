@@ -12,6 +12,11 @@ import shutil
 import glob
 import numpy as np
 import geopandas as gpd
+import site_footprint
+import raster_staging
+import zonal_stats_parquet
+import spatial_io
+import zonal_stats_chunks
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -61,7 +66,32 @@ SOFTWARE.
 ========================================================================================================================
 '''
 
-def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
+# header of the three band zonal stats (band 1, 2 and 3 outputs side by side).
+ZONAL_STATS_HEADER = ['ident', 'prop_name', 'prop_code', 'site', 'site_date', 'b1_min', 'b1_max', 'b1_mean',
+                      'b1_count', 'b1_std', 'b1_median', 'band', 'image', 'date', 'b2_ident', 'b2_prop_name',
+                      'b2_prop_code', 'b2_site', 'b2_site_date', 'b2_min', 'b2_max', 'b2_mean', 'b2_count', 'b2_std',
+                      'b2_median', 'band2', 'image2', 'date2', 'b3_ident', 'b3_prop_name', 'b3_prop_code', 'b3_site',
+                      'b3_site_date', 'b3_min', 'b3_max', 'b3_mean', 'b3_count', 'b3_std', 'b3_median', 'band3',
+                      'image3', 'date3']
+
+
+def read_band_fn(image_s, no_data, band):
+    """ Read a band of a Landsat scene.
+
+    @param image_s: string object containing the path to the Landsat scene.
+    @param no_data: integer object containing the raster no data value.
+    @param band: integer object containing the band number.
+    @return raster: tuple object containing the band array, the affine transform and the raster name (str(srci)).
+    """
+
+    # read the local copy when the scenes are staged (raster_staging, step1_1 --staging_dir); the copy keeps the
+    # scene file name and is pinned (not evicted) while it is read.
+    with raster_staging.staged_raster_fn(image_s) as local_path:
+        with rasterio.open(local_path, nodata=no_data) as srci:
+            return srci.read(band), srci.transform, str(srci)
+
+
+def apply_zonal_stats_fn(image_s, no_data, band, shape, uid, footprint=None, raster=None):
     """ Collect the zonal statistical information fom a raster file contained within a polygon extend outputting a
     list of results (final_results).
 
@@ -69,8 +99,12 @@ def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
         cleaned imagery_list_image_results.
         @param no_data: integer object containing the raster no data value.
         @param band: string object containing the current band number being processed.
-        @param shape: open odk shapefile containing the 1ha site polygons.
+        @param shape: string object containing the path to the odk shapefile or a geo-dataframe (in memory)
+        containing the 1ha site polygons.
         @param uid: unique identifier number.
+        @param footprint: tuple object containing the unique site footprints and the footprint position of each record
+        (site_footprint.unique_footprint_fn), used to calculate the zonal stats once per footprint (in memory only).
+        @param raster: tuple object containing the band already read (read_band_fn), or None to read the band.
         @return final_results: list object containing all of the zonal stats, image and shapefile polygon/site
         information. """
 
@@ -85,70 +119,149 @@ def apply_zonal_stats_fn(image_s, no_data, band, shape, uid):
     image_date = []
     list_band = []
 
-    with rasterio.open(image_s, nodata=no_data) as srci:
-        affine = srci.transform
-        array = srci.read(band)
-
-        with fiona.open(shape) as src:
-            # using 'all_touched=True' will increase the number of pixels used to produce the stats 'False'
-            # reduces the number define the zonal stats being calculated
+    if raster is None:
+        raster = read_band_fn(image_s, no_data, band)
+    array, affine, raster_name = raster
+
+    if isinstance(shape, gpd.GeoDataFrame):
+        # the site by tile geo-dataframe handed over by step1_4 (in memory).
+        src = [{'properties': properties} for properties in shape.drop(columns='geometry').to_dict('records')]
+        # using 'all_touched=True' will increase the number of pixels used to produce the stats 'False'
+        # reduces the number define the zonal stats being calculated
+        if footprint is not None:
+            # revisits of a site share a footprint - calculate once per footprint and fan out to each record.
+            zs = site_footprint.footprint_zonal_stats_fn(footprint[0], footprint[1], array, affine, no_data,
+                                                        ['count', 'min', 'max', 'mean', 'median', 'std'], False)
+        else:
+            zs = zonal_stats(shape, array, affine=affine, nodata=no_data,
+                             stats=['count', 'min', 'max', 'mean', 'median', 'std'], all_touched=False)
+    else:
+        with fiona.open(shape) as src_shape:
+            src = list(src_shape)
             zs = zonal_stats(src, array, affine=affine, nodata=no_data,
                              stats=['count', 'min', 'max', 'mean', 'median', 'std'], all_touched=False)
 
-
-            print("zs: ", zs)
-            # extract image name and append to list
-            img_name = str(srci)[-54:-11]
-            list_image_name.append(img_name)
-            # extract image date and append to list
-            img_date = str(srci)[-38:-30]
-            image_date.append(img_date)
-
-            for zone in zs:
-                bands = 'b' + str(band)
-                list_band.append(bands)
-                # extract 'values' as a tuple from a dictionary
-                keys, values = zip(*zone.items())
-                # convert tuple to a list and append to zone_stats
-                result = list(values)
-                zone_stats.append(result)
-
-            for i in src:
-                # extract shapefile records
-                table_attributes = i['properties']
-
-                uid_ = table_attributes[uid]
-                details = [uid_]
-                list_uid.append(details)
-
-                site = table_attributes['site_name']
-                site_ = [site]
-                list_site.append(site_)
-
-                prop = table_attributes['prop_name']
-                prop_ = [prop]
-                list_prop.append(prop_)
-
-                prop_code = table_attributes['prop_code']
-                prop_code_ = [prop_code]
-                list_prop_code.append(prop_code_)
-
-                site_date = table_attributes['site_date']
-                site_date_ = [site_date]
-                list_site_date.append(site_date_)
-
-        # join the elements in each of the lists row by row 
-        final_results = [list_uid + list_prop + list_prop_code + list_site + list_site_date + zone_stats for
-                         list_uid, list_prop, list_prop_code, list_site, list_site_date, zone_stats in
-                         zip(list_uid, list_prop, list_prop_code, list_site, list_site_date, zone_stats)]
-
-        # close the vector and raster file 
-        src.close()
-        srci.close()
+    print("zs: ", zs)
+    # extract image name and append to list
+    img_name = raster_name[-54:-11]
+    list_image_name.append(img_name)
+    # extract image date and append to list
+    img_date = raster_name[-38:-30]
+    image_date.append(img_date)
+
+    for zone in zs:
+        bands = 'b' + str(band)
+        list_band.append(bands)
+        # extract 'values' as a tuple from a dictionary
+        keys, values = zip(*zone.items())
+        # convert tuple to a list and append to zone_stats
+        result = list(values)
+        zone_stats.append(result)
+
+    for i in src:
+        # extract shapefile records
+        table_attributes = i['properties']
+
+        uid_ = table_attributes[uid]
+        details = [uid_]
+        list_uid.append(details)
+
+        site = table_attributes['site_name']
+        site_ = [site]
+        list_site.append(site_)
+
+        prop = table_attributes['prop_name']
+        prop_ = [prop]
+        list_prop.append(prop_)
+
+        prop_code = table_attributes['prop_code']
+        prop_code_ = [prop_code]
+        list_prop_code.append(prop_code_)
+
+        site_date = table_attributes['site_date']
+        site_date_ = [site_date]
+        list_site_date.append(site_date_)
+
+    # join the elements in each of the lists row by row 
+    final_results = [list_uid + list_prop + list_prop_code + list_site + list_site_date + zone_stats for
+                     list_uid, list_prop, list_prop_code, list_site, list_site_date, zone_stats in
+                     zip(list_uid, list_prop, list_prop_code, list_site, list_site_date, zone_stats)]
 
     return final_results, str(prop_code), str(prop_[0])
 
 
+def band_zonal_stats_fn(image_s, no_data, band, shape, uid, footprint=None, raster=None):
+    """ Calculate the zonal stats of a single band of a Landsat scene as a dataframe (one row per 1ha site).
+
+    @param image_s: string object containing the path to the Landsat scene.
+    @param no_data: integer object containing the raster no data value.
+    @param band: integer object containing the band number.
+    @param shape: string object containing the path to the odk shapefile or a geo-dataframe (in memory)
+    containing the 1ha site polygons.
+    @param uid: unique identifier number.
+    @param footprint: tuple object containing the unique site footprints (site_footprint.unique_footprint_fn) or None.
+    @param raster: tuple object containing the band already read (read_band_fn), or None to read the band.
+    @return df: dataframe object containing the band zonal stats, band number, image name and image date.
+    @return prop_code: string object containing the property code of the last site.
+    @return prop_name: string object containing the property name of the last site.
+    """
+
+    # May need to change these values depending on whether there is a 2 or 3 in the name.
+    im_name = image_s[-43:-1] + 'g'
+    im_date = image_s[-27:-19]
+
+    final_results, prop_code, prop_name = apply_zonal_stats_fn(image_s, no_data, band, shape, uid, footprint, raster)
+
+    header = [str(band) + '_number', str(band) + '_prop_name', str(band) + '_prop_code',
+              str(band) + '_site', str(band) + '_site_date', str(band) + '_min', str(band) + '_max',
+              str(band) + '_mean', str(band) + '_count', str(band) + '_std', str(band) + '_median']
+
+    df = pd.DataFrame.from_records(final_results, columns=header)
+    df['band'] = band
+    df['image'] = im_name
+    df['date'] = im_date
+
+    return df, prop_code, prop_name
+
+
+def scene_zonal_stats_fn(image_s, no_data, shape, uid, footprint=None, raster_list=None):
+    """ Calculate the zonal stats of the three bands of a Landsat scene (one row per 1ha site, ZONAL_STATS_HEADER),
+    used by the scene work queue (scene_queue).
+
+    @param image_s: string object containing the path to the Landsat scene.
+    @param no_data: integer object containing the raster no data value.
+    @param shape: geo-dataframe containing the 1ha site polygons.
+    @param uid: unique identifier number.
+    @param footprint: tuple object containing the unique site footprints (site_footprint.unique_footprint_fn) or None.
+    @param raster_list: list object containing the three bands already read (read_band_fn), or None to read the bands.
+    @return scene_df: dataframe object containing the three band zonal stats of the scene.
+    """
+
+    raster_list = raster_list or [None, None, None]
+    band_df_list = [band_zonal_stats_fn(image_s, no_data, band, shape, uid, footprint, raster_list[band - 1])[0]
+                    for band in [1, 2, 3]]
+    scene_df = pd.concat(band_df_list, axis=1, sort=False)
+    scene_df.columns = ZONAL_STATS_HEADER
+
+    return scene_df
+
+
+def site_chunk_zonal_stats_fn(image_s, no_data, site_chunk_list, uid):
+    """ Calculate the three band zonal stats of a Landsat scene for each site chunk, reading the scene bands once.
+
+    @param image_s: string object containing the path to the Landsat scene.
+    @param no_data: integer object containing the raster no data value.
+    @param site_chunk_list: list object containing the site chunk geo-dataframes and their unique site footprints.
+    @param uid: unique identifier number.
+    @return scene_df: generator object yielding the three band zonal stats of the scene for each site chunk.
+    """
+
+    raster_list = [read_band_fn(image_s, no_data, band) for band in [1, 2, 3]]
+
+    for site_df, footprint in site_chunk_list:
+        yield scene_zonal_stats_fn(image_s, no_data, site_df, uid, footprint, raster_list)
+
+
 def time_stamp_fn(output_zonal_stats):
     """Insert a timestamp into feature position 4, convert timestamp into year, month and day strings and append to
     dataframe.
@@ -201,11 +314,141 @@ def landsat_correction_fn(output_zonal_stats):
     return output_zonal_stats
 
 
-def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stats_output):
+def clean_zonal_stats_fn(output_zonal_stats):
+    """ Clean the three band zonal stats dataframe (ZONAL_STATS_HEADER) into the tile csv columns.
+
+    @param output_zonal_stats: dataframe object containing the three band zonal stats of the scenes.
+    @return output_zonal_stats: dataframe object containing the cleaned zonal stats.
+    """
+
+    # Convert the date to a time stamp
+    time_stamp_fn(output_zonal_stats)
+
+    # remove 100 from zone_stats
+    landsat_correction_fn(output_zonal_stats)
+
+    # reshape the final dataframe
+    output_zonal_stats = output_zonal_stats[
+        ['ident', 'prop_name', 'prop_code', 'site', 'site_date', 'image', 'year', 'month', 'day', 'b1_min',
+         'b1_max', 'b1_mean', 'b1_count', 'b1_std', 'b1_median', 'b2_min', 'b2_max', 'b2_mean', 'b2_count',
+         'b2_std', 'b2_median', 'b3_min', 'b3_max', 'b3_mean', 'b3_count', 'b3_median', 'b3_std']]
+
+    output_zonal_stats.insert(4, 'comp_site', output_zonal_stats.prop_code + '_' + output_zonal_stats.prop_name +
+                              '_' + output_zonal_stats.site)
+
+    return output_zonal_stats
+
+
+def output_csv_fn(zonal_stats_output, complete_tile, prop_code, prop_name):
+    """ Return the path to the tile zonal stats csv (named after the property of the last site). """
+
+    return os.path.join(zonal_stats_output, "{0}_{1}_{2}_zonal_stats.csv".format(
+        prop_code, prop_name.replace(' ', '_').replace('-', '_').title(), str(complete_tile)))
+
+
+def export_zonal_stats_fn(output_zonal_stats, zonal_stats_output, complete_tile, prop_code, prop_name):
+    """ Clean the three band zonal stats dataframe (ZONAL_STATS_HEADER) and export it to the zonal stats directory.
+
+    @param output_zonal_stats: dataframe object containing the three band zonal stats of every scene of the tile.
+    @param zonal_stats_output: string object containing the path to the export_dir/zonal_stats directory.
+    @param complete_tile: string object containing the six character tile name.
+    @param prop_code: string object containing the property code used to name the output csv.
+    @param prop_name: string object containing the property name used to name the output csv.
+    @return output_zonal_stats: dataframe object containing the cleaned zonal stats.
+    @return output_csv: string object containing the path to the output csv.
+    """
+
+    # -------------------------------------------------- Clean dataframe -----------------------------------------------
+
+    output_zonal_stats = clean_zonal_stats_fn(output_zonal_stats)
+    output_csv = output_csv_fn(zonal_stats_output, complete_tile, prop_code, prop_name)
+    print(output_csv)
+
+    # export the results to a csv file
+    output_zonal_stats.to_csv(output_csv, index=False)
+
+    # write the partitioned Parquet dataset alongside the csv (zonal_stats_parquet, step1_1 --parquet).
+    zonal_stats_parquet.write_partitions_fn(output_zonal_stats, os.path.dirname(zonal_stats_output), 'fc',
+                                            complete_tile)
+
+    return output_zonal_stats, output_csv
+
+
+def chunked_zonal_stats_fn(image_list, no_data, shape, uid, temp_dir_path, zonal_stats_output, complete_tile, tile,
+                           max_memory):
+    """ Calculate the three band zonal stats of a tile in chunks of scenes and sites that fit within the memory budget
+    (step1_1 --max_memory). Each cleaned chunk is spilled to the temporary directory and the chunks are streamed into
+    the tile csv (and Parquet dataset) one at a time.
+
+    @param image_list: list object containing the paths to the Landsat scenes of the tile.
+    @param no_data: integer object containing the raster no data value.
+    @param shape: geo-dataframe containing the 1ha site polygons of the tile.
+    @param uid: unique identifier number.
+    @param temp_dir_path: string object containing the path to the tile temporary directory.
+    @param zonal_stats_output: string object containing the path to the export_dir/zonal_stats directory.
+    @param complete_tile: string object containing the six character tile name.
+    @param tile: string object containing the path to the tile scene list csv.
+    @param max_memory: integer object containing the memory budget (MB).
+    @return output_csv: string object containing the path to the output csv.
+    @return spill_dir: string object containing the path to the (removed) spill directory.
+    """
+
+    spill_dir = os.path.join(temp_dir_path, 'temp_spill')
+    scene_chunk, site_chunk = zonal_stats_chunks.chunk_size_fn(len(image_list), len(shape.index), tile, max_memory)
+
+    # the zonal stats are held as floats so that every chunk writes the same csv values.
+    stat_column_list = [column for column in ZONAL_STATS_HEADER if
+                        column.split('_')[-1] in ['min', 'max', 'mean', 'std', 'median']]
+
+    # unique site footprints of each site chunk (revisits with identical coordinates share a footprint).
+    site_chunk_list = [(site_df, site_footprint.unique_footprint_fn(site_df, site_footprint.PROJECTED_PRECISION))
+                       for site_df in zonal_stats_chunks.chunk_list_fn(shape, site_chunk)]
+
+    spill_list = []
+    for scene_list in zonal_stats_chunks.chunk_list_fn(image_list, scene_chunk):
+        # the bands of each scene are read once for every site chunk; the site chunk results of the scene chunk are
+        # held until the last scene, then each site chunk is spilled as soon as it is complete (in site chunk order).
+        scene_df_list = [[] for _ in site_chunk_list]
+        for scene_position, image_s in enumerate(scene_list):
+            for position, scene_df in enumerate(site_chunk_zonal_stats_fn(image_s, no_data, site_chunk_list, uid)):
+                scene_df_list[position].append(scene_df)
+                if scene_position < len(scene_list) - 1:
+                    continue
+
+                chunk_df = pd.concat(scene_df_list[position], ignore_index=True)
+                scene_df_list[position] = []
+                chunk_df[stat_column_list] = chunk_df[stat_column_list].astype(float)
+                spill_list.append(zonal_stats_chunks.spill_fn(clean_zonal_stats_fn(chunk_df), spill_dir,
+                                                              len(spill_list)))
+                del chunk_df
+
+        print(' - chunks spilled: ', len(spill_list))
+
+    # the output is named after the property of the last site.
+    output_csv = output_csv_fn(zonal_stats_output, complete_tile, str(shape.prop_code.iloc[-1]),
+                               str(shape.prop_name.iloc[-1]))
+    print(output_csv)
+
+    def parquet_chunk_fn(df, chunk_number, row_offset):
+        # write the partitioned Parquet dataset alongside the csv (zonal_stats_parquet, step1_1 --parquet).
+        zonal_stats_parquet.write_partitions_fn(df, os.path.dirname(zonal_stats_output), 'fc', complete_tile,
+                                                chunk_number, row_offset)
+
+    row_count = zonal_stats_chunks.merge_spill_fn(spill_list, output_csv, parquet_chunk_fn)
+    print(' - rows merged: ', row_count)
+
+    shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return output_csv, spill_dir
+
+
+def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stats_output, site_tile_dict=None):
 
     """Restructure ODK 1ha geo-DataFrame to calculate the zonal statistics for each 1ha site per Landsat Fractional
     Cover image, per band (b1, b2 and b3). Concatenate and clean final output DataFrame and export to the Export
-    directory/zonal stats."""
+    directory/zonal stats. The 1ha sites are taken from the step1_4 site_tile_dict (in memory) when it is provided,
+    otherwise they are read from the zonal_stats_ready_dir shapefile. With a memory budget (--max_memory) the scenes and
+    sites are processed in chunks and the returned zonal stats dataframe is None."""
 
     # print('step1_6_fc_zonal_stats.py INITIATED.'
 
@@ -222,15 +465,39 @@ def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stat
     print('=' * 50)
     print('......')
 
-    odk_shapefile = zonal_stats_ready_dir + '\\' + complete_tile + '_odk_by_tile.shp'
-    print("odk_shapefile: ", odk_shapefile)
-    df = gpd.read_file(odk_shapefile)
+    if site_tile_dict is not None:
+        shape = site_tile_dict[complete_tile]
+        # unique site footprints (revisits with identical coordinates share a footprint).
+        footprint = site_footprint.unique_footprint_fn(shape, site_footprint.PROJECTED_PRECISION)
+    elif spatial_io.format_fn() != 'shp':
+        # the site by tile layer of a GeoPackage or GeoParquet file (--spatial_format) is read in once.
+        shape = spatial_io.read_layer_fn(zonal_stats_ready_dir, complete_tile + '_ODK_by_tile')
+        footprint = None
+    else:
+        odk_shapefile = os.path.join(zonal_stats_ready_dir, complete_tile + '_ODK_by_tile.shp')
+        print("odk_shapefile: ", odk_shapefile)
+        shape = odk_shapefile
+        footprint = None
 
-    shape = odk_shapefile
     # nodata = int(0)
     uid = 'uid'
     im_list = tile
 
+    max_memory = zonal_stats_chunks.max_memory_fn()
+    if max_memory is not None:
+        # chunk the scenes and sites so the tile stays within the memory budget (step1_1 --max_memory).
+        if not isinstance(shape, gpd.GeoDataFrame):
+            shape = gpd.read_file(shape)
+        with open(im_list, 'r') as imagery_list:
+            image_list = [image.rstrip() for image in imagery_list if image.strip()]
+
+        output_csv, spill_dir = chunked_zonal_stats_fn(image_list, no_data, shape, uid, temp_dir_path,
+                                                       zonal_stats_output, complete_tile, tile, max_memory)
+        print('=' * 50)
+
+        # the zonal stats are not held in memory (written to output_csv).
+        return None, complete_tile, tile, spill_dir
+
     # create temporary folders
     temp_dir_bands = temp_dir_path + '//temp_individual_bands'
     os.makedirs(temp_dir_bands)
@@ -256,54 +523,19 @@ def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stat
                 image_s = image.rstrip()
                 print("image_s:", image_s)
 
-                im_name_s = image_s[
-                           -43:-1]  # May need to change these values depending on whether there is a 2 or 3 in the
-                # name.
-                im_name = im_name_s + 'g'
-                # print('Image name: ', im_name)
-                im_date = image_s[
-                          -27:-19]  # May need to change these values depending on whether there is a 2 or 3 in the
-                # name.
-
-                # loops through each image
-                with rasterio.open(image_s, nodata=no_data) as srci:
-                    image_results = 'image_' + im_name + '.csv'
-
-                    # runs the zonal stats function and outputs a csv in a band specific folder
-                    final_results, prop_code, prop_name = apply_zonal_stats_fn(image_s, no_data, band, shape, uid)
-
-                    header = [str(band) + '_number', str(band) + '_prop_name', str(band) + '_prop_code',
-                              str(band) + '_site', str(band) + '_site_date', str(band) + '_min', str(band) + '_max',
-                              str(band) + '_mean', str(band) + '_count', str(band) + '_std', str(band) + '_median']
-
-                    if band == 1:
-                        df = pd.DataFrame.from_records(final_results, columns=header)
-                        df['band'] = band
-                        df['image'] = im_name
-                        df['date'] = im_date
-                        df.to_csv(temp_dir_bands + '//band1//' + image_results, index=False)
-                    elif band == 2:
-                        df = pd.DataFrame.from_records(final_results, columns=header)
-                        df['band'] = band
-                        df['image'] = im_name
-                        df['date'] = im_date
-                        df.to_csv(temp_dir_bands + '//band2//' + image_results, index=False)
-                    elif band == 3:
-                        df = pd.DataFrame.from_records(final_results, columns=header)
-                        df['band'] = band
-                        df['image'] = im_name
-                        df['date'] = im_date
-                        df.to_csv(temp_dir_bands + '//band3//' + image_results, index=False)
-                    else:
-                        print('There is an error.')
+                image_results = 'image_' + image_s[-43:-1] + 'g.csv'
+
+                # runs the zonal stats function and outputs a csv in a band specific folder
+                df, prop_code, prop_name = band_zonal_stats_fn(image_s, no_data, band, shape, uid, footprint)
+                df.to_csv(temp_dir_bands + '//band' + str(band) + '//' + image_results, index=False)
 
     # -------------------------------------------------- Concatenate csv -----------------------------------------------
 
     # for loops through the band folders and concatenates zonal stat outputs into a complete band specific csv
     for x in num_bands:
         location_output = temp_dir_bands + '//band' + str(x)
-        band_files = glob.glob(os.path.join(location_output,
-                                            '*.csv'))
+        band_files = sorted(glob.glob(os.path.join(location_output,
+                                                   '*.csv')))
 
         # advisable to use os.path.join as this makes concatenation OS independent
         df_from_each_band_file = (pd.read_csv(f) for f in band_files)
@@ -314,44 +546,18 @@ def main_routine(temp_dir_path, zonal_stats_ready_dir, no_data, tile, zonal_stat
     # ----------------------------------------- Concatenate three bands together ---------------------------------------
 
     # Concatenate Three bands
-    header_all = ['ident', 'prop_name', 'prop_code', 'site', 'site_date', 'b1_min', 'b1_max', 'b1_mean', 'b1_count',
-                  'b1_std', 'b1_median', 'band', 'image', 'date', 'b2_ident', 'b2_prop_name', 'b2_prop_code',
-                  'b2_site', 'b2_site_date', 'b2_min', 'b2_max', 'b2_mean', 'b2_count', 'b2_std', 'b2_median',
-                  'band2', 'image2', 'date2', 'b3_ident', 'b3_prop_name', 'b3_prop_code', 'b3_site', 'b3_site_date',
-                  'b3_min', 'b3_max', 'b3_mean', 'b3_count', 'b3_std', 'b3_median', 'band3', 'image3', 'date3']
     # print("temp_dir_bands: ", temp_dir_bands)
 
-    all_files = glob.glob(os.path.join(temp_dir_bands,
-                                       '*.csv'))
+    all_files = sorted(glob.glob(os.path.join(temp_dir_bands,
+                                              '*.csv')))
     # advisable to use os.path.join as this makes concatenation OS independent
     df_from_each_file = (pd.read_csv(f) for f in all_files)
     output_zonal_stats = pd.concat(df_from_each_file, ignore_index=False, axis=1, sort=False)
-    output_zonal_stats.columns = header_all
-
-    # -------------------------------------------------- Clean dataframe -----------------------------------------------
-
-    # Convert the date to a time stamp
-    time_stamp_fn(output_zonal_stats)
-
-    # remove 100 from zone_stats
-    landsat_correction_fn(output_zonal_stats)
-
-    # reshape the final dataframe
-    output_zonal_stats = output_zonal_stats[
-        ['ident', 'prop_name', 'prop_code', 'site', 'site_date', 'image', 'year', 'month', 'day', 'b1_min',
-         'b1_max', 'b1_mean', 'b1_count', 'b1_std', 'b1_median', 'b2_min', 'b2_max', 'b2_mean', 'b2_count',
-         'b2_std', 'b2_median', 'b3_min', 'b3_max', 'b3_mean', 'b3_count', 'b3_median', 'b3_std']]
-
-    output_zonal_stats.insert(4, 'comp_site', output_zonal_stats.prop_code + '_' + output_zonal_stats.prop_name +
-                              '_' + output_zonal_stats.site)
-    print("{0}\\{1}_{2}_{3}_zonal_stats.csv".format(zonal_stats_output, prop_code,
-                                                    prop_name.replace(' ', '_').replace('-', '_').title(),
-                                                    str(complete_tile)))
+    output_zonal_stats.columns = ZONAL_STATS_HEADER
 
-    # export the results to a csv file
-    output_zonal_stats.to_csv("{0}\\{1}_{2}_{3}_zonal_stats.csv".format(zonal_stats_output, prop_code,
-                                               prop_name.replace(' ', '_').replace('-', '_').title(),
-                                               str(complete_tile)), index=False)
+    # clean and export the three band zonal stats.
+    output_zonal_stats, output_csv = export_zonal_stats_fn(output_zonal_stats, zonal_stats_output, complete_tile,
+                                                           prop_code, prop_name)
 
     # ----------------------------------------------- Delete temporary files -------------------------------------------
     # remove the temp dir and single band csv files
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
 from __future__ import print_function, division
+import os
 import fiona
 import rasterio
 import pandas as pd
 from rasterstats import zonal_stats
 import geopandas as gpd
+import site_footprint
+import raster_staging
+import zonal_stats_parquet
+import spatial_io
+import reprojection
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -58,40 +64,57 @@ SOFTWARE.
 '''
 
 
-def project_shapefile_gcs_wgs84_fn(complete_tile, zonal_stats_ready_dir, gcs_wgs84_dir):
+def project_shapefile_gcs_wgs84_fn(complete_tile, zonal_stats_ready_dir, gcs_wgs84_dir, site_tile_dict=None,
+                                   debug_dump=False):
     """ Re-project a shapefile to 'GCSWGS84' to match the projection of the rainfall data.
     @param complete_tile: string object containing the Landsat tile name that was used to produce the 1ha plots.
     @param zonal_stats_ready_dir: zonal_stats_ready_dir: string object containing the path to a temporary sub-directory
     prime_temp_grid_dir\zonal_stats_ready\crs_name.
     @param gcs_wgs84_dir: string object containing the path to the subdirectory located in the temporary_dir\gcs_wgs84
-    @return:
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value) handed
+    over by step1_4 (in memory), or None to read the zonal_stats_ready_dir layer (--spatial_format).
+    @param debug_dump: boolean object, True to export the re-projected shapefile when working in memory.
+    @return cgs_df: geo-dataframe containing the 1ha sites re-projected to GCSWGS84.
+    @return projected_shape_path: string object containing the path to the re-projected shapefile, or None if the
+    shapefile was not exported (or was exported as a GeoPackage or GeoParquet layer).
     """
 
-    # read in shp as a geoDataFrame.
-    df = gpd.read_file(zonal_stats_ready_dir + '\\' + complete_tile + '_odk_by_tile.shp')
+    if site_tile_dict is not None:
+        df = site_tile_dict[complete_tile]
+    else:
+        # read in the site by tile layer as a geoDataFrame.
+        df = spatial_io.read_layer_fn(zonal_stats_ready_dir, complete_tile + '_ODK_by_tile')
 
-    # project to GCSWGS84
-    cgs_df = df.to_crs(epsg=4326)
+    # project to GCSWGS84 (the transformer is cached and the sites memoized - reprojection).
+    cgs_df = reprojection.to_crs_fn(df, epsg=4326)
 
     # define crs file/path name variable.
     crs_name = 'GCSWGS84'
 
-    # Export re-projected shapefiles.
-    projected_shape_path = gcs_wgs84_dir + '\\' + str(complete_tile) + '_' + str(crs_name) + '.shp'
+    if site_tile_dict is None or debug_dump:
+        # Export re-projected layer (--spatial_format).
+        projected_shape_path = spatial_io.write_layer_fn(cgs_df, gcs_wgs84_dir,
+                                                         str(complete_tile) + '_' + str(crs_name))
 
-    # Export re-projected shapefiles.
-    cgs_df.to_file(projected_shape_path)
+        if spatial_io.format_fn() != 'shp':
+            # the zonal stats are calculated from the geo-dataframe (a GeoPackage may hold several layers).
+            projected_shape_path = None
+    else:
+        projected_shape_path = None
 
     return cgs_df, projected_shape_path
 
 
-def apply_zonal_stats_fn(image_s, projected_shape_path, uid):
+def apply_zonal_stats_fn(image_s, projected_shape_path, uid, footprint=None):
     """
     Derive zonal stats for a list of Landsat imagery.
 
     @param image_s: string object containing the file path to the current rainfall tiff.
-    @param projected_shape_path: string object containing the path to the current 1ha shapefile path.
+    @param projected_shape_path: string object containing the path to the current 1ha shapefile path or a
+    geo-dataframe (in memory) containing the 'GCSWGS84' projected 1ha sites.
     @param uid: ODK 1ha dataframe feature (unique numeric identifier)
+    @param footprint: tuple object containing the unique site footprints and the footprint position of each record
+    (site_footprint.unique_footprint_fn), used to calculate the zonal stats once per footprint (in memory only).
     @return final_results: list object containing the specified zonal statistic values.
     """
     # create empty lists to write in  zonal stats results 
@@ -101,60 +124,70 @@ def apply_zonal_stats_fn(image_s, projected_shape_path, uid):
     image_name_list = []
     no_data = -1  # the no_data value for the silo rainfall raster imagery
 
-    with rasterio.open(image_s, nodata=no_data) as srci:
+    # read the local copy when the rainfall images are staged (raster_staging, step1_1 --staging_dir) - the copy is
+    # pinned (not evicted) while it is read.
+    with raster_staging.staged_raster_fn(image_s) as local_path, rasterio.open(local_path, nodata=no_data) as srci:
 
         affine = srci.transform
         array = srci.read(1)
-        # open the 'GCSWGS84' projected shapefile (1ha sites)
-        with fiona.open(projected_shape_path) as src:
-
-            zs = zonal_stats(src, array, affine=affine, nodata=no_data,
-                             stats=['count', 'min', 'max', 'mean', 'median', 'std'], all_touched=True)
-
-            # using "all_touched=True" will increase the number of pixels used to produce the stats "False" reduces
-            # the number extract the image name from the opened file from the input file read in by rasterio
-
-            list_a = str(srci).rsplit('\\')
-            file_name = list_a[-1]
-            list_b = file_name.rsplit("'")
-            file_name_final = list_b[0]
-            img_date = file_name_final[0:6]
-
-            for zone in zs:
-                zone_stats = zone
-                count = zone_stats["count"]
-                mean = zone_stats["mean"]
-                minimum = zone_stats["min"]
-                maximum = zone_stats['max']
-                med = zone_stats['median']
-                std = zone_stats['std']
-
-                # put the individual results in a list and append them to the zone_stats list
-                result = [mean, std, med, minimum, maximum, count]  # perc5,perc95
-                zone_stats_list.append(result)
-
-            # extract out the site number for the polygon
-            for i in src:
-                table_attributes = i['properties']  # reads in the attribute table for each record
-
-                ident = table_attributes[
-                    uid]  # reads in the id field from the attribute table and prints out the selected record
-                site = table_attributes['site_name']
-                prop = table_attributes['prop_name']
-                prop_code = table_attributes['prop_code']
-                site_date = table_attributes['site_date']
-                details = [ident, site, prop, prop_code, site_date, img_date]
-
-                site_id_list.append(details)
-                image_used = [file_name_final]
-                image_name_list.append(image_used)
+        if isinstance(projected_shape_path, gpd.GeoDataFrame):
+            # the 'GCSWGS84' projected 1ha sites (in memory).
+            src = [{'properties': properties} for properties in
+                   projected_shape_path.drop(columns='geometry').to_dict('records')]
+            if footprint is not None:
+                # revisits of a site share a footprint - calculate once per footprint and fan out to each record.
+                zs = site_footprint.footprint_zonal_stats_fn(footprint[0], footprint[1], array, affine, no_data,
+                                                            ['count', 'min', 'max', 'mean', 'median', 'std'], True)
+            else:
+                zs = zonal_stats(projected_shape_path, array, affine=affine, nodata=no_data,
+                                 stats=['count', 'min', 'max', 'mean', 'median', 'std'], all_touched=True)
+        else:
+            # open the 'GCSWGS84' projected shapefile (1ha sites)
+            with fiona.open(projected_shape_path) as src_shape:
+                src = list(src_shape)
+                zs = zonal_stats(src, array, affine=affine, nodata=no_data,
+                                 stats=['count', 'min', 'max', 'mean', 'median', 'std'], all_touched=True)
+
+        # using "all_touched=True" will increase the number of pixels used to produce the stats "False" reduces
+        # the number extract the image name from the opened file from the input file read in by rasterio
+
+        file_name_final = os.path.basename(srci.name)
+        img_date = file_name_final[0:6]
+
+        for zone in zs:
+            zone_stats = zone
+            count = zone_stats["count"]
+            mean = zone_stats["mean"]
+            minimum = zone_stats["min"]
+            maximum = zone_stats['max']
+            med = zone_stats['median']
+            std = zone_stats['std']
+
+            # put the individual results in a list and append them to the zone_stats list
+            result = [mean, std, med, minimum, maximum, count]  # perc5,perc95
+            zone_stats_list.append(result)
+
+        # extract out the site number for the polygon
+        for i in src:
+            table_attributes = i['properties']  # reads in the attribute table for each record
+
+            ident = table_attributes[
+                uid]  # reads in the id field from the attribute table and prints out the selected record
+            site = table_attributes['site_name']
+            prop = table_attributes['prop_name']
+            prop_code = table_attributes['prop_code']
+            site_date = table_attributes['site_date']
+            details = [ident, site, prop, prop_code, site_date, img_date]
+
+            site_id_list.append(details)
+            image_used = [file_name_final]
+            image_name_list.append(image_used)
 
         # join the elements in each of the lists row by row
         final_results = [siteid + zoneR + imU for siteid, zoneR, imU in
                          zip(site_id_list, zone_stats_list, image_name_list)]
 
-        # close the vector and raster file 
-        src.close()
+        # close the raster file
         srci.close()
 
     return final_results
@@ -185,27 +218,37 @@ def clean_data_frame_fn(output_list, rainfall_output_dir, complete_tile):
     prop_name = "{0}_{1}".format(prop_tag[0], prop[0])
     # export the pandas df to a csv file
     output_rainfall.to_csv(
-        "{0}\\{1}_{2}_rainfall_zonal_stats.csv".format(rainfall_output_dir, prop_name, str(complete_tile),
-                                                       index=False))
+        os.path.join(rainfall_output_dir, "{0}_{1}_rainfall_zonal_stats.csv".format(prop_name, str(complete_tile))))
+
+    # write the partitioned Parquet dataset alongside the csv (zonal_stats_parquet, step1_1 --parquet).
+    zonal_stats_parquet.write_partitions_fn(output_rainfall, os.path.dirname(rainfall_output_dir), 'rainfall',
+                                            complete_tile)
 
     return output_rainfall
 
 
-def main_routine(export_dir_path, zonal_stats_ready_dir, complete_tile, export_rainfall, temp_dir_path):
+def main_routine(export_dir_path, zonal_stats_ready_dir, complete_tile, export_rainfall, temp_dir_path,
+                 site_tile_dict=None, debug_dump=False):
     """ Calculate the zonal statistics for each 1ha site per QLD monthly rainfall image (single band).
-    Concatenate and clean final output DataFrame and export to the Export directory/zonal stats."""
+    Concatenate and clean final output DataFrame and export to the Export directory/zonal stats. The 1ha sites are taken
+    from the step1_4 site_tile_dict (in memory) when it is provided."""
 
     uid = 'uid'
     output_list = []
 
     # define the GCSWGS84 directory pathway
-    gcs_wgs84_dir = (temp_dir_path + '\\gcs_wgs84')
+    gcs_wgs84_dir = os.path.join(temp_dir_path, 'gcs_wgs84')
 
     # define the rainfallOutput directory pathway
-    rainfall_output_dir = (export_dir_path + '\\rainfall')
+    rainfall_output_dir = os.path.join(export_dir_path, 'rainfall')
 
     # call the project_shapefile_gcs_wgs84_fn function
-    cgs_df, projected_shape_path = project_shapefile_gcs_wgs84_fn(complete_tile, zonal_stats_ready_dir, gcs_wgs84_dir)
+    cgs_df, projected_shape_path = project_shapefile_gcs_wgs84_fn(complete_tile, zonal_stats_ready_dir, gcs_wgs84_dir,
+                                                                  site_tile_dict, debug_dump)
+
+    if site_tile_dict is not None:
+        # unique site footprints (revisits with identical coordinates share a footprint).
+        footprint = site_footprint.unique_footprint_fn(cgs_df, site_footprint.GEOGRAPHIC_PRECISION)
 
     # open the list of imagery and read it into memory and call the apply_zonal_stats_fn function
     with open(export_rainfall, 'r') as imagery_list:
@@ -216,7 +259,12 @@ def main_routine(export_dir_path, zonal_stats_ready_dir, complete_tile, export_r
 
             image_s = image.rstrip()
 
-            final_results = apply_zonal_stats_fn(image_s, projected_shape_path, uid)  # cgs_df,projected_shape_path,
+            if site_tile_dict is not None:
+                final_results = apply_zonal_stats_fn(image_s, cgs_df, uid, footprint)
+            elif projected_shape_path is None:
+                final_results = apply_zonal_stats_fn(image_s, cgs_df, uid)
+            else:
+                final_results = apply_zonal_stats_fn(image_s, projected_shape_path, uid)
 
             for i in final_results:
                 output_list.append(i)
@@ -33,10 +33,11 @@ from datetime import datetime
 import argparse
 import shutil
 import sys
-import pandas as pd
 from glob import glob
 import warnings
-import geopandas as gpd
+import pastoral_estate_index
+import run_report
+import stage_profiler
 
 warnings.filterwarnings("ignore")
 
@@ -94,8 +95,8 @@ def export_dir_fn(export_dir):
     date_time_replace = str(datetime.now()).replace('-', '')
     date_time_list = date_time_replace.split(' ')
     date_time_list_split = date_time_list[1].split(':')
-    export_dir_path = export_dir + '\\' + str(date_time_list[0]) + '_' + str(date_time_list_split[0]) + str(
-        date_time_list_split[1])
+    export_dir_path = os.path.join(export_dir, str(date_time_list[0]) + '_' + str(date_time_list_split[0]) + str(
+        date_time_list_split[1]))
 
     # check if the folder already exists - if False = create directory, if True = return error message.
     try:
@@ -120,16 +121,16 @@ def create_export_dir_fn(export_dir_path):
     """
 
     # Create folders within the tempDir directory.
-    plot_dir = export_dir_path + '\\plots'
+    plot_dir = os.path.join(export_dir_path, 'plots')
     os.mkdir(plot_dir)
 
-    interactive_dir = plot_dir + '\\interactive'
+    interactive_dir = os.path.join(plot_dir, 'interactive')
     os.mkdir(interactive_dir)
 
-    final_plot_dir = export_dir_path + '\\final_plots'
+    final_plot_dir = os.path.join(export_dir_path, 'final_plots')
     os.mkdir(final_plot_dir)
 
-    final_inter_dir = export_dir_path + '\\final_interactive'
+    final_inter_dir = os.path.join(export_dir_path, 'final_interactive')
     os.mkdir(final_inter_dir)
 
     return plot_dir
@@ -145,11 +146,13 @@ def glob_create_df(directory, search_criteria):
     @return file_list: list objet containing open data frames.
     """
 
+    import pandas as pd
+
     # create a df from all csv files in a directory.
     list_df = []
     file_list = []
     # search through the directory
-    for file in glob(directory + search_criteria):
+    for file in glob(os.path.join(directory, search_criteria)):
         file_list.append(file)
         df = pd.read_csv(file)
         list_df.append(df)
@@ -192,16 +195,14 @@ def rainfall_start_fin_dates(list_image):
     list_image.sort()
     path_s = list_image[0]
 
-    image_ = path_s.rsplit('\\')
-    image_name = image_[-1]
+    image_name = os.path.basename(path_s)
 
     year_s = image_name[:4]
     month_s = image_name[4:6]
     rain_start_date = (str(year_s) + '-' + str(month_s) + '-01')
 
     path_f = list_image[-1]
-    image_ = path_f.rsplit('\\')
-    image_name = image_[-1]
+    image_name = os.path.basename(path_f)
 
     year_f = image_name[:4]
     month_f = image_name[4:6]
@@ -213,9 +214,14 @@ def rainfall_start_fin_dates(list_image):
 
 
 def main_routine(zonal_dir, export_dir, rainfall_dir, end_date, rainfall_raster_dir, previous_visits,
-                 pastoral_estate, rolling_mean, pastoral_districts_dir, zonal_stats_ready_dir):
+                 pastoral_estate, rolling_mean, pastoral_districts_dir, zonal_stats_ready_dir, report=None,
+                 zonal_stats_store_path=None, plot_site_dict=None):
     """ Created time series plots using matplotlib one per site per tile and interactive time series plots using Boken.
-    Plots are sorted based on which tile registered the most amount of zonal stats hits (i.e. limited cloud masking)."""
+    Plots are sorted based on which tile registered the most amount of zonal stats hits (i.e. limited cloud masking).
+    The performance of each plot stage is recorded in the run report (run_report) when it is provided. The zonal stats
+    of the run are read from the zonal stats store (zonal_stats_store) one tile at a time when its path is provided.
+    When plot_site_dict (tile: comp_site set - odk_state_ledger.plot_site_dict_fn) is provided, only those sites are
+    plotted (incremental run - the plots of the other sites are merged from the previous run)."""
 
     # read in the command arguments
     """cmdargs = get_cmd_args_fn()
@@ -229,6 +235,11 @@ def main_routine(zonal_dir, export_dir, rainfall_dir, end_date, rainfall_raster_
     rolling_mean = cmdargs.rolling_mean
     pastoral_districts_dir = cmdargs.pastoral_districts_dir"""
 
+    # the plot stages (matplotlib and bokeh) are only imported once plotting starts - not within the tile loop.
+    import pandas as pd
+    import step2_2_bare_ground_plots
+    import step2_3_interactive_plots
+
     print('=' * 50)
     print('Initiate plotting')
     print('=' * 50)
@@ -237,10 +248,17 @@ def main_routine(zonal_dir, export_dir, rainfall_dir, end_date, rainfall_raster_
     export_dir_path = export_dir
     # call the create_export_dir_fn function.
     # plot_dir = create_export_dir_fn(export_dir_path)
-    plot_dir = "{0}\\plots".format(export_dir_path)
-    output_zonal_stats, zonal_file_list = glob_create_df(zonal_dir, '//*.csv')
+    plot_dir = os.path.join(export_dir_path, 'plots')
+    if zonal_stats_store_path is not None:
+        import zonal_stats_store
+        # the tiles and the rainfall zonal stats of this run (indexed by run directory).
+        zonal_file_list = zonal_stats_store.distinct_fn(zonal_stats_store_path, 'fc', 'tile', run_dir=export_dir_path)
+        output_rainfall = zonal_stats_store.read_fn(zonal_stats_store_path, 'rainfall', csv_layout=True,
+                                                    run_dir=export_dir_path)
+    else:
+        output_zonal_stats, zonal_file_list = glob_create_df(zonal_dir, '*.csv')
 
-    output_rainfall, rainfall_file_list = glob_create_df(rainfall_dir, '//*.csv')
+        output_rainfall, rainfall_file_list = glob_create_df(rainfall_dir, '*.csv')
     list_image = list_dir(rainfall_raster_dir, '.tif')
 
     rain_start_date, rain_finish_date = rainfall_start_fin_dates(list_image)
@@ -251,34 +269,54 @@ def main_routine(zonal_dir, export_dir, rainfall_dir, end_date, rainfall_raster_
     else:
         finish_date = '2022-10-30'
 
-    # read in the pastoral estate shapefile and create two property dictionaries to extract the district and prop tag
+    # retrieve the pastoral estate index (shared with step1_3 and step2_3) to extract the district and prop tag
     # information.
-    pastoral_estate_gdf = gpd.read_file(pastoral_estate)
-    prop_dist_dict = dict(zip(pastoral_estate_gdf.PROPERTY, pastoral_estate_gdf.DISTRICT))
-    prop_tag_dict = dict(zip(pastoral_estate_gdf.PROPERTY, pastoral_estate_gdf.PROP_TAG))
+    estate_index = pastoral_estate_index.estate_index_fn(pastoral_estate)
+    prop_dist_dict = estate_index.prop_dist_dict
+    prop_tag_dict = estate_index.prop_tag_dict
 
     for tile in zonal_file_list:
         # strip Landsat tile label from csv file name.
 
         print('=' * 50)
-        test_tile = tile.split('_')
-        complete_tile = test_tile[-3]
-        output_zonal_stats = pd.read_csv(tile)
-
-        import step2_2_bare_ground_plots
-        step2_2_bare_ground_plots.main_routine(output_zonal_stats, output_rainfall, complete_tile, previous_visits,
-                                               plot_dir, rolling_mean, finish_date)
-
-        import step2_3_interactive_plots
-        step2_3_interactive_plots.main_routine(export_dir_path, output_zonal_stats, complete_tile,
-                                               plot_dir, pastoral_estate, rolling_mean)
+        if zonal_stats_store_path is not None:
+            complete_tile = tile
+            output_zonal_stats = zonal_stats_store.read_fn(zonal_stats_store_path, 'fc', csv_layout=True,
+                                                           run_dir=export_dir_path, tile=complete_tile)
+        else:
+            test_tile = tile.split('_')
+            complete_tile = test_tile[-3]
+            output_zonal_stats = pd.read_csv(tile)
+
+        if plot_site_dict is not None:
+            # incremental run - only the sites of the new or changed records are plotted.
+            output_zonal_stats = output_zonal_stats.loc[output_zonal_stats.comp_site.astype(str).isin(
+                plot_site_dict.get(str(complete_tile), set()))]
+            if len(output_zonal_stats.index) == 0:
+                continue
+
+        result, metrics = run_report.measure_fn(
+            stage_profiler.profile_call_fn, step2_2_bare_ground_plots.main_routine, output_zonal_stats,
+            output_rainfall, complete_tile, previous_visits, plot_dir, rolling_mean, finish_date,
+            profile_tag=complete_tile)
+        run_report.record_stage_fn(report, 'step2_2_bare_ground_plots_' + complete_tile, metrics)
+
+        result, metrics = run_report.measure_fn(
+            stage_profiler.profile_call_fn, step2_3_interactive_plots.main_routine, export_dir_path,
+            output_zonal_stats, complete_tile, plot_dir, pastoral_estate, rolling_mean, profile_tag=complete_tile)
+        run_report.record_stage_fn(report, 'step2_3_interactive_plots_' + complete_tile, metrics)
 
     import step2_4_sort_plots
-    step2_4_sort_plots.main_routine(export_dir_path, zonal_dir)
+    result, metrics = run_report.measure_fn(stage_profiler.profile_call_fn, step2_4_sort_plots.main_routine,
+                                            export_dir_path, zonal_dir)
+    run_report.record_stage_fn(report, 'step2_4_sort_plots', metrics)
 
     import step2_5_file_plots_to_working_drive
-    step2_5_file_plots_to_working_drive.main_routine(pastoral_districts_dir, export_dir_path, zonal_dir, rainfall_dir,
-                                                     finish_date, prop_dist_dict, prop_tag_dict, zonal_stats_ready_dir)
+    result, metrics = run_report.measure_fn(
+        stage_profiler.profile_call_fn, step2_5_file_plots_to_working_drive.main_routine, pastoral_districts_dir,
+        export_dir_path, zonal_dir, rainfall_dir, finish_date, prop_dist_dict, prop_tag_dict, zonal_stats_ready_dir,
+        zonal_stats_store_path)
+    run_report.record_stage_fn(report, 'step2_5_file_plots_to_working_drive', metrics)
 
     print('Zonal stats and plots have been created!!.'
           'The zonal stats pipeline has finished.')
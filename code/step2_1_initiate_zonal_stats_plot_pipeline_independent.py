@@ -33,10 +33,9 @@ from datetime import datetime
 import argparse
 import shutil
 import sys
-import pandas as pd
 from glob import glob
 import warnings
-import geopandas as gpd
+import pastoral_estate_index
 
 warnings.filterwarnings("ignore")
 
@@ -178,6 +177,8 @@ def glob_create_df(directory, search_criteria):
     @return file_list: list objet containing open data frames.
     """
 
+    import pandas as pd
+
     # create a df from all csv files in a directory.
     list_df = []
     file_list = []
@@ -261,6 +262,12 @@ def main_routine():
     rolling_mean = cmdargs.rolling_mean
     pastoral_districts_dir = cmdargs.pastoral_districts_dir
 
+    # the plot stages (matplotlib and bokeh) are only imported once the command arguments are read - not within the
+    # tile loop.
+    import pandas as pd
+    import step2_2_bare_ground_plots
+    import step2_3_interactive_plots
+
     print('=' * 50)
     print('Initiate plotting')
     print('=' * 50)
@@ -288,11 +295,11 @@ def main_routine():
     else:
         finish_date = '2022-10-30'
 
-    # read in the pastoral estate shapefile and create two property dictionaries to extract the district and prop tag
+    # retrieve the pastoral estate index (shared with step1_3 and step2_3) to extract the district and prop tag
     # information.
-    pastoral_estate_gdf = gpd.read_file(pastoral_estate)
-    prop_dist_dict = dict(zip(pastoral_estate_gdf.PROPERTY, pastoral_estate_gdf.DISTRICT))
-    prop_tag_dict = dict(zip(pastoral_estate_gdf.PROPERTY, pastoral_estate_gdf.PROP_TAG))
+    estate_index = pastoral_estate_index.estate_index_fn(pastoral_estate)
+    prop_dist_dict = estate_index.prop_dist_dict
+    prop_tag_dict = estate_index.prop_tag_dict
 
     for tile in zonal_file_list:
         # strip Landsat tile label from csv file name.
@@ -302,11 +309,9 @@ def main_routine():
         complete_tile = test_tile[-3]
         output_zonal_stats = pd.read_csv(tile)
 
-        import step2_2_bare_ground_plots
         step2_2_bare_ground_plots.main_routine(output_zonal_stats, output_rainfall, complete_tile, previous_visits,
                                                plot_dir, rolling_mean, finish_date)
 
-        import step2_3_interactive_plots
         step2_3_interactive_plots.main_routine(export_dir_path, output_zonal_stats, complete_tile,
                                                plot_dir, pastoral_estate, rolling_mean)
 
@@ -27,11 +27,13 @@ SOFTWARE.
 
 # import modules.
 from __future__ import print_function, division
-import geopandas as gpd
+import os
 import pandas as pd
+import matplotlib as mpl
+# the plots are only written to file - the non-interactive backend avoids loading a GUI toolkit.
+mpl.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-import matplotlib as mpl
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -45,6 +47,8 @@ def previous_visits_fn(previous_visits):
     @return integrated: open geo-dataframe.
     """
 
+    import geopandas as gpd
+
     # Import the integrated site shapefile for previous visit dates to the site.
     integrated = gpd.read_file(previous_visits)
     # convert site name to capital letters
@@ -308,7 +312,7 @@ def plot_bare_ground_fn(lsat_npv, values, date, rain, integrated, complete_tile,
     # plt.xticks(fontsize=20)
     # plt.yticks(fontsize=20)
 
-    output_name = (plot_outputs + '\\BG_plot_' + str(i) + '_' + str(complete_tile) + '_' + str(start_date).replace('-', '') + '_' + str(finish_date).replace('-', '') + '.png')
+    output_name = os.path.join(plot_outputs, 'BG_plot_' + str(i) + '_' + str(complete_tile) + '_' + str(start_date).replace('-', '') + '_' + str(finish_date).replace('-', '') + '.png')
     fig.savefig(output_name, dpi=150, bbox_inches='tight')  # bbox_inches removes the white space
 
     plt.close(fig)
@@ -411,7 +415,7 @@ def plot_all_bands_fn(lsat_npv, date, rain, values_bg, values_pv, values_npv, in
         for i in list_date:
             plt.axvline(x=pd.Timestamp(i), color='dimgrey', linestyle='--')
 
-    output_name = (plot_outputs + '\\All_B_interp_' + str(i) + '_' + str(complete_tile) + '_' + str(start_date).replace('-', '') + '_' + str(finish_date).replace('-', '') + '.png')
+    output_name = os.path.join(plot_outputs, 'All_B_interp_' + str(i) + '_' + str(complete_tile) + '_' + str(start_date).replace('-', '') + '_' + str(finish_date).replace('-', '') + '.png')
     fig.savefig(output_name, dpi=150, bbox_inches='tight')  # bbox_inches removes the white space
 
     plt.close(fig)
@@ -24,49 +24,31 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 # import modules
+import os
 import pandas as pd
 from bokeh.models import ColumnDataSource, HoverTool
 from bokeh.plotting import figure, output_file, save
 from bokeh.layouts import column
 from bokeh.plotting import figure
-import geopandas as gpd
+import pastoral_estate_index
 import warnings
 
 warnings.filterwarnings("ignore")
 
 
-def string_clean_upper_fn(dirty_string):
-    """ Remove whitespaces and clean strings.
+def prop_name_extraction_fn(estate_index, site_code):
+    """ Extract the property name from the pastoral estate index.
 
-    @param dirty_string: string object that may have whitespaces, - or _.
-    @return clean_string: processed string object.
-    """
-
-    str1 = dirty_string.replace('_', ' ')
-    str2 = str1.replace('-', ' ')
-    str3 = str2.upper()
-    clean_string = str3.strip()
-    return clean_string
-
-
-def prop_name_extraction_fn(estate_series, site_code):
-    """ Extract the property name from the geopandas series.
-
-    @param estate_series: geopandas series object containing properties and properties code variables.
+    @param estate_index: EstateIndex named tuple containing the property and property code lookups
+    (pastoral_estate_index).
     @param site_code: string object containing the properties three letter code - read into the function.
     @return prop_label: string object containing the property name and code.
     """
 
-    property_code_list = estate_series.PROP_TAG.tolist()
-    prop_code_upper = string_clean_upper_fn(str(site_code))
-
-    if prop_code_upper in property_code_list:
-        prop_name = estate_series.loc[estate_series['PROP_TAG'] == prop_code_upper, 'PROPERTY'].item() #loc[0]
-
-    else:
-        prop_name = prop_code_upper
+    prop_code_upper = pastoral_estate_index.string_clean_upper_fn(str(site_code))
+    prop_name = pastoral_estate_index.prop_name_lookup_fn(estate_index, prop_code_upper)
 
-    properties = string_clean_upper_fn(str(prop_name))
+    properties = pastoral_estate_index.string_clean_upper_fn(str(prop_name))
     prop_label = properties + "_" + prop_code_upper
 
     return prop_label
@@ -85,11 +67,10 @@ def main_routine(export_dir, output_zonal_stats, complete_tile, plot_outputs, pa
     :return output_file: interactive html file with three plots per site.
     """
 
-    interactive_outputs = plot_outputs + '\\interactive'
+    interactive_outputs = os.path.join(plot_outputs, 'interactive')
 
-    # read in the estate shapefile and create series
-    estate = gpd.read_file(pastoral_estate)
-    estate_series = estate[['PROPERTY', 'PROP_TAG']]
+    # retrieve the pastoral estate index (read in once per run and shared between tiles)
+    estate_index = pastoral_estate_index.estate_index_fn(pastoral_estate)
 
     # subset DataFrame - drop all values less than 3 to reduce noise
     output_zonal_stats = output_zonal_stats[(output_zonal_stats['b1_count'] > 3)]
@@ -107,7 +88,7 @@ def main_routine(export_dir, output_zonal_stats, complete_tile, plot_outputs, pa
 
         site_code = str(i[:3])
         # select out only the landsat derived fractional cover values.
-        prop_label = prop_name_extraction_fn(estate_series, site_code)
+        prop_label = prop_name_extraction_fn(estate_index, site_code)
 
         # subset DataFrame by the unique identifier 'site'.
         site_df = output_zonal_stats.loc[(output_zonal_stats.comp_site == i)]
@@ -123,7 +104,7 @@ def main_routine(export_dir, output_zonal_stats, complete_tile, plot_outputs, pa
 
         # use all predicted fractional cover values to produce the fitted line
         sort_site_df = output_zonal_stats.loc[(output_zonal_stats.comp_site == i)]
-        sort_site_df.to_csv(export_dir + '\\sort_site_df_' + str(i) + '.csv')
+        sort_site_df.to_csv(os.path.join(export_dir, 'sort_site_df_' + str(i) + '.csv'))
         date_f = sort_site_df.sort_values(['dateTime'])
 
         date_fit = date_f['dateTime']
@@ -208,7 +189,7 @@ def main_routine(export_dir, output_zonal_stats, complete_tile, plot_outputs, pa
         s3.circle("dateTime", "b3_mean", source=source2, name="lsat", size=5, color='blue', alpha=0.6, line_alpha=0.6,
                   line_color='black')
 
-        output_file(interactive_outputs + '\\' + str(i) + '_' + str(complete_tile) + '_interactive.html')
+        output_file(os.path.join(interactive_outputs, str(i) + '_' + str(complete_tile) + '_interactive.html'))
 
         save(column(s1, s2, s3))
 
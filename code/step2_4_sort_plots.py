@@ -62,7 +62,7 @@ def glob_dir_fn(zonal_dir):
     # create an empty list
     list_df = []
 
-    for file in glob.glob(zonal_dir + '\\*'):
+    for file in glob.glob(os.path.join(zonal_dir, '*')):
         # read in all zonal stats csv
         df = pd.read_csv(file)
         # append all zonal stats DataFrames to a list.
@@ -142,16 +142,19 @@ def sort_plots_fn(export_dir, final_plot_outputs, final_interactive_outputs, com
     directory.
     """
 
-    for bare_plot in glob.glob(export_dir + '\\plots\\BG_plot_' + str(comp_site) + '_' + str(tile) + '*.png'):
+    for bare_plot in glob.glob(os.path.join(export_dir, 'plots',
+                                            'BG_plot_' + str(comp_site) + '_' + str(tile) + '*.png')):
 
         shutil.copy(bare_plot, final_plot_outputs)
 
-    for inter_plot in glob.glob(export_dir + '\\plots\\All_B_interp_' + str(comp_site) + '_' + str(tile) + '*.png'):
+    for inter_plot in glob.glob(os.path.join(export_dir, 'plots',
+                                             'All_B_interp_' + str(comp_site) + '_' + str(tile) + '*.png')):
 
         shutil.copy(inter_plot, final_plot_outputs)
 
     for interactive_plot in glob.glob(
-            export_dir + '\\plots\\interactive\\*' + str(comp_site) + '_' + str(tile) + '_interactive.html'):
+            os.path.join(export_dir, 'plots', 'interactive',
+                         '*' + str(comp_site) + '_' + str(tile) + '_interactive.html')):
 
         shutil.copy(interactive_plot, final_interactive_outputs)
 
@@ -165,9 +168,9 @@ def main_routine(export_dir, zonal_dir):
     """
 
     # output folder paths
-    final_plot_outputs = export_dir + '\\final_plots'
+    final_plot_outputs = os.path.join(export_dir, 'final_plots')
 
-    final_interactive_outputs = export_dir + '\\final_interactive'
+    final_interactive_outputs = os.path.join(export_dir, 'final_interactive')
 
     # call the glob dir function to concatenate all csv files.
     df_concat = glob_dir_fn(zonal_dir)
@@ -31,7 +31,8 @@ import glob
 import os
 import shutil
 import warnings
-import geopandas as gpd
+import spatial_io
+import reprojection
 
 warnings.filterwarnings("ignore")
 
@@ -41,7 +42,7 @@ def create_sub_directories_fn(sub, directory):
     @param sub: string object containing the sub-directory.
     @param directory: string object containing the path to an existing directory.
     """
-    output = '{0}\\{1}'.format(directory, str(sub))
+    output = os.path.join(directory, str(sub))
 
     if not os.path.exists(output):
         os.mkdir(output)
@@ -61,9 +62,9 @@ def glob_dir_fn(zonal_dir, export_dir, prop_output, file_end, prop_list, year):
         @param zonal_dir: list object containing the path to the fractional cover zonal stats directory.
         @return df_concat: pandas data frame object - all zonal stats csv files concatenated together."""
 
-    for file_path in glob.glob(zonal_dir + '\\*'):
+    for file_path in glob.glob(os.path.join(zonal_dir, '*')):
 
-        _, file = file_path.rsplit('\\', 1)
+        _, file = os.path.split(file_path)
         tile_name = file.split('_')
         tile_name_ = tile_name[-3]
 
@@ -80,23 +81,97 @@ def glob_dir_fn(zonal_dir, export_dir, prop_output, file_end, prop_list, year):
         comp_site_list = df.prop_name.unique().tolist()
 
         for prop in comp_site_list:
-            ind_prop_output = create_sub_directories_fn(prop, prop_output)
-
             site_df = df.loc[df['prop_name'] == prop]
-            file_output = '{0}\\{1}_{2}{3}.csv'.format(ind_prop_output, str(prop), str(tile_), file_end)
-            print("Output: ", file_output)
-            site_df.to_csv(file_output)
+            prop_dir_path = file_prop_csv_fn(site_df, prop, tile_, prop_output, file_end, prop_list, year)
 
-            matching_path = [s for s in prop_list if prop in s]
+    return prop_dir_path
 
-            prop_dir_path = matching_path[0]
-            dest_prop_path = os.path.join(prop_dir_path, 'Data', 'Rs_Outputs', 'Zonal_Stats')
 
-            year_dir_path = create_sub_directories_fn(str(year), dest_prop_path)
-            raw_year_dir_path = create_sub_directories_fn('Raw', year_dir_path)
-            file_output = '{0}\\{1}_{2}{3}.csv'.format(raw_year_dir_path, str(prop), str(tile_), file_end)
-            print("Output: ", file_output)
-            site_df.to_csv(file_output)
+def file_prop_csv_fn(site_df, prop, tile_, prop_output, file_end, prop_list, year):
+    """ Export the zonal stats of a property within a tile to the prop_output directory and the property
+    sub-directory of the pastoral districts directory.
+
+    @param site_df: pandas data frame object containing the zonal stats of the property within the tile.
+    @param prop: string object containing the property name.
+    @param tile_: string object containing the Landsat tile.
+    @param prop_output: string object containing the path to the export_dir/prop_output directory.
+    @param file_end: string object containing the end of the output file name (i.e. _fc_zonal_stats).
+    @param prop_list: list object containing a list of paths to the property level sub-directory within the
+    pastoral districts directory.
+    @param year: string object containing the year of the finish date.
+    @return prop_dir_path: string object containing the path to the property sub-directory.
+    """
+
+    ind_prop_output = create_sub_directories_fn(prop, prop_output)
+
+    file_output = os.path.join(ind_prop_output, '{0}_{1}{2}.csv'.format(str(prop), str(tile_), file_end))
+    print("Output: ", file_output)
+    site_df.to_csv(file_output)
+
+    matching_path = [s for s in prop_list if prop in s]
+
+    prop_dir_path = matching_path[0]
+    dest_prop_path = os.path.join(prop_dir_path, 'Data', 'Rs_Outputs', 'Zonal_Stats')
+
+    year_dir_path = create_sub_directories_fn(str(year), dest_prop_path)
+    raw_year_dir_path = create_sub_directories_fn('Raw', year_dir_path)
+    file_output = os.path.join(raw_year_dir_path, '{0}_{1}{2}.csv'.format(str(prop), str(tile_), file_end))
+    print("Output: ", file_output)
+    site_df.to_csv(file_output)
+
+    return prop_dir_path
+
+
+def store_dir_fn(zonal_stats_store_path, kind, export_dir, prop_output, file_end, prop_list, year):
+    """ Read the zonal stats of the run from the zonal stats store one property and tile at a time (indexed) and
+    export them as glob_dir_fn does.
+
+    @param zonal_stats_store_path: string object containing the path to the zonal stats store (zonal_stats_store).
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param export_dir: string object containing the path to the run directory.
+    @return prop_dir_path: string object containing the path to the last property sub-directory.
+    """
+
+    import zonal_stats_store
+
+    prop_dir_path = None
+    for tile_ in zonal_stats_store.distinct_fn(zonal_stats_store_path, kind, 'tile', run_dir=export_dir):
+        print('-' * 50)
+        print('tile_: ', tile_)
+
+        for prop in zonal_stats_store.distinct_fn(zonal_stats_store_path, kind, 'prop_name', run_dir=export_dir,
+                                                  tile=tile_):
+            site_df = zonal_stats_store.read_fn(zonal_stats_store_path, kind, csv_layout=True, run_dir=export_dir,
+                                                tile=tile_, prop_name=prop)
+            prop_dir_path = file_prop_csv_fn(site_df, prop, tile_, prop_output, file_end, prop_list, year)
+
+    return prop_dir_path
+
+
+def parquet_dir_fn(kind, export_dir, prop_output, file_end, prop_list, year):
+    """ Read the zonal stats of the run from the partitioned Parquet dataset one property and tile at a time
+    (zonal_stats_parquet) and export them as glob_dir_fn does.
+
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param export_dir: string object containing the path to the run directory.
+    @return prop_dir_path: string object containing the path to the last property sub-directory.
+    """
+
+    import zonal_stats_parquet
+
+    prop_dir_path = None
+    partition_list = zonal_stats_parquet.partition_list_fn(export_dir, kind)
+
+    for prop_code, tile_ in sorted(set((partition[0], partition[1]) for partition in partition_list)):
+        print('-' * 50)
+        print('tile_: ', tile_)
+
+        # only the partitions of the property within the tile are read.
+        df = zonal_stats_parquet.read_partitions_fn(export_dir, kind, prop_code=prop_code, tile=tile_,
+                                                    csv_layout=True)
+        for prop in df.prop_name.unique().tolist():
+            site_df = df.loc[df['prop_name'] == prop]
+            prop_dir_path = file_prop_csv_fn(site_df, prop, tile_, prop_output, file_end, prop_list, year)
 
     return prop_dir_path
 
@@ -107,9 +182,9 @@ def glob_rainfall_dir_fn(rainfall_dir, export_dir, prop_output, file_end, prop_l
         @param zonal_dir: list object containing the path to the fractional cover zonal stats directory.
         @return df_concat: pandas data frame object - all zonal stats csv files concatenated together."""
 
-    for file_path in glob.glob(rainfall_dir + '\\*'):
+    for file_path in glob.glob(os.path.join(rainfall_dir, '*')):
 
-        _, file = file_path.rsplit('\\', 1)
+        _, file = os.path.split(file_path)
         _, tile = file.rsplit('_', 1)
         tile_name, _ = tile.rsplit('.', 1)
         # read in all zonal stats csv
@@ -123,7 +198,7 @@ def glob_rainfall_dir_fn(rainfall_dir, export_dir, prop_output, file_end, prop_l
             site_date = site_df['site_date'].iloc[0]
             _, year = site_date.rsplit('.', 1)
 
-            file_output = '{0}\\{1}_{2}{3}.csv'.format(ind_prop_output, str(prop), str(tile_name), file_end)
+            file_output = os.path.join(ind_prop_output, '{0}_{1}{2}.csv'.format(str(prop), str(tile_name), file_end))
             print("Output: ", file_output)
             site_df.to_csv(file_output)
 
@@ -133,7 +208,7 @@ def glob_rainfall_dir_fn(rainfall_dir, export_dir, prop_output, file_end, prop_l
 
             year_dir_path = create_sub_directories_fn(str(year), dest_prop_path)
             raw_year_dir_path = create_sub_directories_fn('Raw', year_dir_path)
-            file_output = '{0}\\{1}_{2}{3}.csv'.format(raw_year_dir_path, str(prop), str(tile_name), file_end)
+            file_output = os.path.join(raw_year_dir_path, '{0}_{1}{2}.csv'.format(str(prop), str(tile_name), file_end))
             print("Output: ", file_output)
             site_df.to_csv(file_output)
 
@@ -168,7 +243,7 @@ def glob_plot_dir_fn(export_dir, search_criteria, year, folder_, folder_name, pr
 
     print("searching in: ", export_dir, folder_, search_criteria)
 
-    for file_path in glob.glob('{0}\\{1}\\{2}'.format(export_dir, folder_, search_criteria)):
+    for file_path in glob.glob(os.path.join(export_dir, folder_, search_criteria)):
         print('located: ', file_path)
 
         _, file_name = os.path.split(file_path)
@@ -191,10 +266,10 @@ def assets_search_fn(search_criteria, folder):
     @return files: string object containing the path to any located files or "" if none were located.
     """
     path_parent = os.path.dirname(os.getcwd())
-    assets_dir = (path_parent + '\\' + folder)
+    assets_dir = os.path.join(path_parent, folder)
 
     files = ""
-    file_path = (assets_dir + '\\' + search_criteria)
+    file_path = os.path.join(assets_dir, search_criteria)
     for files in glob.glob(file_path):
         pass
 
@@ -202,20 +277,26 @@ def assets_search_fn(search_criteria, folder):
 
 
 def glob_dir_1_ha_fn(ha_directory, prop_list, year):
-    """  Search a temporary directory for the 1ha shapefile and export for property.
+    """  Search a temporary directory for the 1ha layers and export a shapefile (final deliverable) for each property.
 
-    @param ha_directory: list object containing the path to the temporary directory with 1ha shapefiles produced
-    under step1_4_landsat_tile_list.
+    @param ha_directory: list object containing the path to the temporary directory with 1ha layers produced
+    under step1_4_landsat_tile_list, or a dictionary object containing the tile (key) and the 1ha sites within the tile
+    (value) handed over by step1_4 (in memory).
     @param year: integer object containing the current year.
     @param prop_list: list object containing all located property sub-directory paths.
     """
 
+    if isinstance(ha_directory, dict):
+        list_gdf = list(ha_directory.values())
+    else:
+        # the site by tile layers are written in the spatial intermediate format (--spatial_format).
+        list_gdf = spatial_io.layer_list_fn(ha_directory)
+
     gdf_list = []
-    for file_path in glob.glob(ha_directory + '\\*.shp'):
-        _, file = file_path.rsplit('\\', 1)
-        gdf = gpd.read_file(file_path)
+    for gdf in list_gdf:
+        gdf = gdf.copy()
         gdf['crs'] = str(gdf.crs)
-        gda94 = gdf.to_crs(epsg=4283)
+        gda94 = reprojection.to_crs_fn(gdf, epsg=4283)
 
         gdf_list.append(gda94)
 
@@ -236,18 +317,21 @@ def glob_dir_1_ha_fn(ha_directory, prop_list, year):
         year_path = create_sub_directories_fn(str(year), prop_path)
         output_path = create_sub_directories_fn('Shp', year_path)
 
-        file_output = '{0}\\{1}_1ha_plot_gda94.shp'.format(output_path, str(prop_final))
+        file_output = os.path.join(output_path, '{0}_1ha_plot_gda94.shp'.format(str(prop_final)))
         print("Output: ", file_output)
         prop_gdf.to_file(file_output, driver="ESRI Shapefile")
 
 
 def main_routine(pastoral_districts_dir, export_dir_path, zonal_dir, rainfall_dir, finish_date,
-                 prop_dist_dict, prop_tag_dict, zonal_stats_ready_dir):
+                 prop_dist_dict, prop_tag_dict, zonal_stats_ready_dir, zonal_stats_store_path=None):
+    """ File the zonal stats, plots and 1ha sites of each property to the pastoral districts directory. The zonal
+    stats are read from the zonal stats store (one property and tile at a time) when its path is provided, or from
+    the partitioned Parquet dataset (--parquet). """
 
     print("Transferring plots to working drive")
-    if zonal_stats_ready_dir:
+    if isinstance(zonal_stats_ready_dir, str):
         print(zonal_stats_ready_dir)
-    prop_output = '{0}\\{1}'.format(export_dir_path, 'prop_output')
+    prop_output = os.path.join(export_dir_path, 'prop_output')
     if not os.path.exists(prop_output):
         print('Create the following directory:')
         print(' - ', prop_output)
@@ -256,8 +340,20 @@ def main_routine(pastoral_districts_dir, export_dir_path, zonal_dir, rainfall_di
     prop_list = property_path_fn(pastoral_districts_dir, prop_dist_dict, prop_tag_dict)
     year = finish_date.split('-')[0]
 
-    prop_dir_path = glob_dir_fn(zonal_dir, export_dir_path, prop_output, '_fc_zonal_stats', prop_list, year)
-    prop_dir_path = glob_dir_fn(rainfall_dir, export_dir_path, prop_output, '_rain_zonal_stats', prop_list, year)
+    import zonal_stats_parquet
+
+    if zonal_stats_store_path is not None:
+        prop_dir_path = store_dir_fn(zonal_stats_store_path, 'fc', export_dir_path, prop_output, '_fc_zonal_stats',
+                                     prop_list, year)
+        prop_dir_path = store_dir_fn(zonal_stats_store_path, 'rainfall', export_dir_path, prop_output,
+                                     '_rain_zonal_stats', prop_list, year)
+    elif zonal_stats_parquet.enabled_fn() and zonal_stats_parquet.partition_list_fn(export_dir_path, 'fc'):
+        prop_dir_path = parquet_dir_fn('fc', export_dir_path, prop_output, '_fc_zonal_stats', prop_list, year)
+        prop_dir_path = parquet_dir_fn('rainfall', export_dir_path, prop_output, '_rain_zonal_stats', prop_list,
+                                       year)
+    else:
+        prop_dir_path = glob_dir_fn(zonal_dir, export_dir_path, prop_output, '_fc_zonal_stats', prop_list, year)
+        prop_dir_path = glob_dir_fn(rainfall_dir, export_dir_path, prop_output, '_rain_zonal_stats', prop_list, year)
     #glob_plot_dir_fn(export_dir_path, 'All_B*.png', year, 'final_plots', 'All_Bands', prop_dir_path)
     # glob_plot_dir_fn(export_dir_path, 'BG*.png', year, 'final_plots', 'Bare_Ground', prop_dir_path)
     glob_plot_dir_fn(export_dir_path, '*.html', year, 'final_interactive', 'Interactive', prop_dir_path)
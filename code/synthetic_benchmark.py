@@ -0,0 +1,721 @@
+#!/usr/bin/env python
+
+"""
+synthetic_benchmark.py
+======================
+
+Description: This script generates a synthetic, reproducible dataset and runs the fractional cover zonal stats pipeline
+(step1_1: step1_2 to step2_5) over it, recording the time taken by each stage, so that optimisations can be measured on
+any machine (Windows or Linux) without access to the production drives.
+
+The synthetic dataset (written to --output_dir/data) contains:
+
+1. Landsat fractional cover scenes (3 bands, uint8, no data 255, WGS84 UTM zone 53) for each tile, named and filed like
+the production scenes (i.e. landsat/103_070/lztmre_p103r070_20160101_dp0m3_zstdmask.img), with cloud (no data)
+patches in a proportion of the scenes (--raster_format img (ERDAS Imagine) or tif (GeoTIFF)).
+
+2. Monthly rainfall grids (single band, float32, no data -1, GCS WGS84) covering the tiles
+(i.e. 201601.monthly_rain.tif).
+
+3. A Landsat tile grid shapefile (WRSPR feature), the tiles overlap so that some sites fall within two tiles.
+
+4. A pastoral estate shapefile (PROPERTY, PROP_TAG and DISTRICT features), a previous visits shapefile (site and
+obs_time features) and the pastoral districts directory structure used by step2_5.
+
+5. ODK star transect csv files (one per property) with several visits to each site.
+
+The pipeline is run as a separate process with the step1_1 command arguments (additional arguments such as
+--tile_workers 2 can be passed with --pipeline_args). The run_report.json written by the pipeline is summarised into
+benchmark_report.json within --output_dir (settings, dataset size and the wall time, cpu time, peak memory and scenes
+per second of each stage and tile) and printed as a table.
+
+The band 1, 2 and 3 means of the pipeline zonal stats csv files are checked against reference means calculated directly
+(rasterstats) from the synthetic scenes and sites; a mismatch (i.e. the bands joined in the wrong order) fails the
+benchmark.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import sys
+import csv
+import json
+import glob
+import time
+import shlex
+import shutil
+import argparse
+import subprocess
+from datetime import date, timedelta
+import numpy as np
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# WGS84 UTM zone 53 (south) - the synthetic tiles are all owned by zone 53 (WRSPR <= 104073).
+BENCHMARK_EPSG = 32753
+
+# Landsat path of the synthetic tiles (rows are numbered from 070).
+BENCHMARK_PATH = 103
+BENCHMARK_FIRST_ROW = 70
+
+# upper left corner (UTM zone 53 metres) of the first synthetic tile.
+BENCHMARK_ORIGIN = (500000.0, 8450000.0)
+
+# Landsat pixel size (metres) and the proportion of the tile width each following tile is offset by (tiles overlap).
+PIXEL_SIZE = 30.0
+TILE_OFFSET = 0.7
+
+# sites are placed at least this distance (metres) inside a tile (the tiles are negatively buffered by 4000m).
+SITE_MARGIN = 4500.0
+
+# first scene date, days between scenes and the proportion of scenes with a cloud (no data) patch.
+FIRST_SCENE_DATE = date(2016, 1, 1)
+SCENE_INTERVAL = 16
+CLOUD_FRACTION = 0.2
+
+# rainfall grid resolution (degrees).
+RAINFALL_RESOLUTION = 0.05
+
+# synthetic pastoral districts (step2_5 folder names).
+DISTRICT_LIST = ['Darwin', 'Katherine']
+
+# largest difference between the pipeline and the reference band means (the pipeline buffers the sites in GDA94 MGA,
+# so a pixel on the edge of a site may differ from the reference site in WGS84 UTM).
+MEAN_TOLERANCE = 1.0
+
+SETTINGS_NAME = 'synthetic_settings.json'
+BENCHMARK_REPORT_NAME = 'benchmark_report.json'
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(
+        description='Generate a synthetic dataset and benchmark the fractional cover zonal stats pipeline.')
+
+    p.add_argument('-o', '--output_dir', help='Directory for the synthetic dataset, pipeline outputs and the '
+                                              'benchmark report.', required=True)
+
+    p.add_argument('-t', '--tiles', type=int, default=2, help='Number of Landsat tiles (default 2).')
+
+    p.add_argument('-r', '--raster_size', type=int, default=1000,
+                   help='Width and height of each fractional cover scene in pixels (default 1000, minimum 320).')
+
+    p.add_argument('-s', '--scenes', type=int, default=24, help='Number of fractional cover scenes per tile '
+                                                                '(default 24).')
+
+    p.add_argument('-m', '--months', type=int, default=24, help='Number of monthly rainfall grids (default 24).')
+
+    p.add_argument('-p', '--properties', type=int, default=2, help='Number of properties (default 2).')
+
+    p.add_argument('-n', '--sites', type=int, default=5, help='Number of sites per property (default 5).')
+
+    p.add_argument('-v', '--visits', type=int, default=2, help='Number of visits per site (default 2).')
+
+    p.add_argument('-f', '--raster_format', choices=['img', 'tif'], default='img',
+                   help='Fractional cover scene format - img (ERDAS Imagine) or tif (GeoTIFF) (default img).')
+
+    p.add_argument('-sd', '--seed', type=int, default=0, help='Random seed (default 0).')
+
+    p.add_argument('-pa', '--pipeline_args', default='',
+                   help='Additional step1_1 command arguments (i.e. "--tile_workers 2 --best_tile_only").')
+
+    p.add_argument('-g', '--generate_only', action='store_true', help='Generate the synthetic dataset only.')
+
+    p.add_argument('-re', '--reuse', action='store_true',
+                   help='Re-use the synthetic dataset in the output directory if it was generated with the same '
+                        'settings.')
+
+    cmd_args = p.parse_args()
+
+    if cmd_args.raster_size * PIXEL_SIZE < 2 * SITE_MARGIN + 600:
+        p.error('--raster_size must be at least {0}'.format(int((2 * SITE_MARGIN + 600) / PIXEL_SIZE) + 1))
+
+    return cmd_args
+
+
+def settings_fn(cmd_args):
+    """ Return the settings which determine the synthetic dataset.
+
+    @param cmd_args: argparse namespace object containing the command arguments.
+    @return settings: dictionary object containing the dataset settings.
+    """
+
+    return {key: getattr(cmd_args, key) for key in ['tiles', 'raster_size', 'scenes', 'months', 'properties',
+                                                     'sites', 'visits', 'raster_format', 'seed']}
+
+
+def tile_list_fn(tile_count, raster_size):
+    """ Create the name, WRSPR value and footprint (UTM zone 53 bounds) of each synthetic tile.
+
+    @param tile_count: integer object containing the number of tiles.
+    @param raster_size: integer object containing the width and height of each scene in pixels.
+    @return tile_list: list object containing a (tile name, WRSPR, (left, bottom, right, top)) tuple for each tile.
+    """
+
+    width = raster_size * PIXEL_SIZE
+    tile_list = []
+
+    for n in range(tile_count):
+        row = BENCHMARK_FIRST_ROW + n
+        left = BENCHMARK_ORIGIN[0] + n * TILE_OFFSET * width
+        top = BENCHMARK_ORIGIN[1]
+        tile_list.append(('{0:03d}_{1:03d}'.format(BENCHMARK_PATH, row), BENCHMARK_PATH * 1000 + row,
+                          (left, top - width, left + width, top)))
+
+    return tile_list
+
+
+def fc_scene_fn(rng, raster_size, no_data):
+    """ Create the three fractional cover bands (bare, green and non-green, 100 - 200) of a synthetic scene.
+
+    @param rng: numpy RandomState object.
+    @param raster_size: integer object containing the width and height of the scene in pixels.
+    @param no_data: integer object containing the no data value.
+    @return array: numpy array object (3, raster_size, raster_size) containing the scene bands.
+    """
+
+    # a smooth bare ground gradient with pixel noise - green and non-green cover share the remainder.
+    gradient = np.linspace(0, 1, raster_size, dtype=np.float32)
+    bare = (rng.uniform(10, 60) + 30 * np.add.outer(gradient, gradient) / 2 +
+            rng.normal(0, 5, (raster_size, raster_size))).clip(0, 100)
+    green_share = rng.uniform(0.2, 0.8)
+    green = (100 - bare) * green_share
+    non_green = 100 - bare - green
+
+    array = (np.stack([bare, green, non_green]) + 100).round().astype(np.uint8)
+
+    if rng.uniform() < CLOUD_FRACTION:
+        # cloud patch (no data in every band).
+        size = rng.randint(raster_size // 8, raster_size // 2)
+        row, col = rng.randint(0, raster_size - size, 2)
+        array[:, row:row + size, col:col + size] = no_data
+
+    return array
+
+
+def generate_fc_fn(landsat_dir, tile_list, raster_size, scene_count, raster_format, rng):
+    """ Write the synthetic fractional cover scenes of each tile (landsat_dir/<tile>/<scene>).
+
+    @param landsat_dir: string object containing the path to the synthetic Landsat directory.
+    @param tile_list: list object containing the synthetic tiles (tile_list_fn).
+    @param raster_size: integer object containing the width and height of each scene in pixels.
+    @param scene_count: integer object containing the number of scenes per tile.
+    @param raster_format: string object containing the scene format (img or tif).
+    @param rng: numpy RandomState object.
+    @return scene_bytes: integer object containing the size of the scenes (bytes).
+    """
+
+    import rasterio
+    from rasterio.transform import from_origin
+
+    no_data = 255
+    driver = 'HFA' if raster_format == 'img' else 'GTiff'
+    scene_bytes = 0
+
+    for tile, wrspr, (left, bottom, right, top) in tile_list:
+        tile_dir = os.path.join(landsat_dir, tile)
+        os.makedirs(tile_dir)
+        path, row = tile.split('_')
+
+        for n in range(scene_count):
+            scene_date = FIRST_SCENE_DATE + timedelta(days=SCENE_INTERVAL * n)
+            # the file name length and layout match the production scenes (step1_6 and step2_4 slice the name).
+            scene = os.path.join(tile_dir, 'lztmre_p{0}r{1}_{2}_dp0m3_zstdmask.{3}'.format(
+                path, row, scene_date.strftime('%Y%m%d'), raster_format))
+
+            with rasterio.open(scene, 'w', driver=driver, width=raster_size, height=raster_size, count=3,
+                               dtype='uint8', nodata=no_data, crs='EPSG:{0}'.format(BENCHMARK_EPSG),
+                               transform=from_origin(left, top, PIXEL_SIZE, PIXEL_SIZE)) as dst:
+                dst.write(fc_scene_fn(rng, raster_size, no_data))
+
+            scene_bytes += sum(os.path.getsize(file) for file in glob.glob(os.path.splitext(scene)[0] + '.*'))
+
+        print(' - fractional cover scenes: ', tile, scene_count)
+
+    return scene_bytes
+
+
+def geographic_bounds_fn(tile_list):
+    """ Return the geographic (GCS WGS84) bounds of the synthetic tiles.
+
+    @param tile_list: list object containing the synthetic tiles (tile_list_fn).
+    @return bounds: numpy array object containing the (west, south, east, north) bounds.
+    """
+
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    footprint = gpd.GeoSeries([box(*bounds) for tile, wrspr, bounds in tile_list], crs=BENCHMARK_EPSG)
+
+    return footprint.to_crs(epsg=4326).total_bounds
+
+
+def generate_rainfall_fn(rainfall_dir, tile_list, month_count, rng):
+    """ Write the synthetic monthly rainfall grids (YYYYMM.monthly_rain.tif) covering the synthetic tiles.
+
+    @param rainfall_dir: string object containing the path to the synthetic rainfall directory.
+    @param tile_list: list object containing the synthetic tiles (tile_list_fn).
+    @param month_count: integer object containing the number of monthly grids.
+    @param rng: numpy RandomState object.
+    """
+
+    import rasterio
+    from rasterio.transform import from_origin
+
+    os.makedirs(rainfall_dir)
+    west, south, east, north = geographic_bounds_fn(tile_list)
+    west, south = west - RAINFALL_RESOLUTION * 2, south - RAINFALL_RESOLUTION * 2
+    width = int(np.ceil((east - west) / RAINFALL_RESOLUTION)) + 4
+    height = int(np.ceil((north - south) / RAINFALL_RESOLUTION)) + 4
+
+    for n in range(month_count):
+        year = FIRST_SCENE_DATE.year + (FIRST_SCENE_DATE.month - 1 + n) // 12
+        month = (FIRST_SCENE_DATE.month - 1 + n) % 12 + 1
+        # monsoonal rainfall - wet season (November to April) totals are much higher.
+        mean = 250.0 if month in [11, 12, 1, 2, 3, 4] else 15.0
+        array = rng.gamma(2.0, mean / 2.0, (height, width)).astype(np.float32)
+
+        with rasterio.open(os.path.join(rainfall_dir, '{0}{1:02d}.monthly_rain.tif'.format(year, month)), 'w',
+                           driver='GTiff', width=width, height=height, count=1, dtype='float32', nodata=-1,
+                           crs='EPSG:4326', transform=from_origin(west, north + RAINFALL_RESOLUTION * 2,
+                                                                 RAINFALL_RESOLUTION, RAINFALL_RESOLUTION)) as dst:
+            dst.write(array, 1)
+
+    print(' - monthly rainfall grids: ', month_count)
+
+
+def generate_tile_grid_fn(tile_grid, tile_list):
+    """ Write the synthetic Landsat tile grid shapefile (WRSPR feature, GCS WGS84).
+
+    @param tile_grid: string object containing the path to the tile grid shapefile.
+    @param tile_list: list object containing the synthetic tiles (tile_list_fn).
+    """
+
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    tile_grid_gdf = gpd.GeoDataFrame({'WRSPR': [wrspr for tile, wrspr, bounds in tile_list]},
+                                     geometry=[box(*bounds) for tile, wrspr, bounds in tile_list],
+                                     crs='EPSG:{0}'.format(BENCHMARK_EPSG))
+    tile_grid_gdf.to_crs(epsg=4326).to_file(tile_grid)
+
+
+def site_list_fn(tile_list, property_count, site_count, rng):
+    """ Place the synthetic sites inside the tiles (away from the negatively buffered tile edges).
+
+    @param tile_list: list object containing the synthetic tiles (tile_list_fn).
+    @param property_count: integer object containing the number of properties.
+    @param site_count: integer object containing the number of sites per property.
+    @param rng: numpy RandomState object.
+    @return site_list: list object containing a (property, prop_tag, district, site, x, y) tuple for each site (UTM).
+    """
+
+    site_list = []
+
+    for n in range(property_count):
+        prop = 'BENCHMARK DOWNS {0}'.format(chr(ord('A') + n % 26) * (n // 26 + 1))
+        prop_tag = 'PB{0:03d}'.format(n + 1)
+        district = DISTRICT_LIST[n % len(DISTRICT_LIST)]
+
+        for i in range(site_count):
+            tile, wrspr, (left, bottom, right, top) = tile_list[rng.randint(len(tile_list))]
+            x = rng.uniform(left + SITE_MARGIN, right - SITE_MARGIN)
+            y = rng.uniform(bottom + SITE_MARGIN, top - SITE_MARGIN)
+            site_list.append((prop, prop_tag, district, '{0}{1:02d}'.format(prop_tag, i + 1), x, y))
+
+    return site_list
+
+
+def generate_estate_fn(pastoral_estate, site_list):
+    """ Write the synthetic pastoral estate shapefile (the extent of the sites of each property, GDA94).
+
+    @param pastoral_estate: string object containing the path to the pastoral estate shapefile.
+    @param site_list: list object containing the synthetic sites (site_list_fn).
+    """
+
+    import geopandas as gpd
+    from shapely.geometry import MultiPoint
+
+    prop_dict = {}
+    for prop, prop_tag, district, site, x, y in site_list:
+        prop_dict.setdefault((prop, prop_tag, district), []).append((x, y))
+
+    estate = gpd.GeoDataFrame({'PROPERTY': [key[0] for key in prop_dict],
+                               'PROP_TAG': [key[1] for key in prop_dict],
+                               'DISTRICT': [key[2] for key in prop_dict]},
+                              geometry=[MultiPoint(point_list).envelope.buffer(2000) for point_list in
+                                        prop_dict.values()],
+                              crs='EPSG:{0}'.format(BENCHMARK_EPSG))
+    estate.to_crs(epsg=4283).to_file(pastoral_estate)
+
+
+def visit_date_list_fn(scene_count, visit_count, rng):
+    """ Create the visit dates of a site within the fractional cover scene period.
+
+    @param scene_count: integer object containing the number of scenes per tile.
+    @param visit_count: integer object containing the number of visits per site.
+    @param rng: numpy RandomState object.
+    @return visit_date_list: sorted list object containing the visit dates.
+    """
+
+    period = max(SCENE_INTERVAL * scene_count, visit_count)
+    day_list = sorted(rng.choice(period, visit_count, replace=False))
+
+    return [FIRST_SCENE_DATE + timedelta(days=int(day)) for day in day_list]
+
+
+def generate_odk_fn(odk_dir, previous_visits, site_list, scene_count, visit_count, rng):
+    """ Write the synthetic ODK star transect csv files (one per property) and the previous visits shapefile.
+
+    @param odk_dir: string object containing the path to the synthetic ODK directory.
+    @param previous_visits: string object containing the path to the previous visits shapefile.
+    @param site_list: list object containing the synthetic sites (site_list_fn).
+    @param scene_count: integer object containing the number of scenes per tile.
+    @param visit_count: integer object containing the number of visits per site.
+    @param rng: numpy RandomState object.
+    @return record_count: integer object containing the number of ODK records.
+    """
+
+    import geopandas as gpd
+    from shapely.geometry import Point
+
+    points = gpd.GeoSeries([Point(x, y) for prop, prop_tag, district, site, x, y in site_list],
+                           crs=BENCHMARK_EPSG).to_crs(epsg=4283)
+
+    header = ['final_prop', 'site_orig', 'date', 'loc_c', 'wgs_c_lon', 'wgs_c_lat', 'gda_c_lon', 'gda_c_lat',
+              'recorder']
+    prop_row_dict = {}
+    visit_site_list = []
+    visit_time_list = []
+    visit_point_list = []
+
+    for (prop, prop_tag, district, site, x, y), point in zip(site_list, points):
+        for visit_date in visit_date_list_fn(scene_count, visit_count, rng):
+            prop_row_dict.setdefault(prop, []).append(
+                [prop.title(), site, visit_date.strftime('%d/%m/%Y') + ' 09:30', 'GPS', round(point.x, 7),
+                 round(point.y, 7), round(point.x, 7), round(point.y, 7), 'benchmark'])
+            visit_site_list.append(site)
+            visit_time_list.append(visit_date.strftime('%Y-%m-%d') + 'T09:30:00')
+            visit_point_list.append(point)
+
+    for prop, row_list in prop_row_dict.items():
+        prop_dir = os.path.join(odk_dir, prop.title().replace(' ', '_'))
+        os.makedirs(prop_dir)
+        with open(os.path.join(prop_dir, prop.title().replace(' ', '_') + '_star_transect.csv'), 'w') as output:
+            writer = csv.writer(output, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(row_list)
+
+    gpd.GeoDataFrame({'site': visit_site_list, 'obs_time': visit_time_list}, geometry=visit_point_list,
+                     crs='EPSG:4283').to_file(previous_visits)
+
+    return len(visit_site_list)
+
+
+def generate_districts_fn(pastoral_districts_dir, site_list):
+    """ Create the pastoral districts directory structure written to by step2_5.
+
+    @param pastoral_districts_dir: string object containing the path to the synthetic pastoral districts directory.
+    @param site_list: list object containing the synthetic sites (site_list_fn).
+    """
+
+    for prop, prop_tag, district in sorted(set(site[:3] for site in site_list)):
+        prop_dir = os.path.join(pastoral_districts_dir, district.replace(' ', '_').title(),
+                                '{0}_{1}'.format(prop_tag, prop.replace(' ', '_').title()))
+        for folder in ['Zonal_Stats', 'Time_Trace']:
+            os.makedirs(os.path.join(prop_dir, 'Data', 'Rs_Outputs', folder))
+
+
+def directory_size_fn(directory):
+    """ Return the size (bytes) of the files within a directory. """
+
+    return sum(os.path.getsize(os.path.join(root, file)) for root, dirs, files in os.walk(directory) for file in files)
+
+
+def generate_dataset_fn(data_dir, settings):
+    """ Generate the synthetic dataset.
+
+    @param data_dir: string object containing the path to the synthetic dataset directory (deleted if it exists).
+    @param settings: dictionary object containing the dataset settings (settings_fn).
+    @return dataset: dictionary object containing the dataset paths and sizes.
+    """
+
+    if os.path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir)
+
+    print('=' * 50)
+    print('Generating the synthetic dataset: ', data_dir)
+    start = time.time()
+
+    rng = np.random.RandomState(settings['seed'])
+    dataset = dataset_paths_fn(data_dir)
+    os.makedirs(os.path.dirname(dataset['tile_grid']))
+
+    tile_list = tile_list_fn(settings['tiles'], settings['raster_size'])
+    generate_tile_grid_fn(dataset['tile_grid'], tile_list)
+    generate_fc_fn(dataset['landsat_dir'], tile_list, settings['raster_size'], settings['scenes'],
+                   settings['raster_format'], rng)
+    generate_rainfall_fn(dataset['rainfall_dir'], tile_list, settings['months'], rng)
+
+    site_list = site_list_fn(tile_list, settings['properties'], settings['sites'], rng)
+    generate_estate_fn(dataset['pastoral_estate'], site_list)
+    record_count = generate_odk_fn(dataset['odk_dir'], dataset['previous_visits'], site_list, settings['scenes'],
+                                   settings['visits'], rng)
+    generate_districts_fn(dataset['pastoral_districts_dir'], site_list)
+
+    with open(os.path.join(data_dir, SETTINGS_NAME), 'w') as settings_file:
+        json.dump({'settings': settings, 'odk_records': record_count}, settings_file, indent=1, sort_keys=True)
+
+    print(' - ODK records: ', record_count)
+    print(' - dataset size (MB): ', round(directory_size_fn(data_dir) / 1048576.0, 1))
+    print(' - generated in (s): ', round(time.time() - start, 1))
+
+    return dataset
+
+
+def dataset_paths_fn(data_dir):
+    """ Return the paths of the synthetic dataset.
+
+    @param data_dir: string object containing the path to the synthetic dataset directory.
+    @return dataset: dictionary object containing the dataset paths.
+    """
+
+    assets_dir = os.path.join(data_dir, 'assets')
+
+    return {'data_dir': data_dir,
+            'landsat_dir': os.path.join(data_dir, 'landsat'),
+            'rainfall_dir': os.path.join(data_dir, 'rainfall'),
+            'odk_dir': os.path.join(data_dir, 'odk'),
+            'pastoral_districts_dir': os.path.join(data_dir, 'pastoral_districts'),
+            'tile_grid': os.path.join(assets_dir, 'synthetic_tile_grid.shp'),
+            'pastoral_estate': os.path.join(assets_dir, 'synthetic_pastoral_estate.shp'),
+            'previous_visits': os.path.join(assets_dir, 'synthetic_previous_visits.shp')}
+
+
+def reusable_dataset_fn(data_dir, settings):
+    """ Determine if the synthetic dataset in the data directory was generated with the same settings. """
+
+    settings_path = os.path.join(data_dir, SETTINGS_NAME)
+    if not os.path.exists(settings_path):
+        return False
+
+    with open(settings_path, 'r') as settings_file:
+        return json.load(settings_file)['settings'] == settings
+
+
+def run_pipeline_fn(dataset, settings, export_dir, pipeline_args):
+    """ Run the fractional cover zonal stats pipeline (step1_1) over the synthetic dataset as a separate process.
+
+    @param dataset: dictionary object containing the dataset paths (dataset_paths_fn).
+    @param settings: dictionary object containing the dataset settings (settings_fn).
+    @param export_dir: string object containing the path to the pipeline export directory.
+    @param pipeline_args: string object containing additional step1_1 command arguments.
+    @return return_code: integer object containing the pipeline exit code.
+    @return wall_time: float object containing the pipeline wall time (seconds).
+    """
+
+    if not os.path.exists(export_dir):
+        os.makedirs(export_dir)
+
+    search_criteria = 'dp0m3_zstdmask.' + settings['raster_format']
+    step1_1 = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'step1_1_initiate_fractional_cover_zonal_stats_pipeline.py')
+
+    command = [sys.executable, step1_1,
+               '--tile_grid', dataset['tile_grid'],
+               '--directory_odk', dataset['odk_dir'],
+               '--export_dir', export_dir,
+               '--image_count', str(settings['scenes']),
+               '--landsat_dir', dataset['landsat_dir'],
+               '--rainfall_dir', dataset['rainfall_dir'],
+               '--search_criteria1', search_criteria,
+               '--search_criteria2', search_criteria,
+               '--search_criteria4', search_criteria,
+               '--visits', dataset['previous_visits'],
+               '--pastoral_estate', dataset['pastoral_estate'],
+               '--pastoral_districts_dir', dataset['pastoral_districts_dir'],
+               '--cache_dir', 'None'] + shlex.split(pipeline_args)
+
+    print('=' * 50)
+    print('Running the pipeline: ', ' '.join(command))
+    start = time.time()
+    # the step scripts import each other by module name - run from the code directory.
+    return_code = subprocess.call(command, cwd=os.path.dirname(step1_1))
+
+    return return_code, time.time() - start
+
+
+def latest_run_report_fn(export_dir):
+    """ Return the run report of the latest pipeline run within the export directory, or None. """
+
+    report_list = glob.glob(os.path.join(export_dir, '*', 'run_report.json'))
+    if not report_list:
+        return None
+
+    with open(max(report_list, key=os.path.getmtime), 'r') as report_file:
+        return json.load(report_file)
+
+
+def validate_zonal_stats_fn(dataset, run_dir):
+    """ Check the band means of the pipeline zonal stats against the reference means of the synthetic scenes.
+
+    @param dataset: dictionary object containing the dataset paths (dataset_paths_fn).
+    @param run_dir: string object containing the path to the pipeline run directory.
+    @return validation: dictionary object containing the number of rows checked and the mismatched rows.
+    """
+
+    import geopandas as gpd
+    import pandas as pd
+    from rasterstats import zonal_stats
+
+    zonal_stats_list = glob.glob(os.path.join(run_dir, 'zonal_stats', '*_zonal_stats.csv'))
+    if not zonal_stats_list:
+        return {'rows': 0, 'mismatches': [], 'error': 'no zonal stats csv files'}
+
+    output_df = pd.concat([pd.read_csv(path) for path in zonal_stats_list], ignore_index=True, sort=False)
+
+    # the 1ha site (100 m square) of each site in the scene projection.
+    visits = gpd.read_file(dataset['previous_visits']).drop_duplicates('site').to_crs(epsg=BENCHMARK_EPSG)
+    site_dict = dict(zip(visits['site'], visits.geometry.buffer(50, cap_style=3)))
+
+    # the scene of each image name (named as step1_6 band_zonal_stats_fn).
+    scene_dict = {scene[-43:-1] + 'g': scene for scene in
+                  glob.glob(os.path.join(dataset['landsat_dir'], '*', '*dp0m3_zstdmask.*')) if
+                  os.path.splitext(scene)[1] in ['.img', '.tif']}
+
+    reference_dict = {}
+    mismatch_list = []
+    for row in output_df.itertuples(index=False):
+        key = (row.image, row.site)
+        if key not in reference_dict:
+            reference_dict[key] = [zonal_stats([site_dict[row.site]], scene_dict[row.image], band=band, nodata=255,
+                                               stats=['mean'], all_touched=False)[0]['mean'] for band in [1, 2, 3]]
+
+        for band, reference in zip([1, 2, 3], reference_dict[key]):
+            value = getattr(row, 'b{0}_mean'.format(band))
+            if reference is None and pd.isnull(value):
+                continue
+            if reference is None or pd.isnull(value) or abs(value - reference) > MEAN_TOLERANCE:
+                mismatch_list.append({'image': row.image, 'site': row.site, 'band': band,
+                                      'value': None if pd.isnull(value) else float(value), 'reference': reference})
+
+    return {'rows': len(output_df.index), 'mismatches': mismatch_list}
+
+
+def benchmark_report_fn(output_dir, settings, dataset, return_code, wall_time, run_report, validation=None):
+    """ Write the benchmark report (benchmark_report.json) and print the stage timings.
+
+    @param output_dir: string object containing the path to the benchmark output directory.
+    @param settings: dictionary object containing the dataset settings (settings_fn).
+    @param dataset: dictionary object containing the dataset paths (dataset_paths_fn).
+    @param return_code: integer object containing the pipeline exit code.
+    @param wall_time: float object containing the pipeline wall time (seconds).
+    @param run_report: dictionary object containing the pipeline run report, or None.
+    @param validation: dictionary object containing the zonal stats check (validate_zonal_stats_fn), or None.
+    @return report: dictionary object containing the benchmark report.
+    """
+
+    column_list = ['wall_time', 'cpu_time', 'peak_rss_mb', 'scenes_per_s', 'rows_written']
+    report = {'settings': settings,
+              'dataset_mb': round(directory_size_fn(dataset['data_dir']) / 1048576.0, 1),
+              'return_code': return_code,
+              'wall_time': round(wall_time, 3),
+              'stages': [],
+              'tiles': {},
+              'validation': validation}
+
+    if run_report is not None:
+        report['run_dir'] = run_report.get('run_dir')
+        report['stages'] = [{key: stage.get(key) for key in ['stage', 'status'] + column_list}
+                            for stage in run_report['stages']]
+        report['tiles'] = run_report['tiles']
+
+    with open(os.path.join(output_dir, BENCHMARK_REPORT_NAME), 'w') as report_file:
+        json.dump(report, report_file, indent=1, sort_keys=True)
+
+    print('=' * 50)
+    print('Benchmark: ', ', '.join('{0}={1}'.format(key, value) for key, value in sorted(settings.items())))
+    print('{0:<45}{1:>10}{2:>10}{3:>10}{4:>12}{5:>10}'.format('stage', 'wall (s)', 'cpu (s)', 'rss (MB)',
+                                                              'scenes/s', 'rows'))
+    for stage in report['stages']:
+        print('{0:<45}{1:>10}{2:>10}{3:>10}{4:>12}{5:>10}'.format(
+            stage['stage'][:44], *[('-' if stage.get(key) is None else
+                                    round(stage[key], 1) if isinstance(stage[key], float) else stage[key])
+                                   for key in column_list]))
+    print('Total wall time (s): ', round(wall_time, 1), ' - exit code: ', return_code)
+    if validation is not None:
+        print('Zonal stats rows checked: ', validation['rows'], ' - band mean mismatches: ',
+              len(validation['mismatches']), validation.get('error', ''))
+        for mismatch in validation['mismatches'][:10]:
+            print(' - ', mismatch)
+    print('Benchmark report: ', os.path.join(output_dir, BENCHMARK_REPORT_NAME))
+    print('=' * 50)
+
+    return report
+
+
+def main_routine():
+    """ Generate (or re-use) the synthetic dataset, run the pipeline over it and report the stage timings. """
+
+    cmd_args = get_cmd_args_fn()
+    output_dir = os.path.abspath(cmd_args.output_dir)
+    data_dir = os.path.join(output_dir, 'data')
+    settings = settings_fn(cmd_args)
+
+    if cmd_args.reuse and reusable_dataset_fn(data_dir, settings):
+        print('Re-using the synthetic dataset: ', data_dir)
+        dataset = dataset_paths_fn(data_dir)
+    else:
+        dataset = generate_dataset_fn(data_dir, settings)
+
+    if cmd_args.generate_only:
+        return
+
+    export_dir = os.path.join(output_dir, 'export')
+    return_code, wall_time = run_pipeline_fn(dataset, settings, export_dir, cmd_args.pipeline_args)
+    run_report = latest_run_report_fn(export_dir)
+
+    validation = None
+    if return_code == 0 and run_report is not None:
+        validation = validate_zonal_stats_fn(dataset, run_report['run_dir'])
+
+    benchmark_report_fn(output_dir, settings, dataset, return_code, wall_time, run_report, validation)
+
+    if return_code != 0:
+        sys.exit(return_code)
+    if validation is not None and (validation['mismatches'] or validation.get('error')):
+        # the pipeline zonal stats do not match the synthetic scenes.
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_routine()
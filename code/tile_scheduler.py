@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""
+tile_scheduler.py
+=================
+
+Description: This script schedules the per tile zonal stats (step1_6 - fractional cover and step1_7 - rainfall) of the
+fractional cover zonal stats pipeline (step1_1) so that several Landsat tiles are processed at once.
+
+1. The fractional cover zonal stats (CPU heavy) are run in a process pool limited by the command argument
+--tile_workers (default 1 - the tiles are processed one at a time within the pipeline process).
+
+2. The rainfall zonal stats (I/O heavy and light weight) of every tile are queued up front on a thread pool limited by
+the command argument --io_workers, and run at the same time as the fractional cover zonal stats. With the defaults (one
+tile worker and one io worker) the tiles are processed one at a time - fractional cover then rainfall - as before.
+
+3. A tile is only started if the estimated memory of the running tiles plus the tile (a full scene band read by step1_6)
+is within the memory budget (command argument --memory_budget, MB). One tile is always allowed to run.
+
+4. When the Landsat scenes are staged to a local directory (raster_staging, command argument --staging_dir), the scenes
+of the next queued tile are copied in the background while the current tiles are processed - in list order, up to the
+staging size limit less the scenes and rainfall images of the running tiles.
+
+5. The progress of every tile is printed as one combined report each time a tile task starts, finishes or fails.
+
+Each tile is processed within its own temporary sub-directory so that concurrent tiles do not share temporary files.
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import run_report
+import stage_profiler
+import raster_staging
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# memory (MB) assumed for a tile when the scene size can not be read.
+DEFAULT_TILE_MEMORY = 512
+
+# multiplier applied to a single scene band read (array, masks and the zonal stats working copies).
+TILE_MEMORY_FACTOR = 3
+
+
+def tile_temp_dir_fn(temp_dir_path, complete_tile):
+    """ Create a temporary sub-directory for a tile (with the gcs_wgs84 sub-directory used by step1_7).
+
+    @param temp_dir_path: string object containing the path to the temporary directory.
+    @param complete_tile: string object containing the six character tile name (i.e. 101077).
+    @return tile_temp_dir: string object containing the path to the tile temporary sub-directory.
+    """
+
+    tile_temp_dir = os.path.join(temp_dir_path, 'tile_' + complete_tile)
+    gcs_wgs84_dir = os.path.join(tile_temp_dir, 'gcs_wgs84')
+
+    if not os.path.exists(gcs_wgs84_dir):
+        os.makedirs(gcs_wgs84_dir)
+
+    return tile_temp_dir
+
+
+def tile_memory_estimate_fn(tile):
+    """ Estimate the memory (MB) required to process a tile from the size of the first scene in the tile scene list.
+
+    @param tile: string object containing the path to the tile scene list csv (tile_status/for_processing).
+    @return memory: float object containing the estimated memory (MB).
+    """
+
+    try:
+        import numpy as np
+        import rasterio
+        with open(tile, 'r') as imagery_list:
+            image_s = imagery_list.readline().rstrip()
+        with rasterio.open(image_s) as srci:
+            band_bytes = srci.width * srci.height * np.dtype(srci.dtypes[0]).itemsize
+        memory = TILE_MEMORY_FACTOR * band_bytes / 1048576.0
+
+    except Exception:
+        memory = DEFAULT_TILE_MEMORY
+
+    return memory
+
+
+def fc_zonal_stats_task_fn(tile_temp_dir, zonal_stats_ready_dir, no_data, tile, zonal_stats_output, tile_site_dict):
+    """ Run the step1_6 fractional cover zonal stats for a tile (process pool task).
+
+    @param tile_temp_dir: string object containing the path to the tile temporary sub-directory.
+    @param zonal_stats_ready_dir: string object containing the path to the zonal_stats_ready temporary sub-directory.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @param tile: string object containing the path to the tile scene list csv.
+    @param zonal_stats_output: string object containing the path to the export_dir/zonal_stats directory.
+    @param tile_site_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @return complete_tile: string object containing the six character tile name.
+    @return metrics: dictionary object containing the task performance metrics (run_report).
+    """
+
+    import step1_6_fc_zonal_stats
+    (output_zonal_stats, complete_tile, tile, temp_dir_bands), metrics = run_report.measure_fn(
+        stage_profiler.profile_call_fn, step1_6_fc_zonal_stats.main_routine, tile_temp_dir, zonal_stats_ready_dir,
+        no_data, tile, zonal_stats_output, tile_site_dict, profile_tag=os.path.basename(tile)[:7].replace('_', ''))
+
+    return complete_tile, run_report.add_counts_fn(metrics, scenes=run_report.line_count_fn(tile))
+
+
+def rainfall_zonal_stats_task_fn(export_dir_path, zonal_stats_ready_dir, complete_tile, export_rainfall, tile_temp_dir,
+                                 tile_site_dict, debug_dump):
+    """ Run the step1_7 rainfall zonal stats for a tile (thread pool task).
+
+    @param export_dir_path: string object containing the path to the export directory.
+    @param zonal_stats_ready_dir: string object containing the path to the zonal_stats_ready temporary sub-directory.
+    @param complete_tile: string object containing the six character tile name.
+    @param export_rainfall: string object containing the path to the rainfall image list csv.
+    @param tile_temp_dir: string object containing the path to the tile temporary sub-directory.
+    @param tile_site_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param debug_dump: boolean object, True to export the intermediate shapefiles.
+    @return complete_tile: string object containing the six character tile name.
+    @return metrics: dictionary object containing the task performance metrics (run_report).
+    """
+
+    import step1_7_monthly_rainfall_zonal_stats
+    result, metrics = run_report.measure_fn(
+        stage_profiler.profile_call_fn, step1_7_monthly_rainfall_zonal_stats.main_routine, export_dir_path,
+        zonal_stats_ready_dir, complete_tile, export_rainfall, tile_temp_dir, tile_site_dict, debug_dump,
+        profile_tag=complete_tile)
+
+    return complete_tile, run_report.add_counts_fn(metrics, scenes=run_report.line_count_fn(export_rainfall))
+
+
+def progress_report_fn(status_dict):
+    """ Print the combined progress report of every tile.
+
+    @param status_dict: ordered dictionary object containing the tile (key) and the tile status dictionary (value).
+    """
+
+    count_dict = {}
+    for status in status_dict.values():
+        count_dict[status['status']] = count_dict.get(status['status'], 0) + 1
+
+    print('=' * 50)
+    print('Tile progress: {0} of {1} complete, {2} running, {3} queued, {4} failed'.format(
+        count_dict.get('complete', 0), len(status_dict), count_dict.get('running', 0), count_dict.get('queued', 0),
+        count_dict.get('failed', 0)))
+
+    for tile, status in status_dict.items():
+        task_list = ['{0} {1}'.format(task, state) for task, state in sorted(status['tasks'].items())]
+        elapsed = ''
+        if status['start'] is not None:
+            elapsed = ' - {0:.1f}s'.format((status['finish'] or time.time()) - status['start'])
+        print(' - {0}: {1} ({2}){3}'.format(tile, status['status'], ', '.join(task_list), elapsed))
+
+    print('=' * 50)
+
+
+def run_tile_schedule_fn(task_list, tile_workers=1, io_workers=1, memory_budget=0, complete_fn=None):
+    """ Run the fractional cover and rainfall zonal stats of each tile concurrently within the concurrency limits and
+    the memory budget. With one tile worker and one io worker the tiles are processed one at a time (fractional cover
+    then rainfall) within the pipeline process.
+
+    @param task_list: list object containing a tile task dictionary for each tile (tile_task_fn).
+    @param tile_workers: integer object containing the maximum number of tiles processed at once (process pool).
+    @param io_workers: integer object containing the maximum number of rainfall tasks run at once (thread pool).
+    @param memory_budget: float object containing the memory budget (MB) of the running tiles, 0 for no budget.
+    @param complete_fn: function object called with the tile task dictionary (including the metrics of each task) when
+    both tile tasks are complete.
+    @return failed_list: list object containing the tiles that failed.
+    """
+
+    status_dict = OrderedDict((task['complete_tile'], {'status': 'queued', 'tasks': {'fc': 'queued',
+                                                                                     'rainfall': 'queued'},
+                                                       'start': None, 'finish': None}) for task in task_list)
+    if len(task_list) == 0:
+        return []
+
+    tile_workers = max(1, int(tile_workers))
+    io_workers = max(1, int(io_workers))
+    serial = tile_workers == 1 and io_workers == 1
+
+    if tile_workers > 1:
+        cpu_executor = ProcessPoolExecutor(max_workers=tile_workers)
+    else:
+        # a single tile at a time - run within the pipeline process.
+        cpu_executor = ThreadPoolExecutor(max_workers=1)
+    # serial - the rainfall task of a tile runs after its fractional cover task (the same single thread).
+    io_executor = cpu_executor if serial else ThreadPoolExecutor(max_workers=io_workers)
+
+    pending = deque(task_list)
+    future_dict = {}
+    running_dict = {}
+    remaining_dict = {task['complete_tile']: {'task': task, 'remaining': 2, 'failed': False} for task in task_list}
+    failed_list = []
+    memory_used = 0.0
+    prefetch_list = []
+
+    def start_task_fn(task, task_name):
+        complete_tile = task['complete_tile']
+        status_dict[complete_tile]['tasks'][task_name] = 'running'
+        if task_name == 'fc':
+            # the tile is running once its fractional cover task has started.
+            status_dict[complete_tile].update({'status': 'running', 'start': time.time()})
+
+        if task_name == 'fc':
+            # the fractional cover task may be replaced (i.e. by the scene queue task - scene_queue).
+            fc_fn = task.get('fc_fn', fc_zonal_stats_task_fn)
+            future_dict[cpu_executor.submit(fc_fn, *task['fc_args'])] = (complete_tile, 'fc')
+        else:
+            future_dict[io_executor.submit(rainfall_zonal_stats_task_fn, *task['rainfall_args'])] = (
+                complete_tile, 'rainfall')
+
+    try:
+        if not serial:
+            # the rainfall tasks (light weight) are queued on the io pool up front, so --io_workers rainfall tasks run
+            # at once regardless of the number of running fractional cover tasks.
+            for task in task_list:
+                start_task_fn(task, 'rainfall')
+            progress_report_fn(status_dict)
+
+        while pending or future_dict:
+
+            # start tiles while there is a free tile worker and the memory budget allows.
+            while pending and len(running_dict) < tile_workers:
+                task = pending[0]
+                if running_dict and memory_budget and memory_used + task['memory'] > memory_budget:
+                    break
+
+                pending.popleft()
+                running_dict[task['complete_tile']] = task
+                memory_used += task['memory']
+
+                start_task_fn(task, 'fc')
+                if serial:
+                    start_task_fn(task, 'rainfall')
+
+                progress_report_fn(status_dict)
+
+            # stage the scenes of the next queued tile while the running tiles are processed (raster_staging), within
+            # the staging size limit less the scenes and rainfall images of the running tiles.
+            if pending and pending[0]['complete_tile'] not in prefetch_list:
+                prefetch_list.append(pending[0]['complete_tile'])
+                try:
+                    reserved_list = []
+                    for running in running_dict.values():
+                        reserved_list.extend(raster_staging.list_file_fn(running['tile']))
+                        reserved_list.extend(raster_staging.list_file_fn(running['rainfall_args'][3]))
+                    raster_staging.prefetch_fn(raster_staging.list_file_fn(pending[0]['tile']), reserved_list)
+                except (IOError, OSError):
+                    pass
+
+            done, _ = wait(list(future_dict), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                complete_tile, task_name = future_dict.pop(future)
+                remaining = remaining_dict[complete_tile]
+                remaining['remaining'] -= 1
+
+                try:
+                    remaining['task'].setdefault('metrics', {})[task_name] = future.result()[1]
+                    status_dict[complete_tile]['tasks'][task_name] = 'complete'
+                except Exception as error:
+                    print('Tile task failed: ', complete_tile, task_name, repr(error))
+                    status_dict[complete_tile]['tasks'][task_name] = 'failed'
+                    remaining['failed'] = True
+
+                if task_name == 'fc':
+                    # the tile worker and its memory are released once the fractional cover task is complete.
+                    running_dict.pop(complete_tile)
+                    memory_used -= remaining['task']['memory']
+
+                if remaining['remaining'] == 0:
+                    status_dict[complete_tile]['finish'] = time.time()
+
+                    if remaining['failed']:
+                        status_dict[complete_tile]['status'] = 'failed'
+                        failed_list.append(complete_tile)
+                    else:
+                        status_dict[complete_tile]['status'] = 'complete'
+                        if complete_fn is not None:
+                            complete_fn(remaining['task'])
+
+            progress_report_fn(status_dict)
+
+    finally:
+        cpu_executor.shutdown(wait=True)
+        io_executor.shutdown(wait=True)
+
+    return failed_list
+
+
+def tile_task_fn(tile, complete_tile, temp_dir_path, zonal_stats_ready_dir, no_data, zonal_stats_output,
+                 export_dir_path, export_rainfall, site_tile_dict, debug_dump, stage=None, input_hash=None):
+    """ Create the tile task dictionary (arguments of the fractional cover and rainfall tasks of a tile).
+
+    @param tile: string object containing the path to the tile scene list csv.
+    @param complete_tile: string object containing the six character tile name.
+    @param temp_dir_path: string object containing the path to the temporary directory.
+    @param zonal_stats_ready_dir: string object containing the path to the zonal_stats_ready temporary sub-directory.
+    @param no_data: integer object containing the Landsat Fractional Cover no data value.
+    @param zonal_stats_output: string object containing the path to the export_dir/zonal_stats directory.
+    @param export_dir_path: string object containing the path to the export directory.
+    @param export_rainfall: string object containing the path to the rainfall image list csv.
+    @param site_tile_dict: dictionary object containing the tile (key) and the 1ha sites within the tile (value).
+    @param debug_dump: boolean object, True to export the intermediate shapefiles.
+    @param stage: string object containing the run manifest stage name of the tile.
+    @param input_hash: string object containing the run manifest input hash of the tile.
+    @return task: dictionary object containing the tile task.
+    """
+
+    tile_temp_dir = tile_temp_dir_fn(temp_dir_path, complete_tile)
+
+    # only the sites of the tile are sent to the worker process.
+    tile_site_dict = {complete_tile: site_tile_dict[complete_tile]} if site_tile_dict is not None else None
+
+    task = {'tile': tile,
+            'complete_tile': complete_tile,
+            'stage': stage,
+            'input_hash': input_hash,
+            'memory': tile_memory_estimate_fn(tile),
+            'fc_args': (tile_temp_dir, zonal_stats_ready_dir, no_data, tile, zonal_stats_output, tile_site_dict),
+            'rainfall_args': (export_dir_path, zonal_stats_ready_dir, complete_tile, export_rainfall, tile_temp_dir,
+                              tile_site_dict, debug_dump)}
+
+    return task
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+"""
+zonal_stats_chunks.py
+======================
+
+Description: This script keeps the peak memory of the step1_6 fractional cover zonal stats of a tile within a budget
+(step1_1 command argument --max_memory, MB) for large backfills, where holding the zonal stats of every scene and band
+of a tile at once exceeds the memory of the machine. The budget is shared by the tiles processed at once (step1_1
+command argument --tile_workers) - each tile worker process is given an equal share.
+
+1. chunk_size_fn estimates the memory of the process (current resident memory), of the scene bands read
+(tile_scheduler.tile_memory_estimate_fn) and of a zonal stats row, and returns the number of scenes and sites that are
+processed together (a chunk) so that the chunk results fit within the remaining budget. The bands of a scene are read
+once for every site chunk, so the results of all site chunks of a scene chunk are held until they are spilled.
+
+2. spill_fn writes the cleaned zonal stats of each chunk to the temporary directory as a gzip compressed pickle
+(the value types are kept and the files are small), so only one chunk is held in memory.
+
+3. merge_spill_fn streams the spilled chunks (in chunk order) into the tile csv one chunk at a time and removes each
+spill file once it has been merged.
+
+The rows of the tile csv are ordered by scene chunk and then site chunk (a single chunk keeps the scene order).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import gzip
+import pickle
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# environment variables holding the memory budget and the number of tile workers (inherited by the tile worker
+# processes).
+MAX_MEMORY_ENV = 'RMB_MAX_MEMORY'
+TILE_WORKERS_ENV = 'RMB_TILE_WORKERS'
+
+# memory (MB) assumed for the process when the resident memory can not be read.
+DEFAULT_BASE_MEMORY = 256
+
+# estimated memory (bytes) of a three band zonal stats row (dataframe values and the working copies of the clean up).
+ROW_BYTES = 4096
+
+# gzip compression level of the spill files (fast - the files are only kept until the merge).
+SPILL_COMPRESS_LEVEL = 1
+
+
+def configure_fn(max_memory, tile_workers=1):
+    """ Store the memory budget and the number of tile workers in the environment (step1_1 command arguments
+    --max_memory and --tile_workers).
+
+    @param max_memory: integer object containing the memory budget (MB) of the fractional cover zonal stats of the tiles
+    processed at once, None or 0 for no budget.
+    @param tile_workers: integer object containing the number of tiles processed at once (sharing the budget).
+    """
+
+    if max_memory:
+        os.environ[MAX_MEMORY_ENV] = str(int(max_memory))
+    else:
+        os.environ.pop(MAX_MEMORY_ENV, None)
+
+    os.environ[TILE_WORKERS_ENV] = str(max(1, int(tile_workers or 1)))
+
+
+def max_memory_fn():
+    """ Return the memory budget (MB) of a tile worker (an equal share of the budget of the tiles processed at once),
+    or None if the zonal stats are not chunked. """
+
+    max_memory = os.environ.get(MAX_MEMORY_ENV)
+    if not max_memory:
+        return None
+
+    tile_workers = max(1, int(os.environ.get(TILE_WORKERS_ENV, 1)))
+
+    return max(1, int(max_memory) // tile_workers)
+
+
+def chunk_size_fn(scene_count, site_count, tile, max_memory):
+    """ Return the number of scenes and sites processed together so that the chunk fits within the memory budget.
+
+    @param scene_count: integer object containing the number of scenes of the tile.
+    @param site_count: integer object containing the number of site records of the tile.
+    @param tile: string object containing the path to the tile scene list csv (tile_status/for_processing).
+    @param max_memory: integer object containing the memory budget (MB) of the tile worker (max_memory_fn).
+    @return scene_chunk: integer object containing the number of scenes per chunk.
+    @return site_chunk: integer object containing the number of site records per chunk.
+    """
+
+    import run_report
+    import tile_scheduler
+
+    # the current (not the peak) resident memory - a large tile processed earlier by the worker does not reduce the
+    # chunks of the later tiles.
+    base_memory = run_report.current_rss_fn()
+    if base_memory is None:
+        print('The process memory can not be read - assuming {0} MB for the memory budget (--max_memory).'.format(
+            DEFAULT_BASE_MEMORY))
+        base_memory = DEFAULT_BASE_MEMORY
+
+    raster_memory = tile_scheduler.tile_memory_estimate_fn(tile)
+    row_limit = int((max_memory - base_memory - raster_memory) * 1048576 // ROW_BYTES)
+
+    if row_limit < 1:
+        print('The memory budget ({0} MB per tile worker) is below the estimated process ({1:.0f} MB) and scene band '
+              '({2:.0f} MB) memory - one scene and site per chunk.'.format(max_memory, base_memory, raster_memory))
+        row_limit = 1
+
+    # the site chunks of a scene chunk are held together (the scene bands are read once) - more than one scene per
+    # chunk only when every site of the tile fits within the budget.
+    site_chunk = max(1, min(site_count, row_limit))
+    scene_chunk = max(1, min(scene_count, row_limit // max(1, site_count)))
+
+    print(' - memory budget: {0} MB (per tile worker), {1} scene(s) and {2} site record(s) per chunk'.format(
+        max_memory, scene_chunk, site_chunk))
+
+    return scene_chunk, site_chunk
+
+
+def chunk_list_fn(item_list, chunk_size):
+    """ Split a list (or dataframe) into consecutive chunks of chunk_size items.
+
+    @param item_list: list or dataframe object to be split.
+    @param chunk_size: integer object containing the number of items per chunk.
+    @return chunk_list: list object containing the chunks.
+    """
+
+    if hasattr(item_list, 'iloc'):
+        return [item_list.iloc[start:start + chunk_size] for start in range(0, len(item_list.index), chunk_size)]
+
+    return [item_list[start:start + chunk_size] for start in range(0, len(item_list), chunk_size)]
+
+
+def spill_fn(df, spill_dir, chunk_number):
+    """ Write the results of a chunk to the spill directory (gzip compressed pickle).
+
+    @param df: dataframe object containing the results of the chunk.
+    @param spill_dir: string object containing the path to the spill directory (within the tile temporary directory).
+    @param chunk_number: integer object containing the position of the chunk (merge order).
+    @return spill_path: string object containing the path to the spill file.
+    """
+
+    if not os.path.exists(spill_dir):
+        os.makedirs(spill_dir)
+
+    spill_path = os.path.join(spill_dir, 'chunk_{0:06d}.pkl.gz'.format(chunk_number))
+    with gzip.open(spill_path, 'wb', compresslevel=SPILL_COMPRESS_LEVEL) as spill_file:
+        pickle.dump(df, spill_file, protocol=4)
+
+    return spill_path
+
+
+def read_spill_fn(spill_path):
+    """ Read the results of a chunk from its spill file. """
+
+    with gzip.open(spill_path, 'rb') as spill_file:
+        return pickle.load(spill_file)
+
+
+def merge_spill_fn(spill_list, output_csv, chunk_fn=None):
+    """ Stream the spilled chunks into one csv (one chunk in memory at a time) and remove the spill files.
+
+    @param spill_list: list object containing the spill file paths in merge order.
+    @param output_csv: string object containing the path to the output csv.
+    @param chunk_fn: function object called with each chunk dataframe, its chunk number and the csv row of its first
+    record (i.e. to write the chunk to the Parquet dataset), or None.
+    @return row_count: integer object containing the number of rows written.
+    """
+
+    row_count = 0
+    for chunk_number, spill_path in enumerate(spill_list):
+        df = read_spill_fn(spill_path)
+        df.to_csv(output_csv, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0, index=False)
+
+        if chunk_fn is not None:
+            chunk_fn(df, chunk_number, row_count)
+
+        row_count += len(df.index)
+        del df
+        os.remove(spill_path)
+
+    return row_count
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+"""
+zonal_stats_parquet.py
+======================
+
+Description: This script writes the fractional cover and rainfall zonal stats of each tile as a partitioned Parquet
+dataset alongside the per tile csv files (step1_1 command argument --parquet), so that a reader can load the zonal
+stats of a single property (or tile or year) rather than every tile csv.
+
+1. write_partitions_fn (called by step1_6 and step1_7 once the tile csv is written) writes the rows of the tile to
+export_dir/parquet/<fc|rainfall>/prop_code=<code>/tile=<tile>/year=<year>/part-0.parquet. Each file holds the csv
+columns (with the csv value types and row index) of its partition, so concurrent tiles never write the same file and a
+re-run tile replaces its own partitions. A tile csv written in chunks (step1_6 --max_memory) adds a part-<n>.parquet
+file per chunk.
+
+2. read_partitions_fn only opens the partitions matching the prop_code, tile and year filters and only reads the
+requested columns (column pushdown) and rows (filters - predicate pushdown); step2_5 files the zonal stats of each
+property from its partitions.
+
+3. Ad-hoc queries from the command line, i.e.
+python zonal_stats_parquet.py --run_dir <run_dir> --prop_code PROP --year 2020 --columns site,image,b1_mean
+
+pyarrow is optional; without it the Parquet dataset is not written and the csv files are used. The csv files remain
+the pipeline deliverables (plots, shard merge and incremental merge).
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import glob
+import shutil
+import argparse
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# environment variable holding the Parquet setting (inherited by the worker processes).
+PARQUET_ENV = 'RMB_PARQUET'
+
+# name of the Parquet dataset directory within the run directory.
+PARQUET_DIR_NAME = 'parquet'
+
+# name of the file(s) within each partition (one per chunk of the tile csv).
+PART_FILE_TEMPLATE = 'part-{0}.parquet'
+
+# partition keys (directory levels).
+PARTITION_LIST = ['prop_code', 'tile', 'year']
+
+# column types of the csv files when read back (the zonal stats are held as strings before they are exported).
+CSV_DTYPE_DICT = {'fc': {'year': int, 'month': int, 'day': int},
+                  'rainfall': {'im_date': int}}
+
+# name of the unnamed row index column of the rainfall csv when it is read in.
+RAINFALL_INDEX_COLUMN = 'Unnamed: 0'
+
+
+def parquet_available_fn():
+    """ Return True if pyarrow (Parquet) is installed. """
+
+    try:
+        import pyarrow.parquet
+        return True
+    except ImportError:
+        return False
+
+
+def configure_fn(parquet):
+    """ Store the Parquet setting in the environment (step1_1 command argument --parquet).
+
+    @param parquet: boolean object, True to write the Parquet dataset alongside the csv files.
+    """
+
+    if not parquet:
+        os.environ.pop(PARQUET_ENV, None)
+        return
+
+    if not parquet_available_fn():
+        print('pyarrow is not installed - the Parquet dataset (--parquet) will not be written.')
+        os.environ.pop(PARQUET_ENV, None)
+        return
+
+    os.environ[PARQUET_ENV] = '1'
+
+
+def enabled_fn():
+    """ Return True if the Parquet dataset is written (--parquet). """
+
+    return os.environ.get(PARQUET_ENV) == '1'
+
+
+def dataset_dir_fn(export_dir_path, kind):
+    """ Return the path to the Parquet dataset of a zonal stats kind (fc or rainfall) within the run directory. """
+
+    return os.path.join(export_dir_path, PARQUET_DIR_NAME, kind)
+
+
+def partition_value_fn(value):
+    """ Return a partition value that is safe to use as a directory name. """
+
+    return str(value).replace(os.sep, '_').replace('/', '_').replace('=', '_')
+
+
+def write_partitions_fn(df, export_dir_path, kind, complete_tile, part=0, row_offset=0):
+    """ Write the zonal stats of a tile to the Parquet dataset (one file per property and year).
+
+    @param df: pandas dataframe object containing the zonal stats of the tile (the csv columns).
+    @param export_dir_path: string object containing the path to the run directory.
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param complete_tile: string object containing the six character tile name.
+    @param part: integer object containing the chunk number of the rows (step1_6 --max_memory), 0 for the whole tile
+    or the first chunk.
+    @param row_offset: integer object containing the tile csv row of the first record of the chunk.
+    @return output_list: list object containing the paths to the Parquet files, empty if Parquet is disabled.
+    """
+
+    if not enabled_fn():
+        return []
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dataset_dir = dataset_dir_fn(export_dir_path, kind)
+
+    # a re-run tile replaces its partitions (when the first chunk is written).
+    if part == 0:
+        for tile_dir in glob.glob(os.path.join(dataset_dir, '*', 'tile=' + str(complete_tile))):
+            shutil.rmtree(tile_dir)
+
+    # the csv value types and row index (the row position within the tile csv).
+    df = df.reset_index(drop=True).astype(CSV_DTYPE_DICT[kind])
+    df.index = df.index + row_offset
+    year = df['year'] if kind == 'fc' else df['im_date'] // 100
+
+    output_list = []
+    for (prop_code, year_value), partition_df in df.groupby([df['prop_code'], year], sort=True):
+        partition_dir = os.path.join(dataset_dir, 'prop_code=' + partition_value_fn(prop_code),
+                                     'tile=' + str(complete_tile), 'year=' + str(year_value))
+        if not os.path.exists(partition_dir):
+            os.makedirs(partition_dir)
+
+        output_path = os.path.join(partition_dir, PART_FILE_TEMPLATE.format(part))
+        pq.write_table(pa.Table.from_pandas(partition_df, preserve_index=True), output_path)
+        output_list.append(output_path)
+
+    return output_list
+
+
+def partition_list_fn(export_dir_path, kind, prop_code=None, tile=None, year=None):
+    """ Return the partitions of the Parquet dataset matching the filters (None - not filtered).
+
+    @param export_dir_path: string object containing the path to the run directory.
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @return partition_list: list object containing a (prop_code, tile, year, path) tuple per partition file.
+    """
+
+    pattern_list = ['*' if value is None else partition_value_fn(value) for value in [prop_code, tile, year]]
+    search = os.path.join(dataset_dir_fn(export_dir_path, kind), *['{0}={1}'.format(key, pattern) for key, pattern
+                                                                     in zip(PARTITION_LIST, pattern_list)])
+
+    partition_list = []
+    for partition_dir in sorted(glob.glob(search)):
+        value_list = [os.path.basename(folder).split('=', 1)[1] for folder in
+                      [os.path.dirname(os.path.dirname(partition_dir)), os.path.dirname(partition_dir),
+                       partition_dir]]
+        # the part files of a chunked tile are returned in chunk order.
+        path_list = glob.glob(os.path.join(partition_dir, PART_FILE_TEMPLATE.format('*')))
+        for path in sorted(path_list, key=lambda part_path: int(os.path.basename(part_path)[5:-8])):
+            partition_list.append(tuple(value_list) + (path,))
+
+    return partition_list
+
+
+def read_partitions_fn(export_dir_path, kind, prop_code=None, tile=None, year=None, column_list=None, filters=None,
+                       csv_layout=False):
+    """ Read the partitions of the Parquet dataset matching the filters.
+
+    @param export_dir_path: string object containing the path to the run directory.
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param prop_code: string object containing the property code partition, or None for every property.
+    @param tile: string object containing the tile partition, or None for every tile.
+    @param year: integer object containing the year partition, or None for every year.
+    @param column_list: list object containing the columns to read, or None for every column.
+    @param filters: list object containing pyarrow row filters (i.e. [('site', '=', 'SITE1')]), or None.
+    @param csv_layout: boolean object, True to return the row index of the tile csv (ordered by tile and csv row).
+    @return df: pandas dataframe object containing the rows, or None if no partition matched.
+    """
+
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    df_list = []
+    for partition_prop_code, partition_tile, partition_year, path in partition_list_fn(export_dir_path, kind,
+                                                                                        prop_code, tile, year):
+        partition_df = pq.read_table(path, columns=column_list, filters=filters).to_pandas()
+        if csv_layout:
+            partition_df['_tile'] = partition_tile
+        df_list.append(partition_df)
+
+    if not df_list:
+        return None
+
+    df = pd.concat(df_list)
+
+    if csv_layout:
+        # restore the row order of the tile csv files (the rainfall csv also contains its row index as a column).
+        df['_row'] = df.index
+        df = df.sort_values(['_tile', '_row'], kind='mergesort').drop(columns=['_tile', '_row'])
+        if kind == 'rainfall':
+            df.insert(0, RAINFALL_INDEX_COLUMN, df.index)
+
+    return df
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(description='Query the partitioned Parquet zonal stats of a run directory.')
+
+    p.add_argument('-d', '--run_dir', required=True, help='Path to the run directory (export_dir/user_YYYYMMDD_HHMM).')
+
+    p.add_argument('-r', '--rainfall', action='store_true', help='Query the rainfall zonal stats (default: fc).')
+
+    p.add_argument('-pc', '--prop_code', default=None, help='Property code partition.')
+
+    p.add_argument('-t', '--tile', default=None, help='Landsat tile partition (i.e. 101077).')
+
+    p.add_argument('-y', '--year', default=None, help='Year partition (image year).')
+
+    p.add_argument('-si', '--site', default=None, help='Site to return (row filter).')
+
+    p.add_argument('-c', '--columns', default=None, help='Comma separated columns to return (default: all).')
+
+    p.add_argument('-o', '--output', default=None, help='csv file for the query results (default: print).')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def main_routine():
+    """ Query the Parquet dataset of a run directory from the command line. """
+
+    cmd_args = get_cmd_args_fn()
+
+    df = read_partitions_fn(cmd_args.run_dir, 'rainfall' if cmd_args.rainfall else 'fc', cmd_args.prop_code,
+                            cmd_args.tile, cmd_args.year, cmd_args.columns.split(',') if cmd_args.columns else None,
+                            [('site', '=', cmd_args.site)] if cmd_args.site else None)
+
+    if df is None:
+        print('There are no matching partitions: ', dataset_dir_fn(cmd_args.run_dir, 'fc'))
+    elif cmd_args.output:
+        df.to_csv(cmd_args.output, index=False)
+        print('{0} rows written to: {1}'.format(len(df.index), cmd_args.output))
+    else:
+        print(df.to_string())
+
+
+if __name__ == '__main__':
+    main_routine()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+"""
+zonal_stats_store.py
+====================
+
+Description: This script maintains a consolidated store (SQLite - zonal_stats_store.sqlite within the export
+directory) of the fractional cover and rainfall zonal stats of every run, so that the time series of a site can be
+read without searching the run directories (step1_1 command argument --zonal_stats_store).
+
+1. load_run_fn loads the per tile zonal stats csv files of a run directory (zonal_stats and rainfall) into the store.
+The records of a site visit within a tile are replaced by the latest run that processed the visit (an upsert keyed by
+the site, tile, scene and site visit date), the earlier visits of the site are kept - the same rule used to merge the
+outputs of an incremental run (odk_state_ledger).
+csv files that are unchanged since they were loaded are skipped.
+
+2. read_fn reads an indexed subset of the store (by run, tile, property, site and image date range) as a dataframe.
+The plot (step2_1 - step2_3) and filing (step2_5) stages read the zonal stats of the run from the store when it is
+enabled; csv_layout=True returns the rows with the columns and row index of the per tile csv file.
+
+3. Ad-hoc queries from the command line, i.e. the bare ground of a site since 1988:
+python zonal_stats_store.py --store <export_dir> --site "PROP_Property_Name_SITE1" --start 1988-01-01
+--columns image,b1_mean --output site1.csv
+Runs produced before the store was enabled can be added with --load <run_dir> [<run_dir> ...].
+
+###############################################################################################
+
+MIT License
+
+Copyright (c) 2020 Rob McGregor
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the 'Software'), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+##################################################################################################
+
+========================================================================================================
+"""
+
+# Import modules
+from __future__ import print_function, division
+import os
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# name of the store within the export directory.
+STORE_NAME = 'zonal_stats_store.sqlite'
+
+# columns of the per tile fractional cover zonal stats csv (step1_6).
+FC_COLUMN_LIST = ['ident', 'prop_name', 'prop_code', 'site', 'comp_site', 'site_date', 'image', 'year', 'month', 'day',
+                  'b1_min', 'b1_max', 'b1_mean', 'b1_count', 'b1_std', 'b1_median', 'b2_min', 'b2_max', 'b2_mean',
+                  'b2_count', 'b2_std', 'b2_median', 'b3_min', 'b3_max', 'b3_mean', 'b3_count', 'b3_median', 'b3_std']
+
+# columns of the per tile rainfall zonal stats csv (step1_7 - the csv also contains the unnamed row index).
+RAINFALL_COLUMN_LIST = ['ident', 'site', 'prop_name', 'prop_code', 'comp_site', 'site_date', 'im_date', 'mean', 'std',
+                        'median', 'minimum', 'maximum', 'count', 'im_name']
+
+# zonal stats kind (key): table name, csv columns, scene column and run directory sub-folder.
+KIND_DICT = {'fc': ('fc_zonal_stats', FC_COLUMN_LIST, 'image', 'zonal_stats'),
+             'rainfall': ('rainfall_zonal_stats', RAINFALL_COLUMN_LIST, 'im_name', 'rainfall')}
+
+# columns added to each row: the tile, the image date (YYYY-MM-DD), the run directory and the csv row position.
+EXTRA_COLUMN_LIST = ['tile', 'date', 'run_dir', 'csv_row']
+
+# name of the unnamed row index column of the rainfall csv when it is read in.
+RAINFALL_INDEX_COLUMN = 'Unnamed: 0'
+
+
+def store_path_fn(export_dir):
+    """ Return the path to the store within the export directory (or the store path if a store file is provided). """
+
+    if export_dir.endswith('.sqlite'):
+        return export_dir
+
+    return os.path.join(export_dir, STORE_NAME)
+
+
+def connect_fn(store_path):
+    """ Open the store, creating the tables and indexes if they do not exist.
+
+    @param store_path: string object containing the path to the store.
+    @return connection: sqlite3 connection object.
+    """
+
+    store_dir = os.path.dirname(os.path.abspath(store_path))
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    connection = sqlite3.connect(store_path, timeout=60)
+
+    for kind, (table, column_list, scene_column, folder) in sorted(KIND_DICT.items()):
+        # the columns have no declared type so the csv values keep their type (text, integer or real).
+        connection.execute('CREATE TABLE IF NOT EXISTS {0} ({1})'.format(
+            table, ', '.join('"{0}"'.format(column) for column in column_list + EXTRA_COLUMN_LIST)))
+        connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS {0}_key ON {0} (comp_site, tile, "{1}", site_date, '
+                           'ident)'.format(table, scene_column))
+        connection.execute('CREATE INDEX IF NOT EXISTS {0}_site_date ON {0} (comp_site, date)'.format(table))
+        connection.execute('CREATE INDEX IF NOT EXISTS {0}_run ON {0} (run_dir, tile, prop_name)'.format(table))
+        connection.execute('CREATE INDEX IF NOT EXISTS {0}_property ON {0} (prop_code, date)'.format(table))
+
+    connection.execute('CREATE TABLE IF NOT EXISTS source (path TEXT PRIMARY KEY, kind TEXT, tile TEXT, '
+                       'run_dir TEXT, size INTEGER, mtime REAL, row_count INTEGER, loaded REAL)')
+    connection.commit()
+
+    return connection
+
+
+def csv_tile_fn(csv_path):
+    """ Return the tile of a per tile zonal stats csv (i.e. 101077 from PROP_Name_101077_zonal_stats.csv or
+    PROP_Name_101077_rainfall_zonal_stats.csv). """
+
+    name_list = os.path.basename(csv_path).split('_')
+
+    if name_list[-3] == 'rainfall':
+        return name_list[-4]
+
+    return name_list[-3]
+
+
+def image_date_fn(df, kind):
+    """ Return the image date (YYYY-MM-DD) of each zonal stats row (the 15th of the month for rainfall). """
+
+    if kind == 'fc':
+        return (df['year'].astype(int).astype(str) + '-' + df['month'].astype(int).astype(str).str.zfill(2) + '-' +
+                df['day'].astype(int).astype(str).str.zfill(2))
+
+    im_date = df['im_date'].astype(str)
+    return im_date.str[:4] + '-' + im_date.str[4:6] + '-15'
+
+
+def load_csv_fn(connection, csv_path, kind, run_dir):
+    """ Load a per tile zonal stats csv into the store, replacing the rows of its sites within the tile.
+
+    @param connection: sqlite3 connection object.
+    @param csv_path: string object containing the path to the zonal stats csv.
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param run_dir: string object containing the path to the run directory of the csv.
+    @return row_count: integer object containing the number of rows loaded.
+    """
+
+    import pandas as pd
+
+    table, column_list, scene_column, folder = KIND_DICT[kind]
+    tile = csv_tile_fn(csv_path)
+
+    df = pd.read_csv(csv_path)
+    df = df[[column for column in column_list if column in df.columns]]
+    df['tile'] = tile
+    df['date'] = image_date_fn(df, kind)
+    df['run_dir'] = os.path.abspath(run_dir)
+    df['csv_row'] = range(len(df.index))
+
+    # python values with None for the missing values (stored as NULL).
+    row_list = df.astype(object).where(pd.notnull(df), None).values.tolist()
+    insert_column_list = df.columns.tolist()
+    visit_df = df[['comp_site', 'site_date']].drop_duplicates()
+    visit_list = [(comp_site, site_date, tile) for comp_site, site_date in
+                  visit_df.astype(object).where(pd.notnull(visit_df), None).values.tolist()]
+
+    with connection:
+        # the records of each site visit processed by the run are cleared (a reprocessed visit may have fewer scenes)
+        # and replaced (upsert) - the earlier visits of the site are kept.
+        connection.executemany('DELETE FROM {0} WHERE comp_site = ? AND site_date = ? AND tile = ?'.format(table),
+                               visit_list)
+        connection.executemany('INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})'.format(
+            table, ', '.join('"{0}"'.format(column) for column in insert_column_list),
+            ', '.join('?' * len(insert_column_list))), row_list)
+
+        stat = os.stat(csv_path)
+        connection.execute('INSERT OR REPLACE INTO source VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (os.path.abspath(csv_path), kind, tile, os.path.abspath(run_dir), stat.st_size,
+                            stat.st_mtime, len(row_list), time.time()))
+
+    return len(row_list)
+
+
+def load_run_fn(store_path, run_dir):
+    """ Load the per tile zonal stats csv files of a run directory into the store (unchanged csv files are skipped).
+
+    @param store_path: string object containing the path to the store.
+    @param run_dir: string object containing the path to the run directory (export_dir/user_YYYYMMDD_HHMM).
+    @return row_count: integer object containing the number of rows loaded.
+    """
+
+    connection = connect_fn(store_path)
+    row_count = 0
+
+    try:
+        for kind, (table, column_list, scene_column, folder) in sorted(KIND_DICT.items()):
+            for csv_path in sorted(glob.glob(os.path.join(run_dir, folder, '*.csv'))):
+                stat = os.stat(csv_path)
+                source = connection.execute('SELECT size, mtime FROM source WHERE path = ?',
+                                            (os.path.abspath(csv_path),)).fetchone()
+                if source is not None and tuple(source) == (stat.st_size, stat.st_mtime):
+                    continue
+
+                row_count += load_csv_fn(connection, csv_path, kind, run_dir)
+    finally:
+        connection.close()
+
+    print('Zonal stats store: {0} rows loaded from {1} - {2}'.format(row_count, run_dir, store_path))
+
+    return row_count
+
+
+def where_fn(run_dir=None, tile=None, prop_name=None, prop_code=None, comp_site=None, start_date=None,
+             end_date=None):
+    """ Create the where clause and the parameters of a store query (None - not filtered).
+
+    @return where: string object containing the where clause (or an empty string).
+    @return parameter_list: list object containing the query parameters.
+    """
+
+    condition_list = []
+    parameter_list = []
+
+    for column, operator, value in [('run_dir', '=', None if run_dir is None else os.path.abspath(run_dir)),
+                                    ('tile', '=', tile), ('prop_name', '=', prop_name),
+                                    ('prop_code', '=', prop_code), ('comp_site', '=', comp_site),
+                                    ('date', '>=', start_date), ('date', '<=', end_date)]:
+        if value is not None:
+            condition_list.append('{0} {1} ?'.format(column, operator))
+            parameter_list.append(str(value))
+
+    if not condition_list:
+        return '', parameter_list
+
+    return ' WHERE ' + ' AND '.join(condition_list), parameter_list
+
+
+def read_fn(store_path, kind, column_list=None, csv_layout=False, **filter_dict):
+    """ Read an indexed subset of the store.
+
+    @param store_path: string object containing the path to the store.
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param column_list: list object containing the columns to read (default: the csv columns).
+    @param csv_layout: boolean object, True to return the columns and the row index of the per tile csv files.
+    @param filter_dict: the run_dir, tile, prop_name, prop_code, comp_site, start_date and end_date filters (where_fn).
+    @return df: pandas dataframe object containing the rows (ordered by tile and csv row).
+    """
+
+    import pandas as pd
+
+    table, csv_column_list, scene_column, folder = KIND_DICT[kind]
+    column_list = column_list or csv_column_list
+    where, parameter_list = where_fn(**filter_dict)
+
+    connection = connect_fn(store_path)
+    try:
+        df = pd.read_sql_query('SELECT {0}, csv_row FROM {1}{2} ORDER BY tile, csv_row'.format(
+            ', '.join('"{0}"'.format(column) for column in column_list), table, where), connection,
+            params=parameter_list)
+    finally:
+        connection.close()
+
+    if csv_layout:
+        # the row index of the csv (the rainfall csv also contains it as an unnamed column).
+        if kind == 'rainfall':
+            df.insert(0, RAINFALL_INDEX_COLUMN, df['csv_row'])
+        df.index = df['csv_row'].values
+
+    return df.drop(columns='csv_row')
+
+
+def distinct_fn(store_path, kind, column, **filter_dict):
+    """ Return the distinct values of a column (in order of first appearance by tile and csv row).
+
+    @param store_path: string object containing the path to the store.
+    @param kind: string object containing the zonal stats kind (fc or rainfall).
+    @param column: string object containing the column name (i.e. tile or prop_name).
+    @param filter_dict: the store filters (where_fn).
+    @return value_list: list object containing the distinct values.
+    """
+
+    table = KIND_DICT[kind][0]
+    where, parameter_list = where_fn(**filter_dict)
+
+    connection = connect_fn(store_path)
+    try:
+        row_list = connection.execute('SELECT "{0}", MIN(tile), MIN(csv_row) FROM {1}{2} GROUP BY "{0}" '
+                                      'ORDER BY MIN(tile), MIN(csv_row)'.format(column, table, where),
+                                      parameter_list).fetchall()
+    finally:
+        connection.close()
+
+    return [row[0] for row in row_list]
+
+
+def get_cmd_args_fn():
+    p = argparse.ArgumentParser(description='Load and query the consolidated zonal stats store.')
+
+    p.add_argument('-s', '--store', required=True,
+                   help='Path to the export directory (or the zonal_stats_store.sqlite file).')
+
+    p.add_argument('-l', '--load', nargs='+', default=None, help='Run directories to load into the store.')
+
+    p.add_argument('-r', '--rainfall', action='store_true', help='Query the rainfall zonal stats (default: fc).')
+
+    p.add_argument('-si', '--site', default=None, help='comp_site to query (i.e. PROP_Property_Name_SITE1).')
+
+    p.add_argument('-pc', '--prop_code', default=None, help='Property code to query.')
+
+    p.add_argument('-t', '--tile', default=None, help='Landsat tile to query (i.e. 101077).')
+
+    p.add_argument('-st', '--start', default=None, help='First image date to query (YYYY-MM-DD).')
+
+    p.add_argument('-e', '--end', default=None, help='Last image date to query (YYYY-MM-DD).')
+
+    p.add_argument('-c', '--columns', default=None, help='Comma separated columns to return (default: all).')
+
+    p.add_argument('-o', '--output', default=None, help='csv file for the query results (default: print).')
+
+    cmd_args = p.parse_args()
+
+    return cmd_args
+
+
+def main_routine():
+    """ Load run directories into the store and/or query the store from the command line. """
+
+    cmd_args = get_cmd_args_fn()
+    store_path = store_path_fn(cmd_args.store)
+
+    if cmd_args.load:
+        for run_dir in cmd_args.load:
+            load_run_fn(store_path, run_dir)
+
+    if cmd_args.load and not (cmd_args.site or cmd_args.prop_code or cmd_args.tile):
+        return
+
+    if not os.path.isfile(store_path):
+        print('The zonal stats store does not exist: ', store_path)
+        sys.exit(1)
+
+    df = read_fn(store_path, 'rainfall' if cmd_args.rainfall else 'fc',
+                 cmd_args.columns.split(',') if cmd_args.columns else None, comp_site=cmd_args.site,
+                 prop_code=cmd_args.prop_code, tile=cmd_args.tile, start_date=cmd_args.start, end_date=cmd_args.end)
+
+    if cmd_args.output:
+        df.to_csv(cmd_args.output, index=False)
+        print('{0} rows written to: {1}'.format(len(df.index), cmd_args.output))
+    else:
+        print(df.to_string())
+
+
+if __name__ == '__main__':
+    main_routine()